@@ -1,30 +1,68 @@
-import sys, json, hashlib, serial, serial.tools.list_ports
-import os, hashlib
-from dotenv import load_dotenv
+import sys, glob, hashlib, serial, shutil, tempfile
+import math, os, selectors, time
 from collections import deque
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QRect, QPoint
-from PyQt6.QtGui import QAction, QPainter, QColor, QPen, QShortcut, QKeySequence, QFont, QPixmap
+from PyQt6.QtCore import Qt, QObject, QTimer, QThread, pyqtSignal, QRect, QPoint, QPointF, QAbstractListModel, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QAction, QPainter, QColor, QPen, QShortcut, QKeySequence, QFont, QPixmap, QPolygonF, QBrush
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
     QGridLayout, QComboBox, QLineEdit, QTextEdit, QGroupBox, QCheckBox,
     QRadioButton, QButtonGroup, QSpinBox, QMessageBox, QFileDialog, QDialog,
-    QFormLayout, QTabWidget, QSlider, QFrame, QToolButton
+    QFormLayout, QTabWidget, QSlider, QFrame, QToolButton, QListView, QTableView, QHeaderView, QProgressBar
 )
-from dotenv import load_dotenv
-import os
+from framing import StreamFramer, StatusSample, SamplePool, SeqTracker, MAX_FRAME_BYTES
+from ring import SampleRing
+from series import HistoryRing, TimeSeriesStore, minmax_decimate, runs, np
+from telemetry import TelemetryLog, LogLocked, LOG_DIR
+from txqueue import CommandWriter
+from hub import DeviceHub, auto_alarm
+from rules import RulesEngine, default_rules, RULE_HYSTERESIS, RULE_DEBOUNCE_S, RULE_MIN_HOLD_S
+from dsp import GasDsp
+from devstate import (DeviceState, CH_ALL, CH_GAS, CH_DISTANCE, CH_CLIMATE, CH_LED, CH_FAN, CH_SERVO, CH_ALARM,
+                      CH_MODE, CH_THRESHOLDS, GROUPS)
+from metrics import REGISTRY as MET, METRICS_ENABLED, METRICS_FILE, METRICS_PORT
+from ports import PortInfo, PortWatcher, Backoff, find_port, RECONNECT_MIN_S, RECONNECT_MAX_S
 
 
 # ====== CONFIG ======
 DEFAULT_BAUD = 115200
 AUTO_STATUS_MS = 1000
-
-
-load_dotenv()
-USERNAME = os.getenv("IOT_USER", "").strip()
-PASSWORD_PLAIN = os.getenv("IOT_PASSWORD", "").strip()
-if not USERNAME or not PASSWORD_PLAIN:
-    raise ValueError("Missing USERNAME or PASSWORD in .env file!")
-PASSWORD_HASH = hashlib.sha256(PASSWORD_PLAIN.encode()).hexdigest()
+READER_MODE = os.getenv("IOT_READER", "auto")   # auto | select | poll
+PROTOCOL = os.getenv("IOT_PROTO", "JSON").upper()  # JSON | BIN (gửi "PROTO BIN" khi connect)
+STREAM_HZ = int(os.getenv("IOT_STREAM_HZ", "0"))   # 0 = hỏi STATUS theo AUTO_STATUS_MS
+STREAM_STALL_PERIODS = 5       # mất ngần này chu kỳ liên tiếp → quay về polling
+STREAM_STALL_MIN_S = 1.5
+GAS_HISTORY_POINTS = int(os.getenv("IOT_HISTORY_POINTS", "300"))
+HISTORY_RANGES = (("Live", 0), ("10 min", 600), ("1 h", 3600), ("24 h", 86400), ("7 d", 7 * 86400), ("30 d", 30 * 86400))
+UI_FPS = int(os.getenv("IOT_UI_FPS", "30"))
+TX_INTERVAL_MS = int(os.getenv("IOT_TX_INTERVAL_MS", "15"))   # khoảng cách tối thiểu giữa 2 lệnh gửi
+TX_WAIT_ACK = os.getenv("IOT_TX_ACK", "0") == "1"    # chờ status frame sau LED/FAN/SERVO/... mới gửi lệnh kế
+RULE_HYST = float(os.getenv("IOT_RULE_HYSTERESIS", RULE_HYSTERESIS))   # auto logic: xem rules.py
+RULE_DEBOUNCE = float(os.getenv("IOT_RULE_DEBOUNCE_S", RULE_DEBOUNCE_S))
+RULE_MIN_HOLD = float(os.getenv("IOT_RULE_MIN_HOLD_S", RULE_MIN_HOLD_S))
+DSP_ENABLED = os.getenv("IOT_DSP", "1") == "1"   # lọc + rate-of-rise (dsp.py); auto logic so sánh gas_pred thay cho gas
+API_URL = os.getenv("IOT_API_URL", "")     # ws://gateway:8765/ws: dashboard là client của daemon.py
+MQTT_URL = os.getenv("IOT_MQTT", "")        # host[:port]: publish status/state/lệnh lên broker, nhận lệnh (mqtt.py)
+LOG_LINES = int(os.getenv("IOT_LOG_LINES", "5000"))   # số dòng giữ trong log view (phần cũ hơn nằm trong spool)
+LOG_SPOOL_BYTES = int(os.getenv("IOT_LOG_SPOOL_MB", "64")) << 20   # spool của Save Log: 2 file xoay vòng, tổng tối đa
+PORT_WATCH = os.getenv("IOT_PORT_WATCH", "auto")   # auto | inotify | poll | off: theo dõi cắm/rút cổng (ports.py)
+RECONNECT = os.getenv("IOT_RECONNECT", "1") == "1"   # mất cổng (rút cáp, USB reset) → tự nối lại với backoff
+RECONNECT_MAX = float(os.getenv("IOT_RECONNECT_MAX_S", RECONNECT_MAX_S))
+STATE_DIFF = os.getenv("IOT_STATE_DIFF", "1") == "1"   # 0: vẽ lại mọi widget + gửi mọi lệnh auto mỗi frame (để so sánh)
+SAMPLE_POOL = int(os.getenv("IOT_SAMPLE_POOL", "0"))   # >0: tái dùng StatusSample (free list tối đa ngần này)
+JOB_POLL_MS = 100      # chu kỳ đọc progress của job (workers.py) cho thanh tiến trình
+
+
+
+def load_credentials():
+    """(user, sha256 password) từ env, thiếu thì đọc .env — gọi trong main(), không phải lúc import."""
+    user = os.getenv("IOT_USER", "").strip(); password = os.getenv("IOT_PASSWORD", "").strip()
+    if not user or not password:
+        from dotenv import load_dotenv    # import ~30 ms: chỉ khi env chưa có sẵn
+        load_dotenv()
+        user = os.getenv("IOT_USER", "").strip(); password = os.getenv("IOT_PASSWORD", "").strip()
+    if not user or not password:
+        raise ValueError("Missing USERNAME or PASSWORD in .env file!")
+    return user, hashlib.sha256(password.encode()).hexdigest()
 
 
 
@@ -117,67 +155,405 @@ class LoginDialog(QDialog):
             self.reject()
 
 
+# ---------- Instrumentation (metrics.py; F12 = overlay, IOT_METRICS=1 / IOT_METRICS_FILE / IOT_METRICS_PORT) ----------
+M_BYTES = MET.counter("iot_serial_bytes_read_total", "bytes read from the serial port")
+M_FRAMES = MET.counter("iot_frames_parsed_total", "status frames decoded")
+M_ERRORS = MET.counter("iot_frame_errors_total", "status frames that failed to decode")
+M_DROPPED = MET.counter("iot_frames_dropped_total", "frames missing from the seq stream")
+M_READER_ERR = MET.counter("iot_reader_errors_total", "reader thread stopped on an exception")
+H_PARSE = MET.histogram("iot_parse_seconds", "one read chunk: framing + decode + on_frame hook (DSP, rules)")
+H_QUEUE = MET.histogram("iot_signal_queue_seconds", "reader hand-off to GUI slot start, per status")
+H_STATUS = MET.histogram("iot_on_status_seconds", "Main.on_status: render + ingest of the newest status")
+H_PAINT_CANVAS = MET.histogram("iot_paint_seconds", "paintEvent duration", widget="GasCanvas")
+H_PAINT_HOME = MET.histogram("iot_paint_seconds", "paintEvent duration", widget="nhapromax")
+M_RECONNECTS = MET.counter("iot_reconnects_total", "serial link re-opened after the reader lost the port")
+H_JOB = MET.histogram("iot_job_seconds", "analytics job: submit → result delivered on the GUI thread",
+                      bounds=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+H_RECONNECT = MET.histogram("iot_reconnect_seconds", "link lost → port re-opened and reader running",
+                            bounds=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+
 # ---------- Serial đọc nền ----------
 class SerialReader(QThread):
+    """Polling reader (fallback): read(128) + msleep(20) khi không có dữ liệu."""
     lineReceived = pyqtSignal(str)
-    statusParsed = pyqtSignal(dict)
-    def __init__(self, ser):
+    statusParsed = pyqtSignal(object)    # StatusSample
+    errorRaised = pyqtSignal(str)    # lỗi decode / thread đọc dừng → log view (LOG_ERROR)
+    linkLost = pyqtSignal(str)       # thread đọc dừng vì lỗi cổng (rút cáp, USB reset) → Main nối lại
+    def __init__(self, ser, max_frame=MAX_FRAME_BYTES, sink=None, pool=None):
         super().__init__()
-        self.ser = ser; self._run=True; self._buf=""
+        self.ser = ser; self._run=True; self.framer = StreamFramer(max_frame, pool)
+        self.sink = sink   # FrameCoalescer: đẩy vào ring thay vì emit từng frame
+        self.pool = pool   # SamplePool: sample lấy từ free list, Main trả lại khi đã dùng xong
+        self.on_frame = None   # on_frame(st, t_rx): gọi ngay trên thread đọc mỗi khi có status (ack + rules)
+        self._err_t = 0.0; self._err_n = 0
     def run(self):
         try:
             while self._run and self.ser and self.ser.is_open:
                 data = self.ser.read(128)
                 if not data: self.msleep(20); continue
-                try: self._buf += data.decode(errors="ignore")
-                except: continue
-                while "\n" in self._buf:
-                    line, self._buf = self._buf.split("\n",1); line=line.strip()
-                    if not line: continue
-                    self.lineReceived.emit(line)
-                    import re
-
-                    # ...
-                    if "{" in line and "}" in line:
-                        match = re.search(r'\{.*\}', line)
-                        if match:
-                            json_str = match.group()
-                            try:
-                                data = json.loads(json_str)
-                                self.statusParsed.emit(data)
-                            except Exception as e:
-                                print("⚠ JSON error:", e, "->", json_str[:80])
-                        # bỏ qua phần ký tự rác còn lại
-
-        except: pass
+                self._feed(data)
+
+        except Exception as e: self._fail(e)
+    def _fail(self, e):
+        """Exception làm dừng thread đọc; bỏ qua khi đang stop() (cổng bị đóng dưới chân read)."""
+        if not self._run: return
+        if MET.on: M_READER_ERR.inc()
+        msg = f"Reader stopped: {type(e).__name__}: {e}"
+        self.errorRaised.emit(msg); self.linkLost.emit(msg)
+    def _warn(self, msg:str):
+        """Tối đa 1 dòng/giây lên GUI (stream rác không làm ngập log), số bị gộp ghi kèm."""
+        now = time.monotonic(); self._err_n += 1
+        if now - self._err_t < 1.0: return
+        if self._err_n > 1: msg += f" (+{self._err_n - 1} more)"
+        self._err_t = now; self._err_n = 0
+        self.errorRaised.emit(msg)
+    def _feed(self, data):
+        sink = self.sink; pool = self.pool; t_rx = time.perf_counter(); on = MET.on
+        if on: M_BYTES.inc(len(data))
+        for line, frame in self.framer.feed(data):
+            if line is not None:
+                if sink: sink.lines.push(line)
+                else: self.lineReceived.emit(line)
+            if frame is None: continue
+            try:
+                st = frame if frame.__class__ is StatusSample else StatusSample.from_json(frame, pool)
+            except ValueError as e:
+                if on: M_ERRORS.inc()
+                self._warn(f"⚠ JSON error: {e} -> {bytes(frame[:80]).decode('utf-8', 'replace')}"); continue
+            st.t_rx = t_rx       # on_status đo độ trễ hàng đợi
+            if self.on_frame: self.on_frame(st, t_rx)
+            if on: M_FRAMES.inc()
+            if sink: sink.status.push(st)
+            else: self.statusParsed.emit(st)
+        if on: H_PARSE.observe(time.perf_counter() - t_rx)
     def stop(self): self._run=False
 
+class SelectorSerialReader(SerialReader):
+    """Event-driven reader: block trên fd của cổng, đọc hết in_waiting trong một lần."""
+    def __init__(self, ser, max_frame=MAX_FRAME_BYTES, sink=None, pool=None):
+        super().__init__(ser, max_frame, sink, pool)
+        self._wake_w = -1   # self-pipe: stop() đánh thức select()
+    @staticmethod
+    def supported(ser) -> bool:
+        if sys.platform == "win32": return False
+        try: return ser.fileno() >= 0
+        except Exception: return False
+    def run(self):
+        sel = selectors.DefaultSelector()
+        wake_r, self._wake_w = os.pipe()
+        try:
+            sel.register(self.ser.fileno(), selectors.EVENT_READ)
+            sel.register(wake_r, selectors.EVENT_READ)
+            while self._run and self.ser and self.ser.is_open:
+                events = sel.select()
+                if not self._run: break
+                if not any(key.fd != wake_r for key, _ in events): continue
+                data = self.ser.read(self.ser.in_waiting or 1)
+                if data: self._feed(data)
+        except Exception as e: self._fail(e)
+        finally:
+            wake_w, self._wake_w = self._wake_w, -1
+            sel.close(); os.close(wake_r); os.close(wake_w)
+    def stop(self):
+        self._run=False
+        if self._wake_w >= 0:
+            try: os.write(self._wake_w, b"\0")
+            except OSError: pass
+
+def make_reader(ser, mode=READER_MODE, sink=None, pool=None) -> SerialReader:
+    if mode != "poll" and SelectorSerialReader.supported(ser): return SelectorSerialReader(ser, sink=sink, pool=pool)
+    return SerialReader(ser, sink=sink, pool=pool)
+
+# ---------- Gom frame cho GUI ----------
+class FrameCoalescer(QObject):
+    """Reader ghi vào SampleRing; một QTimer kiểu vsync (fps) giao cả lô cho GUI thread."""
+    batchReady = pyqtSignal(list)   # mọi status từ tick trước (cũ → mới)
+    linesReady = pyqtSignal(list)
+    def __init__(self, fps=UI_FPS, cap=8192, parent=None):
+        super().__init__(parent)
+        self.status = SampleRing(cap); self.lines = SampleRing(cap)
+        self.rendered = 0
+        self.timer = QTimer(self); self.timer.setInterval(max(1, round(1000 / max(1, fps))))
+        self.timer.timeout.connect(self.flush)
+    @property
+    def received(self): return self.status.head
+    def start(self): self.timer.start()
+    def stop(self): self.timer.stop(); self.flush()
+    def flush(self):
+        lines = self.lines.drain()
+        if lines: self.linesReady.emit(lines)
+        batch = self.status.drain()
+        if batch:
+            self.rendered += 1; self.batchReady.emit(batch)
+
+# ---------- Trạng thái board → widget ----------
+class DeviceModel(QObject):
+    """Phát signal theo nhóm field chỉ khi nhóm đó đổi (mask = StatusSample.changed từ devstate.DeviceState).
+
+    invalidate(mask): widget vừa bị người dùng đổi (lệnh chưa được board xác nhận)
+    → lần apply() kế tiếp phát lại nhóm đó từ sample để widget khớp với board.
+    """
+    gasChanged = pyqtSignal(int)
+    distanceChanged = pyqtSignal(int)
+    climateChanged = pyqtSignal(object, object)    # temperature, humidity (None = DHT chưa đọc được)
+    ledChanged = pyqtSignal(bool)
+    fanChanged = pyqtSignal(bool)
+    servoChanged = pyqtSignal(int)
+    alarmChanged = pyqtSignal(bool)
+    modeChanged = pyqtSignal(str)
+    thresholdsChanged = pyqtSignal(int, int)      # THR LOW/HIGH board đang dùng
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._dirty = 0
+        self.renders = 0; self.updates = 0; self.skipped = 0    # sample đã vẽ, signal đã phát, nhóm bỏ qua
+    def invalidate(self, mask:int=CH_ALL): self._dirty |= mask
+    def apply(self, st:StatusSample, mask:int) -> int:
+        mask |= self._dirty; self._dirty = 0; sent = 0
+        if mask & CH_GAS and st.gas is not None: self.gasChanged.emit(st.gas); sent += 1
+        if mask & CH_DISTANCE and st.distance is not None: self.distanceChanged.emit(st.distance); sent += 1
+        if mask & CH_CLIMATE: self.climateChanged.emit(st.temperature, st.humidity); sent += 1
+        if mask & CH_LED and st.led is not None: self.ledChanged.emit(bool(st.led)); sent += 1
+        if mask & CH_FAN and st.fan is not None: self.fanChanged.emit(bool(st.fan)); sent += 1
+        if mask & CH_SERVO and st.servo is not None: self.servoChanged.emit(st.servo); sent += 1
+        if mask & CH_ALARM and st.alarm is not None: self.alarmChanged.emit(bool(st.alarm)); sent += 1
+        if mask & CH_MODE and st.mode is not None: self.modeChanged.emit(st.mode); sent += 1
+        if mask & CH_THRESHOLDS and st.threshold_low is not None and st.threshold_high is not None:
+            self.thresholdsChanged.emit(st.threshold_low, st.threshold_high); sent += 1
+        self.renders += 1; self.updates += sent; self.skipped += len(GROUPS) - sent
+        return mask
+
+# ---------- Serial log (model + ring, không dùng QTextEdit) ----------
+LOG_INFO, LOG_JSON, LOG_TEXT, LOG_CMD, LOG_ERROR = range(5)
+LOG_FILTERS = (("All", None), ("JSON", {LOG_JSON}), ("Text", {LOG_TEXT}), ("Commands", {LOG_CMD}),
+               ("Errors", {LOG_ERROR}), ("Info", {LOG_INFO}))
+
+class LogModel(QAbstractListModel):
+    """Ring `cap` dòng cho QListView + chỉ mục theo loại để lọc nhanh.
+
+    Mọi dòng cũng được ghi nối vào file spool trên đĩa, nên save_log chép file
+    thay vì dựng lại toàn bộ văn bản trong bộ nhớ. Spool xoay vòng qua 2 file
+    (<spool>, <spool>.1), mỗi file tối đa spool_bytes / 2 byte (UTF-8): giữ
+    từ spool_bytes / 2 tới spool_bytes byte mới nhất, không phình theo thời gian
+    chạy. Phần cũ hơn bị bỏ và được đếm (dropped_lines): save() ghi một dòng
+    báo ở đầu file và trả về số dòng đã mất. close() xoá cả hai.
+    """
+    COLORS = {LOG_INFO: "#94a3b8", LOG_JSON: "#e5e7eb", LOG_TEXT: "#cbd5e1", LOG_CMD: "#7dd3fc", LOG_ERROR: "#f87171"}
+    def __init__(self, cap=LOG_LINES, spool_path=None, parent=None, spool_bytes=LOG_SPOOL_BYTES):
+        super().__init__(parent)
+        self.cap = cap; self._text = [""] * cap; self._kind = bytearray(cap)
+        self.head = 0; self.tail = 0                       # id tuyệt đối: [tail, head)
+        self._index = {k: deque() for k in self.COLORS}    # id theo loại
+        self._filter = None; self._rows = None; self._off = 0
+        self._brushes = {k: QBrush(QColor(c)) for k, c in self.COLORS.items()}
+        self.spool_path = spool_path; self.spool_bytes = spool_bytes; self._spooled = 0
+        self._spool_lines = 0; self._old_lines = 0; self.dropped_lines = 0     # dòng trong file hiện tại / .1 / đã bỏ
+        self._spool = open(spool_path, "wb", buffering=1 << 16) if spool_path else None
+
+    # Qt model
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return self.head - self.tail if self._rows is None else len(self._rows) - self._off
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        a = self.tail + index.row() if self._rows is None else self._rows[self._off + index.row()]
+        i = a % self.cap
+        if role == Qt.ItemDataRole.DisplayRole: return self._text[i]
+        if role == Qt.ItemDataRole.ForegroundRole: return self._brushes[self._kind[i]]
+        return None
+
+    # API
+    def set_filter(self, kinds):
+        self.beginResetModel()
+        self._filter = frozenset(kinds) if kinds else None
+        self._rows = sorted(a for k in self._filter for a in self._index[k]) if self._filter else None
+        self._off = 0
+        self.endResetModel()
+    def append_many(self, items):
+        """items = [(kind, text), ...]; một lần remove + một lần insert cho cả lô."""
+        if not items: return
+        if self._spool:
+            data = ("\n".join(t for _, t in items) + "\n").encode("utf-8", "replace")
+            self._spool.write(data); self._spooled += len(data); self._spool_lines += len(items)
+            if self._spooled >= self.spool_bytes // 2: self._rotate()
+        items = items[-self.cap:]
+        new_tail = max(self.tail, self.head + len(items) - self.cap)
+        if new_tail > self.tail:
+            n = new_tail - self.tail if self._rows is None else \
+                sum(1 for a in self._rows[self._off:self._off + len(items)] if a < new_tail)
+            if n: self.beginRemoveRows(QModelIndex(), 0, n - 1)
+            self.tail = new_tail
+            for q in self._index.values():
+                while q and q[0] < new_tail: q.popleft()
+            if self._rows is not None:
+                self._off += n
+                if self._off > self.cap: del self._rows[:self._off]; self._off = 0
+            if n: self.endRemoveRows()
+        keep = [(self.head + j, k, t) for j, (k, t) in enumerate(items)]
+        shown = len(keep) if self._filter is None else sum(1 for _, k, _ in keep if k in self._filter)
+        first = self.rowCount()
+        if shown: self.beginInsertRows(QModelIndex(), first, first + shown - 1)
+        for a, k, t in keep:
+            i = a % self.cap; self._text[i] = t; self._kind[i] = k; self._index[k].append(a)
+            if self._filter is not None and k in self._filter: self._rows.append(a)
+        self.head += len(keep)
+        if shown: self.endInsertRows()
+    def lines(self):
+        return [self._text[a % self.cap] for a in range(self.tail, self.head)]
+    def _rotate(self):
+        """File spool đầy nửa hạn mức → thành <spool>.1 (bỏ file .1 cũ, đếm vào dropped_lines), mở file mới."""
+        self._spool.close(); os.replace(self.spool_path, self.spool_path + ".1")
+        self.dropped_lines += self._old_lines; self._old_lines = self._spool_lines
+        self._spool = open(self.spool_path, "wb", buffering=1 << 16); self._spooled = 0; self._spool_lines = 0
+    def save(self, path) -> int:
+        """Log của phiên → path, chép theo khối; trả về số dòng đầu phiên không còn giữ (0 = đủ cả phiên)."""
+        if self._spool:
+            dropped = self.dropped_lines
+            self._spool.flush()
+            with open(path, "wb") as dst:
+                if dropped:
+                    dst.write(f"# {dropped} earlier lines of this session were dropped "
+                              f"(Save Log keeps the last {self.spool_bytes / (1 << 20):g} MB, IOT_LOG_SPOOL_MB)\n".encode())
+                for src_path in (self.spool_path + ".1", self.spool_path):
+                    if not os.path.exists(src_path): continue
+                    with open(src_path, "rb") as src: shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            dropped = self.tail
+            with open(path, "w", encoding="utf-8") as f:
+                if dropped: f.write(f"# {dropped} earlier lines of this session were dropped (last {self.cap} kept)\n")
+                f.write("\n".join(self.lines()) + "\n")
+        return dropped
+    @staticmethod
+    def sweep(spool_dir:str, max_age_s:float=7 * 86400):
+        """Xoá spool của phiên đã chết (crash / kill không qua close()) cũ hơn max_age_s."""
+        cutoff = time.time() - max_age_s
+        for p in glob.glob(os.path.join(spool_dir, "iot-serial-*.txt*")):
+            try:
+                if os.path.getmtime(p) < cutoff: os.remove(p)
+            except OSError: pass
+    def close(self):
+        if self._spool:
+            self._spool.close(); self._spool = None
+            for p in (self.spool_path, self.spool_path + ".1"):
+                try: os.remove(p)
+                except OSError: pass
+
 # ---------- Canvas vẽ đồ thị GAS ----------
 class GasCanvas(QWidget):
-    def __init__(self, parent=None, max_points=300):
-        super().__init__(parent); self.history=deque(maxlen=max_points)
+    """GAS history: ring buffer cấp phát sẵn, min/max decimation theo pixel, một drawPolyline.
+
+    Nền (khung + ngưỡng + lưới) được cache thành QPixmap, chỉ vẽ lại khi resize/đổi ngưỡng;
+    polyline được cache theo (số sample, kích thước) nên repaint không đổi dữ liệu gần như miễn phí.
+    Khi sample có gas_f (dsp.GasDsp), đường đã lọc được vẽ đè lên raw (chỉ ở live view).
+    NaN (push_gap / gap trong envelope) ngắt nét: mỗi đoạn liền là một polyline riêng.
+    """
+    def __init__(self, parent=None, max_points=GAS_HISTORY_POINTS):
+        super().__init__(parent); self.history=HistoryRing(max_points)
+        self.filtered = HistoryRing(max_points); self._has_filtered = False   # gas_f của dsp.GasDsp, cùng chỉ số với history
         self.thr_lo, self.thr_hi = 380, 450; self.setMinimumHeight(120)
-    def set_thresholds(self, lo, hi): self.thr_lo, self.thr_hi = lo, hi; self.update()
-    def push(self, gas):
-        if gas is not None: self.history.append(int(gas)); self.update()
-    def paintEvent(self, ev):
-        p = QPainter(self); r = self.rect()
+        self._bg = None; self._poly = None; self._poly_key = None; self._fpoly = None; self._fpoly_key = None
+        self._view = None; self._view_id = 0; self._title = "GAS history"   # _view: zoom từ TimeSeriesStore
+    def set_view(self, ys, title="GAS history"):
+        """ys = min/max xen kẽ từ TimeSeriesStore.envelope(); None = quay lại live history."""
+        self._view = ys; self._view_id += 1
+        if title != self._title: self._title = title; self._bg = None
+        self.update()
+    def set_thresholds(self, lo, hi):
+        if (lo, hi) == (self.thr_lo, self.thr_hi): return
+        self.thr_lo, self.thr_hi = lo, hi; self._bg = None; self.update()
+    def push(self, gas, filtered=None):
+        if gas is None: return
+        self.history.append(int(gas))
+        if filtered is not None: self._has_filtered = True
+        self.filtered.append(gas if filtered is None else filtered)
+        self.update()
+    def push_gap(self):
+        """Mất kết nối: một điểm NaN để đường không nối qua khoảng trống."""
+        v = self.history.last()
+        if v is None or v != v: return          # chưa có gì / đã có gap ngay trước
+        self.history.append(math.nan); self.filtered.append(math.nan); self.update()
+    def extend(self, values, filtered=None):
+        """filtered: gas_f song song với values (None = không có bộ lọc)."""
+        self.history.extend(values)
+        self.filtered.extend(values if filtered is None else filtered)
+        if filtered is not None: self._has_filtered = True
+        self.update()
+    def clear(self):
+        self.history.clear(); self.filtered.clear(); self._has_filtered = False; self.update()
+    def resizeEvent(self, ev):
+        self._bg = None; super().resizeEvent(ev)
+    def _background(self, r):
+        pix = QPixmap(r.size()); p = QPainter(pix)
         p.fillRect(r, QColor("#0b1220"))
-        p.setPen(QPen(QColor("#334155"), 1)); p.drawRect(r.adjusted(0,0,-1,-1))
         def y(v): return r.bottom()-int((v/1023.0)*r.height())
+        p.setPen(QPen(QColor("#1e293b"), 1))
+        for v in (256, 512, 768): p.drawLine(r.left(), y(v), r.right(), y(v))
+        p.setPen(QPen(QColor("#334155"), 1)); p.drawRect(r.adjusted(0,0,-1,-1))
         p.setPen(QPen(QColor("#fbbf24"), 1, Qt.PenStyle.DashLine)); p.drawLine(r.left(), y(self.thr_lo), r.right(), y(self.thr_lo))
         p.setPen(QPen(QColor("#ef4444"), 1, Qt.PenStyle.DashLine)); p.drawLine(r.left(), y(self.thr_hi), r.right(), y(self.thr_hi))
-        if len(self.history)>=2:
-            step = r.width()/max(1,len(self.history)-1)
-            p.setPen(QPen(QColor("#22d3ee"), 2))
-            for i in range(len(self.history)-1):
-                p.drawLine(int(r.left()+i*step), y(self.history[i]),
-                           int(r.left()+(i+1)*step), y(self.history[i+1]))
-        p.setPen(QColor("#94a3b8")); p.drawText(QRect(r.left()+6,r.top()+6,200,18), Qt.AlignmentFlag.AlignLeft, "GAS history")
+        p.setPen(QColor("#94a3b8")); p.drawText(QRect(r.left()+6,r.top()+6,300,18), Qt.AlignmentFlag.AlignLeft, self._title)
+        p.end()
+        return pix
+    def _series(self):
+        return self.history.window() if self._view is None else self._view
+    def _polyline(self, r):
+        key = (self.history.count if self._view is None else -self._view_id, r.width(), r.height())
+        if key == self._poly_key: return self._poly
+        self._poly, self._poly_key = self._make_polyline(r, self._series()), key
+        return self._poly
+    def _filtered_polyline(self, r):
+        key = (self.filtered.count, r.width(), r.height())
+        if key != self._fpoly_key: self._fpoly, self._fpoly_key = self._make_polyline(r, self.filtered.window()), key
+        return self._fpoly
+    def _make_polyline(self, r, y):
+        """Một QPolygonF cho mỗi đoạn không có NaN (gap)."""
+        n = len(y)
+        xs, ys = minmax_decimate(y, r.width())
+        step = r.width()/max(1, n-1); left, bottom, h = r.left(), r.bottom(), r.height()
+        out = []
+        for i, j in runs(ys):
+            poly = QPolygonF()
+            if np is not None:
+                # ghi thẳng vào bộ nhớ QPointF (2 x double) của polygon
+                m = j - i; poly.resize(m)
+                ptr = poly.data(); ptr.setsize(m * 16)
+                pts = np.frombuffer(ptr, dtype=np.float64).reshape(m, 2)
+                pts[:, 0] = left + xs[i:j] * step
+                pts[:, 1] = bottom - ys[i:j] * (h / 1023.0)
+            else:
+                for x, v in zip(xs[i:j], ys[i:j]): poly.append(QPointF(left + x*step, bottom - v*h/1023.0))
+            out.append(poly)
+        return out
+    def paintEvent(self, ev):
+        t0 = time.perf_counter() if MET.on else 0.0
+        p = QPainter(self); r = self.rect()
+        if self._bg is None or self._bg.size() != r.size(): self._bg = self._background(r)
+        p.drawPixmap(0, 0, self._bg)
+        n = len(self._series())
+        if n>=2:
+            overlay = self._view is None and self._has_filtered
+            # đường min/max dày đặc: bút 1px (stroker của bút 2px rất chậm với đường zigzag)
+            raw = QColor("#22d3ee")
+            if overlay: raw.setAlpha(110)     # có gas_f: raw mờ đi, đường lọc nổi lên trên
+            p.setPen(QPen(raw, 1 if n > 2*r.width() else 2))
+            for poly in self._polyline(r): p.drawPolyline(poly)
+            if overlay:
+                p.setPen(QPen(QColor("#a3e635"), 1 if n > 2*r.width() else 2))
+                for poly in self._filtered_polyline(r): p.drawPolyline(poly)
+        if t0: p.end(); H_PAINT_CANVAS.observe(time.perf_counter() - t0)
 
 # ---------- Nha pRo mAx Home View ----------
+def repolish(w:QWidget, name:str, value) -> bool:
+    """Đổi dynamic property dùng trong stylesheet; chỉ re-polish (không parse lại sheet) khi giá trị đổi."""
+    if w.property(name) == value: return False
+    w.setProperty(name, value); w.style().unpolish(w); w.style().polish(w)
+    return True
+
 class nhapromax(QFrame):
-    """Isometric house + overlay icon (LED/FAN/SERVO) + status panel + optional background image."""
+    """Isometric house + overlay icon (LED/FAN/SERVO) + status panel + optional background image.
+
+    Nền + ảnh đã scale + khung nhà được cache thành một QPixmap (chỉ vẽ lại khi resize / đổi ảnh);
+    paintEvent chỉ blit pixmap + vẽ badge GAS. Vị trí icon/panel tính trong resizeEvent,
+    trạng thái nút là dynamic property "on" (stylesheet dựng sẵn) nên không setStyleSheet mỗi frame.
+    """
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setObjectName("Nha pRo mAx")
@@ -244,7 +620,11 @@ class nhapromax(QFrame):
     QToolButton:hover {
         background: #fde68a;
     }
+    QToolButton[on="true"] {
+        background: #16a34a;
+    }
     QLabel { color: #1f2937; }
+    QLabel#panel { background:#fde68a; border:1px solid #f59e0b; border-radius:8px; padding:6px; }
 
         """)
         # states
@@ -255,6 +635,8 @@ class nhapromax(QFrame):
         self.temp = None
         self.thr_lo, self.thr_hi = 380, 450
         self.bg_pix: QPixmap|None = None
+        self._scene: QPixmap|None = None   # nền + ảnh + khung nhà, theo kích thước hiện tại
+        self._badge = QPoint(0, 0)          # tâm badge GAS (tính trong _layout)
         self.buzzer_on = False  # 🔊 thêm biến trạng thái loa
         self.humid = None  # 💧 nếu bạn hiển thị độ ẩm
 
@@ -266,8 +648,7 @@ class nhapromax(QFrame):
         # status panel
         self.lblThermo = QLabel(self._thermo_text(), self)
         self.lblState = QLabel(self._state_text(), self)
-        panelCss = "background:#fde68a; border:1px solid #f59e0b; border-radius:8px; padding:6px;"
-        self.lblThermo.setStyleSheet(panelCss); self.lblState.setStyleSheet(panelCss)
+        self.lblThermo.setObjectName("panel"); self.lblState.setObjectName("panel")
 
         # overlay icons
         self.btnLed  = QToolButton(self); self.btnLed.setText("💡");  self.btnLed.setToolTip("LED 12V ON/OFF")
@@ -282,75 +663,108 @@ class nhapromax(QFrame):
         self.btnDoor.clicked.connect(self.bump_servo)
 
         self._send = None  # set_sender() sẽ gán
-        self._sync_buttons()
+        self._sync_buttons(); self._layout()
 
     # API
     def set_sender(self, send_callable): self._send = send_callable
-    def update_from_status(self, st:dict):
-        if st.get("gas") is not None: self.gas = float(st["gas"])
-        if st.get("temperature") is not None: self.temp = float(st["temperature"])
-        if st.get("humidity") is not None: self.humid = float(st["humidity"])
-        if st.get("led") is not None:
-            self.led_on = bool(int(st["led"]))
-        if st.get("fan") is not None: self.fan_on = bool(int(st["fan"]))
-        if st.get("servo") is not None: self.servo = int(st["servo"])
-        if st.get("alarm") is not None:
-            try:
-                self.buzzer_on = int(st["alarm"]) == 1
-            except ValueError:
-                self.buzzer_on = False
-
-        self.lblThermo.setText(self._thermo_text()); self.lblState.setText(self._state_text())
-        self._sync_buttons()
-        self.repaint()
+    def update_from_status(self, st:StatusSample):
+        if st.gas is not None: self.gas = float(st.gas)
+        if st.temperature is not None: self.temp = st.temperature
+        if st.humidity is not None: self.humid = st.humidity
+        if st.led is not None: self.led_on = bool(st.led)
+        if st.fan is not None: self.fan_on = bool(st.fan)
+        if st.servo is not None: self.servo = st.servo
+        if st.alarm is not None: self.buzzer_on = bool(st.alarm)
+
+        self._sync_labels(); self._sync_buttons()
+        self.update()
 
-    def set_thresholds(self, lo:int, hi:int): self.thr_lo, self.thr_hi = lo, hi; self.update()
+    # slot của DeviceModel: mỗi signal chỉ đổi phần liên quan (update() gộp thành một lần vẽ)
+    def set_gas(self, v:int):
+        self.gas = float(v); self._sync_labels(); self.update()
+    def set_climate(self, temp, humid):
+        if temp is not None: self.temp = temp
+        if humid is not None: self.humid = humid
+        self._sync_labels()
+    def set_led(self, on:bool): self.led_on = on; self._sync_buttons(); self.update()
+    def set_fan(self, on:bool): self.fan_on = on; self._sync_buttons(); self.update()
+    def set_servo(self, v:int): self.servo = v; self._sync_buttons(); self.update()
+    def set_alarm(self, on:bool): self.buzzer_on = on; self._sync_buttons()
+
+    def set_thresholds(self, lo:int, hi:int):
+        if (lo, hi) == (self.thr_lo, self.thr_hi): return
+        self.thr_lo, self.thr_hi = lo, hi; self._sync_labels(); self.update()
     def load_background(self, path:str):
         pix = QPixmap(path)
-        if not pix.isNull(): self.bg_pix = pix; self.update()
+        if not pix.isNull(): self.bg_pix = pix; self._scene = None; self.update()
 
     # interactions
     def toggle_led(self):
         self.led_on = not self.led_on
         if self._send: self._send(f"LED {1 if self.led_on else 0}")
-        self.update()
+        self._sync_buttons()
     def toggle_fan(self):
         self.fan_on = not self.fan_on
         if self._send: self._send(f"FAN {1 if self.fan_on else 0}")
-        self.update()
+        self._sync_buttons()
     def bump_servo(self):
         self.servo = 0 if self.servo >= 90 else 90
         if self._send: self._send(f"SERVO {self.servo}")
         self._sync_buttons()
-        self.update()
 
     def _sync_buttons(self):
         door_open = (self.servo >= 90)
-        self.btnDoor.setText("🚪" if door_open else "🚪")
-        self.btnDoor.setToolTip("Door (SERVO 90° = Open, 0° = Close)")
-        self._color_button(self.btnBuzz, self.buzzer_on)
-        self.repaint()
-
-    # drawing
-    def paintEvent(self, e):
-        p = QPainter(self); r = self.rect()
-        p.fillRect(r, QColor("#fff7ed"))
-        if self.bg_pix:
-            scaled = self.bg_pix.scaled(r.size(), Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation)
-            p.setOpacity(0.08); p.drawPixmap(0, 0, scaled); p.setOpacity(1.0)
-
-        house = r.adjusted(12, 48, -12, -72)
-        p.setRenderHint(QPainter.RenderHint.Antialiasing, True)
-
-        pen = QPen(QColor("#f59e0b")); pen.setWidth(2); pen.setStyle(Qt.PenStyle.DotLine); p.setPen(pen)
+        self.btnDoor.setText("🚪" if door_open else "🚪")    # setText cùng chuỗi: Qt bỏ qua
+        # cửa xanh khi MỞ; chỉ re-polish nút đổi trạng thái
+        for btn, on in ((self.btnLed, self.led_on), (self.btnFan, self.fan_on),
+                        (self.btnDoor, self.servo >= 90), (self.btnBuzz, self.buzzer_on)):
+            repolish(btn, "on", on)
+
+    def _sync_labels(self):
+        moved = False
+        for lbl, text in ((self.lblThermo, self._thermo_text()), (self.lblState, self._state_text())):
+            if lbl.text() != text: lbl.setText(text); lbl.adjustSize(); moved = True
+        if moved: self._place_labels()
+
+    def _place_labels(self):
+        self.lblThermo.move(16, self.height()-self.lblThermo.height()-16)
+        self.lblState.move(self.lblThermo.x()+self.lblThermo.width()+10, self.lblThermo.y())
 
+    # layout + drawing
+    def _house(self):
+        """Các đỉnh của khung nhà isometric theo kích thước hiện tại: (A, B, C, D, A2, B2, C2, D2)."""
+        house = self.rect().adjusted(12, 48, -12, -72)
         cx, cy = house.center().x(), house.center().y()+10
         w, h, z = 320, 150, 90
         A = QPoint(cx - w//2, cy)
         B = QPoint(cx + w//2, cy)
         C = QPoint(cx + w//2 + z, cy - z)
         D = QPoint(cx - w//2 + z, cy - z)
-        A2 = QPoint(A.x(), A.y()-h); B2 = QPoint(B.x(), B.y()-h); C2 = QPoint(C.x(), C.y()-h); D2 = QPoint(D.x(), D.y()-h)
+        return A, B, C, D, QPoint(A.x(), A.y()-h), QPoint(B.x(), B.y()-h), QPoint(C.x(), C.y()-h), QPoint(D.x(), D.y()-h)
+
+    def _layout(self):
+        A, B, C, D = self._house()[:4]
+        # đặt icon (luôn nằm trên khung nhà để click được)
+        self.btnLed.move(A.x()+40, A.y()-80)                 # trái
+        self.btnFan.move((A.x()+B.x())//2 - 20, A.y()-60)    # giữa
+        self.btnDoor.move(C.x()-36, C.y()-110)               # phải (cửa)
+        self.btnBuzz.move(D.x() + 60, D.y() - 130)
+        for b in (self.btnLed, self.btnFan, self.btnDoor, self.btnBuzz): b.raise_()
+        self._badge = QPoint(D.x()+20, D.y()-18)
+        self.lblThermo.adjustSize(); self.lblState.adjustSize(); self._place_labels()
+
+    def resizeEvent(self, e):
+        self._scene = None; self._layout(); super().resizeEvent(e)
+
+    def _render_scene(self, r):
+        pix = QPixmap(r.size()); p = QPainter(pix)
+        p.fillRect(r, QColor("#fff7ed"))
+        if self.bg_pix:
+            scaled = self.bg_pix.scaled(r.size(), Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation)
+            p.setOpacity(0.08); p.drawPixmap(0, 0, scaled); p.setOpacity(1.0)
+        p.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+        pen = QPen(QColor("#f59e0b")); pen.setWidth(2); pen.setStyle(Qt.PenStyle.DotLine); p.setPen(pen)
+        A, B, C, D, A2, B2, C2, D2 = self._house()
 
         # khung
         p.drawPolygon(A, B, C, D); p.drawLine(A, A2); p.drawLine(B, B2); p.drawLine(C, C2); p.drawLine(D, D2); p.drawPolygon(A2, B2, C2, D2)
@@ -361,37 +775,23 @@ class nhapromax(QFrame):
         p.drawLine(mid(A,B),  mid(A2,B2))
         p.drawLine(mid(B,C),  mid(B2,C2))
         p.drawLine(mid(A,D),  mid(A2,D2))
+        p.end()
+        return pix
 
-        # đặt icon (tọa độ mới + raise_ để luôn click được)
-        self.btnLed.move(A.x()+40, A.y()-80)                 # trái
-        self.btnFan.move((A.x()+B.x())//2 - 20, A.y()-60)    # giữa
-        self.btnDoor.move(C.x()-36, C.y()-110)               # phải (cửa)
-        self.btnBuzz.move(D.x() + 60, D.y() - 130)
-        for b in (self.btnLed, self.btnFan, self.btnDoor, self.btnBuzz):
-            b.raise_(); b.show()
+    def paintEvent(self, e):
+        t0 = time.perf_counter() if MET.on else 0.0
+        p = QPainter(self); r = self.rect()
+        if self._scene is None or self._scene.size() != r.size(): self._scene = self._render_scene(r)
+        p.drawPixmap(0, 0, self._scene)
 
         # GAS badge
-        gx, gy = D.x()+20, D.y()-18
+        p.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+        gx, gy = self._badge.x(), self._badge.y()
         col = QColor("#10b981") if self.gas < self.thr_lo else (QColor("#f59e0b") if self.gas < self.thr_hi else QColor("#ef4444"))
         p.setBrush(col); p.setPen(Qt.PenStyle.NoPen); p.drawEllipse(QPoint(gx, gy), 22, 22)
         p.setPen(QColor("#083344")); p.setFont(QFont("Segoe UI", 9, QFont.Weight.Bold))
         p.drawText(QRect(gx-18, gy-12, 36, 24), Qt.AlignmentFlag.AlignCenter, str(int(self.gas)))
-
-        # cập nhật style nút (cửa xanh khi MỞ)
-        self._color_button(self.btnLed,  self.led_on)
-        self._color_button(self.btnFan,  self.fan_on)
-        self._color_button(self.btnDoor, self.servo >= 90)
-        self._color_button(self.btnBuzz, self.buzzer_on)
-
-        # status panel
-        self.lblThermo.setText(self._thermo_text()); self.lblState.setText(self._state_text())
-        self.lblThermo.adjustSize(); self.lblState.adjustSize()
-        self.lblThermo.move(16, r.height()-self.lblThermo.height()-16)
-        self.lblState.move(self.lblThermo.x()+self.lblThermo.width()+10, self.lblThermo.y())
-
-    def _color_button(self, btn:QToolButton, on:bool):
-        btn.setStyleSheet("background:{}; border:1px solid #f59e0b; border-radius:12px; padding:6px 10px;"
-                          .format("#16a34a" if on else "rgba(255,255,255,0.85)"))
+        if t0: p.end(); H_PAINT_HOME.observe(time.perf_counter() - t0)
 
     def _thermo_text(self):
         t = f"{self.temp:.1f}" if self.temp is not None else "--"
@@ -403,23 +803,356 @@ class nhapromax(QFrame):
         if self.gas < self.thr_hi: return "Status: Warning"
         return "Status: DANGER!"
 
+# ---------- Khởi động nhanh: quét cổng nền + tab dựng khi cần ----------
+class PortScanner(QObject):
+    """Danh sách cổng cho GUI, giữ cập nhật bởi ports.PortWatcher (inotify trên /dev, không thì poll).
+
+    Main và HubPanel dùng chung một instance. scan() lần đầu khởi động watcher: quét đầy đủ comports()
+    trên thread của nó (không chặn cửa sổ), sau đó chỉ cắm/rút mới cập nhật. Signal phát trên GUI thread.
+    """
+    portsReady = pyqtSignal(list)      # tên cổng: sau mỗi lần quét và mỗi lần cắm/rút
+    portAdded = pyqtSignal(object)     # PortInfo vừa xuất hiện (auto-reconnect)
+    _changed = pyqtSignal(list, list)
+    def __init__(self, mode:str=PORT_WATCH, parent=None):
+        super().__init__(parent)
+        self.ports = None       # list[str] sau lần quét đầu
+        self.watcher = PortWatcher(self._changed.emit, mode)
+        self._changed.connect(self._apply)
+    def scan(self, force:bool=False):
+        if not self.watcher.running: self.watcher.start()
+        elif force: self.watcher.rescan()
+        elif self.ports is not None: self.portsReady.emit(list(self.ports))
+    def info(self, device:str) -> PortInfo|None: return self.watcher.ports.get(device)
+    def find(self, want:PortInfo|None, name:str) -> PortInfo|None: return find_port(self.watcher.ports.values(), want, name)
+    def stop(self): self.watcher.stop()
+    def _apply(self, added, removed):
+        self.ports = list(self.watcher.ports)
+        self.portsReady.emit(list(self.ports))
+        for p in added: self.portAdded.emit(p)
+
+class LazyTab(QWidget):
+    """Trang tab rỗng, gọi build() lần đầu được hiện (hoặc khi code cần tới widget())."""
+    def __init__(self, build, parent=None):
+        super().__init__(parent)
+        self._build = build; self._w = None
+        QVBoxLayout(self).setContentsMargins(0, 0, 0, 0)
+    @property
+    def built(self) -> bool: return self._w is not None
+    def widget(self) -> QWidget:
+        if self._w is None:
+            self._w = self._build(); self.layout().addWidget(self._w)
+        return self._w
+    def showEvent(self, e):
+        self.widget(); super().showEvent(e)
+
+def fill_ports(cb:QComboBox, ports):
+    """Thay danh sách cổng, giữ cổng đang chọn nếu vẫn còn."""
+    cur = cb.currentText(); cb.clear(); cb.addItems(ports)
+    i = cb.findText(cur)
+    if i >= 0: cb.setCurrentIndex(i)
+
+# ---------- Việc nặng ngoài GUI process (workers.py) ----------
+class JobRunner(QObject):
+    """workers.JobPool cho GUI: progress đọc từ slot shared memory theo timer, kết quả / lỗi / huỷ qua signal.
+
+    Pool (và import multiprocessing) chỉ được tạo khi có job đầu tiên. Signal phát trên GUI thread,
+    luôn ở vòng event loop sau (job xong ngay trong submit() cũng vậy), nên người gọi kịp ghi job id.
+    """
+    progress = pyqtSignal(int, float)
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+    _result = pyqtSignal(int, object, object)
+    def __init__(self, workers:int=0, parent=None):
+        super().__init__(parent)
+        from workers import JobPool, WORKERS
+        self.pool = JobPool(workers or WORKERS, on_done=self._result.emit)
+        self._result.connect(self._deliver, Qt.ConnectionType.QueuedConnection)
+        self._last = {}       # job đang chạy → progress đã phát
+        self.timer = QTimer(self); self.timer.setInterval(JOB_POLL_MS); self.timer.timeout.connect(self._poll)
+    def submit(self, fn, *args, **kw) -> int:
+        jid = self.pool.submit(fn, *args, **kw); self._last[jid] = 0.0
+        if not self.timer.isActive(): self.timer.start()
+        return jid
+    def cancel(self, jid:int) -> bool: return self.pool.cancel(jid)
+    def running(self) -> list: return self.pool.running()
+    def shutdown(self): self.timer.stop(); self.pool.shutdown()
+    def _deliver(self, jid, result, error):
+        from workers import Cancelled
+        if error is None: self.finished.emit(jid, result)
+        elif isinstance(error, Cancelled): self.cancelled.emit(jid)
+        else: self.failed.emit(jid, f"{type(error).__name__}: {error}")
+    def _poll(self):
+        for jid in list(self._last):
+            p = self.pool.progress(jid)
+            if p is None: del self._last[jid]
+            elif p != self._last[jid]: self._last[jid] = p; self.progress.emit(jid, p)
+        if not self._last: self.timer.stop()
+
+def bucket_label(width:float) -> str:
+    if not width: return "raw"
+    width = int(width)
+    return f"{width} s" if width < 60 else (f"{width // 60} min" if width < 3600 else f"{width // 3600} h")
+
+# ---------- Multi-device hub (tab "Devices") ----------
+HUB_COLUMNS = (("Device", None), ("Gas", "gas"), ("Temp °C", "temperature"), ("Humi %", "humidity"),
+               ("Dist", "distance"), ("LED", "led"), ("Fan", "fan"), ("Servo", "servo"), ("Alarm", "alarm"),
+               ("Frames/s", None), ("Dropped", None))
+
+class DeviceTableModel(QAbstractTableModel):
+    """Overview grid: một dòng mỗi board, chỉ báo dataChanged cho dòng có `version` đổi."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.devs = []; self._seen = []; self._rate = {}; self._rate_at = (0.0, {})
+        self._alarm = QBrush(QColor("#7f1d1d")); self._error = QBrush(QColor("#334155"))
+    def set_devices(self, devs):
+        self.beginResetModel()
+        self.devs = list(devs); self._seen = [-1] * len(self.devs)
+        self.endResetModel()
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.devs)
+    def columnCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(HUB_COLUMNS)
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return HUB_COLUMNS[section][0]
+        return None
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        dev = self.devs[index.row()]; st = dev.latest; col = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 0: return dev.name + (f"  ({dev.error})" if dev.error else "")
+            if col == 9: return f"{self._rate.get(dev.name, 0.0):.1f}"
+            if col == 10: return str(dev.seq.dropped)
+            v = None if st is None else getattr(st, HUB_COLUMNS[col][1])
+            if v is None: return ""
+            return f"{v:.1f}" if isinstance(v, float) else str(v)
+        if role == Qt.ItemDataRole.BackgroundRole:
+            if dev.error: return self._error
+            if st is not None and st.alarm: return self._alarm
+        return None
+    def refresh(self):
+        now = time.monotonic(); t0, prev = self._rate_at
+        if now - t0 >= 1.0:
+            cur = {d.name: d.frames for d in self.devs}
+            if t0: self._rate = {n: (c - prev.get(n, c)) / (now - t0) for n, c in cur.items()}
+            self._rate_at = (now, cur); self._seen = [-1] * len(self.devs)   # cột Frames/s đổi
+        last = len(HUB_COLUMNS) - 1
+        for row, dev in enumerate(self.devs):
+            if dev.version != self._seen[row]:
+                self._seen[row] = dev.version
+                self.dataChanged.emit(self.index(row, 0), self.index(row, last))
+
+class HubPanel(QWidget):
+    """Tab "Devices": N board qua một DeviceHub (một I/O thread), bảng tổng quan + chi tiết board đang chọn."""
+    def __init__(self, busy_port=None, ports:PortScanner|None=None, parent=None):
+        super().__init__(parent)
+        self.hub = None; self.busy_port = busy_port or (lambda: None)
+        self.ports = ports or PortScanner(parent=self)
+        root = QVBoxLayout(self)
+        top = QHBoxLayout()
+        self.cbPort = QComboBox(); self.cbPort.setEditable(True)
+        self.btnScan = QPushButton("Scan"); self.btnAdd = QPushButton("Add")
+        self.btnAddAll = QPushButton("Add all"); self.btnRemove = QPushButton("Remove")
+        self.lblHub = QLabel("0 devices")
+        top.addWidget(QLabel("Port:")); top.addWidget(self.cbPort, 1)
+        for b in (self.btnScan, self.btnAdd, self.btnAddAll, self.btnRemove): top.addWidget(b)
+        top.addWidget(self.lblHub)
+        root.addLayout(top)
+
+        self.model = DeviceTableModel(self)
+        self.table = QTableView(); self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        root.addWidget(self.table, 1)
+
+        det = QHBoxLayout()
+        self.cbDevice = QComboBox()
+        self.spLo = QSpinBox(); self.spLo.setRange(0, 1023); self.spLo.setValue(380)
+        self.spHi = QSpinBox(); self.spHi.setRange(0, 1023); self.spHi.setValue(450)
+        self.btnThr = QPushButton("Apply Thr")
+        self.spStream = QSpinBox(); self.spStream.setRange(0, 100); self.spStream.setSpecialValueText("Poll")
+        self.btnLed = QPushButton("LED"); self.btnFan = QPushButton("Fan"); self.btnServo = QPushButton("Servo 0↔90")
+        det.addWidget(QLabel("Device:")); det.addWidget(self.cbDevice, 1)
+        det.addWidget(QLabel("THR LOW:")); det.addWidget(self.spLo); det.addWidget(QLabel("HIGH:")); det.addWidget(self.spHi)
+        det.addWidget(self.btnThr); det.addWidget(QLabel("Stream (Hz):")); det.addWidget(self.spStream)
+        for b in (self.btnLed, self.btnFan, self.btnServo): det.addWidget(b)
+        root.addLayout(det)
+        self.canvas = GasCanvas(); root.addWidget(self.canvas)
+
+        self.timer = QTimer(self); self.timer.setInterval(max(1, round(1000 / max(1, UI_FPS))))
+        self.timer.timeout.connect(self.refresh)
+        self.btnScan.clicked.connect(self.scan_ports)
+        self.ports.portsReady.connect(lambda ports: fill_ports(self.cbPort, ports))
+        self.btnAdd.clicked.connect(lambda: self.add_port(self.cbPort.currentText().strip()))
+        self.btnAddAll.clicked.connect(self.add_all)
+        self.btnRemove.clicked.connect(self.remove_current)
+        self.cbDevice.currentIndexChanged.connect(self._select)
+        self.table.clicked.connect(lambda idx: self.cbDevice.setCurrentIndex(idx.row()))
+        self.btnThr.clicked.connect(self.apply_thr)
+        self.spStream.valueChanged.connect(lambda hz: self._do(lambda n: self.hub.set_stream(n, hz)))
+        self.btnLed.clicked.connect(lambda: self._toggle("LED", "led", 1))
+        self.btnFan.clicked.connect(lambda: self._toggle("FAN", "fan", 1))
+        self.btnServo.clicked.connect(lambda: self._toggle("SERVO", "servo", 90))
+        if self.ports.ports is None: self.ports.scan()
+        else: fill_ports(self.cbPort, self.ports.ports)     # Main đã quét lúc khởi động
+
+    def scan_ports(self):
+        self.ports.scan(force=True)
+    def current(self):
+        return self.model.devs[self.cbDevice.currentIndex()] if 0 <= self.cbDevice.currentIndex() < len(self.model.devs) else None
+    def add_port(self, port:str):
+        if not port: return
+        if self.hub is None:
+            self.hub = DeviceHub(AUTO_STATUS_MS / 1000.0, TX_INTERVAL_MS / 1000.0, on_sample=auto_alarm(
+                (f"FAN {ALARM_FAN}", f"SERVO {ALARM_SERVO}", "LED 1"),
+                (f"FAN {DEFAULT_FAN}", f"SERVO {DEFAULT_SERVO}", "LED 0"))).start()
+            self.timer.start()
+        if port == self.busy_port() or port in self.hub.devices: return
+        try: self.hub.open(port, DEFAULT_BAUD, threshold_low=self.spLo.value(), threshold_high=self.spHi.value(),
+                           dsp=DSP_ENABLED)
+        except Exception as e:
+            QMessageBox.warning(self, "Devices", f"Không mở được {port}:\n{e}"); return
+        self.hub.set_thresholds(port, self.spLo.value(), self.spHi.value())
+        self._sync()
+    def add_all(self):
+        for i in range(self.cbPort.count()): self.add_port(self.cbPort.itemText(i))
+    def remove_current(self):
+        dev = self.current()
+        if dev is None: return
+        self.hub.remove(dev.name); self._sync()
+    def _sync(self):
+        devs = list(self.hub.devices.values()); keep = self.current()
+        self.model.set_devices(devs)
+        self.cbDevice.blockSignals(True); self.cbDevice.clear(); self.cbDevice.addItems([d.name for d in devs])
+        self.cbDevice.setCurrentIndex(devs.index(keep) if keep in devs else len(devs) - 1)
+        self.cbDevice.blockSignals(False)
+        self.lblHub.setText(f"{len(devs)} devices"); self._select()
+    def _select(self, *_):
+        dev = self.current(); self.canvas.clear()
+        if dev is None: return
+        raw = dev.store.raw; n = len(raw)
+        gas = raw.slice("gas", max(0, n - self.canvas.history.cap), n)
+        self.canvas.extend([int(v) if v == v else v for v in gas])   # NaN = gap (ngắt nét); store không giữ gas_f
+        self.canvas.set_thresholds(dev.threshold_low, dev.threshold_high)
+        for sp, v in ((self.spLo, dev.threshold_low), (self.spHi, dev.threshold_high), (self.spStream, dev.stream_hz)):
+            sp.blockSignals(True); sp.setValue(v); sp.blockSignals(False)
+        self.table.selectRow(self.cbDevice.currentIndex())
+    def _do(self, fn):
+        dev = self.current()
+        if dev is not None and self.hub: fn(dev.name)
+    def _toggle(self, verb, field, on):
+        st = self.current() and self.current().latest
+        self._do(lambda n: self.hub.send(n, f"{verb} {0 if st and getattr(st, field) else on}"))
+    def apply_thr(self):
+        self._do(lambda n: self.hub.set_thresholds(n, self.spLo.value(), self.spHi.value()))
+        self.canvas.set_thresholds(self.spLo.value(), self.spHi.value())
+    def refresh(self):
+        sel = self.current()
+        for dev in self.model.devs:
+            batch = dev.status.drain()
+            if dev is sel:
+                for s in batch: self.canvas.push(s.gas, s.gas_f)
+        self.model.refresh()
+    def close_hub(self):
+        self.timer.stop()
+        if self.hub: self.hub.stop(); self.hub = None
+
+# ---------- Overlay metrics (F12) ----------
+class MetricsOverlay(QLabel):
+    """Bảng metrics bán trong suốt đè lên cửa sổ, không nhận chuột; refresh() theo perfTimer (1 Hz)."""
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.setObjectName("metricsOverlay")     # style: MAIN_QSS
+        self.setFont(QFont("monospace", 9)); self.hide()
+        self._last = {}; self._last_t = time.monotonic()
+    def refresh(self):
+        now = time.monotonic(); dt = max(1e-3, now - self._last_t); self._last_t = now
+        rows = []
+        for m in sorted(MET.items(), key=lambda m: (m.name, sorted(m.labels.items()))):
+            name = m.name.removeprefix("iot_") + (f"[{','.join(map(str, m.labels.values()))}]" if m.labels else "")
+            s = m.sample()
+            if m.kind == "histogram":
+                rows.append(f"{name:34s} n {s['count']:>8d}  p50 ≤{s['p50'] * 1e3:8.3f} ms  p99 ≤{s['p99'] * 1e3:8.3f} ms"
+                            f"  max {s['max'] * 1e3:8.3f} ms")
+            elif m.kind == "counter":
+                prev = self._last.get(name, s["value"]); self._last[name] = s["value"]
+                rows.append(f"{name:34s} {s['value']:>10d}  {(s['value'] - prev) / dt:10.1f}/s")
+            else:
+                rows.append(f"{name:34s} {s['value']:>10}")
+        self.setText("\n".join(rows)); self.adjustSize()
+        self.move(max(0, self.parentWidget().width() - self.width() - 12), 36); self.raise_()
+
 # ---------- Main Window ----------
+# Theme của cửa sổ chính: parse một lần khi tạo Main; widget chỉ đổi objectName / dynamic property (repolish)
+MAIN_QSS = """
+        QMainWindow{background:#0b1220;}
+        QLabel{color:#cbd5e1;}
+        QMenuBar{background:#0f172a; color:#e2e8f0;}
+        QMenuBar::item:selected{background:#1f2937;}
+        QGroupBox{border:1px solid #334155; border-radius:12px; margin-top:10px;}
+        QGroupBox::title{subcontrol-origin: margin; left:12px; padding:0 6px; color:#7dd3fc; font-weight:bold;}
+        QComboBox, QSpinBox, QLineEdit{background:#111827; color:#e2e8f0; border:1px solid #334155; border-radius:8px; padding:6px;}
+        QPushButton{padding:8px 14px; border-radius:10px; background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #06b6d4, stop:1 #3b82f6); color:white;}
+        QPushButton:hover{opacity:0.9;}
+        QCheckBox{color:#e2e8f0;}
+        QTextEdit, QListView{background:#0b1325; color:#e5e7eb; border:1px solid #334155; border-radius:8px; padding:6px;}
+        QTabBar::tab{padding:8px 16px;}
+        QLabel#big{font-size:20px; font-weight:800; color:#e2e8f0;}
+        QLabel#temp{color:#38bdf8; font-weight:600;}
+        QLabel#humid{color:#10b981; font-weight:600;}
+        QLabel#stat{color:red; font-weight:bold;}
+        QLabel#stat[link="up"]{color:lime;}
+        QLabel#stat[link="retry"]{color:orange;}
+        QLabel#banner{padding:10px; border-radius:12px; font-weight:bold; background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #0ea5e9, stop:1 #22d3ee); color:#081018;}
+        QLabel#banner[alarm="true"]{background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #f43f5e, stop:1 #ef4444); color:white;}
+        QPushButton#mapButton{padding:8px 12px; border-radius:10px; background:#334155; color:#e2e8f0;}
+        QLabel#metricsOverlay{background:rgba(2,6,23,0.85); color:#a7f3d0; border:1px solid #334155; border-radius:8px; padding:8px;}
+        """
+
 class Main(QMainWindow):
+    txSent = pyqtSignal(str)    # phát từ thread CommandWriter → slot chạy trên GUI thread
+    txError = pyqtSignal(str)
+    mqttCommand = pyqtSignal(str, str)    # (device, lệnh) từ thread MQTT → send() trên GUI thread
     def __init__(self):
         super().__init__()
         self.setWindowTitle("IoT Gas Dashboard (PyQt6) – Nha pRo mAx")
-        self.ser=None; self.reader=None
-        self._reset_done = False      # chống spam reset
-        self._alarm_applied = False   # chống spam bật khi >= THR LOW
+        self.setStyleSheet(MAIN_QSS)    # một sheet cho cả cửa sổ, đặt trước khi tạo con; trạng thái đổi qua repolish()
+        self.ser=None; self.reader=None; self.tx=None
+        self.remote = False           # True: nối qua API của daemon.py (ingest/auto/log chạy ở daemon)
+        self.seq = SeqTracker(); self._stream_hz = 0; self._last_frame = 0.0
+        self.frames = FrameCoalescer(UI_FPS, parent=self) if UI_FPS > 0 else None
+        self.samples = SamplePool(SAMPLE_POOL) if SAMPLE_POOL > 0 else None   # trả lại sau on_batch / _render
+        self.store = TimeSeriesStore()
+        self.tlog = TelemetryLog(LOG_DIR) if LOG_DIR else None   # IOT_LOG_DIR="" để tắt; start() ở _open (cổng local)
+        # auto/safety logic: chạy trên thread đọc (_on_frame), GUI chỉ đọc rules.active()
+        self.dsp = GasDsp() if DSP_ENABLED else None    # lọc trước rules, trên cùng thread đọc
+        self.rules = RulesEngine(default_rules(
+            380, RULE_HYST, RULE_DEBOUNCE, RULE_MIN_HOLD,
+            (f"FAN {ALARM_FAN}", f"SERVO {ALARM_SERVO}", "LED 1"),
+            (f"FAN {DEFAULT_FAN}", f"SERVO {DEFAULT_SERVO}", "LED 0"),
+            field="gas_pred" if self.dsp else "gas"))
+        self._dsp_flags = (0, 0)      # (warmup, gas_anomaly) của sample trước: log khi đổi
+        # trạng thái board: diff trên thread đọc (_on_frame), widget chỉ cập nhật nhóm field đổi (DeviceModel)
+        self.device = DeviceState(); self.model = DeviceModel(self); self._overruns = 0; self._thr_warned = None
+        self.mqtt = None; self._mqtt_dev = None     # MqttBridge: publish từ thread đọc chỉ xếp hàng, không chờ mạng
+        if MQTT_URL:
+            from mqtt import MqttBridge, parse_url
+            host, port, user, pw = parse_url(MQTT_URL)
+            self.mqtt = MqttBridge(host, port, user=user, password=pw, on_command=self.mqttCommand.emit).start()
 
         # Menus
         menu = self.menuBar()
         mFile = menu.addMenu("&File")
         actConnect = QAction("Connect", self); actDisconnect = QAction("Disconnect", self)
         actSaveLog = QAction("Save Log...", self); actQuit = QAction("Quit", self)
-        mFile.addActions([actConnect, actDisconnect, actSaveLog]); mFile.addSeparator(); mFile.addAction(actQuit)
+        actExport = QAction("Export Telemetry CSV...", self)
+        mFile.addActions([actConnect, actDisconnect, actSaveLog, actExport]); mFile.addSeparator(); mFile.addAction(actQuit)
         mView = menu.addMenu("&View")
         actLoadMap = QAction("Load Background Image…", self); mView.addAction(actLoadMap)
+        mTools = menu.addMenu("&Tools")
+        actAnalyze = QAction("Analyze GAS History", self); mTools.addAction(actAnalyze)
+        actTune = QAction("Tune Thresholds (what-if replay)", self); mTools.addAction(actTune)
         mHelp = menu.addMenu("&Help"); actAbout = QAction("About", self); mHelp.addAction(actAbout)
 
         tabs = QTabWidget(); self.setCentralWidget(tabs)
@@ -429,10 +1162,10 @@ class Main(QMainWindow):
         root = QVBoxLayout(dash)
 
         top = QHBoxLayout()
-        self.cbPort = QComboBox(); self.btnScan = QPushButton("Scan")
+        self.cbPort = QComboBox(); self.cbPort.setEditable(True); self.btnScan = QPushButton("Scan")
         self.lblBaud = QLabel(f"Baud {DEFAULT_BAUD}")
         self.btnConn = QPushButton("Connect"); self.btnDisc = QPushButton("Disconnect")
-        self.lblStat = QLabel("Disconnected"); self._stat("red")
+        self.lblStat = QLabel("Disconnected"); self.lblStat.setObjectName("stat")
         top.addWidget(QLabel("Port:")); top.addWidget(self.cbPort,1); top.addWidget(self.btnScan)
         top.addStretch(); top.addWidget(self.lblBaud); top.addStretch()
         top.addWidget(self.btnConn); top.addWidget(self.btnDisc); top.addWidget(self.lblStat)
@@ -441,8 +1174,7 @@ class Main(QMainWindow):
         grid = QGridLayout()
 
         # --- Gas & Distance ---
-        self.lblGas = QLabel("---");
-        self._big(self.lblGas)
+        self.lblGas = QLabel("---"); self.lblGas.setObjectName("big")
         self.lblDist = QLabel("--")
         grid.addWidget(QLabel("Gas (0..1023):"), 0, 0)
         grid.addWidget(self.lblGas, 0, 1)
@@ -450,12 +1182,8 @@ class Main(QMainWindow):
         grid.addWidget(self.lblDist, 0, 3)
 
         # --- Temperature & Humidity ---
-        self.lblTemp = QLabel("-- °C");
-        self._big(self.lblTemp)
-        self.lblHumid = QLabel("-- %");
-        self._big(self.lblHumid)
-        self.lblTemp.setStyleSheet("color:#38bdf8; font-weight:600;")
-        self.lblHumid.setStyleSheet("color:#10b981; font-weight:600;")
+        self.lblTemp = QLabel("-- °C"); self.lblTemp.setObjectName("temp")
+        self.lblHumid = QLabel("-- %"); self.lblHumid.setObjectName("humid")
         grid.addWidget(QLabel("Temperature:"), 1, 0)
         grid.addWidget(self.lblTemp, 1, 1)
         grid.addWidget(QLabel("Humidity:"), 1, 2)
@@ -475,6 +1203,14 @@ class Main(QMainWindow):
         grid.addWidget(self.spHi, 2, 3)
         grid.addWidget(self.btnApplyThr, 2, 4)
 
+        # --- Stream (push) ---
+        self.spStream = QSpinBox(); self.spStream.setRange(0, 100)
+        self.spStream.setSpecialValueText("Poll"); self.spStream.setValue(STREAM_HZ)
+        self.lblSeq = QLabel("")
+        grid.addWidget(QLabel("Stream (Hz):"), 3, 0)
+        grid.addWidget(self.spStream, 3, 1)
+        grid.addWidget(self.lblSeq, 3, 2, 1, 3)
+
         root.addLayout(grid)
         root.addSpacing(8)  # thêm khoảng trống giữa các phần
 
@@ -492,38 +1228,87 @@ class Main(QMainWindow):
         self.vServo = QLabel("")
         root.addLayout(act)
 
+        hist = QHBoxLayout()
+        self.cbRange = QComboBox()
+        for name, span in HISTORY_RANGES: self.cbRange.addItem(name, span)
+        hist.addWidget(QLabel("History:")); hist.addWidget(self.cbRange); hist.addStretch()
+        root.addLayout(hist)
         self.canvas = GasCanvas(); root.addWidget(self.canvas)
-        self.banner = QLabel("STATUS: NORMAL")
+        self.banner = QLabel("STATUS: NORMAL"); self.banner.setObjectName("banner"); self.banner.setProperty("alarm", False)
         self.banner.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.banner.setStyleSheet("padding:10px; border-radius:12px; font-weight:bold; background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #0ea5e9, stop:1 #22d3ee); color:#081018;")
         root.addWidget(self.banner)
         row = QHBoxLayout()
-        self.edCmd = QLineEdit(); self.edCmd.setPlaceholderText("Command: STATUS / LED 1 / FAN 1 / SERVO 90 ...")
+        self.edCmd = QLineEdit(); self.edCmd.setPlaceholderText("Command: STATUS / LED 1 / FAN 1 / SERVO 90 / STREAM 10 ...")
         self.btnSend = QPushButton("Send"); row.addWidget(self.edCmd,1); row.addWidget(self.btnSend)
         root.addLayout(row)
-        self.log = QTextEdit(); self.log.setReadOnly(True); self.log.setPlaceholderText("Serial log…")
+        logbar = QHBoxLayout()
+        self.cbLogFilter = QComboBox()
+        for name, kinds in LOG_FILTERS: self.cbLogFilter.addItem(name, kinds)
+        logbar.addWidget(QLabel("Serial log:")); logbar.addWidget(self.cbLogFilter); logbar.addStretch()
+        root.addLayout(logbar)
+        # spool chỉ phục vụ Save Log của phiên này (telemetry log mới là bản lưu lâu dài): thư mục tạm, xoá khi đóng
+        LogModel.sweep(tempfile.gettempdir())
+        spool = os.path.join(tempfile.gettempdir(), time.strftime(f"iot-serial-%Y%m%d-%H%M%S-{os.getpid()}.txt"))
+        self.logModel = LogModel(LOG_LINES, spool, self)
+        self.log = QListView(); self.log.setModel(self.logModel); self.log.setUniformItemSizes(True)
+        self.log.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.cbLogFilter.currentIndexChanged.connect(lambda _: self.logModel.set_filter(self.cbLogFilter.currentData()))
+        self._log_pending = []
         root.addWidget(self.log,1)
 
 
-        tab = QWidget(); self.tab = nhapromax()
-        tabs.addTab(tab, "Nha pRo mAx")
-        kv = QVBoxLayout(tab); kv.addWidget(self.tab, 1)
-
-        bar = QHBoxLayout()
-        self.btnMapFan = QPushButton("Fan")
-        self.btnMapLed = QPushButton("LED 12V")
-        self.btnMapServo = QPushButton("Servo 0↔90")
-        self.btnLoadBg = QPushButton("Chọn ảnh nền…")
-        for b in (self.btnMapFan, self.btnMapLed, self.btnMapServo):
-            b.setStyleSheet("padding:8px 12px; border-radius:10px; background:#334155; color:#e2e8f0;")
-        bar.addWidget(self.btnMapFan); bar.addWidget(self.btnMapLed); bar.addWidget(self.btnMapServo)
-        bar.addStretch(); bar.addWidget(self.btnLoadBg)
-        kv.addLayout(bar)
+        # Tab 2/3 dựng lần đầu được mở (hoặc khi code cần self.hubPanel / self.tab)
+        self.ports = PortScanner(parent=self)
+        self._hub = None; self._home = None; self._last_st = None
+        self.devTab = LazyTab(self._build_devices); tabs.addTab(self.devTab, "Devices")
+        self.homeTab = LazyTab(self._build_home); tabs.addTab(self.homeTab, "Nha pRo mAx")
 
         # Timer + shortcuts
         self.timer = QTimer(self); self.timer.setInterval(AUTO_STATUS_MS); self.timer.timeout.connect(self.tick)
+        self.streamWatch = QTimer(self); self.streamWatch.setInterval(250); self.streamWatch.timeout.connect(self._check_stream)
+        self.histTimer = QTimer(self); self.histTimer.setInterval(1000); self.histTimer.timeout.connect(self.refresh_history_view)
+        # auto-reconnect: _link = (port, PortInfo|None) giữ qua lúc mất cổng; None = người dùng đã Disconnect
+        self._link = None; self._lost_at = 0.0; self._attempts = 0
+        self.reconnects = 0; self._last_reconnect = 0.0
+        self.backoff = Backoff(RECONNECT_MIN_S, RECONNECT_MAX)
+        self.reconnTimer = QTimer(self); self.reconnTimer.setSingleShot(True); self.reconnTimer.timeout.connect(self._try_reconnect)
+        self._known_ports = None; self._scan_log = False
+        self.lblPerf = QLabel(""); self.statusBar().addPermanentWidget(self.lblPerf)
+        # job ở process pool (Tools, Export): thanh tiến trình + nút huỷ, ẩn khi không có job
+        self._jobs = None; self._job_info = {}      # job id → (nhãn, on_result, cleanup, t_submit)
+        self.jobBar = QProgressBar(); self.jobBar.setRange(0, 1000); self.jobBar.setMaximumWidth(220); self.jobBar.hide()
+        self.btnJobCancel = QToolButton(); self.btnJobCancel.setText("✕"); self.btnJobCancel.setToolTip("Cancel job")
+        self.btnJobCancel.hide(); self.btnJobCancel.clicked.connect(self.cancel_jobs)
+        self.statusBar().addPermanentWidget(self.jobBar); self.statusBar().addPermanentWidget(self.btnJobCancel)
+        self._perf_last = (0, 0)
+        self.perfTimer = QTimer(self); self.perfTimer.setInterval(1000); self.perfTimer.timeout.connect(self._update_perf)
+        self.metricsOverlay = MetricsOverlay(self)
+        MET.gauge("iot_tx_queue_depth", "commands waiting in CommandWriter", fn=lambda: self.tx.depth if self.tx else 0)
+        MET.gauge("iot_status_ring_overruns", "statuses lost because the GUI ring overflowed",
+                  fn=lambda: self.frames.status.overruns if self.frames else 0)
+        MET.gauge("iot_link_up", "1 while the serial link is open", fn=lambda: int(bool(self.ser and self.ser.is_open)))
+        MET.gauge("iot_widget_updates", "DeviceModel signals emitted (field groups redrawn)", fn=lambda: self.model.updates)
+        MET.gauge("iot_widget_updates_skipped", "field groups not redrawn because the board state did not change",
+                  fn=lambda: self.model.skipped)
+        MET.gauge("iot_commands_suppressed", "automatic commands not sent: board already in that state",
+                  fn=lambda: self.device.suppressed)
+        MET.gauge("iot_tx_sent", "commands written to the serial port", fn=lambda: self.tx.sent if self.tx else 0)
+        MET.gauge("iot_mqtt_queue_depth", "MQTT messages queued or awaiting PUBACK", fn=lambda: self.mqtt.depth if self.mqtt else 0)
+        MET.gauge("iot_mqtt_dropped", "MQTT messages dropped because the offline queue was full",
+                  fn=lambda: self.mqtt.dropped if self.mqtt else 0)
+        if METRICS_FILE or METRICS_PORT:
+            MET.on = True; MET.start_exporter(METRICS_FILE, METRICS_PORT)
+        if self.frames:
+            self.frames.batchReady.connect(self.on_batch)
+            self.frames.linesReady.connect(self.on_lines)
+            self.frames.start()
+        self.perfTimer.start()
+        self.txSent.connect(lambda cmd: self._append(f"» {cmd}", LOG_CMD))
+        self.txError.connect(lambda msg: self._append(msg, LOG_ERROR))
+        self.mqttCommand.connect(self._on_mqtt_command)
         QShortcut(QKeySequence("Ctrl+R"), self, activated=lambda: self.send("ALARM RESET"))
         QShortcut(QKeySequence("F5"), self, activated=lambda: self.send("STATUS"))
+        QShortcut(QKeySequence("F12"), self, activated=self.toggle_metrics)
 
         # Wiring
         self.btnScan.clicked.connect(self.scan_ports)
@@ -532,69 +1317,140 @@ class Main(QMainWindow):
         self.btnSend.clicked.connect(self.send_line); self.edCmd.returnPressed.connect(self.send_line)
 
         self.btnApplyThr.clicked.connect(self.apply_thr)
+        self.spLo.valueChanged.connect(lambda v: self.rules.set_threshold("gas_low", v))
+        self.spLo.valueChanged.connect(self._on_thr_edit); self.spHi.valueChanged.connect(self._on_thr_edit)
+        m = self.model
+        m.gasChanged.connect(lambda v: self.lblGas.setText(str(v)))
+        m.distanceChanged.connect(lambda v: self.lblDist.setText(str(v)))
+        m.climateChanged.connect(self._on_climate)
+        m.ledChanged.connect(lambda b: self._set_check(self.cbLed, b))
+        m.fanChanged.connect(lambda b: self._set_check(self.cbFan, b))
+        m.servoChanged.connect(self._on_servo)
+        m.thresholdsChanged.connect(self._on_board_thr)
+        self._on_thr_edit()
+        self.spStream.valueChanged.connect(lambda _: self.apply_stream())
+        self.cbRange.currentIndexChanged.connect(lambda _: self.refresh_history_view())
         self.cbLed.toggled.connect(lambda b: self.send(f"LED {1 if b else 0}"))
         self.cbFan.toggled.connect(lambda b: self.send(f"FAN {1 if b else 0}"))
 
         actConnect.triggered.connect(self.connect_serial)
         actDisconnect.triggered.connect(self.disconnect_serial)
         actSaveLog.triggered.connect(self.save_log)
+        actExport.triggered.connect(self.export_telemetry)
+        actAnalyze.triggered.connect(self.analyze_history)
+        actTune.triggered.connect(self.tune_thresholds)
         actQuit.triggered.connect(self.close)
         actLoadMap.triggered.connect(self.choose_bg)
-        self.btnLoadBg.clicked.connect(self.choose_bg)
-        self.btnMapFan.clicked.connect(lambda: self.send(f"FAN {0 if self.tab.fan_on else 1}"))
-        self.btnMapLed.clicked.connect(lambda: self.send(f"LED {0 if self.tab.led_on else 1}"))
-        self.btnMapServo.clicked.connect(lambda: self.send(f"SERVO {0 if self.tab.servo >= 90 else 90}"))
         actAbout.triggered.connect(self.show_about)
+        self.ports.portsReady.connect(self._on_ports)
+        self.ports.portAdded.connect(self._on_port_added)
+
+        QTimer.singleShot(0, self.ports.scan)   # sau khi cửa sổ hiện: comports() không chặn lần paint đầu
+
+    # lazy tabs
+    @property
+    def hubPanel(self) -> HubPanel: return self.devTab.widget()
+    @property
+    def tab(self) -> nhapromax:
+        self.homeTab.widget(); return self._home
+    def _build_devices(self):
+        self._hub = HubPanel(lambda: self.ser.port if self.ser and self.ser.is_open else None, self.ports)
+        return self._hub
+    def _build_home(self):
+        tab = QWidget(); self._home = home = nhapromax()
+        kv = QVBoxLayout(tab); kv.addWidget(home, 1)
 
-        self.tab.set_sender(self.send)  # bridge
-
-        self.scan_ports()
+        bar = QHBoxLayout()
+        self.btnMapFan = QPushButton("Fan")
+        self.btnMapLed = QPushButton("LED 12V")
+        self.btnMapServo = QPushButton("Servo 0↔90")
+        self.btnLoadBg = QPushButton("Chọn ảnh nền…")
+        for b in (self.btnMapFan, self.btnMapLed, self.btnMapServo): b.setObjectName("mapButton")
+        bar.addWidget(self.btnMapFan); bar.addWidget(self.btnMapLed); bar.addWidget(self.btnMapServo)
+        bar.addStretch(); bar.addWidget(self.btnLoadBg)
+        kv.addLayout(bar)
 
-        # Theme
-        self.setStyleSheet("""
-        QMainWindow{background:#0b1220;}
-        QLabel{color:#cbd5e1;}
-        QMenuBar{background:#0f172a; color:#e2e8f0;}
-        QMenuBar::item:selected{background:#1f2937;}
-        QGroupBox{border:1px solid #334155; border-radius:12px; margin-top:10px;}
-        QGroupBox::title{subcontrol-origin: margin; left:12px; padding:0 6px; color:#7dd3fc; font-weight:bold;}
-        QComboBox, QSpinBox, QLineEdit{background:#111827; color:#e2e8f0; border:1px solid #334155; border-radius:8px; padding:6px;}
-        QPushButton{padding:8px 14px; border-radius:10px; background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #06b6d4, stop:1 #3b82f6); color:white;}
-        QPushButton:hover{opacity:0.9;}
-        QCheckBox{color:#e2e8f0;}
-        QTextEdit{background:#0b1325; color:#e5e7eb; border:1px solid #334155; border-radius:8px; padding:6px;}
-        QTabBar::tab{padding:8px 16px;}
-        """)
+        self.btnLoadBg.clicked.connect(self.choose_bg)
+        self.btnMapFan.clicked.connect(lambda: self.send(f"FAN {0 if home.fan_on else 1}"))
+        self.btnMapLed.clicked.connect(lambda: self.send(f"LED {0 if home.led_on else 1}"))
+        self.btnMapServo.clicked.connect(lambda: self.send(f"SERVO {0 if home.servo >= 90 else 90}"))
+        home.set_sender(self.send)  # bridge
+        home.set_thresholds(self.spLo.value(), self.spHi.value())
+        if self._last_st: home.update_from_status(self._last_st)
+        m = self.model
+        m.gasChanged.connect(home.set_gas); m.climateChanged.connect(home.set_climate)
+        m.ledChanged.connect(home.set_led); m.fanChanged.connect(home.set_fan)
+        m.servoChanged.connect(home.set_servo); m.alarmChanged.connect(home.set_alarm)
+        return tab
 
     # helpers
-    def _big(self, w): w.setStyleSheet("font-size:20px; font-weight:800; color:#e2e8f0;")
-    def _stat(self, color): self.lblStat.setStyleSheet(f"color:{color}; font-weight:bold;")
-    def _append(self, t): self.log.append(t); self.log.moveCursor(self.log.textCursor().MoveOperation.End)
+    def _stat(self, link:str): repolish(self.lblStat, "link", link)     # "up" | "retry" | "down"
+    def _append(self, t, kind=LOG_INFO):
+        # gom mọi dòng trong cùng một vòng event loop thành một lần insert
+        if not self._log_pending: QTimer.singleShot(0, self._flush_log)
+        self._log_pending.append((kind, t))
+    def _flush_log(self):
+        items, self._log_pending = self._log_pending, []
+        sb = self.log.verticalScrollBar(); at_end = sb.value() >= sb.maximum() - 2
+        self.logModel.append_many(items)
+        if at_end: self.log.scrollToBottom()
 
     # serial
     def scan_ports(self):
-        self.cbPort.clear()
-        ports = [p.device for p in serial.tools.list_ports.comports()]
-        self.cbPort.addItems(ports); self._append(f"Found ports: {ports or 'None'}")
+        self._scan_log = True; self.ports.scan(force=True)
+    def _on_ports(self, ports):
+        fill_ports(self.cbPort, ports + ([API_URL] if API_URL else []))
+        known, self._known_ports = self._known_ports, set(ports)
+        if known is None or self._scan_log:     # quét đầy đủ (khởi động / nút Scan): in cả danh sách
+            self._scan_log = False; self._append(f"Found ports: {ports or 'None'}"); return
+        for d in sorted(self._known_ports - known):
+            info = self.ports.info(d)
+            self._append(f"Port added: {d}" + (f" ({info.usb_id} {info.description})" if info and info.usb_id else ""))
+        for d in sorted(known - self._known_ports): self._append(f"Port removed: {d}")
     def connect_serial(self):
         if hasattr(self,"ser") and self.ser and self.ser.is_open: return
-        port = self.cbPort.currentText()
+        port = self.cbPort.currentText().strip()
         if not port: QMessageBox.warning(self,"Port","Did not choose COM port yet!"); return
-        try:
-            self.ser = serial.Serial(port, DEFAULT_BAUD, timeout=0.1)
-            self.reader = SerialReader(self.ser)
-            self.reader.lineReceived.connect(self.on_line)
-            self.reader.statusParsed.connect(self.on_status)
-            self.reader.start()
-            self._append(f"Connected {port} @ {DEFAULT_BAUD}")
-            self.lblStat.setText("Connected"); self._stat("lime")
-            self.timer.start()
-            self.apply_thr(); self.send("STATUS")
-
+        self.reconnTimer.stop(); self._link = None
+        try: self._open(port)
         except Exception as e:
-            QMessageBox.critical(self, "Serial", f"Không mở được {port}:\n{e}")
+            self._close_port(); self.lblStat.setText("Disconnected"); self._stat("down")
+            QMessageBox.critical(self, "Serial", f"Không mở được {port}:\n{e}"); return
+        self._link = (port, self.ports.info(port))
+    def _open(self, port:str):
+        """Mở cổng + writer + reader rồi đẩy lại cấu hình (ngưỡng, PROTO, STREAM): dùng cho connect lẫn reconnect."""
+        self.remote = port.startswith("ws://")
+        if self.remote: from daemon import ApiLink     # asyncio/websocket: chỉ import khi dùng
+        self.ser = ApiLink(port) if self.remote else serial.Serial(port, DEFAULT_BAUD, timeout=0.1)
+        self.tx = CommandWriter(self.ser, TX_INTERVAL_MS / 1000.0, TX_WAIT_ACK,
+                                on_sent=self._on_tx_sent, on_error=self.txError.emit).start()
+        self.reader = make_reader(self.ser, sink=self.frames, pool=self.samples)
+        self.reader.on_frame = self._on_frame; self._mqtt_dev = port
+        self.rules.reset(); self.device.reset(); self.model.invalidate(CH_ALL)
+        if self.dsp: self.dsp.reset()
+        self._dsp_flags = (0, 0)
+        self.reader.lineReceived.connect(self.on_line)
+        self.reader.statusParsed.connect(self.on_status)
+        self.reader.errorRaised.connect(lambda msg: self._append(msg, LOG_ERROR))
+        self.reader.linkLost.connect(self._on_link_lost)
+        self.reader.start()
+        self._append(f"Connected {port} @ {DEFAULT_BAUD} ({type(self.reader).__name__})")
+        if self.tlog and not self.remote and not self.tlog.running:    # remote: daemon giữ log của nó
+            try: self.tlog.start()
+            except LogLocked as e: self._append(f"Telemetry log off: {e}", LOG_ERROR)
+        self.lblStat.setText("Connected"); self._stat("up")
+        self.seq = SeqTracker(); self._stream_hz = 0
+        self.apply_thr()
+        self.send("PROTO BIN" if PROTOCOL == "BIN" and not self.remote else "STATUS")
+        self.apply_stream()
     def disconnect_serial(self):
-        self.timer.stop()
+        self._link = None; self.reconnTimer.stop()
+        self._close_port()
+        self.lblStat.setText("Disconnected"); self._stat("down"); self._append("Disconnected.")
+    def _close_port(self):
+        self.timer.stop(); self.streamWatch.stop()
+        if self.tx:
+            self.tx.stop(); self.tx = None
         if hasattr(self,"reader") and self.reader:
             try: self.reader.stop(); self.reader.wait(200)
             except: pass
@@ -603,7 +1459,46 @@ class Main(QMainWindow):
             try: self.ser.close()
             except: pass
             self.ser=None
-        self.lblStat.setText("Disconnected"); self._stat("red"); self._append("Disconnected.")
+
+    # auto-reconnect
+    def _on_link_lost(self, msg:str):
+        """Reader chết vì lỗi cổng: đóng sạch, đánh dấu gap trong history, nối lại với backoff."""
+        if self._link is None or self.reader is None or self.sender() is not self.reader: return
+        port = self._link[0]; t = time.time()
+        self._close_port()
+        self.store.add_gap(t); self.canvas.push_gap()
+        if self.tlog and not self.remote: self.tlog.append_command("#LINK DOWN", t)
+        if not RECONNECT:
+            self._link = None; self.lblStat.setText("Disconnected"); self._stat("down"); return
+        self._lost_at = time.monotonic(); self._attempts = 0; self.backoff.reset()
+        self.lblStat.setText("Reconnecting…"); self._stat("retry")
+        self._append(f"Lost {port}: reconnecting (backoff {RECONNECT_MIN_S:g}…{RECONNECT_MAX:g} s)", LOG_ERROR)
+        self.reconnTimer.start(int(self.backoff.next() * 1000))
+    def _try_reconnect(self):
+        if self._link is None or (self.ser and self.ser.is_open): return
+        port, want = self._link
+        found = None if self.remote else self.ports.find(want, port)
+        target = found.device if found else port      # board USB có thể quay lại với tên khác (ttyUSB0 → ttyUSB1)
+        self._attempts += 1
+        try: self._open(target)
+        except Exception as e:
+            self._close_port()
+            delay = self.backoff.next()
+            self.lblStat.setText(f"Reconnecting… ({self._attempts})")
+            self._append(f"Reconnect {target} failed: {e} (retry in {delay:.1f} s)", LOG_ERROR)
+            self.reconnTimer.start(int(delay * 1000)); return
+        dt = time.monotonic() - self._lost_at
+        self._link = (target, self.ports.info(target) or want)
+        self.reconnects += 1; self._last_reconnect = dt
+        if MET.on: M_RECONNECTS.inc(); H_RECONNECT.observe(dt)
+        if self.tlog and not self.remote: self.tlog.append_command(f"#LINK UP {dt:.2f}s")
+        self._append(f"Reconnected {target} after {dt:.2f} s ({self._attempts} attempts)")
+    def _on_port_added(self, info:PortInfo):
+        """Board cắm lại trong lúc chờ: thử ngay (backoff về mức nhỏ nhất) thay vì đợi hết lượt."""
+        if self._link is None or (self.ser and self.ser.is_open) or self.remote: return
+        port, want = self._link
+        if info.device == port or (want is not None and want.same_board(info)):
+            self.reconnTimer.stop(); self.backoff.reset(); self._try_reconnect()
     def send(self, cmd:str):
         # Ép SERVO về 0 hoặc 90 để tránh giá trị trung gian
         if cmd.upper().startswith("SERVO"):
@@ -618,132 +1513,312 @@ class Main(QMainWindow):
 
             except:
                 pass
-        if hasattr(self,"ser") and self.ser and self.ser.is_open:
-            try: self.ser.write((cmd+"\n").encode("utf-8"))
-            except Exception as e: self._append(f"Send error: {e}")
+        if self.tx and self.ser and self.ser.is_open:
+            self.tx.send(cmd)    # không chặn GUI: thread CommandWriter ghi, log "» cmd" qua txSent
+            # lệnh tay: widget đã đổi trước khi board xác nhận → vẽ lại nhóm đó từ sample kế tiếp
+            self.model.invalidate(self.device.note(cmd, time.time()))
         else:
-            self._append(f"(not connected) {cmd}")
+            self._append(f"(not connected) {cmd}", LOG_CMD)
 
     # slots
-    def on_line(self, line:str): self._append(line)
-
-    def on_status(self, st: dict):
-        gas = st.get("gas")
-        self.lblGas.setText("" if gas is None else str(gas))
-        dist = st.get("distance")
-        self.lblDist.setText("" if dist is None else str(dist))
-        if gas is not None:
-            self.canvas.push(gas)
-        temp = st.get("temperature")
-        humid = st.get("humidity")
-        if temp is not None:
-            self.lblTemp.setText(f"{float(temp):.1f} °C")
-        if humid is not None:
-            self.lblHumid.setText(f"{float(humid):.0f} %")
+    def on_line(self, line:str): self._append(line, LOG_JSON if "{" in line else LOG_TEXT)
+    def on_lines(self, lines:list):
+        for line in lines: self.on_line(line)
+    def _on_frame(self, st:StatusSample, t_rx:float):
+        """Thread đọc: ack cho CommandWriter + DSP + rules engine ngay trên frame vừa decode (không chờ GUI)."""
+        changed = self.device.apply(st)     # st.changed = nhóm field khác sample trước
+        if not STATE_DIFF: st.changed = CH_ALL
+        tx = self.tx
+        if tx is None: return
+        tx.ack(st.mode)
+        if self.remote: return      # daemon chạy DSP + rules (field gas_f/... có sẵn trong frame)
+        now = time.time()
+        if self.dsp: self.dsp.process(st, now)
+        m = self.mqtt
+        if m is not None:
+            m.publish_status(self._mqtt_dev, st, now)
+            if changed: m.publish_state(self._mqtt_dev, st, changed)
+        for c in self.rules.evaluate(st, now):
+            if not STATE_DIFF or self.device.wanted(c, now): tx.send(c, t_rx)    # board đã ở trạng thái đó → bỏ
+    def _on_tx_sent(self, cmd:str):
+        """Chạy trên thread CommandWriter sau khi lệnh đã ghi xong."""
+        if self.tlog and not self.remote: self.tlog.append_command(cmd)
+        if self.mqtt is not None and not self.remote: self.mqtt.publish_command(self._mqtt_dev, cmd)
+        self.txSent.emit(cmd)
+    def _on_mqtt_command(self, dev:str, cmd:str):
+        """Lệnh từ <prefix>/<device>/cmd: chỉ nhận cho board đang nối và verb firmware hiểu (như API của daemon)."""
+        from daemon import COMMANDS
+        from mqtt import topic_slug
+        if not (self.ser and self.ser.is_open and self._mqtt_dev) or dev != topic_slug(self._mqtt_dev): return
+        if cmd.split()[0].upper() not in COMMANDS: self._append(f"MQTT: unknown command {cmd!r}", LOG_ERROR); return
+        self._append(f"MQTT « {cmd}", LOG_CMD); self.send(cmd)
+    def _update_perf(self):
+        parts = []
+        if self.frames:
+            rx, rendered = self.frames.received, self.frames.rendered
+            prx, pren = self._perf_last; self._perf_last = (rx, rendered)
+            parts.append(f"frames rx {rx - prx}/s · rendered {rendered - pren}/s · "
+                         f"total {rx}/{rendered} · overruns {self.frames.status.overruns}")
+        if self.tx:
+            t = self.tx.stats()
+            parts.append(f"tx q {t['depth']} (max {t['max_depth']}) · sent {t['sent']} · merged {t['superseded']} · "
+                         f"lat p50 {t['latency_p50_ms']:.1f} / p99 {t['latency_p99_ms']:.1f} ms · "
+                         f"frame→cmd p50 {t['reaction_p50_ms']:.1f} / p99 {t['reaction_p99_ms']:.1f} ms")
+        if self.model.renders:
+            parts.append(f"widgets {self.model.updates} updated / {self.model.skipped} skipped · "
+                         f"cmds suppressed {self.device.suppressed}")
+        if self.mqtt is not None:
+            m = self.mqtt
+            parts.append(f"mqtt {'up' if m.connected else 'down'} · q {m.depth} · sent {m.published} · dropped {m.dropped}")
+        if self.reconnects:
+            parts.append(f"reconnects {self.reconnects} · last {self._last_reconnect:.2f} s")
+        self.lblPerf.setText(" | ".join(parts))
+        if self.metricsOverlay.isVisible(): self.metricsOverlay.refresh()
+    def toggle_metrics(self):
+        """F12: hiện overlay (và bật thu thập); ẩn thì tắt lại trừ khi IOT_METRICS / exporter đang bật."""
+        if self.metricsOverlay.isVisible():
+            self.metricsOverlay.hide(); MET.on = METRICS_ENABLED or bool(METRICS_FILE or METRICS_PORT)
+        else:
+            MET.on = True; self.metricsOverlay.refresh(); self.metricsOverlay.show()
+
+    def on_status(self, st: StatusSample, mask:int=0):
+        if st.changed is None: mask = CH_ALL      # sample không qua DeviceState (statusParsed, API): vẽ hết
+        else: mask |= st.changed
+        if MET.on:
+            t0 = time.perf_counter()
+            if st.t_rx is not None: H_QUEUE.observe(t0 - st.t_rx)
+            self._render(st, mask); self._ingest(st)
+            H_STATUS.observe(time.perf_counter() - t0); return
+        self._render(st, mask); self._ingest(st)
+
+    def on_batch(self, batch: list):
+        """Coalesced path: sample cũ chỉ vào history + auto logic, widget chỉ vẽ sample mới nhất."""
+        old = batch[:-1]; mask = 0
+        if MET.on:
+            now = time.perf_counter()
+            for st in old:
+                if st.t_rx is not None: H_QUEUE.observe(now - st.t_rx)
+        for st in old:
+            self._ingest(st); mask |= CH_ALL if st.changed is None else st.changed     # đổi giữa lô vẫn phải vẽ
+        overruns = self.frames.status.overruns if self.frames else 0
+        if overruns != self._overruns: self._overruns = overruns; mask = CH_ALL   # ring tràn: mất sample → vẽ hết
+        self.on_status(batch[-1], mask)
+        if self.samples is not None:
+            for st in old: self.samples.release(st)
+
+    def _render(self, st: StatusSample, mask:int=CH_ALL):
+        """Widget chỉ nhận nhóm field trong mask (DeviceModel → slot); banner phụ thuộc cả rules nên luôn cập nhật."""
+        self.model.apply(st, mask)
+        self.set_banner(bool(st.alarm) or self.rules.active("gas_low"))
+        prev = self._last_st; self._last_st = st
+        if self.samples is not None and prev is not None and prev is not st: self.samples.release(prev)
+    # slot của DeviceModel
+    def _set_check(self, cb:QCheckBox, on:bool):
+        cb.blockSignals(True); cb.setChecked(on); cb.blockSignals(False)
+    def _on_climate(self, temp, humid):
+        if temp is not None: self.lblTemp.setText(f"{temp:.1f} °C")
+        if humid is not None: self.lblHumid.setText(f"{humid:.0f} %")
+    def _on_servo(self, v:int):
+        if self.sServo:
+            self.sServo.blockSignals(True); self.sServo.setValue(v); self.sServo.blockSignals(False)
+        self.vServo.setText(f"{v}°")
+    def _on_board_thr(self, lo:int, hi:int):
+        if (lo, hi) != (self.spLo.value(), self.spHi.value()) and (lo, hi) != self._thr_warned:
+            self._thr_warned = (lo, hi)
+            self._append(f"Board thresholds {lo}/{hi} differ from {self.spLo.value()}/{self.spHi.value()} (Apply to sync)")
+    def _on_thr_edit(self, _=None):
         self.canvas.set_thresholds(self.spLo.value(), self.spHi.value())
-
-        # update LED/FAN/SERVO
-        if st.get("led") is not None:
-            self.cbLed.blockSignals(True)
-            self.cbLed.setChecked(bool(int(st["led"])))
-            self.cbLed.blockSignals(False)
-        if st.get("fan") is not None:
-            self.cbFan.blockSignals(True)
-            self.cbFan.setChecked(bool(int(st["fan"])))
-            self.cbFan.blockSignals(False)
-        if st.get("servo") is not None:
-            v = int(st["servo"])
-            if self.sServo:
-                self.sServo.blockSignals(True)
-                self.sServo.setValue(v)
-                self.sServo.blockSignals(False)
-            self.vServo.setText(f"{v}°")
-
-
-        alarm = bool(st.get("alarm", 0))  # nhận từ Arduino (gas >= thrHigh)
-        self.set_banner(alarm)
-        self.tab.update_from_status(st)
-        self.tab.set_thresholds(self.spLo.value(), self.spHi.value())
-
-        # chỉ gửi lệnh nếu có thay đổi trạng thái
-        if not hasattr(self, "_prev_alarm") or self._prev_alarm != alarm:
-            self._prev_alarm = alarm
-            self.send(f"ALARM {1 if alarm else 0}")
-
-        # ======= AUTO bán phần =======
-        try:
-            if gas is None:
-                return
-            g = int(gas)
-            lo = int(self.spLo.value())
-            if g >= lo:
-                # phát hiện khói => AUTO tạm thời
-                self._apply_alarm_low_only()
-                self._auto_override = True
-            else:
-                # hết khói => trả quyền manual
-                if getattr(self, "_auto_override", False):
-                    self._ensure_defaults()
-                    self._auto_override = False
-        except Exception as e:
-            print("Auto logic error:", e)
-
-    def _ensure_defaults(self):
-        """Khi gas an toàn lại thì trả về mặc định."""
-        self.send(f"FAN {DEFAULT_FAN}")
-        self.send(f"SERVO {DEFAULT_SERVO}")
-        self.send("LED 0")  # tắt đèn
-        self.send("ALARM 0")  # tắt còi
-        self.set_banner(False)
-        self._auto_applied = False
-
-    def _apply_alarm_low_only(self):
-        """Tự động bật fan + mở cửa + đèn + còi khi phát hiện khí gas."""
-        if getattr(self, "_auto_applied", False):
-            return
-        self.send(f"FAN {ALARM_FAN}")  # bật quạt
-        self.send(f"SERVO {ALARM_SERVO}")  # mở cửa
-        self.send("LED 1")  # bật LED cảnh báo
-        self.send("ALARM 1")  # bật còi buzzer
-        self._auto_applied = True
-        self.set_banner(True)
+        if self._home: self._home.set_thresholds(self.spLo.value(), self.spHi.value())
+
+    def _ingest(self, st: StatusSample):
+        """History + log: chạy cho MỌI sample, kể cả khi GUI gom frame (auto logic: _on_frame)."""
+        self._last_frame = time.monotonic()
+        if st.seq is not None:
+            late = self.seq.late
+            missed = self.seq.update(st.seq)
+            if missed and MET.on: M_DROPPED.inc(missed)
+            if missed or self.seq.late != late:
+                self.lblSeq.setText(f"seq: {self.seq.received} ok / {self.seq.dropped} dropped / {self.seq.late} late")
+        self.store.append(st)
+        self.canvas.push(st.gas, st.gas_f)
+        flags = (st.warmup or 0, st.gas_anomaly or 0)
+        if flags != self._dsp_flags:
+            if flags[0] != self._dsp_flags[0]:
+                self._append("MQ-2 warming up: auto logic uses the filtered reading" if flags[0] else "MQ-2 warmed up")
+            if flags[1] and not self._dsp_flags[1]:
+                self._append(f"Gas anomaly: {st.gas} (z={st.gas_z or 0.0:.1f})", LOG_ERROR)
+            self._dsp_flags = flags
+        if self.remote: return      # daemon đã ghi log
+        if self.tlog and self.tlog.running: self.tlog.append_status(st)
 
     def set_banner(self, alarm_on:bool):
-        if alarm_on:
-            self.banner.setText("STATUS: ALARM")
-            self.banner.setStyleSheet("padding:10px; border-radius:12px; font-weight:bold; background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #f43f5e, stop:1 #ef4444); color:white;")
-        else:
-            self.banner.setText("STATUS: NORMAL")
-            self.banner.setStyleSheet("padding:10px; border-radius:12px; font-weight:bold; background:qlineargradient(x1:0,y1:0,x2:1,y2:0, stop:0 #0ea5e9, stop:1 #22d3ee); color:#081018;")
+        if repolish(self.banner, "alarm", alarm_on):
+            self.banner.setText("STATUS: ALARM" if alarm_on else "STATUS: NORMAL")
     def choose_bg(self):
         path, _ = QFileDialog.getOpenFileName(self, "Chọn ảnh nền", "", "Images (*.png *.jpg *.jpeg)")
         if path: self.tab.load_background(path)
     def tick(self):
         # luôn hỏi STATUS
         self.send("STATUS")
+    def refresh_history_view(self):
+        """Zoom đồ thị GAS qua các tier của TimeSeriesStore (không tổng hợp lại từ raw)."""
+        span = self.cbRange.currentData()
+        if not span:
+            self.histTimer.stop(); self.canvas.set_view(None); return
+        now = time.time()
+        ys, width = self.store.envelope("gas", now - span, now, max(100, self.canvas.width()))
+        self.canvas.set_view(ys, f"GAS {self.cbRange.currentText()} ({bucket_label(width)} buckets)")
+        self.histTimer.start()
+    def apply_stream(self):
+        """STREAM <hz>: board tự đẩy status, tắt polling; 0 = polling STATUS như cũ."""
+        hz, was = int(self.spStream.value()), self._stream_hz
+        self._stream_hz = hz; self._last_frame = time.monotonic()
+        if not (self.ser and self.ser.is_open): return
+        if hz or was: self.send(f"STREAM {hz}")
+        if hz: self.timer.stop(); self.streamWatch.start()
+        else: self.streamWatch.stop(); self.timer.start()
+    def _check_stream(self):
+        if self._stream_hz <= 0: return
+        stall = max(STREAM_STALL_MIN_S, STREAM_STALL_PERIODS / self._stream_hz)
+        if time.monotonic() - self._last_frame > stall:
+            self._append(f"Stream stalled ({stall:.1f}s without frames) → polling STATUS", LOG_ERROR)
+            self._stream_hz = 0; self.streamWatch.stop(); self.timer.start()
     def send_line(self):
         cmd = self.edCmd.text().strip()
         if cmd: self.send(cmd); self.edCmd.clear()
     def apply_thr(self):
-        self.send(f"THRLO {int(self.spLo.value())}"); self.send(f"THRHI {int(self.spHi.value())}")
-        self.canvas.set_thresholds(self.spLo.value(), self.spHi.value()); self.tab.set_thresholds(self.spLo.value(), self.spHi.value())
+        """Chỉ gửi ngưỡng board chưa có (mỗi lần kết nối DeviceState reset nên luôn gửi lần đầu)."""
+        now = time.time(); sent = 0
+        for cmd in (f"THRLO {int(self.spLo.value())}", f"THRHI {int(self.spHi.value())}"):
+            if not STATE_DIFF or self.device.wanted(cmd, now): self.send(cmd); sent += 1
+        if not sent: self._append("Thresholds already applied on the board")
     def save_log(self):
         path, _ = QFileDialog.getSaveFileName(self, "Save Log", "serial_log.txt", "Text (*.txt)")
         if path:
-            with open(path,"w",encoding="utf-8") as f: f.write(self.log.toPlainText())
-            QMessageBox.information(self,"Saved","Đã lưu log.")
+            dropped = self.logModel.save(path)
+            if dropped:
+                QMessageBox.warning(self, "Saved", f"Đã lưu log, nhưng {dropped} dòng đầu phiên đã bị bỏ "
+                                    f"(giới hạn spool IOT_LOG_SPOOL_MB); file bắt đầu bằng một dòng ghi chú.")
+            else:
+                QMessageBox.information(self,"Saved","Đã lưu log.")
+    def export_telemetry(self):
+        if not self.tlog: QMessageBox.information(self, "Telemetry", "Telemetry log is disabled (IOT_LOG_DIR)."); return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Telemetry", "telemetry.csv", "CSV (*.csv)")
+        if path:
+            import workers
+            self.run_job(f"Export {os.path.basename(path)}", workers.export_csv, self.tlog.dir, path,
+                         on_result=lambda n: QMessageBox.information(self, "Saved", f"Đã xuất {n} record."))
+    def analyze_history(self):
+        """min/max/mean GAS theo bucket + thống kê cả khoảng (cbRange) ở worker process.
+
+        Nguồn: log telemetry trên đĩa (qua nhiều lần chạy), không có thì raw history trong RAM
+        (chép một lần vào shared memory). Kết quả: dòng log, và đồ thị nếu đang chọn một khoảng.
+        """
+        import workers
+        span = self.cbRange.currentData(); now = time.time()
+        t0 = now - span if span else -math.inf
+        src = self.tlog.dir if self.tlog else workers.SharedArrays(self.store.raw_columns(("gas",), t0, now))
+        cleanup = None if self.tlog else (lambda: src.__exit__(None, None, None))
+        name = self.cbRange.currentText() if span else "all"
+        where = "telemetry log" if self.tlog else "history"
+        self.run_job(f"Analyze GAS ({name})", workers.aggregate, src, "gas", t0, now, max(100, self.canvas.width()),
+                     float(self.spLo.value()), on_result=lambda r: self._show_analysis(r, name, span, where), cleanup=cleanup)
+    def _show_analysis(self, r:dict, name:str, span:int, where:str):
+        if not r["count"]: self._append(f"Analysis ({name}): no samples"); return
+        dur = r["t_last"] - r["t_first"]
+        self._append(f"Analysis GAS ({name}): {r['count']} samples over {dur / 3600:.1f} h · min {r['min_v']:.0f} "
+                     f"mean {r['mean_v']:.1f} max {r['max_v']:.0f} · p50 {r['p50']:.0f} p95 {r['p95']:.0f} "
+                     f"p99 {r['p99']:.0f} · ≥ THR LO {r['above_s'] / 60:.1f} min")
+        if span and self.cbRange.currentData() == span:
+            ys = np.empty(2 * len(r["min"])); ys[0::2] = r["min"]; ys[1::2] = r["max"]
+            self.histTimer.stop()      # giữ đồ thị này tới khi đổi khoảng
+            self.canvas.set_view(ys, f"GAS {name} · {where} ({bucket_label(r['width'])} buckets)")
+
+    def tune_thresholds(self):
+        """Replay cả lưới cặp THR LOW/HIGH (tuning.py) trên cùng nguồn với analyze_history, ở worker process.
+
+        Kết quả: bảng các cặp tốt nhất + cặp hiện tại trong log; cặp best() khác hiện tại thì hỏi có áp dụng không.
+        """
+        import workers
+        from tuning import grid, TUNE_LO, TUNE_HI
+        span = self.cbRange.currentData(); now = time.time()
+        t0 = now - span if span else -math.inf
+        src = self.tlog.dir if self.tlog else workers.SharedArrays(self.store.raw_columns(("gas",), t0, now))
+        cleanup = None if self.tlog else (lambda: src.__exit__(None, None, None))
+        name = self.cbRange.currentText() if span else "all"
+        self.run_job(f"Tune thresholds ({name})", workers.tune, src, grid(TUNE_LO), grid(TUNE_HI), t0, now,
+                     field="gas_pred" if self.dsp else "gas", hysteresis=RULE_HYST, debounce_s=RULE_DEBOUNCE,
+                     min_hold_s=RULE_MIN_HOLD, on_result=lambda r: self._show_tuning(r, name), cleanup=cleanup)
+    def _show_tuning(self, r:dict, name:str):
+        from tuning import best, table
+        if not r["samples"]: self._append(f"Tuning ({name}): no samples"); return
+        cur = (float(self.spLo.value()), float(self.spHi.value()))
+        self._append(f"Tuning ({name}): {r['samples']} samples over {r['span_s'] / 3600:.1f} h, "
+                     f"{r['incidents']} incidents, {len(r['lo'])} × {len(r['hi'])} pairs")
+        for line in table(r, 5, cur): self._append("  " + line)
+        b = best(r)
+        if b is None: self._append("Tuning: no pair alarms on every incident in time"); return
+        if b == cur: self._append("Tuning: current thresholds are already the best pair"); return
+        ask = QMessageBox.question(self, "Tune thresholds", f"Apply THR LOW {b[0]:g} / THR HIGH {b[1]:g}?")
+        if ask == QMessageBox.StandardButton.Yes:
+            self.spLo.setValue(int(b[0])); self.spHi.setValue(int(b[1])); self.apply_thr()
+
+    # ---- job chạy ở process pool (workers.py) ----
+    @property
+    def jobs(self) -> JobRunner:
+        if self._jobs is None:
+            self._jobs = JobRunner(parent=self)
+            self._jobs.progress.connect(lambda jid, p: self._update_job_bar())
+            self._jobs.finished.connect(self._on_job_finished)
+            self._jobs.failed.connect(lambda jid, msg: self._job_ended(jid, f"failed: {msg}", LOG_ERROR))
+            self._jobs.cancelled.connect(lambda jid: self._job_ended(jid, "cancelled"))
+        return self._jobs
+    def run_job(self, label:str, fn, *args, on_result=None, cleanup=None, **kw) -> int:
+        """fn(ctx, ...) của workers.py chạy ở worker; on_result(result) chạy trên GUI thread khi xong."""
+        jid = self.jobs.submit(fn, *args, **kw)
+        self._job_info[jid] = (label, on_result, cleanup, time.perf_counter())
+        self._append(f"Job {jid}: {label}…"); self._update_job_bar()
+        return jid
+    def cancel_jobs(self):
+        for jid in list(self._job_info): self.jobs.cancel(jid)
+    def _job_ended(self, jid:int, how:str, kind=LOG_INFO):
+        info = self._job_info.pop(jid, None)
+        if info is None: return None
+        label, on_result, cleanup, t0 = info; dt = time.perf_counter() - t0
+        if cleanup: cleanup()
+        if MET.on: H_JOB.observe(dt)
+        self._append(f"Job {jid}: {label} {how} ({dt:.2f} s)", kind); self._update_job_bar()
+        return on_result
+    def _on_job_finished(self, jid:int, result):
+        on_result = self._job_ended(jid, "done")
+        if on_result: on_result(result)
+    def _update_job_bar(self):
+        if not self._job_info: self.jobBar.hide(); self.btnJobCancel.hide(); return
+        ps = [self._jobs.pool.progress(j) or 0.0 for j in self._job_info]
+        label = next(iter(self._job_info.values()))[0]
+        more = f" +{len(ps) - 1}" if len(ps) > 1 else ""
+        self.jobBar.setFormat(f"{label}{more} %p%"); self.jobBar.setValue(int(1000 * sum(ps) / len(ps)))
+        self.jobBar.show(); self.btnJobCancel.show()
+    def closeEvent(self, ev):
+        self.disconnect_serial(); self.ports.stop()
+        if self._jobs: self._jobs.shutdown()
+        if self._hub: self._hub.close_hub()
+        if self.tlog: self.tlog.close()
+        if self.mqtt: self.mqtt.stop()
+        self.logModel.close(); MET.stop_exporter()
+        super().closeEvent(ev)
     def show_about(self):
         QMessageBox.information(self, "About",
             "IoT Gas Dashboard + Kawaii Home (PyQt6)\n"
             "• Login demo: iot / mk123\n"
             "• LED 12V / Fan / Servo • GAS badge\n"
-            "• Lệnh: STATUS / LED / FAN / SERVO / THRHI / THRLO")
+            "• Lệnh: STATUS / LED / FAN / SERVO / THRHI / THRLO / PROTO BIN|JSON / STREAM <hz>")
 
 def main():
     app = QApplication(sys.argv)
 
     # Pass env credentials into dialog
-    if LoginDialog(USERNAME, PASSWORD_HASH).exec() != QDialog.DialogCode.Accepted:
+    if LoginDialog(*load_credentials()).exec() != QDialog.DialogCode.Accepted:
         sys.exit(0)
 
     # Launch dashboard
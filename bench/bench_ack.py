@@ -0,0 +1,97 @@
+"""Command → ack latency on the firmware simulator: sensor reads inside sendStatus vs cooperative tasks.
+
+    python bench/bench_ack.py --commands 300 --rate 10
+    python bench/bench_ack.py --rate 50 --distance 0        # không có echo: pulseIn chờ hết 25 ms
+
+sim.BoardSim runs once per --acquisition model (see sim.py): "blocking" is
+the firmware before the cooperative tasks (pulseIn + DHT11 in every
+sendStatus, then Serial.flush()), "sched" the current one (gas/ultrasonic
+cached, DHT11 on its own 2 s task, postponed while a command is waiting).
+The host switches the board to MANUAL and toggles FAN at random intervals
+(--gap-ms, so commands land at every phase of the status / DHT cycle); the
+ack is the first status frame reporting the new fan value, measured from
+the end of ser.write to the line read (FAN is only answered in MANUAL: a
+status back in AUTO counts as lost and re-sends AUTO 0). Also reported: the largest gap
+between two status frames and the share of wall time the MCU spent stalled
+in sensor reads.
+"""
+import argparse, json, os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["IOT_LOG_DIR"] = ""
+import serial
+from sim import BoardSim, ACQUISITION
+
+
+def pct(xs, q):
+    xs = sorted(xs); return xs[min(len(xs) - 1, int(q * len(xs)))] * 1e3 if xs else float("nan")
+
+
+class Link:
+    """Đọc dòng JSON status từ cổng; ghi nhận khoảng cách lớn nhất giữa 2 status."""
+    def __init__(self, port):
+        self.ser = serial.Serial(port, 115200, timeout=0.5); self.last = None; self.max_gap = 0.0
+
+    def status(self, timeout:float=2.0):
+        t_end = time.perf_counter() + timeout
+        while time.perf_counter() < t_end:
+            line = self.ser.readline()
+            if not line.startswith(b"{"): continue
+            now = time.perf_counter()
+            if self.last is not None: self.max_gap = max(self.max_gap, now - self.last)
+            self.last = now
+            return json.loads(line), now
+        return None, time.perf_counter()
+
+    def send(self, cmd:str) -> float:
+        self.ser.write((cmd + "\n").encode()); self.ser.flush()
+        return time.perf_counter()
+
+
+def run(mode:str, a):
+    rnd = random.Random(a.seed)
+    sim = BoardSim("steady", a.rate, "json", a.baud, seed=a.seed, acquisition=mode,
+                   distance=lambda t: a.distance).start()
+    link = Link(sim.port)
+    link.send("AUTO 0")
+    while True:
+        st, _ = link.status()
+        if st is None: sys.exit("no status from the simulated board")
+        if st.get("mode") == "MANUAL": break
+    lat = []; lost = 0; fan = st.get("fan", 0)
+    link.max_gap = 0.0; s0 = sim.stalled; t0 = time.perf_counter()
+    for _ in range(a.commands):
+        t_gap = time.perf_counter() + rnd.uniform(*a.gap) / 1e3
+        while time.perf_counter() < t_gap: link.status(t_gap - time.perf_counter())
+        fan ^= 1; t_tx = link.send(f"FAN {fan}")
+        while True:
+            st, t_rx = link.status()
+            if st is None: lost += 1; break
+            if st.get("fan") == fan: lat.append(t_rx - t_tx); break
+            if st.get("mode") != "MANUAL":          # AUTO: firmware bỏ qua FAN, không có ack để chờ
+                lost += 1; link.send("AUTO 0"); break
+    wall = time.perf_counter() - t0
+    print(f"  {mode:8s}  ack p50 {pct(lat, .5):6.2f} ms  p99 {pct(lat, .99):6.2f} ms  max {pct(lat, 1):6.2f} ms  "
+          f"lost {lost}  max status gap {link.max_gap * 1e3:7.1f} ms  "
+          f"MCU stalled in sensor reads {(sim.stalled - s0) / wall:5.1%}")
+    link.ser.close(); sim.stop()
+    return pct(lat, .99)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--commands", type=int, default=300)
+    ap.add_argument("--rate", type=float, default=10, help="status rate (Hz), like STREAM")
+    ap.add_argument("--gap-ms", dest="gap", type=lambda s: tuple(float(x) for x in s.split(":")), default=(20.0, 200.0),
+                    help="random pause between commands, lo:hi ms")
+    ap.add_argument("--distance", type=int, default=120, help="simulated ultrasonic distance (cm), 0 = no echo")
+    ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    print(f"BoardSim {a.rate:g} Hz json @ {a.baud} baud, distance {a.distance} cm, {a.commands} FAN toggles, "
+          f"gap {a.gap[0]:g}–{a.gap[1]:g} ms")
+    p99 = {mode: run(mode, a) for mode in reversed(ACQUISITION)}
+    print(f"  ack p99 {p99['blocking']:.1f} → {p99['sched']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""WebSocket fan-out of daemon.TelemetryApi to many local subscribers.
+
+    python bench/bench_api_fanout.py --subscribers 100 --rates 10,100,1000 --seconds 5
+
+The server runs in a child process with a publisher thread standing in for the
+hub's I/O thread (api.publish at --rate status frames/s); this process opens
+the subscribers on one asyncio loop and measures delivered messages/s,
+publish→receive latency (newest message of each read) and drops. Server CPU
+is process_time of the child.
+"""
+import argparse, asyncio, base64, json, os, subprocess, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from daemon import TelemetryApi, ws_accept, ws_parse
+from hub import DeviceHub
+from framing import StatusSample
+
+STATUS = StatusSample.from_dict({"seq": 0, "gas": 321, "distance": 40, "temperature": 27.5, "humidity": 61.0, "threshold_low": 380,
+          "threshold_high": 450, "mode": "AUTO", "led": 0, "fan": 0, "servo": 0, "alarm": 0})
+
+
+async def serve(rate, seconds):
+    api = await TelemetryApi(DeviceHub(), token="").start("127.0.0.1", 0)
+    print(api.port, flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)   # chờ subscriber kết nối xong
+
+    def publisher():
+        st = STATUS; period = 1.0 / rate; nxt = time.perf_counter()
+        for i in range(int(rate * seconds)):
+            st.seq = i & 0xFFFF
+            api.publish("bench", st)
+            nxt += period; d = nxt - time.perf_counter()
+            if d > 0: time.sleep(d)
+    c0 = time.process_time(); w0 = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, publisher)
+    await asyncio.sleep(0.5)
+    cpu, wall = time.process_time() - c0, time.perf_counter() - w0
+    print(json.dumps({"cpu": cpu, "wall": wall, "published": api.published, "delivered": api.delivered,
+                      "dropped": api.dropped}), flush=True)
+    await api.close()
+
+
+async def subscriber(port, stats, counts, ready):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    assert ws_accept(key).encode() in head
+    ready.release()
+    buf = bytearray(); count = 0
+    while True:
+        chunk = await reader.read(1 << 16)
+        if not chunk: break
+        buf += chunk; last = None
+        while (f := ws_parse(buf)) is not None:
+            if f[0] == 8: break
+            count += 1; last = f[1]
+        if last is not None:     # latency của message mới nhất trong chunk (json.loads từng message sẽ nghẽn ở phía client)
+            stats.append(time.time() - json.loads(last)["t"])
+    counts.append(count)
+    writer.close()
+
+
+async def run_rate(n, rate, seconds):
+    child = subprocess.Popen([sys.executable, __file__, "--serve", "--rate", str(rate), "--seconds", str(seconds)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    port = int(child.stdout.readline())
+    lat = []; counts = []; ready = asyncio.Semaphore(0)
+    tasks = [asyncio.create_task(subscriber(port, lat, counts, ready)) for _ in range(n)]
+    for _ in range(n): await ready.acquire()
+    child.stdin.write("go\n"); child.stdin.flush()
+    res = json.loads(await asyncio.get_running_loop().run_in_executor(None, child.stdout.readline))
+    await asyncio.gather(*tasks); child.wait()
+    lat.sort(); p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1e3 if lat else float("nan")
+    got = sum(counts)
+    print(f"subs={n:4d} rate={rate:6g}/s  delivered {got / res['wall']:9.0f} msg/s "
+          f"({got}/{res['published'] * n} expected, dropped {res['dropped']})  "
+          f"latency p50 {p(.5):6.2f} ms p99 {p(.99):7.2f} ms  server CPU {res['cpu'] / res['wall'] * 100:5.1f}% "
+          f"({res['cpu'] / max(1, res['delivered']) * 1e6:.2f} us/delivery)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--subscribers", type=int, default=100)
+    ap.add_argument("--rates", default="10,100,1000", help="status frames/s published (comma list)")
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--rate", type=float, default=100, help=argparse.SUPPRESS)
+    a = ap.parse_args()
+    if a.serve:
+        asyncio.run(serve(a.rate, a.seconds)); return
+    for rate in (float(r) for r in a.rates.split(",")):
+        asyncio.run(run_rate(a.subscribers, rate, a.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Paint time of GasCanvas (ring + min/max decimation + cached polyline/background)
+vs. the previous deque + per-segment drawLine implementation.
+
+    python bench/bench_canvas.py --points 300 10000 1000000
+"""
+import argparse, math, os, sys, time
+from collections import deque
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QColor, QImage, QPainter, QPen
+from PyQt6.QtWidgets import QApplication, QWidget
+import Iot
+
+
+class LegacyGasCanvas(QWidget):
+    """GasCanvas trước khi tối ưu (giữ nguyên paintEvent cũ)."""
+    def __init__(self, max_points):
+        super().__init__(); self.history = deque(maxlen=max_points); self.thr_lo, self.thr_hi = 380, 450
+    def push(self, gas): self.history.append(int(gas)); self.update()
+    def paintEvent(self, ev):
+        p = QPainter(self); r = self.rect()
+        p.fillRect(r, QColor("#0b1220"))
+        p.setPen(QPen(QColor("#334155"), 1)); p.drawRect(r.adjusted(0,0,-1,-1))
+        def y(v): return r.bottom()-int((v/1023.0)*r.height())
+        p.setPen(QPen(QColor("#fbbf24"), 1, Qt.PenStyle.DashLine)); p.drawLine(r.left(), y(self.thr_lo), r.right(), y(self.thr_lo))
+        p.setPen(QPen(QColor("#ef4444"), 1, Qt.PenStyle.DashLine)); p.drawLine(r.left(), y(self.thr_hi), r.right(), y(self.thr_hi))
+        if len(self.history)>=2:
+            step = r.width()/max(1,len(self.history)-1)
+            p.setPen(QPen(QColor("#22d3ee"), 2))
+            for i in range(len(self.history)-1):
+                p.drawLine(int(r.left()+i*step), y(self.history[i]),
+                           int(r.left()+(i+1)*step), y(self.history[i+1]))
+        p.setPen(QColor("#94a3b8")); p.drawText(QRect(r.left()+6,r.top()+6,200,18), Qt.AlignmentFlag.AlignLeft, "GAS history")
+
+
+def sample(i): return 400 + 300 * math.sin(i / 500.0) + (i * 7919) % 40
+
+
+def measure(w, n, frames, budget_s):
+    w.resize(1000, 240)
+    for i in range(n): w.history.append(sample(i))
+    img = QImage(w.size(), QImage.Format.Format_ARGB32_Premultiplied)
+    times = []; t_end = time.perf_counter() + budget_s
+    for k in range(frames):
+        w.push(sample(n + k))                  # một sample mới mỗi frame (cache polyline bị vô hiệu)
+        t = time.perf_counter(); w.render(img); times.append(time.perf_counter() - t)
+        if time.perf_counter() > t_end: break
+    times.sort()
+    return times[len(times) // 2] * 1e3, len(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", type=int, nargs="+", default=[300, 10_000, 1_000_000])
+    ap.add_argument("--frames", type=int, default=50)
+    ap.add_argument("--budget", type=float, default=10.0, help="max seconds per case")
+    a = ap.parse_args()
+    app = QApplication(sys.argv)
+    print(f"numpy: {'yes' if Iot.np is not None else 'no (array fallback)'}")
+    for n in a.points:
+        old, k_old = measure(LegacyGasCanvas(n), n, a.frames, a.budget)
+        new, k_new = measure(Iot.GasCanvas(max_points=n), n, a.frames, a.budget)
+        print(f"points={n:8d}  legacy {old:9.2f} ms/paint (n={k_old:3d})   new {new:7.2f} ms/paint (n={k_new:3d})   x{old / new:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
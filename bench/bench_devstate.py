@@ -0,0 +1,72 @@
+"""State-diffing actuator sync (devstate.DeviceState + Iot.DeviceModel): widget updates and serial writes per minute.
+
+    python bench/bench_devstate.py --seconds 20 --rate 50
+    python bench/bench_devstate.py --base 300 --noise 5        # xa ngưỡng: chỉ gas/climate đổi
+
+The full Main window (offscreen, Home tab built) is connected to a simulated
+board (sim.BoardSim, AUTO mode, --rate statuses/s) whose gas hovers around
+the alarm threshold (--base ± --noise), so the rules engine and the
+firmware's own auto logic keep switching the actuators. The same run is done
+with IOT_STATE_DIFF off (every rendered sample updates every widget group,
+every rule action is written) and on. Reported per minute of wall time:
+  renders   samples the GUI rendered (FrameCoalescer ticks)
+  widgets   DeviceModel signals emitted = widget groups updated
+  writes    commands the board received (BoardSim.commands), incl. connect-time THRLO/THRHI/PROTO/STREAM
+  supp.     automatic commands dropped because the board already reported that state
+"""
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen"); os.environ["IOT_LOG_DIR"] = ""
+from PyQt6.QtWidgets import QApplication
+import Iot
+from sim import BoardSim, gas_profile
+
+
+def wait(app, cond, timeout):
+    t_end = time.perf_counter() + timeout
+    while time.perf_counter() < t_end:
+        app.processEvents()
+        if cond(): return True
+        time.sleep(0.002)
+    return False
+
+
+def run(app, diff:bool, a):
+    Iot.STATE_DIFF = diff
+    sim = BoardSim("steady", a.rate, proto=a.proto); sim.fw.gas = gas_profile("steady", a.base, a.noise, seed=a.seed)
+    sim.start()
+    w = Iot.Main(); w.resize(1120, 740); w.show(); w.tab          # Home tab: slot của nhapromax cũng nhận signal
+    w.cbPort.setEditText(sim.port); w.connect_serial()
+    if not wait(app, lambda: w.seq.received > 0, 5): sys.exit("no status from the simulated board")
+    m, d = w.model, w.device
+    r0, u0, s0, c0, x0, n0 = m.renders, m.updates, m.skipped, sim.commands, d.suppressed, w.seq.received
+    t0 = time.perf_counter(); wait(app, lambda: False, a.seconds); wall = time.perf_counter() - t0
+    per_min = 60.0 / wall
+    renders, updates = m.renders - r0, m.updates - u0
+    print(f"  diff {'on ' if diff else 'off'}  statuses {(w.seq.received - n0) * per_min:8.0f}/min  "
+          f"renders {renders * per_min:6.0f}/min  widgets {updates * per_min:7.0f}/min "
+          f"({updates / max(1, renders):.2f}/render, skipped {(m.skipped - s0) * per_min:6.0f}/min)  "
+          f"writes {(sim.commands - c0) * per_min:6.1f}/min  supp. {(d.suppressed - x0) * per_min:6.1f}/min  "
+          f"group changes {dict((k, v) for k, v in d.changes.items() if v)}")
+    w.close(); sim.stop(); app.processEvents()
+    return updates * per_min, (sim.commands - c0) * per_min
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=20, help="measured wall time per mode")
+    ap.add_argument("--rate", type=float, default=50, help="board status rate (Hz)")
+    ap.add_argument("--base", type=float, default=385, help="mean gas ADC (alarm threshold 380)")
+    ap.add_argument("--noise", type=float, default=25, help="gas noise sigma")
+    ap.add_argument("--proto", default="json", choices=("json", "bin"))
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    print(f"BoardSim {a.rate:g} Hz {a.proto}, gas {a.base:g} ± {a.noise:g}, UI {Iot.UI_FPS} fps, {a.seconds:g} s per mode")
+    app = QApplication(sys.argv)
+    off = run(app, False, a); on = run(app, True, a)
+    print(f"  widget updates −{1 - on[0] / max(off[0], 1e-9):.0%}, serial writes −{1 - on[1] / max(off[1], 1e-9):.0%}")
+
+
+if __name__ == "__main__":
+    main()
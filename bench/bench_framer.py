@@ -0,0 +1,73 @@
+"""Replay a captured serial byte stream through the old str-concat reader and LineFramer.
+
+    python bench/bench_framer.py                    # synthetic iot.ino stream
+    python bench/bench_framer.py --capture dump.bin # raw bytes captured from the port
+"""
+import argparse, json, os, random, re, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framing import LineFramer
+
+
+def synth_stream(n_frames:int, seed:int=1) -> bytes:
+    rnd = random.Random(seed); out = []
+    for i in range(n_frames):
+        gas = rnd.randint(250, 600)
+        line = ('{"gas":%d,"distance":%d,"temperature":%.2f,"humidity":%.2f,"threshold_low":380,'
+                '"threshold_high":450,"mode":"AUTO","led":%d,"fan":%d,"servo":%d,"alarm":%d}'
+                % (gas, rnd.randint(-1, 300), rnd.uniform(20, 35), rnd.uniform(40, 90),
+                   gas >= 380, gas >= 380, 90 if gas >= 450 else 0, gas >= 450))
+        if i % 50 == 0: line = "\x00\xff" + line     # rác khi board reset
+        out.append(line + "\r\n")
+    return "".join(out).encode("latin-1")
+
+
+def legacy(chunks, parse=True):
+    """SerialReader.run trước đây (str buffer + split + regex mỗi dòng)."""
+    buf = ""; frames = 0
+    for data in chunks:
+        buf += data.decode(errors="ignore")
+        while "\n" in buf:
+            line, buf = buf.split("\n", 1); line = line.strip()
+            if not line: continue
+            if "{" in line and "}" in line:
+                m = re.search(r'\{.*\}', line)
+                if m:
+                    if parse: json.loads(m.group())
+                    frames += 1
+    return frames
+
+
+def framed(chunks, parse=True):
+    fr = LineFramer(); frames = 0
+    for data in chunks:
+        for line, frame in fr.feed(data):
+            if frame is not None:
+                if parse: json.loads(frame)
+                frames += 1
+    return frames
+
+
+def run(name, fn, chunks, nbytes, repeat, parse):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter(); frames = fn(chunks, parse); best = min(best, time.perf_counter() - t)
+    print(f"  {name:8s} {frames:8d} frames  {best*1e3:9.2f} ms  {nbytes/best/1e6:7.2f} MB/s  {frames/best:10.0f} frames/s")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--capture", help="raw byte dump of the serial port")
+    ap.add_argument("--frames", type=int, default=50000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--no-json", action="store_true", help="measure framing only, skip json.loads")
+    a = ap.parse_args()
+    data = open(a.capture, "rb").read() if a.capture else synth_stream(a.frames)
+    for size in (128, 4096, 65536, 1 << 20):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        print(f"chunk={size} bytes={len(data)}")
+        run("legacy", legacy, chunks, len(data), a.repeat, not a.no_json)
+        run("framer", framed, chunks, len(data), a.repeat, not a.no_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Frame cost of the "Nha pRo mAx" home view (nhapromax): update_from_status + paint.
+
+    python bench/bench_home_paint.py --frames 500 --size 1100x640
+
+Runs offscreen with a 1920x1080 background image loaded. Each frame changes
+the gas value (and LED/fan every 10 frames) like a status stream, then lets
+the event loop paint; "paint" is the time inside paintEvent, "frame" also
+includes update_from_status and everything Qt does until the paint is done
+(style polish, relayout of the overlay buttons).
+"""
+import argparse, os, statistics, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6.QtGui import QColor, QLinearGradient, QPainter, QPixmap
+from PyQt6.QtWidgets import QApplication
+from framing import StatusSample
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=500)
+    ap.add_argument("--size", default="1100x640")
+    a = ap.parse_args()
+    app = QApplication(sys.argv)
+    import Iot
+
+    paint = []
+    class Timed(Iot.nhapromax):
+        def paintEvent(self, e):
+            t = time.perf_counter(); super().paintEvent(e); paint.append(time.perf_counter() - t)
+
+    bg = QPixmap(1920, 1080); p = QPainter(bg)
+    g = QLinearGradient(0, 0, 1920, 1080); g.setColorAt(0, QColor("#0ea5e9")); g.setColorAt(1, QColor("#f59e0b"))
+    p.fillRect(bg.rect(), g); p.end()
+    path = "/tmp/bench_home_bg.png"; bg.save(path)
+
+    w = Timed(); w.resize(*map(int, a.size.split("x"))); w.load_background(path); w.show()
+    for _ in range(20): app.processEvents()
+    paint.clear(); frames = []
+    for i in range(a.frames):
+        st = StatusSample(gas=300 + (i * 7) % 250, temperature=25 + (i % 10) / 10, humidity=60.0,
+                          led=(i // 10) & 1, fan=(i // 10) & 1, servo=90 if (i // 20) & 1 else 0, alarm=(i // 40) & 1)
+        t = time.perf_counter()
+        w.update_from_status(st); app.processEvents()
+        frames.append(time.perf_counter() - t)
+    ms = lambda xs, q: sorted(xs)[min(len(xs) - 1, int(q * len(xs)))] * 1e3
+    print(f"size {a.size}  frames {len(frames)}  paints {len(paint)}")
+    print(f"frame  mean {statistics.mean(frames) * 1e3:7.3f} ms  p50 {ms(frames, .5):7.3f}  p99 {ms(frames, .99):7.3f}")
+    if paint:
+        print(f"paint  mean {statistics.mean(paint) * 1e3:7.3f} ms  p50 {ms(paint, .5):7.3f}  p99 {ms(paint, .99):7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""CPU cost per device of DeviceHub (one selector thread) vs. one reader thread per board.
+
+    python bench/bench_hub.py --devices 32 --hz 10 --seconds 10
+    python bench/bench_hub.py --devices 64 --hz 20 --proto json
+
+Every board is a pty pair; a separate feeder process writes status frames to
+all masters, so only the dashboard side is measured (process_time of this
+process). Frames are spread evenly over the period so boards do not all fire at
+once (worst case for wakeups); --batch-ms trades latency for fewer wakeups.
+"""
+import argparse, json, os, pty, random, selectors, subprocess, sys, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serial
+from framing import StatusSample, encode_bin_frame
+from hub import Device, DeviceHub
+
+
+def feeder(fds, hz, seconds, proto):
+    """Child process: round-robin frames to every master fd at `hz` each."""
+    n = len(fds); period = 1.0 / hz; rnd = random.Random(5)
+    t_end = time.monotonic() + seconds; k = 0
+    nxt = time.monotonic()
+    while time.monotonic() < t_end:
+        for i, fd in enumerate(fds):
+            gas = rnd.randint(250, 420)
+            s = StatusSample(k & 0xFFFF, gas, 40, 27.5, 61.0, 380, 450, "AUTO", 0, 0, 0, 0)
+            data = encode_bin_frame(s) if proto == "bin" else (json.dumps(s.to_dict()) + "\r\n").encode()
+            try: os.write(fd, data)
+            except OSError: pass
+            nxt += period / n
+            d = nxt - time.monotonic()
+            if d > 0: time.sleep(d)
+        k += 1
+
+
+def run_threads(sers, batch_s=0.0):
+    """Baseline: một thread + selector cho mỗi board (kiểu SelectorSerialReader), cùng xử lý frame như hub."""
+    hub = DeviceHub(); stop = threading.Event()
+    devs = [Device(f"dev{i}", s) for i, s in enumerate(sers)]
+    def loop(dev):
+        sel = selectors.DefaultSelector(); sel.register(dev.fd, selectors.EVENT_READ)
+        while not stop.is_set():
+            if not sel.select(0.2): continue
+            try: data = os.read(dev.fd, 4096)
+            except BlockingIOError: continue
+            hub._feed(dev, data)
+    ths = [threading.Thread(target=loop, args=(d,), daemon=True) for d in devs]
+    for t in ths: t.start()
+    return (lambda: sum(d.frames for d in devs)), (lambda: (stop.set(), [t.join(1) for t in ths], hub.stop()))
+
+
+def run_hub(sers, batch_s=0.0):
+    hub = DeviceHub(poll_s=3600, batch_s=batch_s).start()
+    for i, s in enumerate(sers): hub.add(s, f"dev{i}")
+    for i in range(len(sers)): hub.set_stream(f"dev{i}", 1)    # coi như đang stream: không poll STATUS
+    return (lambda: sum(d.frames for d in hub.devices.values())), hub.stop
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=32)
+    ap.add_argument("--hz", type=float, default=10)
+    ap.add_argument("--seconds", type=float, default=8)
+    ap.add_argument("--proto", choices=("bin", "json"), default="bin")
+    ap.add_argument("--mode", choices=("hub", "threads", "both"), default="both")
+    ap.add_argument("--batch-ms", type=float, default=0.0, help="DeviceHub batch_s (gom frame mỗi lần thức)")
+    ap.add_argument("--feed", help=argparse.SUPPRESS)
+    a = ap.parse_args()
+    if a.feed:
+        feeder([int(x) for x in a.feed.split(",")], a.hz, a.seconds, a.proto); return
+    for mode in (("hub", "threads") if a.mode == "both" else (a.mode,)):
+        pairs = [pty.openpty() for _ in range(a.devices)]
+        sers = [serial.Serial(os.ttyname(s), 115200, timeout=0) for _, s in pairs]
+        count, stop = (run_hub if mode == "hub" else run_threads)(sers, a.batch_ms / 1000.0)
+        masters = [m for m, _ in pairs]
+        child = subprocess.Popen([sys.executable, __file__, "--feed", ",".join(map(str, masters)),
+                                  "--hz", str(a.hz), "--seconds", str(a.seconds + 1), "--proto", a.proto],
+                                 pass_fds=masters)
+        time.sleep(0.5)                                     # bỏ qua lúc khởi động
+        c0, w0, f0 = time.process_time(), time.perf_counter(), count()
+        time.sleep(a.seconds)
+        cpu, wall, frames = time.process_time() - c0, time.perf_counter() - w0, count() - f0
+        nthreads = threading.active_count()
+        child.wait(); stop()
+        for m, s in pairs: os.close(m); os.close(s)
+        for s in sers:
+            try: s.close()
+            except OSError: pass
+        print(f"{mode:8s} devices={a.devices:3d} {a.proto} {a.hz:g} Hz  frames {frames / wall:7.0f}/s "
+              f"(expected {a.devices * a.hz:.0f})  CPU {cpu / wall * 100:6.2f}% total  "
+              f"{cpu / wall * 100 / a.devices:5.3f}% per device  {cpu / max(1, frames) * 1e6:6.1f} us/frame  "
+              f"threads={nthreads}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""UI responsiveness while an analytics job runs (workers.py): inline vs thread vs process pool.
+
+    python bench/bench_jobs.py --records 2000000 --seconds 6
+    python bench/bench_jobs.py --modes idle,pool --source shared --samples 5000000
+
+The full Main window (offscreen) is connected to a simulated board
+(sim.BoardSim, --rate statuses/s) on the Dashboard tab. For --seconds the
+job workers.aggregate runs back to back over a synthetic telemetry log of
+--records status records (built once in a temp dir, .logz segments like the
+real logger writes) or over --samples rows in SharedArrays (--source shared):
+  idle    no job (baseline)
+  inline  job on the GUI thread (what calling it from a slot would do)
+  thread  job on a Python thread in the GUI process (GIL contention)
+  pool    Main.run_job → JobRunner → worker process
+Reported: jobs finished and mean job time, lateness of a 10 ms probe timer
+(event loop lag), reader→slot queue latency, Main.on_status and GasCanvas
+paint time (metrics.REGISTRY) and statuses ingested per second.
+"""
+import argparse, math, os, sys, tempfile, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen"); os.environ["IOT_LOG_DIR"] = ""
+import numpy as np
+from PyQt6.QtCore import QEventLoop, QTimer
+from PyQt6.QtWidgets import QApplication
+import Iot, workers
+from sim import BoardSim
+from telemetry import REC_SIZE, SEGMENT_BYTES, KIND_STATUS, compress_segment
+
+
+def pump(seconds:float, until=None):
+    """Chạy event loop thật (không busy-loop: worker nice'd trên máy 1 CPU cần phần CPU process GUI không dùng)."""
+    loop = QEventLoop(); t_end = time.perf_counter() + seconds
+    def poll():
+        if time.perf_counter() >= t_end or (until is not None and until()): loop.quit()
+    check = QTimer(); check.setInterval(20); check.timeout.connect(poll)
+    check.start(); loop.exec(); check.stop()
+
+
+def pct(xs, q):
+    return sorted(xs)[min(len(xs) - 1, int(q * len(xs)))] if xs else float("nan")
+
+
+def make_log(n:int) -> str:
+    """Thư mục log telemetry tổng hợp n record status (1 Hz, gas ngẫu nhiên có đỉnh), dùng lại nếu đã có."""
+    d = os.path.join(tempfile.gettempdir(), f"iot_bench_log_{n}")
+    if os.path.isdir(d): return d
+    os.makedirs(d + ".tmp", exist_ok=True)
+    rng = np.random.default_rng(1); per = SEGMENT_BYTES // REC_SIZE; t0 = time.time() - n
+    for s in range(0, n, per):
+        k = min(per, n - s); rec = np.zeros(k, dtype=workers._rec_dtype())
+        rec["t"] = t0 + np.arange(s, s + k); rec["kind"] = KIND_STATUS; rec["seq"] = np.arange(s, s + k) & 0xFFFF
+        rec["gas"] = np.clip(300 + rng.normal(0, 20, k) + 400 * (rng.random(k) < 0.002), 0, 1023)
+        rec["temperature"] = 25.0; rec["humidity"] = 60.0; rec["threshold_low"] = 380; rec["threshold_high"] = 450
+        path = os.path.join(d + ".tmp", f"seg-{int((t0 + s) * 1000)}.log")
+        with open(path, "wb") as f: f.write(rec.tobytes())
+        compress_segment(path)
+    os.rename(d + ".tmp", d)
+    return d
+
+
+def run_mode(app, mode, src, a):
+    Iot.MET.on = True
+    sim = BoardSim("noise+spike", a.rate).start()
+    w = Iot.Main(); w.resize(1120, 740); w.show()
+    w.cbPort.setEditText(sim.port); w.connect_serial()
+    lag = []; probe = QTimer(); probe.setInterval(10); last = [time.perf_counter()]
+    def tick():
+        now = time.perf_counter(); lag.append(now - last[0] - 0.010); last[0] = now
+    probe.timeout.connect(tick)
+    pump(0.5)
+    jobs = []; state = {"run": True}
+    job = lambda ctx: workers.aggregate(ctx, src, "gas", max_points=1000, threshold=380.0)
+    def again(*_):
+        if not state["run"]: return
+        t = time.perf_counter()
+        if mode == "pool":
+            w.run_job("bench", workers.aggregate, src, "gas", max_points=1000, threshold=380.0,
+                      on_result=lambda r, t=t: (jobs.append(time.perf_counter() - t), again()))
+        elif mode == "inline":
+            job(workers.InlineContext()); jobs.append(time.perf_counter() - t); QTimer.singleShot(0, again)
+    if mode == "thread":
+        def loop():
+            while state["run"]:
+                t = time.perf_counter(); job(workers.InlineContext()); jobs.append(time.perf_counter() - t)
+        th = threading.Thread(target=loop, daemon=True)
+    Iot.MET.reset(); probe.start(); last[0] = time.perf_counter()
+    n0 = w.seq.received; w0 = time.perf_counter()
+    if mode == "thread": th.start()
+    elif mode != "idle": QTimer.singleShot(0, again)
+    pump(a.seconds)
+    wall = time.perf_counter() - w0; state["run"] = False; probe.stop(); got = w.seq.received - n0
+    if mode == "thread": th.join()
+    if mode == "pool": pump(60, lambda: not w._job_info)
+    h = {m.name + ("." + m.labels["widget"] if m.labels else ""): m for m in Iot.MET.items() if m.kind == "histogram"}
+    def fmt(key):
+        m = h[key]
+        return f"{m.sum / m.count * 1e3:6.3f}/{m.quantile(.99) * 1e3:6.2f}" if m.count else "     -/     -"
+    print(f"{mode:6s}  jobs {len(jobs):3d} × {np.mean(jobs) if jobs else math.nan:6.3f} s  "
+          f"loop lag p50 {pct(lag, .5) * 1e3:6.2f} p99 {pct(lag, .99) * 1e3:7.2f} max {max(lag) * 1e3:7.1f} ms  "
+          f"queue {fmt('iot_signal_queue_seconds')}  on_status {fmt('iot_on_status_seconds')}  "
+          f"paint {fmt('iot_paint_seconds.GasCanvas')}  {got / wall:5.1f} st/s")
+    w.close(); sim.stop(); app.processEvents()
+    Iot.MET.on = False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", default="idle,inline,thread,pool")
+    ap.add_argument("--source", default="log", choices=("log", "shared"))
+    ap.add_argument("--records", type=int, default=2_000_000, help="telemetry log size (--source log)")
+    ap.add_argument("--samples", type=int, default=5_000_000, help="SharedArrays rows (--source shared)")
+    ap.add_argument("--seconds", type=float, default=6)
+    ap.add_argument("--rate", type=float, default=50, help="board status rate (Hz)")
+    a = ap.parse_args()
+    if a.source == "log":
+        t = time.perf_counter(); src = make_log(a.records)
+        print(f"source: telemetry log {a.records} records ({time.perf_counter() - t:.1f} s to prepare) {src}")
+    else:
+        t = np.arange(a.samples, dtype=np.float64) + time.time() - a.samples
+        src = workers.SharedArrays({"t": t, "gas": 300 + 50 * np.sin(t / 600)})
+        print(f"source: SharedArrays {a.samples} rows ({src.shm.size / 1e6:.0f} MB)")
+    print(f"cpus {os.cpu_count()}, job pool workers {workers.JobPool().workers}; "
+          "queue / on_status / paint = mean/p99 ms (p99 = histogram bucket bound)")
+    app = QApplication(sys.argv)
+    for mode in a.modes.split(","): run_mode(app, mode, src, a)
+    if a.source == "shared": src.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""MQTT bridge (mqtt.MqttBridge → mqtt.MiniBroker): publish cost on the caller, throughput, latency, broker outage.
+
+    python bench/bench_mqtt.py --messages 50000 --rate 1000
+    python bench/bench_mqtt.py --outage 3 --rate 500         # broker tắt 3 s giữa chừng
+
+A MiniBroker runs on localhost; on_publish records every message it
+receives (payload carries a sequence number and the perf_counter time of
+the publish() call). For QoS 0/1 × batched (IOT_MQTT_LINGER_MS, up to
+MQTT_BATCH per sendall) vs unbatched (batch 1, no linger):
+  burst   --messages published back to back: publish() cost on the caller
+          (what the reader thread pays per frame) and broker-side throughput
+  paced   --rate messages/s for --seconds: end-to-end latency p50/p99
+          (publish() call → broker received)
+Then the outage run: QoS 1 at --rate for --seconds + --outage, the broker
+is stopped for --outage seconds and restarted on the same port; reported
+are the unique sequence numbers the broker got (must be all of them),
+duplicates (resent with DUP), and the slowest publish() call while the
+broker was down.
+"""
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["IOT_LOG_DIR"] = ""
+import mqtt
+
+TOPIC = "bench/dev/status"
+
+
+class Sink:
+    """on_publish của broker: seq → thời điểm nhận đầu tiên (+ đếm bản trùng)."""
+    def __init__(self):
+        self.seen = {}; self.lat = []; self.dups = 0
+
+    def __call__(self, topic, payload):
+        if topic != TOPIC: return
+        seq, t = payload.split(b" ", 1); seq = int(seq)
+        if seq in self.seen: self.dups += 1; return
+        now = time.perf_counter(); self.seen[seq] = now; self.lat.append(now - float(t))
+
+
+def pct(v, q):
+    v = sorted(v); return v[min(len(v) - 1, int(q * len(v)))] * 1e3 if v else float("nan")
+
+
+def wait(cond, timeout):
+    t_end = time.perf_counter() + timeout
+    while time.perf_counter() < t_end:
+        if cond(): return True
+        time.sleep(0.002)
+    return False
+
+
+def bridge(port, batched:bool):
+    kw = {} if batched else {"batch": 1, "linger_s": 0.0}
+    b = mqtt.MqttBridge("127.0.0.1", port, prefix="bench", subscribe=[], reconnect=(0.1, 0.5), **kw).start()
+    if not wait(lambda: b.connected, 5): sys.exit("bridge did not connect")
+    return b
+
+
+def pace(t):
+    """Ngủ tới t (không busy-wait: thread MQTT cần GIL)."""
+    dt = t - time.perf_counter()
+    if dt > 0: time.sleep(dt)
+
+
+def send(b, seq, qos):
+    t = time.perf_counter()
+    b.publish(TOPIC, f"{seq} {t!r}".encode(), qos)
+    return time.perf_counter() - t
+
+
+def burst(a, qos, batched):
+    sink = Sink(); br = mqtt.MiniBroker(on_publish=sink).start(); b = bridge(br.port, batched)
+    t0 = time.perf_counter(); calls = [send(b, i, qos) for i in range(a.messages)]; t_pub = time.perf_counter() - t0
+    ok = wait(lambda: len(sink.seen) >= a.messages, 60); el = time.perf_counter() - t0
+    s = b.stats(); b.stop(); br.stop()
+    return (f"burst {a.messages}: publish() {sum(calls) / len(calls) * 1e6:5.2f} µs avg, p99 {pct(calls, 0.99) * 1e3:4.1f} µs, "
+            f"max {max(calls) * 1e3:5.2f} ms, "
+            f"{a.messages / t_pub / 1e3:6.0f} k/s enqueued;  broker got {len(sink.seen)}{'' if ok else ' (TIMEOUT)'} "
+            f"at {len(sink.seen) / el / 1e3:6.1f} k msg/s, {s['batches']} sendall ({a.messages / max(1, s['batches']):.0f}/batch)")
+
+
+def paced(a, qos, batched):
+    sink = Sink(); br = mqtt.MiniBroker(on_publish=sink).start(); b = bridge(br.port, batched)
+    n = int(a.rate * a.seconds); t0 = time.perf_counter()
+    for i in range(n):
+        pace(t0 + i / a.rate); send(b, i, qos)
+    wait(lambda: len(sink.seen) >= n, 10); b.stop(); br.stop()
+    return f"paced {a.rate:g}/s: latency p50 {pct(sink.lat, 0.5):6.2f} ms  p99 {pct(sink.lat, 0.99):6.2f} ms  ({len(sink.seen)}/{n})"
+
+
+def outage(a):
+    sink = Sink(); br = mqtt.MiniBroker(on_publish=sink).start(); port = br.port; b = bridge(port, True)
+    total = a.seconds + a.outage; n = int(a.rate * total); t0 = time.perf_counter()
+    down = (a.seconds / 3, a.seconds / 3 + a.outage)       # broker tắt sau 1/3 thời gian chạy
+    worst = 0.0; state = "up"; peak = 0
+    for i in range(n):
+        now = time.perf_counter() - t0
+        if state == "up" and now >= down[0]: br.stop(); state = "down"
+        elif state == "down" and now >= down[1]:
+            br = mqtt.MiniBroker(port=port, on_publish=sink).start(); state = "back"
+        pace(t0 + i / a.rate); dt = send(b, i, 1)
+        if state == "down": worst = max(worst, dt); peak = max(peak, b.depth)
+    ok = wait(lambda: len(sink.seen) >= n, 30)
+    s = b.stats(); b.stop(); br.stop()
+    print(f"  outage {a.outage:g} s at {a.rate:g}/s QoS 1: broker got {len(sink.seen)}/{n} unique{'' if ok else ' (TIMEOUT)'}, "
+          f"{sink.dups} duplicates, dropped {s['dropped']}, reconnects {s['connects'] - 1}, "
+          f"queue peak {peak}, slowest publish() while down {worst * 1e6:.1f} µs  ({total:g} s run)")
+    return len(sink.seen) == n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=50000, help="burst size")
+    ap.add_argument("--rate", type=float, default=1000, help="paced / outage publish rate (msg/s)")
+    ap.add_argument("--seconds", type=float, default=5, help="paced / outage run length")
+    ap.add_argument("--outage", type=float, default=2, help="broker down time (0 = skip)")
+    a = ap.parse_args()
+    print(f"MiniBroker on localhost, linger {mqtt.MQTT_LINGER_S * 1e3:g} ms, batch {mqtt.MQTT_BATCH}")
+    for qos in (0, 1):
+        for batched in (False, True):
+            tag = f"QoS {qos} {'batched ' if batched else 'unbatched'}"
+            print(f"  {tag}  {burst(a, qos, batched)}")
+            print(f"  {tag}  {paced(a, qos, batched)}")
+    ok = outage(a) if a.outage > 0 else True
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
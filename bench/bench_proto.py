@@ -0,0 +1,71 @@
+"""JSON status line vs. PROTO BIN frame: wire size, line-rate ceiling and host decode throughput.
+
+    python bench/bench_proto.py
+    python bench/bench_proto.py --capture board.bin   # decode a recorded byte stream, report counters
+"""
+import argparse, json, os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framing import StatusSample, StreamFramer, decode_bin_frame, encode_bin_frame
+
+BAUD = 115200
+
+
+def samples(n, seed=3):
+    rnd = random.Random(seed); out = []
+    for i in range(n):
+        gas = rnd.randint(250, 600)
+        out.append(StatusSample(i & 0xFFFF, gas, rnd.randint(-1, 300), round(rnd.uniform(20, 35), 1),
+                                None if i % 97 == 0 else round(rnd.uniform(40, 90), 1), 380, 450, "AUTO",
+                                int(gas > 380), int(gas > 380), 90 if gas >= 450 else 0, int(gas >= 450)))
+    return out
+
+
+def json_line(s):
+    # định dạng giống sendStatusJson (Serial.print(float) in 2 chữ số thập phân)
+    f = lambda v: "null" if v is None else f"{v:.2f}"
+    return ('{"gas":%d,"distance":%d,"temperature":%s,"humidity":%s,"threshold_low":%d,"threshold_high":%d,'
+            '"mode":"%s","led":%d,"fan":%d,"servo":%d,"alarm":%d}\r\n'
+            % (s.gas, s.distance, f(s.temperature), f(s.humidity), s.threshold_low, s.threshold_high,
+               s.mode, s.led, s.fan, s.servo, s.alarm)).encode()
+
+
+def decode_all(stream, chunk):
+    fr = StreamFramer(); n = 0
+    for i in range(0, len(stream), chunk):
+        for line, frame in fr.feed(stream[i:i + chunk]):
+            if frame is None: continue
+            st = frame.to_dict() if isinstance(frame, StatusSample) else json.loads(frame)
+            n += 1
+    return n, fr
+
+
+def bench(name, stream, nframes, chunk, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter(); n, fr = decode_all(stream, chunk); best = min(best, time.perf_counter() - t)
+    assert n == nframes, (name, n, nframes)
+    per = len(stream) / nframes
+    print(f"{name:5s} {per:6.1f} B/frame  line-rate max {BAUD / 10 / per:6.0f} frames/s @ {BAUD}  "
+          f"host decode {n / best:9.0f} frames/s ({best / n * 1e6:5.2f} us/frame)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=50000)
+    ap.add_argument("--chunk", type=int, default=4096)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--capture", help="raw recorded byte stream (JSON, BIN or mixed)")
+    a = ap.parse_args()
+    if a.capture:
+        n, fr = decode_all(open(a.capture, "rb").read(), a.chunk)
+        print(f"{a.capture}: {n} status frames", fr.counters()); return
+    ss = samples(a.frames)
+    for s in ss[:1000]:                         # round-trip encoder/decoder
+        d = decode_bin_frame(encode_bin_frame(s))
+        assert d.to_dict() == s.to_dict(), (d, s)
+    bench("JSON", b"".join(json_line(s) for s in ss), a.frames, a.chunk, a.repeat)
+    bench("BIN", b"".join(encode_bin_frame(s) for s in ss), a.frames, a.chunk, a.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Frame latency of the polling vs. selector SerialReader, using a pty pair as the Arduino.
+
+    python bench/bench_reader_latency.py --frames 500 --hz 50
+
+Each frame carries its write timestamp; latency is measured when statusParsed is
+delivered to a slot on the Qt main thread. Idle CPU is sampled with the line quiet.
+"""
+import argparse, json, os, pty, random, statistics, sys, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+import serial
+from PyQt6.QtCore import QCoreApplication, QObject, QTimer, pyqtSlot
+import Iot
+
+
+class Sink(QObject):
+    def __init__(self, n, app):
+        super().__init__(); self.n = n; self.app = app; self.lat = []
+    @pyqtSlot(object)
+    def on_status(self, st):
+        self.lat.append((time.perf_counter_ns() - st["t"]) / 1e6)
+        if len(self.lat) >= self.n: self.app.quit()
+
+
+def feed(master, n, hz):
+    rnd = random.Random(7)
+    for i in range(n):
+        time.sleep(rnd.uniform(0.5, 1.5) / hz)     # pha ngẫu nhiên so với chu kỳ poll
+        line = {"gas": rnd.randint(250, 600), "distance": 40, "led": 0, "fan": 0, "servo": 0, "alarm": 0,
+                "t": time.perf_counter_ns()}
+        os.write(master, (json.dumps(line) + "\r\n").encode())
+
+
+def measure(app, cls, n, hz, idle_s):
+    master, slave = pty.openpty()
+    ser = serial.Serial(os.ttyname(slave), Iot.DEFAULT_BAUD, timeout=0.1)
+    reader = cls(ser); sink = Sink(n, app)
+    reader.statusParsed.connect(sink.on_status)
+    reader.start()
+    threading.Thread(target=feed, args=(master, n, hz), daemon=True).start()
+    QTimer.singleShot(int(n / hz * 3000) + 2000, app.quit)
+    app.exec()
+    cpu0 = time.process_time(); time.sleep(idle_s); idle = time.process_time() - cpu0
+    reader.stop(); reader.wait(1000); ser.close(); os.close(master); os.close(slave)
+    lat = sorted(sink.lat)
+    if not lat:
+        print(f"{cls.__name__:22s} no frames received"); return
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))]
+    print(f"{cls.__name__:22s} n={len(lat):5d}  mean={statistics.mean(lat):7.2f} ms  p50={p(.5):7.2f}  "
+          f"p99={p(.99):7.2f}  max={lat[-1]:7.2f}  idle CPU={idle / idle_s * 100:5.2f}%")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--hz", type=float, default=50)
+    ap.add_argument("--idle", type=float, default=1.0, help="seconds of quiet line for the idle CPU sample")
+    a = ap.parse_args()
+    app = QCoreApplication(sys.argv)
+    for cls in (Iot.SerialReader, Iot.SelectorSerialReader):
+        measure(app, cls, a.frames, a.hz, a.idle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Auto-reconnect of the dashboard: unplug/replug a simulated board (sim.BoardSim) and time the recovery.
+
+    python bench/bench_reconnect.py --down 0,0.5,2,5 --runs 3
+    python bench/bench_reconnect.py --links /tmp/ttyIOT_bench      # chỉ backoff (watcher không thấy /tmp)
+
+The board is reached through a symlink to the pty. "Unplug" closes the pty
+(the reader gets EIO) and removes the link; after --down seconds a new pty
+is linked under the same name. A link in /dev named ttyUSB* is seen by
+ports.PortWatcher (inotify) and triggers an immediate retry, a link
+elsewhere is only found by the backoff timer. Reported per run:
+  detect  unplug → Main shows "Reconnecting…"
+  back    board available again → port reopened (what the backoff costs)
+  first   board available again → first status frame rendered
+"""
+import argparse, os, statistics, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen"); os.environ["IOT_LOG_DIR"] = ""
+from PyQt6.QtWidgets import QApplication
+import Iot
+from sim import BoardSim
+
+
+def wait(app, cond, timeout):
+    t_end = time.perf_counter() + timeout
+    while time.perf_counter() < t_end:
+        app.processEvents()
+        if cond(): return time.perf_counter()
+        time.sleep(0.001)
+    return None
+
+
+def relink(link, target):
+    if os.path.lexists(link): os.unlink(link)
+    if target: os.symlink(target, link)
+
+
+def run_link(app, link, downs, runs, rate):
+    sim = BoardSim("noise", rate).start(); relink(link, sim.port)
+    w = Iot.Main(); w.show(); w.ports.scan()
+    wait(app, lambda: w.ports.ports is not None, 5)
+    w.cbPort.setEditText(link); w.connect_serial()
+    if not wait(app, lambda: w.seq.received > 0, 5): sys.exit(f"no status from {link}")
+    print(f"{link}  (watcher: {w.ports.watcher.mode})")
+    for down in downs:
+        rows = []
+        for _ in range(runs):
+            n0 = w.reconnects
+            t0 = time.perf_counter(); sim.stop(); relink(link, None)
+            t_det = wait(app, lambda: w.lblStat.property("link") == "retry", 5)
+            wait(app, lambda: False, max(0.0, down - (time.perf_counter() - t0)))
+            sim = BoardSim("noise", rate).start(); t_back = time.perf_counter(); relink(link, sim.port)
+            t_up = wait(app, lambda: w.reconnects > n0, 30)
+            t_first = wait(app, lambda: w.seq.received > 0, 5)
+            if None in (t_det, t_up, t_first): print(f"  down {down:g} s: did not recover"); continue
+            rows.append((t_det - t0, t_up - t_back, t_first - t_back, w._attempts))
+        if rows:
+            med = lambda k: statistics.median(r[k] for r in rows) * 1e3
+            print(f"  down {down:4g} s  detect {med(0):7.1f} ms  back {med(1):7.1f} ms  first {med(2):7.1f} ms  "
+                  f"attempts {max(r[3] for r in rows)}")
+    w.close(); sim.stop(); relink(link, None); app.processEvents()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--down", default="0,0.5,2,5", help="seconds the board stays unplugged")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--rate", type=float, default=20, help="board stream rate (Hz)")
+    ap.add_argument("--links", default="", help="comma list; default: /dev/ttyUSBsim (if writable) and a /tmp link")
+    a = ap.parse_args()
+    links = a.links.split(",") if a.links else \
+        (["/dev/ttyUSBsim"] if os.access("/dev", os.W_OK) else []) + [os.path.join(tempfile.gettempdir(), "ttyIOT_bench")]
+    app = QApplication(sys.argv)
+    for link in links: run_link(app, link, [float(d) for d in a.down.split(",")], a.runs, a.rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Frame → command latency of the rules engine, on the ingest thread vs. on the GUI thread.
+
+    python bench/bench_rules.py --frames 200 --load-ms 25
+
+A pty pair stands in for the board. Each frame crosses THR LOW (gas 300 ↔ 500),
+so the engine answers with FAN/SERVO/LED; latency is measured on the
+master side from writing the frame to reading the FAN line. "gui" evaluates in a
+statusParsed slot while a timer keeps the main thread busy for --load-ms every
+33 ms (a heavy repaint); "ingest" evaluates in SerialReader.on_frame.
+"""
+import argparse, os, pty, random, select, statistics, sys, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+import serial
+from PyQt6.QtCore import QCoreApplication, QTimer
+import Iot
+from framing import StatusSample, encode_bin_frame
+from rules import RulesEngine, default_rules
+from txqueue import CommandWriter
+
+
+def drive(master, n, lat, app):
+    rnd = random.Random(3); buf = b""
+    for i in range(n):
+        gas = 500 if i % 2 == 0 else 300
+        t0 = time.perf_counter()
+        os.write(master, encode_bin_frame(StatusSample(i, gas, 40, 25.0, 60.0, 380, 450, "AUTO", 0, 0, 0, 0)))
+        deadline = t0 + 1.0
+        while True:
+            r, _, _ = select.select([master], [], [], max(0.0, deadline - time.perf_counter()))
+            if not r: break
+            buf += os.read(master, 4096)
+            if b"FAN" in buf:
+                lat.append((time.perf_counter() - t0) * 1e3); buf = b""; break
+        time.sleep(rnd.uniform(0.02, 0.04))
+    app.quit()
+
+
+def measure(app, mode, n, load_ms):
+    master, slave = pty.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0.1)
+    tx = CommandWriter(ser, min_interval=0.0).start()
+    eng = RulesEngine(default_rules(380))
+    reader = Iot.SelectorSerialReader(ser)
+    if mode == "ingest":
+        reader.on_frame = lambda st, t_rx: [tx.send(c, t_rx) for c in eng.evaluate(st, time.time())]
+    else:
+        reader.statusParsed.connect(lambda st: [tx.send(c) for c in eng.evaluate(st, time.time())])
+    busy = QTimer(); busy.setInterval(33)
+    def repaint():
+        end = time.perf_counter() + load_ms / 1000.0
+        while time.perf_counter() < end: pass
+    busy.timeout.connect(repaint)
+    if load_ms: busy.start()
+    reader.start(); lat = []
+    threading.Thread(target=drive, args=(master, n, lat, app), daemon=True).start()
+    app.exec()
+    busy.stop(); reader.stop(); reader.wait(1000); tx.stop(0); ser.close(); os.close(master); os.close(slave)
+    lat.sort()
+    if not lat: print(f"{mode:7s} no commands received"); return
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))]
+    print(f"{mode:7s} load={load_ms:4.0f} ms/33 ms  n={len(lat):4d}  mean={statistics.mean(lat):6.2f} ms  "
+          f"p50={p(.5):6.2f}  p99={p(.99):6.2f}  max={lat[-1]:6.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--load-ms", type=float, default=25, help="busy time per 33 ms GUI tick")
+    a = ap.parse_args()
+    eng = RulesEngine(default_rules(380)); st = {"gas": 400, "alarm": 0}
+    t = time.perf_counter(); N = 200000
+    for i in range(N):
+        st["gas"] = 300 + (i & 255); eng.evaluate(st, i * 0.01)
+    print(f"evaluate(): {(time.perf_counter() - t) / N * 1e6:.2f} us/frame")
+    app = QCoreApplication(sys.argv)
+    for mode in ("gui", "ingest"):
+        measure(app, mode, a.frames, a.load_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark suite on the firmware simulator (sim.BoardSim): reader, on_status and painters.
+
+    python bench/bench_sim.py --seconds 3 --rates 10,100,line --protos json,bin
+    python bench/bench_sim.py --stages gui --rates line --garbage 0.01 --profile leak+spike
+
+Stage "reader": SelectorSerialReader into a SampleRing sink; reports decoded
+frames/s, MB/s, write→decode latency (simulator timestamp taken right before
+os.write, reader's t_rx) and what the framer dropped vs. what was injected
+("stray bytes" also counts the firmware's \r of every line).
+Stage "gui": the full Main window connected to the simulator port (offscreen),
+once on the Dashboard tab (GasCanvas) and once on the home tab (nhapromax);
+reports statuses ingested, reader→slot queue latency, on_status and paint
+times from metrics.REGISTRY and the lateness of a 10 ms probe timer.
+The simulator runs in this process, so CPU% includes it.
+"""
+import argparse, math, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen"); os.environ["IOT_LOG_DIR"] = ""
+import serial
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+import Iot
+from ring import SampleRing
+from sim import BoardSim
+
+
+def pct(xs, q):
+    return sorted(xs)[min(len(xs) - 1, int(q * len(xs)))] if xs else float("nan")
+
+
+class Sink:
+    def __init__(self):
+        self.status = SampleRing(1 << 16); self.lines = SampleRing(4096)
+
+
+def stage_reader(rate, proto, a):
+    emitted = {}; lat = []
+    sim = BoardSim(a.profile, rate, proto, a.baud, a.garbage, on_emit=emitted.__setitem__).start()
+    ser = serial.Serial(sim.port, Iot.DEFAULT_BAUD, timeout=0)
+    reader = Iot.SelectorSerialReader(ser, sink=Sink()); sink = reader.sink
+    def on_frame(st, t_rx):
+        t = emitted.get(st.get("seq"))
+        if t is not None: lat.append(t_rx - t)
+    reader.on_frame = on_frame
+    reader.start(); time.sleep(0.3); sink.status.drain(); lat.clear()
+    c0, w0, b0, n0 = time.process_time(), time.perf_counter(), sim.bytes, sim.frames
+    got = 0; t_end = w0 + a.seconds
+    while time.perf_counter() < t_end:
+        time.sleep(0.05); got += len(sink.status.drain()); sink.lines.drain()
+    cpu, wall = time.process_time() - c0, time.perf_counter() - w0
+    got += len(sink.status.drain())
+    reader.stop(); reader.wait(1000); sim.stop(); ser.close()
+    c = reader.framer.counters()
+    print(f"reader {proto:4s} rate={_rate(rate):>5s}  {got / wall:8.0f} frames/s  {(sim.bytes - b0) / wall / 1e6:6.3f} MB/s  "
+          f"sent {sim.frames - n0}  lat p50 {pct(lat, .5) * 1e3:6.3f} ms p99 {pct(lat, .99) * 1e3:6.3f}  "
+          f"CPU {cpu / wall * 100:5.1f}%  dropped: non-frame lines {c['lines'] - c['frames']} crc {c.get('crc_errors', 0)} "
+          f"stray bytes {c['garbage']}  injected {sum(sim.injected.values())}")
+
+
+def stage_gui(app, rate, proto, a, tab):
+    Iot.MET.on = True; Iot.MET.reset()
+    sim = BoardSim(a.profile, rate, proto, a.baud, a.garbage).start()
+    Iot.PROTOCOL = proto.upper()
+    w = Iot.Main(); w.resize(1120, 740); w.show()
+    w.centralWidget().setCurrentIndex(tab)
+    w.cbPort.setEditText(sim.port); w.connect_serial()
+    lag = []; probe = QTimer(); probe.setInterval(10); last = [time.perf_counter()]
+    def tick():
+        now = time.perf_counter(); lag.append(now - last[0] - 0.010); last[0] = now
+    probe.timeout.connect(tick)
+    t_end = time.perf_counter() + 0.3
+    while time.perf_counter() < t_end: app.processEvents()
+    Iot.MET.reset(); probe.start(); last[0] = time.perf_counter()
+    c0, w0 = time.process_time(), time.perf_counter(); n0 = w.seq.received
+    t_end = w0 + a.seconds
+    while time.perf_counter() < t_end: app.processEvents()
+    cpu, wall = time.process_time() - c0, time.perf_counter() - w0
+    probe.stop(); got = w.seq.received - n0
+    h = {m.name + ("." + m.labels["widget"] if m.labels else ""): m for m in Iot.MET.items() if m.kind == "histogram"}
+    def fmt(key):
+        m = h[key]
+        return f"{m.sum / m.count * 1e3:6.3f}/{m.quantile(.99) * 1e3:6.2f}" if m.count else "     -/     -"
+    paint = "iot_paint_seconds.GasCanvas" if tab == 0 else "iot_paint_seconds.nhapromax"
+    print(f"gui    {proto:4s} rate={_rate(rate):>5s} {('dash', 'devs', 'home')[tab]}  {got / wall:7.0f} st/s  "
+          f"queue {fmt('iot_signal_queue_seconds')}  on_status {fmt('iot_on_status_seconds')}  "
+          f"paint {fmt(paint)} ({h[paint].count / wall:4.0f}/s)  loop lag p99 {pct(lag, .99) * 1e3:6.2f} ms  "
+          f"CPU {cpu / wall * 100:5.1f}%")
+    w.close(); sim.stop(); app.processEvents()
+    Iot.MET.on = False
+
+
+def _rate(r):
+    return "line" if r == math.inf else f"{r:g}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stages", default="reader,gui")
+    ap.add_argument("--rates", default="10,100,line", help='Hz list, "line" = as fast as --baud allows')
+    ap.add_argument("--protos", default="json,bin")
+    ap.add_argument("--seconds", type=float, default=3)
+    ap.add_argument("--baud", type=int, default=115200, help="0 = no UART pacing")
+    ap.add_argument("--garbage", type=float, default=0.0)
+    ap.add_argument("--profile", default="noise+spike")
+    a = ap.parse_args()
+    rates = [math.inf if r == "line" else float(r) for r in a.rates.split(",")]
+    protos = a.protos.split(",")
+    app = QApplication(sys.argv)
+    stages = a.stages.split(",")
+    if "reader" in stages:
+        for proto in protos:
+            for rate in rates: stage_reader(rate, proto, a)
+    if "gui" in stages:
+        print("gui: queue / on_status / paint = mean/p99 ms (p99 = histogram bucket bound)")
+        for proto in protos:
+            for rate in rates:
+                for tab in (0, 2): stage_gui(app, rate, proto, a, tab)
+
+
+if __name__ == "__main__":
+    main()
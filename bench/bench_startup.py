@@ -0,0 +1,97 @@
+"""Cold start of the dashboard: `python -X importtime -c "import Iot"` + time-to-first-paint.
+
+    python bench/bench_startup.py --runs 7
+    python bench/bench_startup.py --scan-delay 2     # comports() chậm như host nhiều cổng USB/ảo
+
+Every run is a fresh interpreter (offscreen). "first paint" is measured in
+the parent from spawn until the child reports that the Main window finished
+its first paint pass; the child also reports its own phases (import Iot,
+QApplication, Main(), show → first paint). --scan-delay makes
+serial.tools.list_ports.comports() sleep, to check that port enumeration
+stays off the path to the first paint. The importtime stage lists Iot's
+direct imports by cumulative time.
+"""
+import argparse, json, os, statistics, subprocess, sys, time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import os, sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, ROOT)
+if SCAN_DELAY:
+    import serial.tools.list_ports as lp
+    _comports = lp.comports
+    def comports(*a, **k):
+        time.sleep(SCAN_DELAY); return _comports(*a, **k)
+    lp.comports = comports
+    t0 = time.perf_counter()
+import Iot
+t1 = time.perf_counter()
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+t2 = time.perf_counter()
+done = []
+class M(Iot.Main):
+    def paintEvent(self, e):
+        super().paintEvent(e)
+        if not done: done.append(1); QTimer.singleShot(0, finish)   # sau khi cả lượt paint đầu xong
+def finish():
+    t4 = time.perf_counter()
+    print(json.dumps({"import": t1 - t0, "qapp": t2 - t1, "main": t3 - t2, "paint": t4 - t3}), flush=True)
+    os._exit(0)
+w = M(); w.resize(1120, 740)
+t3 = time.perf_counter()
+w.show(); app.exec()
+"""
+
+
+def env():
+    e = dict(os.environ, IOT_LOG_DIR="", QT_QPA_PLATFORM="offscreen")
+    e.setdefault("IOT_USER", "bench"); e.setdefault("IOT_PASSWORD", "bench")
+    return e
+
+
+def first_paint(scan_delay):
+    code = CHILD.replace("ROOT", repr(ROOT)).replace("SCAN_DELAY", repr(scan_delay))
+    t = time.perf_counter()
+    p = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env(), timeout=60)
+    total = time.perf_counter() - t
+    line = [l for l in p.stdout.splitlines() if l.startswith("{")]
+    if not line: sys.exit(f"child failed:\n{p.stderr}")
+    return dict(json.loads(line[-1]), total=total)
+
+
+def importtime(top):
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", "import Iot"], capture_output=True,
+                       text=True, env=env(), cwd=ROOT, timeout=60)
+    kids, mine, total = [], [], 0
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[13:]: continue
+        _, cum, name = line[12:].split("|")
+        if not cum.strip().isdigit(): continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2; name = name.strip()
+        if depth == 1: kids.append((int(cum), name))
+        elif depth == 0:
+            if name == "Iot": mine, total = kids, int(cum)
+            kids = []
+    print(f"import Iot: {total / 1e3:.1f} ms cumulative; heaviest direct imports:")
+    for cum, name in sorted(mine, reverse=True)[:top]: print(f"  {cum / 1e3:7.1f} ms  {name}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=7)
+    ap.add_argument("--scan-delay", type=float, default=0.0)
+    ap.add_argument("--top", type=int, default=12)
+    a = ap.parse_args()
+    importtime(a.top)
+    runs = [first_paint(a.scan_delay) for _ in range(a.runs)]
+    med = lambda k: statistics.median(r[k] for r in runs) * 1e3
+    print(f"first paint (median of {a.runs}, scan delay {a.scan_delay:g} s): {med('total'):.0f} ms from spawn")
+    print(f"  import Iot {med('import'):.0f} ms  QApplication {med('qapp'):.0f} ms  Main() {med('main'):.0f} ms  "
+          f"show → painted {med('paint'):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
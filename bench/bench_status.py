@@ -0,0 +1,169 @@
+"""Status record cost: per-frame dict (json.loads + st.get/float/int) vs StatusSample vs pooled StatusSample.
+
+    python bench/bench_status.py --frames 200000 --batch 34
+    python bench/bench_status.py --pipeline --frames 60000     # + Main (offscreen): SerialReader._feed → on_batch
+
+Frames come from sim.Firmware (JSON lines and PROTO BIN frames). Each
+variant decodes a frame the way the reader thread does and consumes it the
+way Main._render/_ingest + nhapromax.update_from_status do, in batches of
+--batch frames (what FrameCoalescer hands over per vsync tick, 1000 Hz / 30 fps):
+  dict    json.loads / StatusSample.to_dict(), then st.get + float()/int() per consumer (before)
+  sample  StatusSample.from_json / decode_bin_frame, consumers read attributes
+  pooled  same, instances from a SamplePool, released after the batch is consumed
+Reported: frames/s (best of --rounds) and, with tracemalloc, what one batch
+leaves allocated per frame (bytes, blocks) plus the transient peak per frame.
+--pipeline runs the real reader + Main.on_batch with IOT_SAMPLE_POOL off/on.
+"""
+import argparse, gc, os, sys, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen"); os.environ["IOT_LOG_DIR"] = ""
+import json
+from framing import StatusSample, SamplePool, decode_bin_frame
+from sim import Firmware, gas_profile
+
+
+def make_frames(n:int, proto:str) -> list:
+    fw = Firmware(gas=gas_profile("noise+spike"), dht_fail=0.02); fw.proto_bin = proto == "bin"
+    out = [fw.send_status(fw.t0 + i * 0.001, True) for i in range(n)]
+    return out if fw.proto_bin else [f.rstrip() for f in out]      # LineFramer bỏ \r\n
+
+
+def consume_dict(st, out):
+    """Main._render + _ingest + nhapromax.update_from_status trên dict (trước StatusSample)."""
+    gas = st.get("gas"); dist = st.get("distance")
+    if st.get("temperature") is not None: out.append(float(st["temperature"]))
+    if st.get("humidity") is not None: out.append(float(st["humidity"]))
+    if st.get("led") is not None: out.append(bool(int(st["led"])))
+    if st.get("fan") is not None: out.append(bool(int(st["fan"])))
+    if st.get("servo") is not None: out.append(int(st["servo"]))
+    out.append(bool(st.get("alarm", 0)))
+    if st.get("seq") is not None: out.append(int(st["seq"]))
+    out.append((gas, dist, st.get("gas_f"), st.get("warmup") or 0, st.get("gas_anomaly") or 0))
+    if st.get("gas") is not None: out.append(float(st["gas"]))
+    if st.get("temperature") is not None: out.append(float(st["temperature"]))
+    if st.get("humidity") is not None: out.append(float(st["humidity"]))
+    if st.get("led") is not None: out.append(bool(int(st["led"])))
+    if st.get("fan") is not None: out.append(bool(int(st["fan"])))
+    if st.get("servo") is not None: out.append(int(st["servo"]))
+    if st.get("alarm") is not None:
+        try: out.append(int(st["alarm"]) == 1)
+        except ValueError: out.append(False)
+
+
+def consume_sample(st, out):
+    """Cùng các consumer trên StatusSample (field đã chuẩn hoá, đọc thẳng attribute)."""
+    if st.temperature is not None: out.append(st.temperature)
+    if st.humidity is not None: out.append(st.humidity)
+    if st.led is not None: out.append(bool(st.led))
+    if st.fan is not None: out.append(bool(st.fan))
+    if st.servo is not None: out.append(st.servo)
+    out.append(bool(st.alarm))
+    if st.seq is not None: out.append(st.seq)
+    out.append((st.gas, st.distance, st.gas_f, st.warmup or 0, st.gas_anomaly or 0))
+    if st.gas is not None: out.append(float(st.gas))
+    if st.temperature is not None: out.append(st.temperature)
+    if st.humidity is not None: out.append(st.humidity)
+    if st.led is not None: out.append(bool(st.led))
+    if st.fan is not None: out.append(bool(st.fan))
+    if st.servo is not None: out.append(st.servo)
+    if st.alarm is not None: out.append(bool(st.alarm))
+
+
+def variants(proto:str):
+    pool = SamplePool(1024)
+    if proto == "bin":
+        dec = {"dict": lambda f: decode_bin_frame(f).to_dict(), "sample": decode_bin_frame,
+               "pooled": lambda f: decode_bin_frame(f, 0, pool)}
+    else:
+        dec = {"dict": json.loads, "sample": StatusSample.from_json, "pooled": lambda f: StatusSample.from_json(f, pool)}
+    return {"dict": (dec["dict"], consume_dict, None), "sample": (dec["sample"], consume_sample, None),
+            "pooled": (dec["pooled"], consume_sample, pool.release)}
+
+
+def run_batches(frames, batch, decode, consume, release):
+    out = []
+    for i in range(0, len(frames), batch):
+        got = [decode(f) for f in frames[i:i + batch]]
+        for st in got: consume(st, out)
+        if release:
+            for st in got: release(st)
+        out.clear()
+
+
+def alloc(frames, batch, decode, consume, release):
+    """Một lô sau khi đã chạy ấm: (bytes, blocks còn giữ, peak tạm thời) / frame."""
+    run_batches(frames[:batch * 4], batch, decode, consume, release)
+    gc.collect(); tracemalloc.start(); tracemalloc.reset_peak()
+    snap0 = tracemalloc.take_snapshot(); base = tracemalloc.get_traced_memory()[0]
+    out = []; got = []
+    for f in frames[batch * 4:batch * 5]:
+        st = decode(f); consume(st, out); got.append(st); out.clear()
+    cur, peak = tracemalloc.get_traced_memory(); snap1 = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in snap1.compare_to(snap0, "filename"))
+    n = len(got)
+    if release:
+        for st in got: release(st)
+    return (cur - base) / n, blocks / n, (peak - base) / n
+
+
+def micro(a):
+    print(f"decode + consume, batches of {a.batch}; alloc = left allocated per frame by one batch (tracemalloc)")
+    for proto in a.proto.split(","):
+        frames = make_frames(a.frames, proto)
+        print(f"{proto.upper():4s} ({len(frames)} frames)")
+        vs = variants(proto); best = dict.fromkeys(vs, float("inf"))
+        for _ in range(a.rounds):          # xen kẽ các biến thể: máy bận thì cả ba cùng chịu
+            for name, (decode, consume, release) in vs.items():
+                t = time.perf_counter(); run_batches(frames, a.batch, decode, consume, release)
+                best[name] = min(best[name], time.perf_counter() - t)
+        for name, (decode, consume, release) in vs.items():
+            size, blocks, peak = alloc(frames, a.batch, decode, consume, release)
+            print(f"  {name:6s}  {len(frames) / best[name] / 1e3:7.1f} k frames/s  {best[name] / len(frames) * 1e6:6.2f} µs/frame  "
+                  f"alloc {size:6.1f} B {blocks:4.1f} blocks  peak {peak:6.1f} B/frame")
+
+
+def pipeline(a):
+    from PyQt6.QtWidgets import QApplication
+    import Iot
+    app = QApplication(sys.argv)
+    data = b"\r\n".join(make_frames(a.frames, "json")) + b"\r\n"
+    chunk = max(1, len(data) // (a.frames // a.batch))
+    print(f"pipeline: SerialReader._feed ({chunk} B chunks, on_frame = DSP + rules) → FrameCoalescer.flush → Main.on_batch")
+    for cap in (0, 1024):
+        w = Iot.Main(); w.resize(1120, 740); w.show(); app.processEvents()
+        if w.frames: w.frames.timer.stop()
+        w.samples = SamplePool(cap) if cap else None
+        r = Iot.SerialReader(None, sink=w.frames, pool=w.samples)
+        r.on_frame = lambda st, t: (w.dsp.process(st, t), w.rules.evaluate(st, t))
+        def go(lo, hi):
+            n0 = w.frames.received
+            for i in range(lo, hi, chunk):
+                r._feed(data[i:min(i + chunk, hi)]); w.frames.flush()
+            return w.frames.received - n0
+        cut = [data.find(b"\n", len(data) * k // 3) + 1 for k in (1, 2)]      # ấm | đo tốc độ | tracemalloc
+        go(0, cut[0])
+        t = time.perf_counter(); n = go(cut[0], cut[1]); el = time.perf_counter() - t
+        gc.collect(); tracemalloc.start(); base = tracemalloc.get_traced_memory()[0]; tracemalloc.reset_peak()
+        go(cut[1], len(data)); cur, peak = tracemalloc.get_traced_memory(); tracemalloc.stop()
+        pool = f"pool {cap} (created {w.samples.created}, reused {w.samples.reused})" if cap else "no pool"
+        print(f"  {pool:40s}  {n / el / 1e3:6.1f} k frames/s  peak {(peak - base) / 1e3:7.1f} kB  "
+              f"left {(cur - base) / 1e3:6.1f} kB  rendered {w.frames.rendered}")
+        w.close(); app.processEvents()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=200_000)
+    ap.add_argument("--batch", type=int, default=34, help="frames per vsync batch (rate / UI fps)")
+    ap.add_argument("--proto", default="json,bin")
+    ap.add_argument("--rounds", type=int, default=5, help="timing rounds, best is reported")
+    ap.add_argument("--pipeline", action="store_true", help="also run the reader + Main.on_batch pipeline")
+    a = ap.parse_args()
+    micro(a)
+    if a.pipeline: pipeline(a)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Write throughput of TelemetryLog and open/query time of LogReader.
+
+    python bench/bench_telemetry_log.py --records 600000 --dir /tmp/iot-bench-log
+"""
+import argparse, os, random, shutil, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import telemetry as T
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=604800, help="default: one week at 1 Hz")
+    ap.add_argument("--dir", help="log directory (default: a temp dir, removed afterwards)")
+    a = ap.parse_args()
+    d = a.dir or tempfile.mkdtemp(prefix="iot-log-")
+    shutil.rmtree(d, ignore_errors=True)
+    rnd = random.Random(1); t0 = time.time() - a.records
+    sts = [{"gas": rnd.randint(250, 600), "distance": rnd.randint(-1, 300), "temperature": 25.0 + rnd.random(),
+            "humidity": 60.0, "led": 0, "fan": 0, "servo": 0, "alarm": 0, "seq": i & 0xFFFF,
+            "threshold_low": 380, "threshold_high": 450} for i in range(min(a.records, 10000))]
+    log = T.TelemetryLog(d, segment_seconds=float("inf")).start()
+    t = time.perf_counter()
+    for i in range(a.records):
+        log.append_status(sts[i % len(sts)], t0 + i)
+        if i % 600 == 0: log.append_command("FAN 1", t0 + i + 0.5)
+    t_append = time.perf_counter() - t
+    log.close(); t_total = time.perf_counter() - t
+    size = sum(os.path.getsize(os.path.join(d, n)) for n in os.listdir(d))
+    print(f"append  {log.records:9d} records  caller {log.records / t_append:10.0f} rec/s "
+          f"({t_append / log.records * 1e6:.2f} us/rec)  incl. write+fsync+compress {log.records / t_total:10.0f} rec/s")
+    print(f"disk    {size / 1e6:8.2f} MB in {len(os.listdir(d))} segments  "
+          f"({size / log.records:.1f} B/rec vs {T.REC_SIZE} raw)  fsyncs={log.fsyncs}")
+    t = time.perf_counter(); r = T.LogReader(d); t_open = time.perf_counter() - t
+    print(f"open    {t_open * 1e3:8.2f} ms  ({sum(s.n for s in r.segments)} records, mmap + block headers only)")
+    for span in (3600, 86400):
+        t = time.perf_counter(); n = sum(1 for _ in r.records(t0 + a.records / 2, t0 + a.records / 2 + span))
+        print(f"query   {span:6d} s  {n:7d} records  {(time.perf_counter() - t) * 1e3:8.2f} ms")
+    out = os.path.join(d, "export.csv")
+    t = time.perf_counter(); n = r.export_csv(out, t0, t0 + 86400)
+    print(f"export  {n:7d} records to CSV  {(time.perf_counter() - t) * 1e3:8.2f} ms")
+    r.close()
+    if not a.dir: shutil.rmtree(d, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
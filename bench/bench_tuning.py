@@ -0,0 +1,93 @@
+"""Threshold what-if replay (tuning.sweep): numpy grid sweep vs RulesEngine replay, and sweep time over weeks of data.
+
+    python bench/bench_tuning.py --days 14 --lo 300:450:5 --hi 400:600:10
+    python bench/bench_tuning.py --check-days 0.5 --days 0        # chỉ so khớp với bản tham chiếu
+
+Synthetic 1 Hz history: MQ-2 noise around a slowly drifting baseline, short
+spikes, and leaks (ramp up, plateau above 450, decay) every few hours, with
+board reboots (seq restarts, DSP warm-up) and link gaps. First a short slice
+is swept both ways for several rule settings (raw / gas_pred, hysteresis,
+debounce, min hold) and every metric must match tuning.sweep_py, which runs
+rules.RulesEngine and the firmware branch sample by sample. Then the full
+--days history is swept over the --lo × --hi grid: load (SharedArrays, like
+Main.tune_thresholds without a log) + DSP + sweep time, and the top pairs.
+"""
+import argparse, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import tuning
+
+
+def history(days:float, seed:int=1) -> dict:
+    rng = np.random.default_rng(seed); n = int(days * 86400)
+    t = 1.7e9 + np.arange(n, dtype=np.float64)
+    base = 300 + 30 * np.sin(t / 21600) + np.cumsum(rng.normal(0, 0.05, n))
+    gas = base + rng.normal(0, 12, n) + 300 * (rng.random(n) < 0.0005)
+    for s in rng.integers(0, max(1, n - 3600), max(1, int(days * 6))):     # rò gas: ~6 lần/ngày
+        up = int(rng.integers(20, 300)); hold = int(rng.integers(5, 600)); peak = rng.uniform(420, 700)
+        k = np.arange(up + hold + 600)
+        shape = np.where(k < up, k / up, np.where(k < up + hold, 1.0, np.exp(-(k - up - hold) / 120)))
+        gas[s:s + len(k)] += (peak - base[s]) * shape[:len(gas[s:s + len(k)])]
+    gas = np.clip(np.round(gas), 0, 1023)
+    seq = np.arange(n) & 0xFFFF
+    for r in rng.integers(0, n, max(1, int(days))):          # board reboot: seq về 0
+        seq[r:] = np.arange(n - r) & 0xFFFF
+    gas[rng.random(n) < 0.001] = np.nan                      # frame hỏng / thiếu
+    keep = np.ones(n, dtype=bool)
+    for g in rng.integers(0, n, max(1, int(days * 2))): keep[g:g + int(rng.integers(60, 900))] = False
+    return {"t": t[keep], "gas": gas[keep], "seq": seq[keep]}
+
+
+def check(a):
+    h = history(a.check_days, a.seed + 1)
+    lo, hi = tuning.grid("340:420:20"), tuning.grid("400:520:40")
+    print(f"check vs RulesEngine replay: {len(h['t'])} samples, {len(lo)} × {len(hi)} pairs")
+    bad = 0
+    for field, hyst, deb, hold in (("gas", 0, 0, 0), ("gas_pred", 0, 0, 0), ("gas", 10, 0, 0),
+                                   ("gas_pred", 15, 3, 0), ("gas", 5, 2, 30), ("gas_pred", 0, 0, 20)):
+        args = (h["t"], h["gas"], lo, hi, h["seq"], field, hyst, deb, hold)
+        t0 = time.perf_counter(); ref = tuning.sweep_py(*args); t1 = time.perf_counter()
+        got = tuning.sweep(*args); t2 = time.perf_counter()
+        diff = [m for m in tuning.METRICS
+                if not np.allclose(np.asarray(ref[m], dtype=float), got[m], equal_nan=True, atol=1e-6)]
+        if ref["incidents"] != got["incidents"]: diff.append("incidents")
+        bad += bool(diff)
+        print(f"  {field:8s} hyst {hyst:3g} debounce {deb:3g} hold {hold:3g}: {got['incidents']} incidents  "
+              f"alarms {int(np.nanmin(got['alarms']))}..{int(np.nanmax(got['alarms']))}  "
+              f"reference {t1 - t0:6.2f} s  numpy {(t2 - t1) * 1e3:7.1f} ms  {'MISMATCH ' + ','.join(diff) if diff else 'ok'}")
+    return bad
+
+
+def full(a):
+    import workers
+    t = time.perf_counter(); h = history(a.days, a.seed); t_gen = time.perf_counter() - t
+    lo, hi = tuning.grid(a.lo), tuning.grid(a.hi)
+    print(f"sweep: {a.days:g} days, {len(h['t'])} samples (generated in {t_gen:.1f} s), "
+          f"{len(lo)} × {len(hi)} = {len(lo) * len(hi)} candidate pairs")
+    with workers.SharedArrays(h) as src:
+        for field, hyst, deb in (("gas_pred", 0, 0), ("gas", 10, 0), ("gas_pred", 10, 2)):
+            t = time.perf_counter()
+            res = workers.tune(workers.InlineContext(), src, lo, hi, field=field, hysteresis=hyst, debounce_s=deb)
+            el = time.perf_counter() - t
+            pairs = int(np.isfinite(res["alarms"]).sum())
+            print(f"  {field:8s} hyst {hyst:3g} debounce {deb:3g}: {el:6.2f} s  ({pairs / el:7.0f} pairs/s, "
+                  f"{len(h['t']) * (len(lo) + len(hi)) / el / 1e6:6.1f} M sample-thresholds/s)  "
+                  f"{res['incidents']} incidents  best {tuning.best(res)}")
+        for line in tuning.table(res, a.top, (380.0, 450.0)): print("    " + line)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=float, default=14, help="history for the timed sweep (0 = skip)")
+    ap.add_argument("--check-days", type=float, default=1, help="history for the reference check (0 = skip)")
+    ap.add_argument("--lo", default="300:450:5"); ap.add_argument("--hi", default="400:600:10")
+    ap.add_argument("--top", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    bad = check(a) if a.check_days > 0 else 0
+    if a.days > 0: full(a)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
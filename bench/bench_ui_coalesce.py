@@ -0,0 +1,76 @@
+"""Event-loop responsiveness of the dashboard under a high status frame rate.
+
+    python bench/bench_ui_coalesce.py --rate 500 --seconds 3
+
+A producer thread feeds synthetic StatusSamples either through the per-frame
+statusParsed signal (legacy, IOT_UI_FPS=0) or through FrameCoalescer rings.
+A 10 ms probe timer measures how late the GUI thread services it.
+"""
+import argparse, os, random, statistics, sys, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("IOT_USER", "bench"); os.environ.setdefault("IOT_PASSWORD", "bench")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QApplication
+import Iot
+from framing import StatusSample
+
+
+class Emitter(QObject):
+    statusParsed = pyqtSignal(object)
+    lineReceived = pyqtSignal(str)
+
+
+def produce(rate, seconds, push_status, push_line, stop):
+    rnd = random.Random(5); period = 1.0 / rate; t0 = time.perf_counter(); i = 0
+    while not stop.is_set() and time.perf_counter() - t0 < seconds:
+        gas = 300 + int(150 * abs(((i % 2000) / 1000.0) - 1)) + rnd.randint(-5, 5)
+        st = StatusSample(i & 0xFFFF, gas, 40, 25.0, 60.0, led=int(gas > 380), fan=int(gas > 380),
+                          servo=90 if gas >= 450 else 0, alarm=int(gas >= 450))
+        push_line(f'{{"gas":{gas}}}'); push_status(st); i += 1
+        target = t0 + i * period
+        while time.perf_counter() < target: time.sleep(0)   # tốc độ ổn định kể cả > 1 kHz
+    return i
+
+
+def run(app, coalesce, rate, seconds):
+    w = Iot.Main(); w.resize(1120, 740); w.show()
+    if coalesce:
+        fr = w.frames; push_status, push_line = fr.status.push, fr.lines.push
+    else:
+        if w.frames: w.frames.timer.stop()
+        em = Emitter(); em.statusParsed.connect(w.on_status); em.lineReceived.connect(w.on_line)
+        push_status, push_line = em.statusParsed.emit, em.lineReceived.emit
+    lags = []; last = [time.perf_counter()]
+    def probe():
+        now = time.perf_counter(); lags.append((now - last[0]) * 1e3 - 10); last[0] = now
+    pt = QTimer(); pt.setInterval(10); pt.timeout.connect(probe); pt.start()
+    stop = threading.Event(); sent = [0]
+    th = threading.Thread(target=lambda: sent.__setitem__(0, produce(rate, seconds, push_status, push_line, stop)))
+    t0 = time.perf_counter(); th.start()
+    while th.is_alive(): app.processEvents()
+    t_end = time.perf_counter() + 0.5
+    while time.perf_counter() < t_end: app.processEvents()     # xả phần còn tồn
+    el = time.perf_counter() - t0
+    pt.stop()
+    lags.sort()
+    rendered = w.frames.rendered if coalesce else sent[0]
+    print(f"{'coalesced' if coalesce else 'per-frame':10s} rate={rate:5d}/s sent={sent[0]:6d} rendered={rendered:6d} "
+          f"({rendered / el:6.1f}/s)  probe lag mean={statistics.mean(lags):6.1f} ms "
+          f"p99={lags[int(.99 * (len(lags) - 1))]:7.1f} ms  max={lags[-1]:7.1f} ms  history={len(w.canvas.history)}")
+    w.close(); w.deleteLater(); app.processEvents()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=int, nargs="+", default=[100, 500, 2000])
+    ap.add_argument("--seconds", type=float, default=3.0)
+    a = ap.parse_args()
+    app = QApplication(sys.argv)
+    for rate in a.rate:
+        run(app, False, rate, a.seconds)
+        run(app, True, rate, a.seconds)
+
+
+if __name__ == "__main__":
+    main()
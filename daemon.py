@@ -0,0 +1,461 @@
+# ---------- Headless daemon: serial ingest + auto logic + log, API HTTP/WebSocket (không Qt) ----------
+"""Run the gateway without Qt: DeviceHub ingest, host auto logic, TelemetryLog,
+and a small HTTP + WebSocket API on asyncio (stdlib only).
+
+    python daemon.py --port /dev/ttyUSB0 --port /dev/ttyUSB1 --stream 5 --proto BIN
+    python daemon.py --port /dev/ttyUSB0 --mqtt localhost:1883      # + bridge MQTT (mqtt.py)
+    curl localhost:8765/api/devices
+    curl -d 'FAN 1' 'localhost:8765/api/command?device=/dev/ttyUSB0'
+
+Endpoints: GET /api/devices, /api/status, /api/history, /api/stats;
+POST /api/command (text "LED 1" or JSON {"device", "cmd"}); GET /ws upgrades to a
+WebSocket that streams one JSON text message per status frame (?device= to
+filter; required when several boards are open) and accepts command lines. With IOT_API_TOKEN set, every request needs
+"Authorization: Bearer <token>" (or ?token=).
+The dashboard connects to it as a client: type ws://host:8765/ws as the port.
+"""
+import argparse, asyncio, base64, hashlib, hmac, json, math, os, re, signal, socket, struct, sys, threading, time
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
+from hub import DeviceHub, auto_alarm
+from telemetry import TelemetryLog, LogLocked, LOG_DIR
+
+API_HOST = os.getenv("IOT_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("IOT_API_PORT", "8765"))
+API_TOKEN = os.getenv("IOT_API_TOKEN", "")
+SUB_BUFFER_LIMIT = 256 << 10     # subscriber chậm: quá mức này thì bỏ frame thay vì phình bộ nhớ
+MAX_BODY = 64 << 10
+COMMANDS = frozenset(("STATUS", "LED", "FAN", "SERVO", "THRLO", "THRHI", "ALARM", "AUTO", "STREAM", "PROTO"))
+
+# ---------- WebSocket (RFC 6455, chỉ phần cần dùng) ----------
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 1, 2, 8, 9, 10
+
+
+def ws_accept(key:str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+
+
+def ws_frame(op:int, payload:bytes, mask:bool=False) -> bytes:
+    """One FIN frame; client → server frames must be masked."""
+    n = len(payload)
+    if n < 126: head = struct.pack("!BB", 0x80 | op, n | (0x80 if mask else 0))
+    elif n < 1 << 16: head = struct.pack("!BBH", 0x80 | op, 126 | (0x80 if mask else 0), n)
+    else: head = struct.pack("!BBQ", 0x80 | op, 127 | (0x80 if mask else 0), n)
+    if not mask: return head + payload
+    key = os.urandom(4)
+    return head + key + _unmask(payload, key)
+
+
+def _unmask(payload:bytes, key:bytes) -> bytes:
+    n = len(payload)
+    if not n: return b""
+    k = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(k, "big")).to_bytes(n, "big")
+
+
+def ws_parse(buf:bytearray):
+    """Pop one complete frame from `buf`: (opcode, payload) or None if incomplete."""
+    if len(buf) < 2: return None
+    b0, b1 = buf[0], buf[1]; n = b1 & 0x7F; pos = 2
+    if n == 126:
+        if len(buf) < 4: return None
+        n = struct.unpack_from("!H", buf, 2)[0]; pos = 4
+    elif n == 127:
+        if len(buf) < 10: return None
+        n = struct.unpack_from("!Q", buf, 2)[0]; pos = 10
+    key = None
+    if b1 & 0x80:
+        if len(buf) < pos + 4: return None
+        key = bytes(buf[pos:pos + 4]); pos += 4
+    if len(buf) < pos + n: return None
+    payload = bytes(buf[pos:pos + n]); del buf[:pos + n]
+    return b0 & 0x0F, (_unmask(payload, key) if key else payload)
+
+
+async def ws_read(reader) -> tuple:
+    b0, b1 = await reader.readexactly(2); n = b1 & 0x7F
+    if n == 126: n = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif n == 127: n = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if n > MAX_BODY: raise ValueError("frame too large")
+    key = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    return b0 & 0x0F, (_unmask(payload, key) if key else payload)
+
+
+class ApiLink:
+    """pyserial-like endpoint over the daemon WebSocket, so SerialReader/CommandWriter work unchanged.
+
+    read() returns the buffered status messages as JSON lines; write() sends
+    command lines as one text frame.
+    """
+
+    def __init__(self, url:str, timeout:float=0.1, token:str=API_TOKEN):
+        u = urlsplit(url); host = u.hostname or "127.0.0.1"; port = u.port or 80
+        path = (u.path or "/ws") + (f"?{u.query}" if u.query else "")
+        self.port = url; self.timeout = timeout; self.is_open = False; self.errors = 0; self.last_error = None
+        self._raw = bytearray(); self._out = bytearray(); self._lock = threading.Lock()
+        self.sock = socket.create_connection((host, port), 5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        auth = f"Authorization: Bearer {token}\r\n" if token else ""
+        self.sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                           f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+                           f"{auth}\r\n").encode())
+        while b"\r\n\r\n" not in self._raw:
+            chunk = self.sock.recv(4096)
+            if not chunk: self.sock.close(); raise OSError("connection closed during handshake")
+            self._raw += chunk
+        i = self._raw.index(b"\r\n\r\n") + 4
+        head = self._raw[:i].decode("latin-1"); del self._raw[:i]
+        if not head.startswith("HTTP/1.1 101") or ws_accept(key) not in head:
+            self.sock.close()
+            raise OSError(f"WebSocket handshake failed: {head.splitlines()[0]} {bytes(self._raw).decode('utf-8', 'replace')}".rstrip())
+        self.sock.settimeout(timeout); self.is_open = True
+        self._parse()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._out)
+
+    def read(self, n:int=1) -> bytes:
+        if not self._out and self.is_open:
+            try: chunk = self.sock.recv(65536)
+            except socket.timeout: chunk = None
+            except OSError: chunk = b""
+            if chunk == b"": self.is_open = False
+            elif chunk: self._raw += chunk; self._parse()
+        out = bytes(self._out); del self._out[:]
+        return out
+
+    def _parse(self):
+        while True:
+            f = ws_parse(self._raw)
+            if f is None: return
+            op, payload = f
+            if op == OP_TEXT:
+                # {"error": ...} trả lời lệnh sai: không phải status, không đưa lên reader
+                if payload.startswith(b'{"error"'): self.errors += 1; self.last_error = payload.decode("utf-8", "replace")
+                else: self._out += payload; self._out += b"\n"
+            elif op == OP_PING: self._send(OP_PONG, payload)
+            elif op == OP_CLOSE: self.is_open = False; return
+
+    def _send(self, op, payload):
+        with self._lock: self.sock.sendall(ws_frame(op, payload, mask=True))
+
+    def write(self, data:bytes) -> int:
+        if not self.is_open: raise OSError("API link closed")
+        self._send(OP_TEXT, bytes(data)); return len(data)
+
+    def close(self):
+        if self.is_open:
+            try: self._send(OP_CLOSE, struct.pack("!H", 1000))
+            except OSError: pass
+        self.is_open = False; self.sock.close()
+
+
+# ---------- API server ----------
+class _Subscriber:
+    __slots__ = ("writer", "device", "task", "delivered", "dropped")
+
+    def __init__(self, writer, device):
+        self.writer = writer; self.device = device; self.task = asyncio.current_task()
+        self.delivered = 0; self.dropped = 0
+
+
+def _json_safe(v):
+    """NaN / ±inf → None (JSON không có NaN), đệ quy qua dict / list."""
+    if isinstance(v, float): return v if math.isfinite(v) else None
+    if isinstance(v, dict): return {k: _json_safe(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)): return [_json_safe(x) for x in v]
+    return v
+
+
+def _dumps(obj) -> bytes:
+    """JSON chuẩn (allow_nan=False); chỉ khi có giá trị không hữu hạn mới đi qua _json_safe."""
+    try: s = json.dumps(obj, separators=(",", ":"), allow_nan=False)
+    except ValueError: s = json.dumps(_json_safe(obj), separators=(",", ":"), allow_nan=False)
+    return s.encode()
+
+
+class TelemetryApi:
+    """HTTP/WebSocket front of a DeviceHub.
+
+    publish() may be called from any thread (the hub's I/O thread): messages
+    are serialized there once, queued, and one call_soon_threadsafe per batch
+    hands them to the loop, which frames each message once and writes one
+    joined blob per subscriber. Subscribers whose socket buffer is over
+    SUB_BUFFER_LIMIT lose messages (counted) instead of stalling the others.
+    """
+
+    def __init__(self, hub:DeviceHub, token:str=API_TOKEN):
+        self.hub = hub; self.token = token
+        self.subs = set(); self.loop = None; self.server = None
+        self._pending = deque(); self._scheduled = False
+        self.published = 0; self.delivered = 0; self.dropped = 0; self.requests = 0
+
+    async def start(self, host:str=API_HOST, port:int=API_PORT):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._client, host, port)
+        return self
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server: self.server.close()
+        tasks = [sub.task for sub in self.subs if sub.task]
+        for sub in list(self.subs):
+            try: sub.writer.write(ws_frame(OP_CLOSE, struct.pack("!H", 1001))); sub.writer.close()
+            except Exception: pass
+        if tasks: await asyncio.wait(tasks, timeout=1.0)     # session tự kết thúc khi socket đóng
+        if self.server: await self.server.wait_closed()
+
+    def publish(self, device:str, st, t:float|None=None):
+        msg = st.to_dict(); msg["device"] = device; msg["t"] = round(time.time() if t is None else t, 3)
+        self._pending.append((device, _dumps(msg)))
+        if not self._scheduled and self.loop is not None:
+            self._scheduled = True
+            self.loop.call_soon_threadsafe(self._flush)
+
+    def _flush(self):
+        self._scheduled = False
+        items = []; pending = self._pending
+        while pending: items.append(pending.popleft())
+        self.published += len(items)
+        if not items or not self.subs: return
+        frames = [(dev, ws_frame(OP_TEXT, payload)) for dev, payload in items]
+        blobs = {}
+        for sub in list(self.subs):
+            blob = blobs.get(sub.device)
+            if blob is None:
+                sel = [f for d, f in frames if sub.device is None or d == sub.device]
+                blob = blobs[sub.device] = (b"".join(sel), len(sel))
+            data, n = blob
+            if not n: continue
+            tr = sub.writer.transport
+            if tr.is_closing(): continue
+            if tr.get_write_buffer_size() > SUB_BUFFER_LIMIT:
+                sub.dropped += n; self.dropped += n; continue
+            sub.writer.write(data); sub.delivered += n; self.delivered += n
+
+    # ---- HTTP ----
+    async def _client(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = lines[0].split(" ", 2)
+            headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+            url = urlsplit(target); q = dict(parse_qsl(url.query))
+            n = int(headers.get("content-length") or 0)
+            if n > MAX_BODY: raise ValueError("body too large")
+            body = await reader.readexactly(n) if n else b""
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError, ConnectionError):
+            writer.close(); return
+        self.requests += 1
+        if self.token:
+            got = headers.get("authorization", "").removeprefix("Bearer ").strip() or q.get("token", "")
+            if not hmac.compare_digest(got.encode(), self.token.encode()):
+                await self._respond(writer, 401, {"error": "unauthorized"}); return
+        if url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._ws_session(reader, writer, headers, q.get("device")); return
+        try: code, obj = self._route(method, url.path, q, body, headers.get("content-type", ""))
+        except KeyError as e: code, obj = 404, {"error": f"unknown device {e.args[0]!r}"}
+        except ValueError as e: code, obj = 400, {"error": str(e)}
+        except Exception as e:            # lỗi lạ: vẫn trả lời và đóng kết nối
+            print(f"API {method} {url.path}: {e!r}", file=sys.stderr)
+            code, obj = 500, {"error": f"internal error: {e.__class__.__name__}"}
+        await self._respond(writer, code, obj)
+
+    async def _respond(self, writer, code:int, obj):
+        body = _dumps(obj)
+        reason = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+                  500: "Internal Server Error"}.get(code, "")
+        writer.write(f"HTTP/1.1 {code} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        try: await writer.drain()
+        except ConnectionError: pass
+        writer.close()
+
+    def _device(self, name:str|None):
+        devs = self.hub.devices
+        if name: return devs[name]
+        if len(devs) == 1: return next(iter(devs.values()))
+        raise ValueError("device=<name> required")
+
+    def _route(self, method, path, q, body, ctype):
+        if path == "/api/command":
+            if method != "POST": return 405, {"error": "POST only"}
+            if "json" in ctype:
+                req = json.loads(body or b"{}")
+                if not isinstance(req, dict): raise ValueError('JSON body must be an object {"device", "cmd"}')
+                cmd = str(req.get("cmd", "")); name = req.get("device") or q.get("device")
+            else:
+                cmd = body.decode("utf-8", "replace"); name = q.get("device")
+            dev = self._device(name)
+            sent = [self.command(dev, c) for c in cmd.splitlines() if c.strip()]
+            return 200, {"device": dev.name, "queued": sent}
+        if method != "GET": return 405, {"error": "GET only"}
+        if path == "/api/devices":
+            return 200, [self._describe(d) for d in list(self.hub.devices.values())]
+        if path == "/api/status":
+            st = self._device(q.get("device")).latest
+            return 200, st and st.to_dict()
+        if path == "/api/history":
+            dev = self._device(q.get("device")); now = time.time(); field = q.get("field", "gas")
+            if field not in dev.store.fields:
+                raise ValueError(f"unknown field {field!r} (one of {', '.join(dev.store.fields)})")
+            t1 = float(q.get("to", now)); t0 = float(q.get("from", t1 - 600))
+            r = dev.store.query(field, t0, t1, int(q.get("points", 1000)))
+            return 200, {k: ([_json_safe(v) for v in a] if k != "width" else a) for k, a in r.items()}
+        if path == "/api/stats":
+            return 200, {"published": self.published, "delivered": self.delivered, "dropped": self.dropped,
+                         "subscribers": len(self.subs), "requests": self.requests,
+                         "devices": {d.name: d.counters() for d in list(self.hub.devices.values())}}
+        return 404, {"error": "not found"}
+
+    def _describe(self, dev) -> dict:
+        return {"name": dev.name, "latest": dev.latest and dev.latest.to_dict(), "threshold_low": dev.threshold_low,
+                "threshold_high": dev.threshold_high, "stream_hz": dev.stream_hz, "error": dev.error,
+                "frames": dev.frames}
+
+    def command(self, dev, cmd:str) -> str:
+        """Validate and queue one command line; THRLO/THRHI/STREAM also update the hub's per-device state."""
+        cmd = " ".join(cmd.split()); parts = cmd.upper().split()
+        if not parts or parts[0] not in COMMANDS: raise ValueError(f"unknown command {cmd!r}")
+        verb = parts[0]
+        if verb in ("THRLO", "THRHI", "STREAM", "SERVO", "LED", "FAN"):
+            if len(parts) != 2 or not re.fullmatch(r"\d+", parts[1]): raise ValueError(f"{verb} needs one integer")
+        if verb == "THRLO": dev.threshold_low = int(parts[1])
+        elif verb == "THRHI": dev.threshold_high = int(parts[1])
+        if verb == "STREAM": self.hub.set_stream(dev.name, int(parts[1]))
+        else: self.hub.send(dev.name, cmd)
+        return cmd
+
+    # ---- WebSocket ----
+    async def _ws_session(self, reader, writer, headers, device):
+        key = headers.get("sec-websocket-key")
+        if not key or (device and device not in self.hub.devices):
+            await self._respond(writer, 400, {"error": "bad websocket request"}); return
+        if not device:
+            # không có ?device=: frame của nhiều board xen kẽ nhau phá SeqTracker / DeviceState phía client
+            devs = list(self.hub.devices)
+            if len(devs) > 1:
+                await self._respond(writer, 400, {"error": f"device=<name> required ({', '.join(devs)})"}); return
+            if devs: device = devs[0]
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept(key)}\r\n\r\n").encode())
+        sock = writer.get_extra_info("socket")
+        if sock is not None: sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sub = _Subscriber(writer, device); self.subs.add(sub)
+        try:
+            while True:
+                op, payload = await ws_read(reader)
+                if op == OP_CLOSE:
+                    writer.write(ws_frame(OP_CLOSE, payload[:2])); break
+                if op == OP_PING: writer.write(ws_frame(OP_PONG, payload)); continue
+                if op != OP_TEXT: continue
+                for line in payload.decode("utf-8", "replace").splitlines():
+                    if not line.strip(): continue
+                    try:
+                        if line.lstrip().startswith("{"):
+                            req = json.loads(line)
+                            if not isinstance(req, dict): raise ValueError("command must be a JSON object")
+                            self.command(self._device(req.get("device") or device), str(req.get("cmd", "")))
+                        else:
+                            self.command(self._device(device), line)
+                    except (KeyError, ValueError) as e:
+                        writer.write(ws_frame(OP_TEXT, json.dumps({"error": str(e)}).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.subs.discard(sub); writer.close()
+
+
+# ---------- CLI ----------
+def _slug(name:str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "dev"
+
+
+async def run(args):
+    logs = {}
+    auto = auto_alarm()
+    api = None; bridge = None
+
+    def on_sample(hub, dev, st):
+        auto(hub, dev, st)
+        log = logs.get(dev.name)
+        if log: log.append_status(st, dev.last_frame)
+        api.publish(dev.name, st, dev.last_frame)
+        if bridge is not None:
+            bridge.publish_status(dev.name, st, dev.last_frame)
+            if st.changed: bridge.publish_state(dev.name, st, st.changed)
+
+    def on_sent(hub, dev, cmd):
+        log = logs.get(dev.name)
+        if log: log.append_command(cmd)
+        if bridge is not None: bridge.publish_command(dev.name, cmd)
+
+    def on_mqtt_command(slug, cmd):
+        from mqtt import topic_slug
+        dev = next((d for d in list(hub.devices.values()) if topic_slug(d.name) == slug), None)
+        if dev is None: return
+        try: api.command(dev, cmd)
+        except ValueError as e: print(f"mqtt: {e}", file=sys.stderr, flush=True)
+
+    hub = DeviceHub(args.poll, on_sample=on_sample, on_sent=on_sent)
+    api = await TelemetryApi(hub, args.token).start(args.host, args.http_port)
+    if args.mqtt:
+        from mqtt import MqttBridge, parse_url
+        host, port, user, pw = parse_url(args.mqtt)
+        bridge = MqttBridge(host, port, args.mqtt_prefix, user=user, password=pw, on_command=on_mqtt_command).start()
+    hub.start()
+    for port in args.port:
+        if args.log_dir:
+            try: logs[port] = TelemetryLog(os.path.join(args.log_dir, _slug(port))).start()
+            except LogLocked as e: print(f"{port}: {e}, not logging", file=sys.stderr, flush=True)
+        hub.open(port, args.baud, threshold_low=args.thr_lo, threshold_high=args.thr_hi, dsp=not args.no_dsp)
+        hub.set_thresholds(port, args.thr_lo, args.thr_hi)
+        if args.proto == "BIN": hub.send(port, "PROTO BIN")
+        if args.stream: hub.set_stream(port, args.stream)
+    print(f"API on http://{args.host}:{api.port}  (ws://{args.host}:{api.port}/ws)  devices: {', '.join(args.port)}",
+          flush=True)
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try: asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError): pass
+    try: await stop.wait()
+    finally:
+        await api.close(); hub.stop()
+        if bridge is not None: bridge.stop()
+        for log in logs.values(): log.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless IoT gas gateway with HTTP/WebSocket API")
+    ap.add_argument("--port", action="append", default=[], help="serial port (repeat for several boards)")
+    ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--host", default=API_HOST)
+    ap.add_argument("--http-port", type=int, default=API_PORT)
+    ap.add_argument("--token", default=API_TOKEN)
+    ap.add_argument("--stream", type=int, default=int(os.getenv("IOT_STREAM_HZ", "0")), help="STREAM <hz>, 0 = poll STATUS")
+    ap.add_argument("--poll", type=float, default=1.0, help="STATUS poll period (s) when not streaming")
+    ap.add_argument("--proto", default=os.getenv("IOT_PROTO", "JSON").upper(), choices=("JSON", "BIN"))
+    ap.add_argument("--thr-lo", type=int, default=380)
+    ap.add_argument("--thr-hi", type=int, default=450)
+    ap.add_argument("--no-dsp", action="store_true", help="auto logic on raw gas (no filter / rate-of-rise stage)")
+    ap.add_argument("--log-dir", default=LOG_DIR, help='telemetry root (one sub-directory per port), "" = off')
+    ap.add_argument("--mqtt", default=os.getenv("IOT_MQTT", ""), help="MQTT broker host[:port], \"\" = off")
+    ap.add_argument("--mqtt-prefix", default=os.getenv("IOT_MQTT_PREFIX", "iot"))
+    args = ap.parse_args(argv)
+    if not args.port:
+        args.port = [p for p in os.getenv("IOT_PORTS", "").split(",") if p]
+    if not args.port: ap.error("no --port given (or IOT_PORTS)")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# ---------- Device state model: diff từng status với trạng thái đã áp dụng, lọc lệnh thừa (không phụ thuộc Qt) ----------
+"""Last known board state, kept current from every status sample.
+
+apply(st) compares the sample with the state and returns a bitmask of the
+field groups that actually changed (CH_GAS, CH_FAN, CH_THRESHOLDS, ...); it
+also stores the mask in `st.changed`, so widgets downstream redraw only those
+groups. Fields missing from a sample (DHT read failed → null) keep their last
+value.
+
+wanted(cmd, t) is the gate for automatic commands (rules engine, threshold
+sync): False when the board already reports the value the command would set,
+or when the same value was sent less than `confirm_s` ago and the board has
+not reported it yet. Commands the user types go out unconditionally; note()
+only records them as pending. Verbs without a reported state (STATUS,
+STREAM, PROTO) always pass. ALARM is not in VERBS: iot.ino has no handler
+for it (the buzzer follows the board's own THR HI in AUTO), so "ALARM x" is
+a no-op on the board and the reported alarm flag is never its result.
+
+    python devstate.py trace.jsonl      # số nhóm field đổi / lệnh bị lọc trên một trace JSONL
+"""
+import json, sys, threading
+
+CH_GAS, CH_DISTANCE, CH_CLIMATE, CH_LED, CH_FAN, CH_SERVO, CH_ALARM, CH_MODE, CH_THRESHOLDS = (1 << i for i in range(9))
+CH_ALL = (1 << 9) - 1
+GROUPS = ((CH_GAS, "gas", ("gas",)), (CH_DISTANCE, "distance", ("distance",)),
+          (CH_CLIMATE, "climate", ("temperature", "humidity")), (CH_LED, "led", ("led",)), (CH_FAN, "fan", ("fan",)),
+          (CH_SERVO, "servo", ("servo",)), (CH_ALARM, "alarm", ("alarm",)), (CH_MODE, "mode", ("mode",)),
+          (CH_THRESHOLDS, "thresholds", ("threshold_low", "threshold_high")))
+FIELDS = tuple(f for _, _, fs in GROUPS for f in fs)
+_BIT = {f: bit for bit, _, fs in GROUPS for f in fs}
+STATE_CONFIRM_S = 2.0      # lệnh đã gửi mà board chưa báo giá trị mới sau ngần này giây → cho gửi lại
+
+# verb → (field, giá trị board sẽ báo sau lệnh "VERB arg"), giống handle_command của iot.ino
+VERBS = {"LED": ("led", lambda a: 0 if a <= 0 else 1), "FAN": ("fan", lambda a: 0 if a <= 0 else 1),
+         "SERVO": ("servo", lambda a: max(0, min(180, a))),
+         "THRLO": ("threshold_low", lambda a: max(0, min(1023, a))),
+         "THRHI": ("threshold_high", lambda a: max(0, min(1023, a))),
+         "AUTO": ("mode", lambda a: "AUTO" if a > 0 else "MANUAL")}
+
+
+def command_target(cmd:str):
+    """"FAN 1" → ("fan", 1); None khi lệnh không đặt một field board báo lại (STATUS, ALARM, ...)."""
+    parts = cmd.split()
+    if len(parts) != 2: return None
+    spec = VERBS.get(parts[0].upper())
+    if spec is None: return None
+    try: arg = int(parts[1])
+    except ValueError: return None
+    return spec[0], spec[1](arg)
+
+
+class DeviceState:
+    """Board state from status samples + gate for automatic commands (see module doc).
+
+    apply() runs on the thread that decodes frames; wanted()/note() may be
+    called from any thread (pending commands are under a lock).
+    """
+    __slots__ = ("values", "confirm_s", "samples", "changes", "passed", "suppressed", "_pending", "_lock")
+
+    def __init__(self, confirm_s:float=STATE_CONFIRM_S):
+        self.confirm_s = confirm_s; self._lock = threading.Lock()
+        self.samples = 0; self.changes = dict.fromkeys((name for _, name, _ in GROUPS), 0)
+        self.passed = 0; self.suppressed = 0
+        self.reset()
+
+    def reset(self):
+        """Quên trạng thái (kết nối mới / board reset): sample kế tiếp đổi mọi nhóm, mọi lệnh được gửi."""
+        self.values = dict.fromkeys(FIELDS); self._pending = {}
+
+    def apply(self, st) -> int:
+        values = self.values; changed = 0
+        for f in FIELDS:
+            v = st.get(f)
+            if v is not None and v != values[f]: values[f] = v; changed |= _BIT[f]
+        if self._pending:
+            with self._lock:
+                for f, (v, _) in list(self._pending.items()):
+                    if values[f] == v: del self._pending[f]
+        self.samples += 1
+        if changed:
+            for bit, name, _ in GROUPS:
+                if changed & bit: self.changes[name] += 1
+        try: st.changed = changed
+        except AttributeError: pass        # dict (replay) không có slot changed
+        return changed
+
+    def wanted(self, cmd:str, t:float) -> bool:
+        """True → gửi (và ghi nhận là đang chờ board báo lại); False → board đã ở trạng thái đó."""
+        target = command_target(cmd)
+        if target is None: self.passed += 1; return True
+        f, v = target
+        with self._lock:
+            p = self._pending.get(f)
+            cur = p[0] if p is not None and t - p[1] < self.confirm_s else self.values[f]
+            if cur == v: self.suppressed += 1; return False
+            self._pending[f] = (v, t)
+        self.passed += 1
+        return True
+
+    def note(self, cmd:str, t:float) -> int:
+        """Lệnh gửi không qua gate (người dùng gõ/bấm): chỉ ghi nhận để lệnh tự động trùng sau đó bị lọc.
+
+        Trả về bit nhóm field lệnh đó đặt (0 nếu không có).
+        """
+        target = command_target(cmd)
+        if target is None: return 0
+        with self._lock: self._pending[target[0]] = (target[1], t)
+        return _BIT[target[0]]
+
+    def stats(self) -> dict:
+        return {"samples": self.samples, "changes": dict(self.changes), "passed": self.passed,
+                "suppressed": self.suppressed, "pending": len(self._pending)}
+
+
+def main():
+    """Trace JSONL của rules.py ({"t": ..., <field status>} / {"t": ..., "cmd": ...}): thống kê diff + gate."""
+    if len(sys.argv) != 2: sys.exit("usage: python devstate.py trace.jsonl")
+    s = DeviceState(); cmds = 0
+    with open(sys.argv[1], encoding="utf-8") as f:
+        for line in f:
+            if not line.strip(): continue
+            d = json.loads(line); t = float(d.pop("t"))
+            if "cmd" in d: cmds += 1; s.wanted(d["cmd"], t)
+            else: s.apply(d)
+    st = s.stats(); n = max(1, st["samples"])
+    print(f"{st['samples']} samples, {sum(st['changes'].values())} group changes "
+          f"({sum(st['changes'].values()) / (n * len(GROUPS)):.1%} of {len(GROUPS)} groups × samples)")
+    for name, c in st["changes"].items(): print(f"  {name:11s} {c:8d}  {c / n:6.1%}")
+    print(f"{cmds} commands: {st['passed']} needed, {st['suppressed']} redundant (board already in that state)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# ---------- DSP cho cảm biến MQ-2: lọc, tốc độ tăng, bất thường, warm-up (không phụ thuộc Qt) ----------
+"""Streaming signal processing of the gas reading, O(1) per sample.
+
+GasDsp.process(st, t) runs on the reader / hub thread right after a frame is
+decoded and adds these fields to the status dict, so the rules engine, the
+history and the GUI all see the same values:
+
+    gas_f        median-of-N then EMA of "gas" (spikes removed, noise smoothed)
+    gas_rate     rate of rise of gas_f in units/s over the last DSP_RATE_N samples
+    gas_pred     gas_f + max(0, gas_rate) * lookahead: reading expected in lookahead s
+                 (lookahead 0 by default, i.e. gas_f; plain gas_f while the sensor is
+                 warming up, so a real leak right after boot still trips the rules)
+    gas_z        z-score of the raw reading against the previous DSP_Z_WINDOW samples
+    gas_anomaly  1 when |gas_z| >= DSP_Z_THRESHOLD (never during warm-up)
+    warmup       1 while the MQ-2 heater is settling after a board boot
+
+Warm-up starts only when the stream looks like a fresh boot (first seq below
+DSP_BOOT_SEQ, or the seq jumps back like SeqTracker's reset); it ends once
+gas_f has been flat for DSP_WARMUP_S or after DSP_WARMUP_MAX_S. A reset also
+restarts every filter.
+
+process_batch() computes the same series with numpy for replayed history
+(telemetry logs, rules replay); bench/bench_dsp.py checks both agree.
+"""
+import math, os
+from bisect import bisect_left, insort
+from collections import deque
+from framing import SeqTracker
+from series import np
+
+DSP_MEDIAN_N = 3           # median N sample: bỏ spike 1 sample, trễ 1 sample
+DSP_EMA_ALPHA = 0.5        # EMA sau median (theo sample, không theo giây)
+DSP_RATE_N = 10            # gas_rate = độ dốc gas_f qua N sample gần nhất
+# gas_pred nhìn trước ngần này giây theo gas_rate (0 = chỉ lọc). Nhìn trước làm ngưỡng bật/tắt
+# nhiều hơn trên dữ liệu nhiễu: chỉ bật cùng IOT_RULE_HYSTERESIS / IOT_RULE_DEBOUNCE_S khác 0
+DSP_LOOKAHEAD_S = float(os.getenv("IOT_DSP_LOOKAHEAD_S", "0"))
+DSP_Z_WINDOW = 120         # z-score so với N sample raw trước đó
+DSP_Z_MIN_SAMPLES = 10     # chưa đủ ngần này sample → gas_z = 0
+DSP_Z_MIN_STD = 2.0        # std tối thiểu (ADC lượng tử hóa: tín hiệu phẳng không cho z vô hạn)
+DSP_Z_THRESHOLD = 4.0
+DSP_BOOT_SEQ = 64          # seq đầu tiên < mức này = board vừa boot → chờ warm-up (0 = tắt)
+DSP_WARMUP_S = 20.0        # warm-up xong khi đã qua ngần này giây và gas_f gần như phẳng
+DSP_WARMUP_RATE = 1.0      # |gas_rate| <= mức này (units/s) = phẳng
+DSP_WARMUP_MAX_S = 180.0   # quá hạn này coi như đã warm-up dù còn trôi
+DSP_FIELDS = ("gas_f", "gas_rate", "gas_pred", "gas_z", "gas_anomaly", "warmup")
+
+
+def _is_reset(prev:int, seq:int) -> bool:
+    """Seq lùi xa hơn SeqTracker.RESET_WINDOW (so với sample trước) = board reset."""
+    return SeqTracker.RESET_WINDOW < ((prev - seq) & 0xFFFF) < 0x8000
+
+
+class GasDsp:
+    """Incremental filter chain for one board; process() mutates and returns `st`."""
+    __slots__ = ("field", "median_n", "alpha", "rate_n", "lookahead_s", "z_window", "z_threshold",
+                 "warmup_s", "warmup_rate", "warmup_max_s", "boot_seq",
+                 "_win", "_sorted", "_ema", "_rate", "_zwin", "_zsum", "_zsq", "_seq", "_t0", "_warm",
+                 "samples", "anomalies", "resets")
+
+    def __init__(self, median_n:int=DSP_MEDIAN_N, ema_alpha:float=DSP_EMA_ALPHA, rate_n:int=DSP_RATE_N,
+                 lookahead_s:float=DSP_LOOKAHEAD_S, z_window:int=DSP_Z_WINDOW, z_threshold:float=DSP_Z_THRESHOLD,
+                 warmup_s:float=DSP_WARMUP_S, warmup_rate:float=DSP_WARMUP_RATE,
+                 warmup_max_s:float=DSP_WARMUP_MAX_S, boot_seq:int=DSP_BOOT_SEQ, field:str="gas"):
+        self.field = field; self.median_n = max(1, median_n); self.alpha = ema_alpha
+        self.rate_n = max(1, rate_n); self.lookahead_s = lookahead_s
+        self.z_window = max(1, z_window); self.z_threshold = z_threshold
+        self.warmup_s = warmup_s; self.warmup_rate = warmup_rate; self.warmup_max_s = warmup_max_s
+        self.boot_seq = boot_seq
+        self.samples = 0; self.anomalies = 0; self.resets = 0
+        self._seq = None
+        self.reset()
+
+    def reset(self):
+        """Quên toàn bộ trạng thái lọc (đổi cổng / board reset); sample kế tiếp là sample đầu."""
+        self._win = deque(); self._sorted = []; self._ema = None
+        self._rate = deque(maxlen=self.rate_n + 1)
+        self._zwin = deque(); self._zsum = 0.0; self._zsq = 0.0
+        self._t0 = None; self._warm = False
+
+    @property
+    def warming(self) -> bool:
+        return self._warm
+
+    def process(self, st:dict, t:float) -> dict:
+        x = st.get(self.field)
+        if x is None: return st
+        try: x = float(x)
+        except (TypeError, ValueError): return st
+        if x != x: return st
+        seq = st.get("seq")
+        if seq is not None:
+            seq = int(seq)
+            if self._seq is not None and _is_reset(self._seq, seq):
+                self.reset(); self.resets += 1
+            self._seq = seq
+        if self._t0 is None:
+            self._t0 = t; self._warm = bool(self.boot_seq) and seq is not None and seq < self.boot_seq
+        self.samples += 1
+
+        # median N: deque giữ thứ tự đến, list sorted cho median (N nhỏ → insort/del gần như O(1))
+        win = self._win; srt = self._sorted
+        win.append(x); insort(srt, x)
+        if len(win) > self.median_n: del srt[bisect_left(srt, win.popleft())]
+        m = len(srt); med = srt[m // 2] if m & 1 else (srt[m // 2 - 1] + srt[m // 2]) * 0.5
+
+        f = med if self._ema is None else self._ema + self.alpha * (med - self._ema)
+        self._ema = f
+
+        rq = self._rate; rq.append((t, f))
+        t_old, f_old = rq[0]
+        rate = (f - f_old) / (t - t_old) if t > t_old else 0.0
+
+        # z-score của raw so với cửa sổ trước đó: tổng + tổng bình phương chạy
+        zw = self._zwin; c = len(zw)
+        if c >= DSP_Z_MIN_SAMPLES:
+            mean = self._zsum / c
+            std = max(DSP_Z_MIN_STD, math.sqrt(max(0.0, self._zsq / c - mean * mean)))
+            z = (x - mean) / std
+        else:
+            z = 0.0
+        zw.append(x); self._zsum += x; self._zsq += x * x
+        if c + 1 > self.z_window:
+            old = zw.popleft(); self._zsum -= old; self._zsq -= old * old
+
+        if self._warm:
+            el = t - self._t0
+            if (el >= self.warmup_s and abs(rate) <= self.warmup_rate) or el >= self.warmup_max_s:
+                self._warm = False
+        warm = self._warm
+        anomaly = not warm and abs(z) >= self.z_threshold
+        if anomaly: self.anomalies += 1
+        st["gas_f"] = f; st["gas_rate"] = rate
+        st["gas_pred"] = f if warm else f + (rate if rate > 0 else 0.0) * self.lookahead_s   # warm-up: không nhìn trước
+        st["gas_z"] = z; st["gas_anomaly"] = int(anomaly); st["warmup"] = int(warm)
+        return st
+
+
+# ---------- Batch (numpy) cho history / replay ----------
+def _ema(x, a:float):
+    """y[0] = x[0], y[i] = y[i-1] + a*(x[i]-y[i-1]) theo khối: y_k = b^(k+1) * (y_prev + a*cumsum(x_j / b^(j+1)))."""
+    y = x.copy()
+    if len(x) < 2 or a >= 1.0: return y
+    if a <= 0.0: y[:] = x[0]; return y
+    b = 1.0 - a
+    blk = int(max(1, min(4096, -200.0 / math.log10(b))))   # b^blk >= 1e-200: không tràn số
+    prev = x[0]; i = 1; n = len(x)
+    while i < n:
+        xb = x[i:i + blk]; pw = b ** np.arange(1, len(xb) + 1)
+        y[i:i + len(xb)] = pw * (prev + a * np.cumsum(xb / pw))
+        prev = y[i + len(xb) - 1]; i += len(xb)
+    return y
+
+
+def _median(x, n:int):
+    """Median trượt N sample; N-1 sample đầu dùng cửa sổ ngắn hơn như bản streaming."""
+    m = len(x); out = np.empty(m)
+    head = min(m, n - 1)
+    for i in range(head): out[i] = np.median(x[:i + 1])
+    if m >= n:
+        w = np.sort(np.lib.stride_tricks.sliding_window_view(x, n), axis=1)   # sort N nhỏ nhanh hơn np.median
+        out[head:] = w[:, n // 2] if n & 1 else (w[:, n // 2 - 1] + w[:, n // 2]) * 0.5
+    return out
+
+
+def _segment(x, t, seq0, d:GasDsp) -> dict:
+    n = len(x); idx = np.arange(n)
+    f = _ema(_median(x, d.median_n), d.alpha)
+    old = np.maximum(idx - d.rate_n, 0); dt = t - t[old]
+    rate = np.divide(f - f[old], dt, out=np.zeros(n), where=dt > 0)
+    cs = np.concatenate(([0.0], np.cumsum(x))); cq = np.concatenate(([0.0], np.cumsum(x * x)))
+    lo = np.maximum(idx - d.z_window, 0); c = idx - lo
+    cc = np.maximum(c, 1); mean = (cs[idx] - cs[lo]) / cc
+    std = np.maximum(DSP_Z_MIN_STD, np.sqrt(np.maximum(0.0, (cq[idx] - cq[lo]) / cc - mean * mean)))
+    z = np.where(c >= DSP_Z_MIN_SAMPLES, (x - mean) / std, 0.0)
+    warm = np.zeros(n, dtype=bool)
+    if d.boot_seq and seq0 is not None and seq0 < d.boot_seq:
+        el = t - t[0]
+        done = ((el >= d.warmup_s) & (np.abs(rate) <= d.warmup_rate)) | (el >= d.warmup_max_s)
+        warm[:int(np.argmax(done)) if done.any() else n] = True
+    pred = np.where(warm, f, f + np.maximum(rate, 0.0) * d.lookahead_s)
+    return {"gas_f": f, "gas_rate": rate, "gas_pred": pred, "gas_z": z,
+            "gas_anomaly": ((np.abs(z) >= d.z_threshold) & ~warm).astype(np.int8), "warmup": warm.astype(np.int8)}
+
+
+def process_batch(gas, t, seq=None, dsp:GasDsp|None=None) -> dict:
+    """Vectorized GasDsp over a whole series → {field: array}.
+
+    `gas`/`t`/`seq` are sequences of equal length without missing values;
+    parameters come from `dsp` (a fresh GasDsp() by default; its state is not
+    touched). Board resets in `seq` split the series exactly like process().
+    Without numpy the streaming stage is run sample by sample.
+    """
+    d = dsp or GasDsp()
+    if np is None:
+        s = GasDsp(d.median_n, d.alpha, d.rate_n, d.lookahead_s, d.z_window, d.z_threshold, d.warmup_s,
+                   d.warmup_rate, d.warmup_max_s, d.boot_seq)
+        rows = [s.process({"gas": g, "seq": None if seq is None else q}, tt)
+                for g, tt, q in zip(gas, t, seq if seq is not None else [None] * len(gas))]
+        return {k: [r[k] if r[k] is not None else math.nan for r in rows] for k in DSP_FIELDS}
+    x = np.asarray(gas, dtype=np.float64); tt = np.asarray(t, dtype=np.float64)
+    cuts = [0]
+    if seq is not None and len(x) > 1:
+        q = np.asarray(seq, dtype=np.int64)
+        back = (q[:-1] - q[1:]) & 0xFFFF
+        cuts += list(np.nonzero((back > SeqTracker.RESET_WINDOW) & (back < 0x8000))[0] + 1)
+    cuts.append(len(x))
+    parts = [_segment(x[a:b], tt[a:b], None if seq is None else int(seq[a]), d)
+             for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+    if not parts: return {k: np.empty(0) for k in DSP_FIELDS}
+    return {k: np.concatenate([p[k] for p in parts]) for k in DSP_FIELDS}
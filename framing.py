@@ -0,0 +1,334 @@
+# ---------- Serial framing (bytes level, không phụ thuộc Qt) ----------
+import binascii, json, math, struct
+from collections import deque
+
+MAX_FRAME_BYTES = 1024    # một dòng JSON của iot.ino ~200 byte
+
+
+class LineFramer:
+    """Incremental newline framer over one reusable bytearray.
+
+    feed() returns (line, frame) pairs: `line` is the stripped text for the log,
+    `frame` the bytes (bytearray) between the first '{' and the last '}' (same span the old
+    regex r'\\{.*\\}' matched) or None when the line carries no JSON object.
+    Garbage = bytes dropped around a frame, blank lines and over-long lines.
+    """
+    __slots__ = ("max_frame", "_buf", "_skip", "bytes_in", "lines", "frames", "garbage", "overflows")
+
+    def __init__(self, max_frame:int=MAX_FRAME_BYTES):
+        self.max_frame = max_frame
+        self._buf = bytearray()
+        self._skip = False        # đang bỏ phần còn lại của một dòng quá dài
+        self.bytes_in = 0; self.lines = 0; self.frames = 0; self.garbage = 0; self.overflows = 0
+
+    def reset(self):
+        del self._buf[:]; self._skip = False
+
+    def counters(self) -> dict:
+        return {"bytes": self.bytes_in, "lines": self.lines, "frames": self.frames,
+                "garbage": self.garbage, "overflows": self.overflows}
+
+    def feed(self, data) -> list:
+        n = len(data)
+        self.bytes_in += n
+        buf = self._buf
+        if self._skip:
+            nl = data.find(b"\n")
+            if nl < 0:
+                self.garbage += n; return []
+            self.garbage += nl + 1; self._skip = False
+            data = memoryview(data)[nl + 1:]
+        buf += data
+        nl = buf.rfind(b"\n")
+        if nl < 0:
+            # chưa đủ một dòng: chỉ nối vào buffer dùng lại
+            if len(buf) > self.max_frame: self._overflow()
+            return []
+        block = buf[:nl]; del buf[:nl + 1]
+        out = []
+        lines = block.split(b"\n")
+        frames = garbage = count = 0
+        for raw in lines:
+            line = raw.strip()
+            if not line:
+                garbage += len(raw); continue
+            count += 1
+            lb = line.find(b"{")
+            rb = line.rfind(b"}") if lb >= 0 else -1
+            if rb > lb:
+                frames += 1
+                garbage += len(raw) - (rb + 1 - lb)
+                out.append((line.decode(errors="ignore"), line[lb:rb + 1]))
+            else:
+                out.append((line.decode(errors="ignore"), None))
+        self.lines += count; self.frames += frames; self.garbage += garbage
+        if len(buf) > self.max_frame: self._overflow()
+        return out
+
+    def _overflow(self):
+        self.garbage += len(self._buf); self.overflows += 1
+        del self._buf[:]; self._skip = True
+
+
+# ---------- Binary status frame (PROTO BIN, xem sendStatusBin trong iot.ino) ----------
+# A5 | len=16 | seq u16 | gas u16 | dist i16 | temp*10 i16 | humi*10 i16 | thrLo u16 | thrHi u16
+#    | flags u8 (bit0 led, bit1 fan, bit2 alarm, bit3 auto) | servo u8 | crc16 u16
+# little-endian; crc = CRC-16/CCITT-FALSE (binascii.crc_hqx, init 0xFFFF) trên len..servo
+BIN_SYNC = 0xA5
+BIN_FRAME = struct.Struct("<BBHHhhhHHBBH")
+BIN_LEN = BIN_FRAME.size - 4          # payload giữa byte len và crc
+BIN_NULL = -32768                     # temp/humi = NaN
+_SYNC_B = bytes([BIN_SYNC])
+
+
+_FW_KEYS = ("seq", "gas", "distance", "temperature", "humidity", "threshold_low", "threshold_high", "mode",
+            "led", "fan", "servo", "alarm")                       # thứ tự = dòng JSON của sendStatus
+_DSP_KEYS = ("gas_f", "gas_rate", "gas_pred", "gas_z", "gas_anomaly", "warmup")   # dsp.GasDsp ghi thêm
+_FW_SET = frozenset(_FW_KEYS); _FIELDS = frozenset(_FW_KEYS + _DSP_KEYS)
+_ON = frozenset(("1", "true", "on", "yes", "high")); _OFF = frozenset(("0", "false", "off", "no", "low", ""))
+
+
+def _int(v):
+    if v.__class__ is int or v is None: return v
+    try: v = float(v)                        # "12", 12.0, True
+    except (TypeError, ValueError): return None
+    return int(v) if math.isfinite(v) else None
+
+
+def _float(v):
+    if v.__class__ is not float:
+        if v is None: return None
+        try: v = float(v)
+        except (TypeError, ValueError): return None
+    return v if v == v else None             # NaN = không đọc được (như null của firmware)
+
+
+def _flag(v):
+    """0/1 cho led/fan/alarm/...: số, bool, "ON"/"true"/"1"; None khi thiếu hoặc không hiểu."""
+    if v.__class__ is int: return 1 if v else 0
+    if v is None: return None
+    if isinstance(v, str):
+        s = v.strip().lower()
+        if s in _ON: return 1
+        if s in _OFF: return 0
+    v = _float(v)
+    return None if v is None else (1 if v else 0)
+
+
+class StatusSample:
+    """One decoded status report (same fields as the JSON line of sendStatus).
+
+    Built once on the reader thread and shared by every consumer: fields are
+    normalized (ints, floats, 0/1 flags, None for missing/null/garbage), so
+    readers use attributes without float()/int(). DSP outputs (gas_f, ...) have
+    their own slots, unknown JSON keys go to `extra`, `t_rx` is the perf_counter
+    time the chunk was read, `changed` the field groups that differ from the
+    previous sample (devstate.DeviceState.apply; None = not diffed). get()/[] keep dict-style consumers working
+    (rules, telemetry, series, replay of logged dicts).
+    """
+    __slots__ = _FW_KEYS + _DSP_KEYS + ("t_rx", "changed", "extra")
+
+    def __init__(self, seq=None, gas=None, distance=None, temperature=None, humidity=None,
+                 threshold_low=None, threshold_high=None, mode=None, led=None, fan=None,
+                 servo=None, alarm=None):
+        self.seq = seq; self.gas = gas; self.distance = distance
+        self.temperature = temperature; self.humidity = humidity
+        self.threshold_low = threshold_low; self.threshold_high = threshold_high
+        self.mode = mode; self.led = led; self.fan = fan; self.servo = servo; self.alarm = alarm
+        self.gas_f = self.gas_rate = self.gas_pred = self.gas_z = self.gas_anomaly = self.warmup = None
+        self.t_rx = None; self.changed = None; self.extra = None
+
+    @classmethod
+    def from_dict(cls, d:dict, pool=None) -> "StatusSample":
+        """Normalize a decoded JSON object (firmware line, or a daemon frame with DSP fields)."""
+        s = pool.acquire() if pool is not None else cls.__new__(cls)
+        g = d.get; I = int; F = float
+        # dòng của firmware: đúng kiểu sẵn → gán thẳng, chỉ gọi hàm chuẩn hoá khi khác kiểu
+        v = g("seq"); s.seq = v if v.__class__ is I else _int(v)
+        v = g("gas"); s.gas = v if v.__class__ is I else _int(v)
+        v = g("distance"); s.distance = v if v.__class__ is I else _int(v)
+        v = g("temperature"); s.temperature = v if v.__class__ is F and v == v else _float(v)
+        v = g("humidity"); s.humidity = v if v.__class__ is F and v == v else _float(v)
+        v = g("threshold_low"); s.threshold_low = v if v.__class__ is I else _int(v)
+        v = g("threshold_high"); s.threshold_high = v if v.__class__ is I else _int(v)
+        v = g("mode"); s.mode = v if v is None or v.__class__ is str else str(v)
+        v = g("led"); s.led = v if v.__class__ is I and 0 <= v <= 1 else _flag(v)
+        v = g("fan"); s.fan = v if v.__class__ is I and 0 <= v <= 1 else _flag(v)
+        v = g("servo"); s.servo = v if v.__class__ is I else _int(v)
+        v = g("alarm"); s.alarm = v if v.__class__ is I and 0 <= v <= 1 else _flag(v)
+        s.t_rx = None; s.changed = None
+        if d.keys() <= _FW_SET:
+            s.gas_f = s.gas_rate = s.gas_pred = s.gas_z = s.gas_anomaly = s.warmup = None; s.extra = None
+            return s
+        s.gas_f = _float(g("gas_f")); s.gas_rate = _float(g("gas_rate")); s.gas_pred = _float(g("gas_pred"))
+        s.gas_z = _float(g("gas_z")); s.gas_anomaly = _flag(g("gas_anomaly")); s.warmup = _flag(g("warmup"))
+        s.extra = None if d.keys() <= _FIELDS else {k: v for k, v in d.items() if k not in _FIELDS}
+        return s
+
+    @classmethod
+    def from_json(cls, raw, pool=None) -> "StatusSample":
+        """Decode one JSON frame; ValueError if it is not valid JSON or not an object."""
+        d = json.loads(raw)
+        if d.__class__ is not dict: raise ValueError(f"status frame is a JSON {type(d).__name__}, not an object")
+        return cls.from_dict(d, pool)
+
+    # dict-style access (field names của JSON; None = thiếu)
+    def get(self, key:str, default=None):
+        if key in _FIELDS: v = getattr(self, key)
+        elif self.extra: v = self.extra.get(key)
+        else: v = None
+        return default if v is None else v
+
+    def __getitem__(self, key:str):
+        if key in _FIELDS: return getattr(self, key)
+        if self.extra and key in self.extra: return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key:str, value):
+        if key in _FIELDS: setattr(self, key, value)
+        elif self.extra is None: self.extra = {key: value}
+        else: self.extra[key] = value
+
+    def to_dict(self) -> dict:
+        """Dạng JSON (API của daemon, log): field firmware, field DSP nếu đã qua GasDsp, rồi `extra`."""
+        d = {k: getattr(self, k) for k in _FW_KEYS}
+        if self.warmup is not None: d.update((k, getattr(self, k)) for k in _DSP_KEYS)
+        if self.extra: d.update(self.extra)
+        return d
+
+    def __repr__(self):
+        return "StatusSample(%s)" % ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items())
+
+
+class SamplePool:
+    """Free list of StatusSample: decoder acquire(), consumer release() khi không còn giữ sample.
+
+    acquire() reuses a released instance (every field is overwritten by the
+    decoder) or makes a new one; release() keeps at most `cap`. deque
+    append/pop are atomic, so reader thread acquire + GUI thread release need
+    no lock. A released sample must not be referenced anywhere any more.
+    """
+    __slots__ = ("cap", "_free", "created", "reused")
+
+    def __init__(self, cap:int=256):
+        self.cap = cap; self._free = deque(); self.created = 0; self.reused = 0
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self) -> StatusSample:
+        try: s = self._free.pop(); self.reused += 1
+        except IndexError: s = StatusSample.__new__(StatusSample); self.created += 1
+        return s
+
+    def release(self, s:StatusSample):
+        if len(self._free) < self.cap: self._free.append(s)
+
+
+def decode_bin_frame(frame, offset:int=0, pool:SamplePool|None=None) -> StatusSample|None:
+    """Decode one BIN_FRAME.size-byte frame at `offset`, None if sync/len/crc do not match."""
+    (sync, ln, seq, gas, dist, t10, h10, lo, hi, flags, servo, crc) = BIN_FRAME.unpack_from(frame, offset)
+    if sync != BIN_SYNC or ln != BIN_LEN: return None
+    with memoryview(frame) as mv:
+        if binascii.crc_hqx(mv[offset + 1:offset + BIN_FRAME.size - 2], 0xFFFF) != crc: return None
+    s = pool.acquire() if pool is not None else StatusSample.__new__(StatusSample)
+    s.__init__(seq, gas, dist, None if t10 == BIN_NULL else t10 / 10.0, None if h10 == BIN_NULL else h10 / 10.0,
+               lo, hi, "AUTO" if flags & 8 else "MANUAL", flags & 1, (flags >> 1) & 1, servo, (flags >> 2) & 1)
+    return s
+
+
+def encode_bin_frame(s:StatusSample) -> bytes:
+    """Host-side encoder (same layout as the firmware), dùng cho bench/giả lập."""
+    t10 = BIN_NULL if s.temperature is None else int(round(s.temperature * 10))
+    h10 = BIN_NULL if s.humidity is None else int(round(s.humidity * 10))
+    flags = (1 if s.led else 0) | (2 if s.fan else 0) | (4 if s.alarm else 0) | (8 if s.mode != "MANUAL" else 0)
+    body = BIN_FRAME.pack(BIN_SYNC, BIN_LEN, (s.seq or 0) & 0xFFFF, s.gas or 0,
+                          -1 if s.distance is None else s.distance, t10, h10,
+                          s.threshold_low or 0, s.threshold_high or 0, flags, s.servo or 0, 0)
+    return body[:-2] + binascii.crc_hqx(body[1:-2], 0xFFFF).to_bytes(2, "little")
+
+
+class SeqTracker:
+    """Dropped / late frame detection from the 16-bit status sequence number."""
+    __slots__ = ("last", "received", "dropped", "late", "resets")
+    RESET_WINDOW = 256      # lùi xa hơn mức này = board reset, không phải frame trễ
+
+    def __init__(self):
+        self.last = None; self.received = 0; self.dropped = 0; self.late = 0; self.resets = 0
+
+    def update(self, seq:int) -> int:
+        """Return how many frames were missed right before `seq`."""
+        if self.last is None:
+            self.last = seq; self.received += 1; return 0
+        d = (seq - self.last) & 0xFFFF
+        if d == 0 or d > 0x8000:
+            if (self.last - seq) & 0xFFFF > self.RESET_WINDOW:
+                self.resets += 1; self.last = seq; self.received += 1
+            else:
+                self.late += 1
+            return 0
+        self.last = seq; self.received += 1; self.dropped += d - 1
+        return d - 1
+
+
+class StreamFramer:
+    """Split a mixed stream into JSON/text lines (LineFramer) and binary frames.
+
+    Text from iot.ino is ASCII, so a 0xA5 byte always starts a binary frame;
+    one that fails len/crc is dropped as garbage and scanning resumes after it.
+    feed() yields (line, frame) like LineFramer, with line=None and
+    frame=StatusSample for binary reports (taken from `pool` if set).
+    """
+    __slots__ = ("text", "pool", "_bin", "bin_frames", "crc_errors")
+
+    def __init__(self, max_frame:int=MAX_FRAME_BYTES, pool:SamplePool|None=None):
+        self.text = LineFramer(max_frame); self.pool = pool
+        self._bin = bytearray()
+        self.bin_frames = 0; self.crc_errors = 0
+
+    def reset(self):
+        self.text.reset(); del self._bin[:]
+
+    def counters(self) -> dict:
+        c = self.text.counters(); c["bin_frames"] = self.bin_frames; c["crc_errors"] = self.crc_errors
+        return c
+
+    def feed(self, data) -> list:
+        if not self._bin and BIN_SYNC not in data:
+            return self.text.feed(data)      # JSON mode: không tốn thêm gì
+        out = []
+        self._feed_mixed(data, out)
+        return out
+
+    def _feed_mixed(self, data, out):
+        buf = self._bin; size = BIN_FRAME.size
+        pos = 0; n = len(data)
+        with memoryview(data) as mv:
+            while pos < n:
+                if not buf:
+                    i = data.find(_SYNC_B, pos)
+                    if i < 0:
+                        out += self.text.feed(data[pos:]); break
+                    if i > pos: out += self.text.feed(data[pos:i])
+                    pos = i
+                    if pos + size <= n:
+                        # frame nằm trọn trong chunk: decode tại chỗ, không copy
+                        s = decode_bin_frame(data, pos, self.pool)
+                        if s is not None:
+                            self.bin_frames += 1; self.text.bytes_in += size
+                            out.append((None, s)); pos += size; continue
+                        self.crc_errors += 1; self.text.garbage += 1; self.text.bytes_in += 1
+                        pos += 1; continue
+                take = min(size - len(buf), n - pos)
+                buf += mv[pos:pos + take]; pos += take
+                if len(buf) < size: break
+                self.text.bytes_in += size
+                s = decode_bin_frame(buf, 0, self.pool)
+                if s is not None:
+                    self.bin_frames += 1; out.append((None, s)); del buf[:]
+                else:
+                    # sync giả: bỏ 1 byte rồi quét lại phần còn lại của frame
+                    self.crc_errors += 1; self.text.garbage += 1
+                    rest = bytes(buf[1:]); del buf[:]
+                    self.text.bytes_in -= len(rest)
+                    self._feed_mixed(rest, out)
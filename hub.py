@@ -0,0 +1,266 @@
+# ---------- Multi-device hub: một I/O thread cho N cổng serial (không phụ thuộc Qt) ----------
+import os, selectors, sys, threading, time
+from collections import OrderedDict, deque
+from framing import StreamFramer, StatusSample, SeqTracker, MAX_FRAME_BYTES
+from ring import SampleRing
+from series import TimeSeriesStore
+from txqueue import coalesce_key, CMD_MIN_INTERVAL_S
+from rules import RulesEngine, default_rules, ALARM_COMMANDS, SAFE_COMMANDS
+from dsp import GasDsp
+from devstate import DeviceState
+
+HUB_POLL_S = 1.0          # hỏi STATUS theo chu kỳ này khi board không stream
+HUB_BATCH_S = 0.0            # >0: sau mỗi lần thức, chờ thêm để gom frame của nhiều board
+HUB_FALLBACK_POLL_S = 0.02   # cổng không có fd (Windows): đọc in_waiting theo chu kỳ
+# history mỗi board nhỏ hơn Main.store (~2.2 MB thay vì ~18 MB) để 32+ board vẫn nhẹ
+HUB_RAW_CAP = 4096
+HUB_TIERS = ((1, 3600), (60, 2 * 1440), (3600, 31 * 24))
+
+def auto_alarm(alarm_cmds=ALARM_COMMANDS, safe_cmds=SAFE_COMMANDS, **rule_kw):
+    """on_sample callback: một RulesEngine (default_rules) cho mỗi board, THR LOW theo dev.threshold_low.
+
+    Board có DSP so sánh gas_pred (đã lọc, warm-up vẫn có giá trị), không thì gas raw.
+    """
+    def on_sample(hub, dev, st):
+        eng = dev.rules
+        if eng is None:
+            eng = dev.rules = RulesEngine(default_rules(dev.threshold_low, alarm_cmds=alarm_cmds, safe_cmds=safe_cmds,
+                                                        field="gas" if dev.dsp is None else "gas_pred", **rule_kw))
+        eng.set_threshold("gas_low", dev.threshold_low)
+        for c in eng.evaluate(st, dev.last_frame):
+            if dev.state.wanted(c, dev.last_frame): hub.send(dev.name, c)    # board đã ở trạng thái đó → bỏ
+    return on_sample
+
+
+class Device:
+    """Per-board state owned by the hub's I/O thread.
+
+    The GUI only reads `latest`/`version`/counters and drains `status`;
+    `store` is appended on the I/O thread (queries from the GUI thread may see
+    the bucket being filled, never a torn row).
+    """
+    __slots__ = ("name", "ser", "fd", "framer", "seq", "store", "status", "latest", "version",
+                 "frames", "json_errors", "threshold_low", "threshold_high", "stream_hz", "rules", "dsp",
+                 "state", "last_frame", "error", "_pending", "_uniq", "_next_tx", "_next_poll", "sent", "superseded")
+
+    def __init__(self, name:str, ser, threshold_low:int=380, threshold_high:int=450, dsp:bool=True):
+        self.name = name; self.ser = ser
+        try: self.fd = ser.fileno() if sys.platform != "win32" else -1
+        except Exception: self.fd = -1
+        self.framer = StreamFramer(MAX_FRAME_BYTES); self.seq = SeqTracker()
+        self.store = TimeSeriesStore(raw_cap=HUB_RAW_CAP, tiers=HUB_TIERS)
+        self.status = SampleRing(1024)
+        self.latest = None; self.version = 0; self.frames = 0; self.json_errors = 0
+        self.threshold_low = threshold_low; self.threshold_high = threshold_high
+        self.stream_hz = 0; self.rules = None; self.last_frame = 0.0; self.error = None
+        self.dsp = GasDsp() if dsp else None
+        self.state = DeviceState()      # diff từng status (st.changed) + lọc lệnh auto thừa
+        self._pending = OrderedDict(); self._uniq = 0; self._next_tx = 0.0; self._next_poll = 0.0
+        self.sent = 0; self.superseded = 0
+
+    def counters(self) -> dict:
+        c = self.framer.counters()
+        c.update(status=self.frames, json_errors=self.json_errors, dropped=self.seq.dropped,
+                 late=self.seq.late, sent=self.sent, superseded=self.superseded, pending=len(self._pending),
+                 suppressed=self.state.suppressed)
+        return c
+
+
+class DeviceHub:
+    """Open N serial ports and serve all of them from one selector thread.
+
+    Each readable fd is drained with one os.read and fed to that device's
+    StreamFramer; commands are coalesced per device (same rule as
+    CommandWriter) and spaced by `tx_interval`; boards that do not stream are
+    polled with STATUS every `poll_s`. `on_sample(hub, dev, st)` runs on the
+    I/O thread for every status (host-side auto logic), `on_sent(hub, dev, cmd)`
+    after every command written.
+    Add/remove/send may be called from any thread.
+    """
+
+    def __init__(self, poll_s:float=HUB_POLL_S, tx_interval:float=CMD_MIN_INTERVAL_S, on_sample=None,
+                 batch_s:float=HUB_BATCH_S, on_sent=None):
+        self.poll_s = poll_s; self.batch_s = batch_s; self.tx_interval = tx_interval
+        self.on_sample = on_sample; self.on_sent = on_sent
+        self.devices = {}                 # name → Device (thứ tự thêm vào)
+        self._ops = deque(); self._lock = threading.Lock()
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()       # self-pipe: đánh thức select()
+        os.set_blocking(self._wake_r, False); os.set_blocking(self._wake_w, False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ)
+        self._polled = []                 # device không có fd
+        self._run = False; self._thread = None; self._kick = False
+        self.loops = 0
+
+    # ---- API (mọi thread) ----
+    def start(self):
+        self._run = True
+        self._thread = threading.Thread(target=self._loop, name="device-hub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._run = False; self._wake()
+        if self._thread: self._thread.join(1.0); self._thread = None
+        for dev in list(self.devices.values()): self._close(dev)
+        self.devices.clear()
+        if self._sel: self._sel.close(); self._sel = None
+        for fd in (self._wake_r, self._wake_w):
+            if fd >= 0: os.close(fd)
+        self._wake_r = self._wake_w = -1
+
+    def open(self, port:str, baud:int=115200, name:str|None=None, **kw) -> Device:
+        import serial
+        return self.add(serial.Serial(port, baud, timeout=0), name or port, **kw)
+
+    def add(self, ser, name:str|None=None, **kw) -> Device:
+        name = name or getattr(ser, "port", None) or f"dev{len(self.devices)}"
+        if name in self.devices: raise ValueError(f"device {name!r} already open")
+        dev = Device(name, ser, **kw)
+        with self._lock: self.devices[name] = dev
+        self._call(self._register, dev)
+        self.send(name, "STATUS")
+        return dev
+
+    def remove(self, name:str):
+        with self._lock: dev = self.devices.pop(name, None)
+        if dev is not None: self._call(self._unregister, dev)
+
+    def send(self, name:str, cmd:str):
+        dev = self.devices.get(name)
+        if dev is None: return
+        self._queue(dev, cmd); self._kick = True; self._wake()
+
+    def set_thresholds(self, name:str, lo:int, hi:int):
+        dev = self.devices.get(name)
+        if dev is None: return
+        dev.threshold_low, dev.threshold_high = int(lo), int(hi)
+        self.send(name, f"THRLO {dev.threshold_low}"); self.send(name, f"THRHI {dev.threshold_high}")
+
+    def set_stream(self, name:str, hz:int):
+        dev = self.devices.get(name)
+        if dev is None: return
+        was, dev.stream_hz = dev.stream_hz, int(hz)
+        if hz or was: self.send(name, f"STREAM {dev.stream_hz}")
+
+    # ---- I/O thread ----
+    def _queue(self, dev:Device, cmd:str):
+        key = coalesce_key(cmd)
+        with self._lock:
+            if key is None:
+                dev._uniq += 1; key = dev._uniq
+            elif key in dev._pending: dev.superseded += 1
+            dev._pending[key] = cmd
+
+    def _wake(self):
+        if self._wake_w >= 0:
+            try: os.write(self._wake_w, b"\0")
+            except (BlockingIOError, OSError): pass
+
+    def _call(self, fn, *args):
+        self._ops.append((fn, args))
+        if self._thread is None: self._run_ops()
+        else: self._wake()
+
+    def _run_ops(self):
+        while self._ops:
+            fn, args = self._ops.popleft(); fn(*args)
+
+    def _register(self, dev:Device):
+        if dev.fd >= 0 and self._sel is not None:
+            self._sel.register(dev.fd, selectors.EVENT_READ, dev)
+        else:
+            self._polled.append(dev)
+
+    def _unregister(self, dev:Device):
+        if dev in self._polled: self._polled.remove(dev)
+        elif self._sel is not None:
+            try: self._sel.unregister(dev.fd)
+            except (KeyError, ValueError): pass
+        self._close(dev)
+
+    def _close(self, dev:Device):
+        try: dev.ser.close()
+        except Exception: pass
+
+    def _loop(self):
+        sel = self._sel; wake_r = self._wake_r
+        next_due = 0.0
+        while self._run:
+            now = time.monotonic()
+            timeout = max(0.0, next_due - now)
+            if self._polled: timeout = min(timeout, HUB_FALLBACK_POLL_S)
+            events = sel.select(timeout)
+            if self.batch_s and len(events) < len(self.devices):
+                # gom: chờ thêm một chút để một lần thức xử lý nhiều board (đổi latency lấy CPU)
+                time.sleep(self.batch_s); events = sel.select(0)
+            for key, _ in events:
+                if key.fd == wake_r:
+                    try: os.read(wake_r, 512)
+                    except BlockingIOError: pass
+                    self._run_ops(); continue
+                dev = key.data
+                try: data = os.read(dev.fd, 4096)
+                except BlockingIOError: continue
+                except OSError as e:
+                    self._fail(dev, e); continue
+                if data: self._feed(dev, data)
+                else: self._fail(dev, EOFError("port closed"))
+            for dev in self._polled:
+                try:
+                    n = dev.ser.in_waiting
+                    if n: self._feed(dev, dev.ser.read(n))
+                except Exception as e: self._fail(dev, e)
+            self.loops += 1
+            now = time.monotonic()
+            if self._kick or now >= next_due:
+                self._kick = False; next_due = self._service(now)
+
+    def _service(self, now:float) -> float:
+        """Ghi lệnh đến hạn + lên lịch STATUS; trả về thời điểm cần thức dậy kế tiếp."""
+        due = now + self.poll_s; wall = time.time()
+        for dev in list(self.devices.values()):
+            if dev.error: continue
+            # stream im lặng quá lâu → hỏi STATUS như board polling
+            polled = not dev.stream_hz or wall - dev.last_frame > max(1.5, 5.0 / dev.stream_hz)
+            if polled and now >= dev._next_poll:
+                dev._next_poll = now + self.poll_s
+                self._queue(dev, "STATUS")
+            if dev._pending:
+                if now >= dev._next_tx:
+                    with self._lock: _, cmd = dev._pending.popitem(last=False)
+                    try:
+                        dev.ser.write((cmd + "\n").encode("utf-8"))
+                        dev.sent += 1
+                    except Exception as e:
+                        self._fail(dev, e); continue
+                    if self.on_sent: self.on_sent(self, dev, cmd)
+                    dev._next_tx = now + self.tx_interval
+                if dev._pending: due = min(due, dev._next_tx)
+            due = min(due, dev._next_poll)
+        return due
+
+    def _fail(self, dev:Device, e):
+        dev.error = str(e) or type(e).__name__; dev.version += 1
+        dev.store.add_gap()                    # đồ thị /api/history không nối qua lúc board mất
+        with self._lock: dev._pending.clear()
+        if dev.fd >= 0 and self._sel is not None:
+            try: self._sel.unregister(dev.fd)
+            except (KeyError, ValueError): pass
+        elif dev in self._polled: self._polled.remove(dev)
+
+    def _feed(self, dev:Device, data):
+        t = time.time()
+        for line, frame in dev.framer.feed(data):
+            if frame is None: continue
+            try:
+                st = frame if frame.__class__ is StatusSample else StatusSample.from_json(frame)
+            except ValueError:
+                dev.json_errors += 1; continue
+            if st.seq is not None: dev.seq.update(st.seq)
+            dev.state.apply(st)
+            if dev.dsp is not None: dev.dsp.process(st, t)
+            dev.store.append(st, t)
+            dev.latest = st; dev.version += 1; dev.frames += 1; dev.last_frame = t
+            dev.status.push(st)
+            if self.on_sample: self.on_sample(self, dev, st)
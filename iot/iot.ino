@@ -28,32 +28,160 @@ int alarmVal = 0;
 
 Servo myServo;
 unsigned long lastStatusMs = 0;
+unsigned long statusPeriodMs = 1000;   // STREAM <hz> đổi chu kỳ đẩy status
 bool busySerial = false;
 
+// PROTO BIN: frame nhị phân cố định thay cho dòng JSON (mặc định JSON)
+bool protoBin = false;
+uint16_t statusSeq = 0;
+const uint8_t BIN_SYNC = 0xA5;
+const uint8_t BIN_LEN  = 16;
+
 int clamp01(int x){ return x<=0?0:1; }
 
-// ----------------- SIÊU ÂM -----------------
-long readDistanceCm(){
-  if(!USE_ULTRASONIC) return -1;
+// ----------------- THU THẬP CẢM BIẾN (cooperative, không chặn) -----------------
+// Mỗi task tự xem millis() rồi trả về ngay; sendStatus chỉ đọc giá trị đã cache,
+// nên lệnh serial không còn phải chờ pulseIn / DHT của từng status.
+const unsigned long GAS_SAMPLE_MS = 5;       // analogRead ~0.1 ms
+const uint8_t       GAS_AVG_N     = 8;       // trung bình trượt 8 mẫu = 40 ms
+const unsigned long DHT_PERIOD_MS = 2000;    // DHT11 chỉ có giá trị mới mỗi 1–2 s
+const unsigned long US_PERIOD_MS  = 60;      // HC-SR04: ≥ 60 ms giữa 2 lần đo
+const unsigned long US_TIMEOUT_US = 25000UL; // như pulseIn cũ: quá 25 ms → -1
+
+// ----- GAS -----
+int gasBuf[GAS_AVG_N];
+long gasSum = 0;
+uint8_t gasIdx = 0, gasCount = 0;
+unsigned long lastGasMs = 0;
+
+void gasTask(unsigned long now){
+  if(gasCount && now - lastGasMs < GAS_SAMPLE_MS) return;
+  lastGasMs = now;
+  int v = analogRead(GAS_PIN);
+  if(gasCount == GAS_AVG_N) gasSum -= gasBuf[gasIdx]; else gasCount++;
+  gasBuf[gasIdx] = v; gasSum += v;
+  gasIdx = (gasIdx + 1) % GAS_AVG_N;
+}
+
+int gasValue(){ return gasCount ? (int)((gasSum + gasCount / 2) / gasCount) : analogRead(GAS_PIN); }
+
+// ----- DHT -----
+// Đọc DHT11 vẫn chặn ~20 ms (giao thức 1 dây, thư viện tắt ngắt) nhưng chỉ mỗi DHT_PERIOD_MS,
+// và được hoãn sang vòng sau khi đang có lệnh chờ trong buffer serial.
+float tempC = NAN, humiPct = NAN;
+unsigned long lastDhtMs = 0;
+bool dhtRead = false;
+
+void dhtTask(unsigned long now){
+  if(dhtRead && now - lastDhtMs < DHT_PERIOD_MS) return;
+  if(Serial.available()) return;
+  lastDhtMs = now; dhtRead = true;
+  tempC   = dht.readTemperature();           // NaN khi đọc lỗi → status báo null như trước
+  humiPct = dht.readHumidity();              // dùng lại kết quả của lần đọc trên (cache 2 s của thư viện)
+}
+
+// ----- SIÊU ÂM -----
+// ECHO qua pin-change interrupt (D12 thuộc PCINT0 trên cả Uno lẫn Mega): ISR ghi micros() ở cạnh
+// lên / xuống, usTask chỉ phát xung TRIG và đọc kết quả.
+volatile unsigned long echoStartUs = 0, echoDurUs = 0;
+volatile bool echoDone = false;
+long distCm = -1;
+unsigned long lastTrigMs = 0, trigUs = 0;
+bool echoWaiting = false;
+
+ISR(PCINT0_vect){
+  unsigned long t = micros();
+  if(digitalRead(ECHO_PIN)) echoStartUs = t;
+  else if(echoStartUs){ echoDurUs = t - echoStartUs; echoDone = true; }
+}
+
+void usBegin(){
+  *digitalPinToPCMSK(ECHO_PIN) |= bit(digitalPinToPCMSKbit(ECHO_PIN));
+  PCIFR |= bit(digitalPinToPCICRbit(ECHO_PIN));
+  PCICR |= bit(digitalPinToPCICRbit(ECHO_PIN));
+}
+
+void usTask(unsigned long now){
+  if(!USE_ULTRASONIC) return;
+  if(echoWaiting){
+    if(echoDone){
+      noInterrupts(); unsigned long dur = echoDurUs; interrupts();
+      distCm = dur <= US_TIMEOUT_US ? (long)(dur / 58) : -1;
+      echoWaiting = false;
+    }
+    else if(micros() - trigUs > US_TIMEOUT_US){ distCm = -1; echoWaiting = false; }   // không có echo
+    else return;
+  }
+  if(now - lastTrigMs < US_PERIOD_MS) return;
+  lastTrigMs = now;
+  noInterrupts(); echoStartUs = 0; echoDone = false; interrupts();
   digitalWrite(TRIG_PIN, LOW); delayMicroseconds(2);
   digitalWrite(TRIG_PIN, HIGH); delayMicroseconds(10);
   digitalWrite(TRIG_PIN, LOW);
-  unsigned long dur = pulseIn(ECHO_PIN, HIGH, 25000UL);
-  if(!dur) return -1;
-  return (long)(dur / 58);
+  trigUs = micros(); echoWaiting = true;
+}
+
+
+// ----------------- FRAME NHỊ PHÂN -----------------
+// A5 | len | seq u16 | gas u16 | dist i16 | temp*10 i16 | humi*10 i16 | thrLo u16 | thrHi u16
+//    | flags u8 (bit0 led, bit1 fan, bit2 alarm, bit3 auto) | servo u8 | crc16 u16   (little-endian)
+uint16_t crc16(const uint8_t* d, uint8_t n){
+  uint16_t c = 0xFFFF;                       // CRC-16/CCITT-FALSE
+  while(n--){
+    c ^= (uint16_t)(*d++) << 8;
+    for(uint8_t i=0;i<8;i++) c = (c & 0x8000) ? (c<<1) ^ 0x1021 : (c<<1);
+  }
+  return c;
+}
+
+void put16(uint8_t* p, int v){ p[0] = (uint8_t)(v & 0xFF); p[1] = (uint8_t)((v >> 8) & 0xFF); }
+
+void sendStatusBin(int gas, long dist, float temp, float humi){
+  uint8_t f[BIN_LEN + 4];
+  f[0] = BIN_SYNC; f[1] = BIN_LEN;
+  put16(f+2,  statusSeq);
+  put16(f+4,  gas);
+  put16(f+6,  (int)dist);
+  put16(f+8,  isnan(temp) ? -32768 : (int)(temp * 10));
+  put16(f+10, isnan(humi) ? -32768 : (int)(humi * 10));
+  put16(f+12, thrLow);
+  put16(f+14, thrHigh);
+  f[16] = (ledVal ? 1 : 0) | (fanVal ? 2 : 0) | (alarmVal ? 4 : 0) | (modeAuto ? 8 : 0);
+  f[17] = (uint8_t)servoDeg;
+  put16(f+18, crc16(f+1, BIN_LEN + 1));
+  Serial.write(f, sizeof(f));
+}
+
+void sendStatusJson(int gas, long dist, float temp, float humi){
+  Serial.print("{\"gas\":"); Serial.print(gas);
+  Serial.print(",\"distance\":"); Serial.print(dist);
+  Serial.print(",\"temperature\":");
+  if (isnan(temp)) Serial.print("null"); else Serial.print(temp);
+  Serial.print(",\"humidity\":");
+  if (isnan(humi)) Serial.print("null"); else Serial.print(humi);
+  Serial.print(",\"threshold_low\":"); Serial.print(thrLow);
+  Serial.print(",\"threshold_high\":"); Serial.print(thrHigh);
+  Serial.print(",\"mode\":\""); Serial.print(modeAuto ? "AUTO" : "MANUAL"); Serial.print("\"");
+  Serial.print(",\"led\":"); Serial.print(ledVal);
+  Serial.print(",\"fan\":"); Serial.print(fanVal);
+  Serial.print(",\"servo\":"); Serial.print(servoDeg);
+  Serial.print(",\"alarm\":"); Serial.print(alarmVal);
+  Serial.print(",\"seq\":"); Serial.print(statusSeq);
+  Serial.println("}");
 }
 
 
 // ----------------- GỬI JSON + AUTO LOGIC -----------------
 void sendStatus(bool force=false){
   unsigned long now = millis();
-  if(!force && now - lastStatusMs < 1000) return;
+  if(!force && now - lastStatusMs < statusPeriodMs) return;
   lastStatusMs = now;
 
-  int gas = analogRead(GAS_PIN);
-  long dist = readDistanceCm();
-  float temp = dht.readTemperature();
-  float humi = dht.readHumidity();
+  // giá trị đã cache bởi gasTask / usTask / dhtTask: không đọc cảm biến ở đây
+  int gas = gasValue();
+  long dist = USE_ULTRASONIC ? distCm : -1;
+  float temp = tempC;
+  float humi = humiPct;
 
   bool overHi = (gas >= thrHigh);
   bool belowLo = (gas <= thrLow);
@@ -98,22 +226,12 @@ if (modeAuto) {
 }
 
 
-  // ----------- GỬI JSON -----------
-  Serial.print("{\"gas\":"); Serial.print(gas);
-  Serial.print(",\"distance\":"); Serial.print(dist);
-  Serial.print(",\"temperature\":");
-  if (isnan(temp)) Serial.print("null"); else Serial.print(temp);
-  Serial.print(",\"humidity\":");
-  if (isnan(humi)) Serial.print("null"); else Serial.print(humi);
-  Serial.print(",\"threshold_low\":"); Serial.print(thrLow);
-  Serial.print(",\"threshold_high\":"); Serial.print(thrHigh);
-  Serial.print(",\"mode\":\""); Serial.print(modeAuto ? "AUTO" : "MANUAL"); Serial.print("\"");
-  Serial.print(",\"led\":"); Serial.print(ledVal);
-  Serial.print(",\"fan\":"); Serial.print(fanVal);
-  Serial.print(",\"servo\":"); Serial.print(servoDeg);
-  Serial.print(",\"alarm\":"); Serial.print(alarmVal);
-  Serial.println("}");
-  Serial.flush();
+  // ----------- GỬI STATUS -----------
+  statusSeq++;
+  if (protoBin) sendStatusBin(gas, dist, temp, humi);
+  else          sendStatusJson(gas, dist, temp, humi);
+  // không Serial.flush(): chờ truyền xong (~15 ms / dòng JSON ở 115200) chặn cả vòng lặp;
+  // buffer TX 64 byte vẫn giữ thứ tự và tự chặn khi đầy
 }
 
 
@@ -131,6 +249,24 @@ void handleCommand(String cmd){
 
   if(cmd=="STATUS"){ sendStatus(true); return; }
 
+  // STREAM <hz>: đẩy status liên tục, 0 = mặc định 1 s
+  if(cmd.startsWith("STREAM")){
+    if(parseIntAfterSpace(cmd,v)){
+      v = constrain(v,0,100);
+      statusPeriodMs = v > 0 ? 1000UL / v : 1000UL;
+    }
+    sendStatus(true);
+    return;
+  }
+
+  // PROTO BIN / PROTO JSON
+  if(cmd.startsWith("PROTO")){
+    if(cmd.endsWith("BIN")) protoBin = true;
+    else if(cmd.endsWith("JSON")) protoBin = false;
+    sendStatus(true);
+    return;
+  }
+
   if(cmd.startsWith("AUTO")){
     if(parseIntAfterSpace(cmd,v)){
       modeAuto = clamp01(v);
@@ -182,7 +318,7 @@ void setup(){
   pinMode(LED_PIN,OUTPUT);
   pinMode(FAN_PIN,OUTPUT);
   pinMode(ALARM_PIN,OUTPUT);
-  if(USE_ULTRASONIC){ pinMode(TRIG_PIN,OUTPUT); pinMode(ECHO_PIN,INPUT); }
+  if(USE_ULTRASONIC){ pinMode(TRIG_PIN,OUTPUT); pinMode(ECHO_PIN,INPUT); usBegin(); }
 
   myServo.attach(SERVO_PIN);
   myServo.write(0);
@@ -193,6 +329,7 @@ void setup(){
 
   dht.begin();
   delay(300);
+  gasTask(millis()); dhtTask(millis());
   sendStatus(true);
 }
 
@@ -210,5 +347,11 @@ void loop(){
     else if((unsigned char)c>=32) buf+=c;
   }
 
+  // các task cảm biến chạy mọi vòng, mỗi task tự giữ nhịp của nó
+  unsigned long now = millis();
+  gasTask(now);
+  usTask(now);
+  dhtTask(now);
+
   if (!busySerial) sendStatus(false);
 }
@@ -0,0 +1,190 @@
+# ---------- Instrumentation: counter / gauge / histogram, xuất Prometheus text + JSON (không phụ thuộc Qt) ----------
+"""In-process metrics for the hot paths (reader, GUI slots, paint).
+
+Call sites guard with `if REGISTRY.on:` so a disabled registry costs one
+attribute check per event. Each instrument is meant to be written by one
+thread; dumps read without locking (a value may be one event behind).
+
+    IOT_METRICS=1                          bật thu thập từ lúc khởi động (F12 trong dashboard: overlay + bật)
+    IOT_METRICS_FILE=/tmp/iot.prom         ghi định kỳ (đuôi .json → JSON, còn lại Prometheus text)
+    IOT_METRICS_PORT=9108                  GET /metrics (Prometheus) và /metrics.json trên 127.0.0.1
+"""
+import json, os, threading, time
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv("IOT_METRICS", "0") == "1"
+METRICS_FILE = os.getenv("IOT_METRICS_FILE", "")
+METRICS_PORT = int(os.getenv("IOT_METRICS_PORT", "0"))
+METRICS_PERIOD_S = 5.0
+# giây, log-spaced 10 µs .. 5 s (đủ cho parse vài µs lẫn paint chục ms)
+TIME_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _labels(labels:dict) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}" if labels else ""
+
+
+class Counter:
+    __slots__ = ("name", "help", "labels", "value")
+    kind = "counter"
+
+    def __init__(self, name:str, help:str="", **labels):
+        self.name = name; self.help = help; self.labels = labels; self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def sample(self) -> dict:
+        return {"value": self.value}
+
+
+class Gauge:
+    """Giá trị tức thời: set() hoặc fn() được gọi lúc dump."""
+    __slots__ = ("name", "help", "labels", "value", "fn")
+    kind = "gauge"
+
+    def __init__(self, name:str, help:str="", fn=None, **labels):
+        self.name = name; self.help = help; self.labels = labels; self.value = 0; self.fn = fn
+
+    def set(self, v):
+        self.value = v
+
+    def sample(self) -> dict:
+        if self.fn is not None:
+            try: self.value = self.fn()
+            except Exception: pass
+        return {"value": self.value}
+
+
+class Histogram:
+    """Fixed buckets (upper bounds), O(log buckets) observe; quantiles are bucket upper bounds."""
+    __slots__ = ("name", "help", "labels", "bounds", "counts", "sum", "count", "max")
+    kind = "histogram"
+
+    def __init__(self, name:str, help:str="", bounds=TIME_BUCKETS, **labels):
+        self.name = name; self.help = help; self.labels = labels
+        self.bounds = tuple(bounds); self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0; self.count = 0; self.max = 0.0
+
+    def observe(self, v:float):
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v; self.count += 1
+        if v > self.max: self.max = v
+
+    def quantile(self, q:float) -> float:
+        if not self.count: return 0.0
+        need = q * self.count; acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= need: return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def sample(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class Registry:
+    """Get-or-create instruments by (name, labels); dump as Prometheus text or JSON."""
+
+    def __init__(self, on:bool=METRICS_ENABLED):
+        self.on = on
+        self._items = {}; self._lock = threading.Lock()
+        self._thread = None; self._run = False; self._httpd = None
+
+    def _get(self, cls, name, help, labels, **kw):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            m = self._items.get(key)
+            if m is None: m = self._items[key] = cls(name, help, **kw, **labels)
+        return m
+
+    def counter(self, name:str, help:str="", **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name:str, help:str="", fn=None, **labels) -> Gauge:
+        g = self._get(Gauge, name, help, labels)
+        if fn is not None: g.fn = fn
+        return g
+
+    def histogram(self, name:str, help:str="", bounds=TIME_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, bounds=bounds)
+
+    def items(self) -> list:
+        with self._lock: return list(self._items.values())
+
+    def reset(self):
+        for m in self.items():
+            if m.kind == "histogram":
+                m.counts = [0] * len(m.counts); m.sum = 0.0; m.count = 0; m.max = 0.0
+            elif m.kind == "counter": m.value = 0
+
+    def to_dict(self) -> dict:
+        out = {}
+        for m in self.items(): out[m.name + _labels(m.labels)] = dict(m.sample(), type=m.kind)
+        return out
+
+    def prometheus(self) -> str:
+        lines = []; seen = set()
+        for m in sorted(self.items(), key=lambda m: m.name):
+            if m.name not in seen:
+                seen.add(m.name)
+                if m.help: lines.append(f"# HELP {m.name} {m.help}")
+                lines.append(f"# TYPE {m.name} {m.kind}")
+            if m.kind != "histogram":
+                m.sample(); lines.append(f"{m.name}{_labels(m.labels)} {m.value}"); continue
+            acc = 0
+            for b, c in zip(m.bounds + (float("inf"),), m.counts):
+                acc += c
+                lines.append(f"{m.name}_bucket{_labels(dict(m.labels, le='+Inf' if b == float('inf') else repr(b)))} {acc}")
+            lines.append(f"{m.name}_sum{_labels(m.labels)} {m.sum!r}")
+            lines.append(f"{m.name}_count{_labels(m.labels)} {m.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path:str):
+        """Ghi atomically (file tạm + rename) để scraper không đọc file dở."""
+        data = json.dumps(self.to_dict(), indent=1) if path.endswith(".json") else self.prometheus()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write(data)
+        os.replace(tmp, path)
+
+    # ---- export ----
+    def start_exporter(self, path:str="", port:int=0, period:float=METRICS_PERIOD_S, host:str="127.0.0.1"):
+        """Dump ra `path` mỗi `period` giây và/hoặc phục vụ HTTP trên `port` (0 = tắt từng phần)."""
+        if path:
+            self._run = True
+            def loop():
+                while self._run:
+                    try: self.dump(path)
+                    except OSError: pass
+                    for _ in range(int(period * 10)):
+                        if not self._run: break
+                        time.sleep(0.1)
+            self._thread = threading.Thread(target=loop, name="metrics-dump", daemon=True); self._thread.start()
+        if port:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            reg = self
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.startswith("/metrics.json"): body, ctype = json.dumps(reg.to_dict()), "application/json"
+                    elif self.path.startswith("/metrics"): body, ctype = reg.prometheus(), "text/plain; version=0.0.4"
+                    else: self.send_error(404); return
+                    data = body.encode(); self.send_response(200)
+                    self.send_header("Content-Type", ctype); self.send_header("Content-Length", str(len(data)))
+                    self.end_headers(); self.wfile.write(data)
+                def log_message(self, *args): pass
+            self._httpd = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        return self
+
+    @property
+    def http_port(self) -> int:
+        return self._httpd.server_address[1] if self._httpd else 0
+
+    def stop_exporter(self):
+        self._run = False
+        if self._thread: self._thread.join(1.0); self._thread = None
+        if self._httpd: self._httpd.shutdown(); self._httpd.server_close(); self._httpd = None
+
+
+REGISTRY = Registry()
@@ -0,0 +1,243 @@
+# ---------- Port discovery: cắm/rút nóng, khớp board theo VID/PID/serial, backoff reconnect (không phụ thuộc Qt) ----------
+"""Serial port watcher and reconnect helpers.
+
+PortWatcher keeps a {device: PortInfo} snapshot current from a background
+thread. On Linux it watches /dev with inotify (ctypes, no pyudev) and reads
+sysfs only for the node that appeared; elsewhere, or when inotify is not
+available, it polls (a /dev listing on Linux, comports() otherwise).
+find_port() picks the same board again after a replug, even under a new
+name (ttyUSB0 → ttyUSB1). Backoff spaces reconnect attempts.
+
+    python ports.py            # in ra sự kiện cắm/rút cho tới Ctrl+C
+"""
+import ctypes, ctypes.util, fnmatch, os, random, select, struct, sys, threading, time
+
+# giống serial.tools.list_ports_linux.comports()
+PORT_PATTERNS = ("ttyS*", "ttyUSB*", "ttyXRUSB*", "ttyACM*", "ttyAMA*", "rfcomm*", "ttyAP*")
+PORT_POLL_S = 1.0          # chế độ poll: chu kỳ so sánh danh sách cổng
+PORT_SETTLE_S = 0.05       # gom một loạt sự kiện inotify (cắm hub USB: nhiều node cùng lúc)
+RECONNECT_MIN_S = 0.25
+RECONNECT_MAX_S = 10.0
+
+_IN_CREATE, _IN_DELETE, _IN_ATTRIB, _IN_MOVED_FROM, _IN_MOVED_TO = 0x100, 0x200, 0x004, 0x040, 0x080
+_IN_EVENT = struct.Struct("iIII")     # wd, mask, cookie, len (+ name[len])
+
+
+class PortInfo:
+    """Một cổng serial: tên + nhận dạng USB (None khi không phải USB)."""
+    __slots__ = ("device", "vid", "pid", "serial_number", "description")
+
+    def __init__(self, device:str, vid:int|None=None, pid:int|None=None, serial_number:str|None=None,
+                 description:str=""):
+        self.device = device; self.vid = vid; self.pid = pid
+        self.serial_number = serial_number; self.description = description
+
+    @classmethod
+    def from_pyserial(cls, p) -> "PortInfo":
+        return cls(p.device, p.vid, p.pid, p.serial_number, p.description or "")
+
+    @property
+    def usb_id(self) -> str:
+        """"vid:pid[:serial]" (hex), "" khi không phải USB."""
+        if self.vid is None: return ""
+        return f"{self.vid:04x}:{self.pid:04x}" + (f":{self.serial_number}" if self.serial_number else "")
+
+    def same_board(self, other:"PortInfo") -> bool:
+        """Cùng VID/PID, và cùng serial number khi cả hai đều có."""
+        if self.vid is None or other.vid is None: return False
+        if (self.vid, self.pid) != (other.vid, other.pid): return False
+        return not (self.serial_number and other.serial_number) or self.serial_number == other.serial_number
+
+    def __repr__(self):
+        return f"PortInfo({self.device!r}{', ' + self.usb_id if self.vid is not None else ''})"
+
+
+def describe(device:str) -> PortInfo|None:
+    """PortInfo của một node (Linux: chỉ đọc sysfs của nó); None nếu không phải cổng thật."""
+    if sys.platform.startswith("linux"):
+        from serial.tools.list_ports_linux import SysFS
+        info = SysFS(device)
+        return None if info.subsystem == "platform" else PortInfo.from_pyserial(info)
+    for p in comports():
+        if p.device == device: return p
+    return None
+
+
+def comports() -> list:
+    """Quét đầy đủ (chậm trên host nhiều cổng): list[PortInfo]."""
+    import serial.tools.list_ports
+    return [PortInfo.from_pyserial(p) for p in serial.tools.list_ports.comports()]
+
+
+def find_port(ports, want:PortInfo|None, name:str|None=None) -> PortInfo|None:
+    """Cổng của board `want` trong `ports`: ưu tiên tên cũ nếu vẫn là board đó, rồi tới cổng khớp VID/PID/serial.
+
+    Board không phải USB (hoặc chưa biết) chỉ khớp theo tên.
+    """
+    ports = list(ports)
+    for p in ports:
+        if p.device == name and (want is None or want.vid is None or want.same_board(p)): return p
+    if want is not None and want.vid is not None:
+        for p in ports:
+            if want.same_board(p): return p
+    return None
+
+
+def parse_usb_id(spec:str) -> PortInfo:
+    """"2341:0043" hoặc "2341:0043:SERIAL" → PortInfo mẫu để find_port()."""
+    parts = spec.split(":", 2)
+    if len(parts) < 2: raise ValueError(f"expected VID:PID[:SERIAL], got {spec!r}")
+    return PortInfo("", int(parts[0], 16), int(parts[1], 16), parts[2] if len(parts) > 2 else None)
+
+
+class Backoff:
+    """Exponential backoff: min_s, min_s·factor, ... tối đa max_s, ±jitter để N board không thử cùng lúc."""
+    __slots__ = ("min_s", "max_s", "factor", "jitter", "attempts")
+
+    def __init__(self, min_s:float=RECONNECT_MIN_S, max_s:float=RECONNECT_MAX_S, factor:float=2.0, jitter:float=0.1):
+        self.min_s = min_s; self.max_s = max_s; self.factor = factor; self.jitter = jitter; self.attempts = 0
+
+    def next(self) -> float:
+        d = min(self.max_s, self.min_s * self.factor ** min(self.attempts, 32)); self.attempts += 1
+        return d * (1.0 + self.jitter * (2.0 * random.random() - 1.0)) if self.jitter else d
+
+    def reset(self):
+        self.attempts = 0
+
+
+def _inotify(path:str, mask:int) -> int:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    if libc.inotify_add_watch(fd, path.encode(), mask) < 0:
+        err = ctypes.get_errno(); os.close(fd); raise OSError(err, f"inotify_add_watch {path} failed")
+    return fd
+
+
+class PortWatcher:
+    """Snapshot {device: PortInfo} giữ cập nhật trên thread riêng; on_change(added, removed) khi tập cổng đổi.
+
+    mode: "auto" (inotify trên Linux, không được thì poll), "inotify", "poll", "off" (chỉ quét khi rescan()).
+    on_change chạy trên thread của watcher: added = list[PortInfo], removed = list[str];
+    sau rescan() luôn được gọi (kể cả khi không đổi). `ports` được thay nguyên dict mỗi lần đổi
+    nên đọc từ thread khác không cần khoá.
+    """
+
+    def __init__(self, on_change=None, mode:str="auto", poll_s:float=PORT_POLL_S, dev_dir:str="/dev"):
+        self.on_change = on_change; self.mode = mode; self.poll_s = poll_s; self.dev_dir = dev_dir
+        self.ports = {}
+        self.scans = 0; self.events = 0
+        self._linux = sys.platform.startswith("linux")
+        self._skip = set()        # node không phải cổng thật (ttyS* platform): không describe() lại
+        self._run = False; self._thread = None; self._rescan = True; self._ino = -1
+        self._wake_r = self._wake_w = -1
+
+    def start(self):
+        if self._thread is not None: return self
+        if self.mode in ("auto", "inotify") and self._linux:
+            try: self._ino = _inotify(self.dev_dir, _IN_CREATE | _IN_DELETE | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO)
+            except (OSError, AttributeError):
+                if self.mode == "inotify": raise
+        if self.mode != "off": self.mode = "inotify" if self._ino >= 0 else "poll"
+        self._wake_r, self._wake_w = os.pipe()
+        self._run = True
+        self._thread = threading.Thread(target=self._loop, name="port-watch", daemon=True); self._thread.start()
+        return self
+
+    def stop(self):
+        self._run = False; self._wake()
+        if self._thread: self._thread.join(1.0); self._thread = None
+        for fd in (self._ino, self._wake_r, self._wake_w):
+            if fd >= 0: os.close(fd)
+        self._ino = self._wake_r = self._wake_w = -1
+
+    @property
+    def running(self) -> bool: return self._thread is not None
+
+    def rescan(self):
+        """Quét đầy đủ comports() trên thread watcher (nút Scan)."""
+        self._rescan = True; self._wake()
+
+    def _wake(self):
+        if self._wake_w >= 0:
+            try: os.write(self._wake_w, b"\0")
+            except OSError: pass
+
+    # ---- watcher thread ----
+    def _names(self) -> set:
+        try: names = os.listdir(self.dev_dir)
+        except OSError: return set()
+        return {os.path.join(self.dev_dir, n) for n in names if any(fnmatch.fnmatchcase(n, p) for p in PORT_PATTERNS)}
+
+    def _publish(self, ports:dict, always:bool=False):
+        added = [p for d, p in ports.items() if d not in self.ports]
+        removed = [d for d in self.ports if d not in ports]
+        if added or removed: self.ports = ports
+        if (added or removed or always) and self.on_change: self.on_change(added, removed)
+
+    def _full_scan(self):
+        self._rescan = False; self.scans += 1
+        try: found = comports()
+        except Exception: found = []
+        self._publish({p.device: p for p in sorted(found, key=lambda p: p.device)}, always=True)
+
+    def _update(self, names:set):
+        """Chỉ describe() node mới; node biến mất thì bỏ."""
+        ports = {d: p for d, p in self.ports.items() if d in names}
+        self._skip &= names
+        for d in sorted(names - self.ports.keys() - self._skip):
+            try: info = describe(d)
+            except Exception: info = None
+            if info is not None: ports[d] = info
+            else: self._skip.add(d)
+        self._publish(ports)
+
+    def _drain_inotify(self) -> bool:
+        seen = False
+        while True:
+            try: buf = os.read(self._ino, 4096)
+            except BlockingIOError: return seen
+            off = 0
+            while off + _IN_EVENT.size <= len(buf):
+                _, _, _, n = _IN_EVENT.unpack_from(buf, off); off += _IN_EVENT.size
+                name = buf[off:off + n].rstrip(b"\0").decode(errors="replace"); off += n
+                if any(fnmatch.fnmatchcase(name, p) for p in PORT_PATTERNS): seen = True; self.events += 1
+
+    def _loop(self):
+        fds = [self._wake_r] + ([self._ino] if self._ino >= 0 else [])
+        names = None
+        while self._run:
+            if self._rescan:
+                self._full_scan()
+                if self._linux: names = self._names(); self._skip = names - self.ports.keys()
+            timeout = self.poll_s if self.mode == "poll" else None
+            r, _, _ = select.select(fds, [], [], timeout)
+            if not self._run: break
+            if self._wake_r in r: os.read(self._wake_r, 512)
+            if self._ino in r and self._drain_inotify():
+                time.sleep(PORT_SETTLE_S); self._drain_inotify()
+                names = self._names(); self._update(names)
+            elif self.mode == "poll" and not r:
+                if self._linux:
+                    now = self._names()
+                    if now != names: names = now; self._update(now)
+                else:
+                    try: found = comports()
+                    except Exception: continue
+                    self._publish({p.device: p for p in sorted(found, key=lambda p: p.device)})
+
+
+def main():
+    def show(added, removed):
+        for p in added: print(f"+ {p.device:16s} {p.usb_id:24s} {p.description}")
+        for d in removed: print(f"- {d}")
+    w = PortWatcher(show).start()
+    print(f"watching ({w.mode}), Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt: pass
+    w.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# ---------- Ring buffer reader thread → GUI (không khóa) ----------
+
+
+class SampleRing:
+    """Single-producer / single-consumer ring with no lock.
+
+    The producer only advances `head`, the consumer only advances `tail`; both
+    are plain int stores, atomic under the GIL. If the consumer falls more than
+    `cap` items behind, the oldest ones are skipped and counted in `overruns`.
+    """
+    __slots__ = ("_slots", "cap", "head", "tail", "overruns")
+
+    def __init__(self, cap:int=8192):
+        self._slots = [None] * cap
+        self.cap = cap; self.head = 0; self.tail = 0; self.overruns = 0
+
+    def __len__(self):
+        return min(self.head - self.tail, self.cap)
+
+    def push(self, item):
+        self._slots[self.head % self.cap] = item
+        self.head += 1
+
+    def drain(self) -> list:
+        head, tail, cap = self.head, self.tail, self.cap
+        n = head - tail
+        if n <= 0: return []
+        if n > cap:
+            self.overruns += n - cap; tail = head - cap; n = cap
+        i, j = tail % cap, head % cap
+        out = self._slots[i:j] if i < j else self._slots[i:] + self._slots[:j]
+        self.tail = head
+        return out
+
+    def latest(self):
+        return self._slots[(self.head - 1) % self.cap] if self.head else None
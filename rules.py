@@ -0,0 +1,214 @@
+# ---------- Rules engine: auto/safety logic, chạy ngay trên ingest thread (không phụ thuộc Qt) ----------
+"""Declarative threshold rules with hysteresis, debounce and minimum hold time.
+
+The engine is a pure function of (sample, time) plus its own state, so the
+same trace always yields the same commands. It runs on the reader / hub thread
+straight off each decoded frame; the GUI only reads `active()`.
+
+Replay a telemetry log (or a JSONL trace) and compare the engine's decisions
+with the commands that were actually sent:
+
+    python rules.py replay --dir telemetry --from 2024-05-01 --tolerance 1.0
+    python rules.py replay --trace trace.jsonl --hysteresis 10 --strict
+    python rules.py replay --dir telemetry --raw      # log ghi với IOT_DSP=0 (rules trên gas raw)
+
+Without --raw every frame first goes through dsp.GasDsp and gas_low compares gas_pred, as on the reader thread.
+
+Trace lines are {"t": ..., <status fields>} or {"t": ..., "cmd": "FAN 1"}.
+"""
+import argparse, json, math, sys, threading
+
+# auto logic mặc định của dashboard: gas >= THR LOW → quạt + mở cửa + đèn
+# (không có "ALARM x": iot.ino không xử lý ALARM, còi chỉ theo THR HI của chính board ở AUTO)
+ALARM_COMMANDS = ("FAN 1", "SERVO 90", "LED 1")
+SAFE_COMMANDS = ("FAN 0", "SERVO 0", "LED 0")
+RULE_HYSTERESIS = 0.0      # gas phải xuống dưới thr - hysteresis mới tắt
+RULE_DEBOUNCE_S = 0.0      # điều kiện phải giữ liên tục ngần này giây mới đổi trạng thái
+RULE_MIN_HOLD_S = 0.0      # sau khi đổi, giữ trạng thái tối thiểu ngần này giây
+
+
+class Rule:
+    """`field` >= `threshold` (or <= when above=False) turns the rule on and emits `on`;
+    leaving the band by more than `hysteresis` turns it off and emits `off`.
+
+    A change is taken only after the new condition held for `debounce_s` and
+    at least `min_hold_s` after the previous change. With `emit_initial` the
+    first sample always emits its state (mirror rules); otherwise the rule
+    starts off and silent.
+    """
+    __slots__ = ("name", "field", "threshold", "on", "off", "above", "hysteresis", "debounce_s",
+                 "min_hold_s", "emit_initial")
+
+    def __init__(self, name:str, field:str, threshold:float, on=(), off=(), above:bool=True,
+                 hysteresis:float=0.0, debounce_s:float=0.0, min_hold_s:float=0.0, emit_initial:bool=False):
+        self.name = name; self.field = field; self.threshold = threshold
+        self.on = tuple(on); self.off = tuple(off); self.above = above
+        self.hysteresis = hysteresis; self.debounce_s = debounce_s; self.min_hold_s = min_hold_s
+        self.emit_initial = emit_initial
+
+    def wants(self, v:float, active) -> bool:
+        thr = self.threshold
+        if active: thr = thr - self.hysteresis if self.above else thr + self.hysteresis
+        return v >= thr if self.above else v <= thr
+
+
+def default_rules(threshold_low:float=380, hysteresis:float=RULE_HYSTERESIS, debounce_s:float=RULE_DEBOUNCE_S,
+                  min_hold_s:float=RULE_MIN_HOLD_S, alarm_cmds=ALARM_COMMANDS, safe_cmds=SAFE_COMMANDS,
+                  field:str="gas") -> list:
+    """Auto logic mặc định: `field` >= THR LOW → bật quạt/cửa/đèn (gas_low).
+
+    field="gas_pred" so sánh giá trị đã lọc (+ nhìn trước nếu bật) của dsp.GasDsp thay cho gas raw.
+    """
+    return [Rule("gas_low", field, threshold_low, alarm_cmds, safe_cmds, hysteresis=hysteresis,
+                 debounce_s=debounce_s, min_hold_s=min_hold_s)]
+
+
+class RulesEngine:
+    """Evaluate rules in order; evaluate() returns the commands of the rules that changed state.
+
+    evaluate() runs on the reader / hub thread while set_threshold() and
+    reset() come from the GUI: all three take the same lock (like DeviceState).
+    """
+    __slots__ = ("rules", "_state", "evaluations", "decisions", "_lock")
+
+    def __init__(self, rules):
+        self.rules = list(rules); self._lock = threading.Lock()
+        self._state = {}
+        self.evaluations = 0; self.decisions = 0
+        self.reset()
+
+    def reset(self):
+        # name → [active (None = chưa có sample), candidate_since, changed_at]
+        with self._lock: self._state = {r.name: [None if r.emit_initial else False, None, None] for r in self.rules}
+
+    def rule(self, name:str) -> Rule:
+        return next(r for r in self.rules if r.name == name)
+
+    def set_threshold(self, name:str, threshold:float):
+        r = self.rule(name)
+        with self._lock: r.threshold = threshold
+
+    def active(self, name:str) -> bool:
+        return bool(self._state[name][0])
+
+    def evaluate(self, st:dict, t:float) -> list:
+        out = []
+        with self._lock:
+            self.evaluations += 1
+            for r in self.rules:
+                v = st.get(r.field)
+                if v is None: continue
+                try: v = float(v)
+                except (TypeError, ValueError): continue
+                if v != v: continue
+                s = self._state[r.name]; active = s[0]
+                want = r.wants(v, active)
+                if active is None:
+                    s[0] = want; s[2] = t; out += r.on if want else r.off; continue
+                if want == active:
+                    s[1] = None; continue
+                if s[1] is None: s[1] = t
+                if t - s[1] < r.debounce_s: continue
+                if s[2] is not None and t - s[2] < r.min_hold_s: continue
+                s[0] = want; s[1] = None; s[2] = t
+                out += r.on if want else r.off
+            if out: self.decisions += 1
+        return out
+
+
+# ---------- Replay harness ----------
+def replay(engine:RulesEngine, samples, thresholds_from_frames:bool=False, rule:str="gas_low", dsp=None) -> list:
+    """Run `samples` [(t, status dict)] through a fresh engine state → [(t, cmd)].
+
+    With `dsp` (a dsp.GasDsp) every sample goes through a reset filter chain first, like on the reader thread.
+    """
+    engine.reset(); out = []
+    if dsp is not None: dsp.reset()
+    for t, st in samples:
+        if dsp is not None: dsp.process(st, t)
+        if thresholds_from_frames and st.get("threshold_low"): engine.set_threshold(rule, st["threshold_low"])
+        out += ((t, c) for c in engine.evaluate(st, t))
+    return out
+
+
+def compare(decided, recorded, tolerance:float=1.0) -> dict:
+    """Pair each decision with the first unused recorded command with the same text within ±tolerance.
+
+    The window is symmetric because the frame record can be logged after the
+    command it triggered (rules run on the reader thread, status is logged on
+    the GUI thread). Only recorded commands whose verb the engine can emit are considered, so
+    manual commands in the log do not count as unexpected.
+    """
+    verbs = {c.split()[0] for _, c in decided} | {c.split()[0] for c in ALARM_COMMANDS + SAFE_COMMANDS}
+    rec = [(t, c) for t, c in recorded if c.split() and c.split()[0] in verbs]
+    used = [False] * len(rec); missing = []; j0 = 0; lags = []
+    for t, c in decided:
+        while j0 < len(rec) and rec[j0][0] < t - tolerance: j0 += 1
+        for j in range(j0, len(rec)):
+            rt, rc = rec[j]
+            if rt > t + tolerance: break
+            if not used[j] and rc == c:
+                used[j] = True; lags.append(abs(rt - t)); break
+        else:
+            missing.append((t, c))
+    unexpected = [r for r, u in zip(rec, used) if not u]
+    return {"decided": len(decided), "recorded": len(rec), "matched": len(lags), "missing": missing,
+            "unexpected": unexpected, "lag_max": max(lags, default=0.0)}
+
+
+def _load_trace(path:str):
+    samples = []; cmds = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip(): continue
+            d = json.loads(line); t = float(d.pop("t"))
+            if "cmd" in d: cmds.append((t, d["cmd"]))
+            else: samples.append((t, d))
+    return samples, cmds
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay recorded frames through the rules engine")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("replay", help="compare engine decisions with the commands in a log or trace")
+    src = rp.add_mutually_exclusive_group(required=True)
+    src.add_argument("--dir", help="telemetry log directory")
+    src.add_argument("--trace", help="JSONL trace")
+    rp.add_argument("--from", dest="t0"); rp.add_argument("--to", dest="t1")
+    rp.add_argument("--thr-lo", type=float, help="fixed THR LOW (default: threshold_low of each frame, else 380)")
+    rp.add_argument("--hysteresis", type=float, default=RULE_HYSTERESIS)
+    rp.add_argument("--debounce", type=float, default=RULE_DEBOUNCE_S)
+    rp.add_argument("--min-hold", type=float, default=RULE_MIN_HOLD_S)
+    rp.add_argument("--raw", action="store_true", help="compare raw gas (no DSP stage), like IOT_DSP=0")
+    rp.add_argument("--tolerance", type=float, default=1.0, help="max seconds between decision and recorded command")
+    rp.add_argument("--strict", action="store_true", help="exit 1 on any mismatch")
+    rp.add_argument("--show", type=int, default=10, help="mismatches to print")
+    a = ap.parse_args(argv)
+    if a.dir:
+        from telemetry import LogReader, KIND_STATUS, _parse_time
+        t0, t1 = _parse_time(a.t0, -math.inf), _parse_time(a.t1, math.inf)
+        samples = []; cmds = []
+        with LogReader(a.dir) as r:
+            for kind, t, d in r.records(t0, t1):
+                if kind == KIND_STATUS: samples.append((t, d))
+                else: cmds.append((t, d["cmd"]))
+    else:
+        samples, cmds = _load_trace(a.trace)
+    engine = RulesEngine(default_rules(a.thr_lo or 380, a.hysteresis, a.debounce, a.min_hold,
+                                       field="gas" if a.raw else "gas_pred"))
+    dsp = None
+    if not a.raw:
+        from dsp import GasDsp
+        dsp = GasDsp()
+    decided = replay(engine, samples, thresholds_from_frames=a.thr_lo is None, dsp=dsp)
+    res = compare(decided, cmds, a.tolerance)
+    print(f"{len(samples)} frames, {res['decided']} decisions, {res['recorded']} recorded auto commands: "
+          f"{res['matched']} matched (max lag {res['lag_max'] * 1e3:.0f} ms), "
+          f"{len(res['missing'])} missing, {len(res['unexpected'])} unexpected")
+    for name, rows in (("missing", res["missing"]), ("unexpected", res["unexpected"])):
+        for t, c in rows[:a.show]: print(f"  {name:10s} {t:.3f} {c}")
+    return 1 if a.strict and (res["missing"] or res["unexpected"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# ---------- History buffers cho đồ thị (không phụ thuộc Qt) ----------
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:     # numpy là tùy chọn: fallback sang array + vòng lặp Python
+    np = None
+
+_NAN = float("nan")
+
+
+class HistoryRing:
+    """Preallocated ring of the last `cap` samples.
+
+    Every value is written twice (at i and i+cap) so window() is always one
+    contiguous slice: a zero-copy view with numpy, an array copy without.
+    """
+    __slots__ = ("cap", "count", "_buf")
+
+    def __init__(self, cap:int):
+        self.cap = cap; self.count = 0
+        self._buf = np.zeros(2 * cap, dtype=np.float32) if np is not None else array("f", bytes(8 * cap))
+
+    def __len__(self):
+        return min(self.count, self.cap)
+
+    def __iter__(self):
+        return iter(self.window())
+
+    def __getitem__(self, i):
+        return self.window()[i]
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, v):
+        i = self.count % self.cap
+        self._buf[i] = v; self._buf[i + self.cap] = v
+        self.count += 1
+
+    def extend(self, values):
+        for v in values: self.append(v)
+
+    def window(self):
+        n = len(self)
+        s = self.count % self.cap if self.count >= self.cap else 0
+        return self._buf[s:s + n]
+
+    def last(self):
+        return self._buf[(self.count - 1) % self.cap] if self.count else None
+
+
+def minmax_decimate(y, width:int):
+    """Reduce `y` to at most 2*width points keeping each pixel column's min and max.
+
+    Returns (xs, ys) where xs are (fractional) sample indices, so spikes shorter
+    than one pixel are still drawn. A NaN (gap marker) makes its column NaN.
+    """
+    n = len(y)
+    if n <= 2 * width or width <= 0:
+        return (np.arange(n, dtype=np.float64), y) if np is not None else (range(n), y)
+    if np is not None:
+        edges = (np.arange(width + 1, dtype=np.int64) * n) // width
+        mn = np.minimum.reduceat(y, edges[:-1]); mx = np.maximum.reduceat(y, edges[:-1])
+        xs = np.repeat((edges[:-1] + edges[1:] - 1) / 2.0, 2)
+        ys = np.empty(2 * width, dtype=y.dtype); ys[0::2] = mn; ys[1::2] = mx
+        return xs, ys
+    xs = []; ys = []
+    for b in range(width):
+        lo = b * n // width; hi = (b + 1) * n // width
+        chunk = y[lo:hi]; x = (lo + hi - 1) / 2.0
+        xs += (x, x); ys += (_NAN, _NAN) if any(v != v for v in chunk) else (min(chunk), max(chunk))
+    return xs, ys
+
+
+def runs(ys):
+    """[(i, j)] of the NaN-free stretches of `ys` (each one drawn as its own polyline)."""
+    if np is not None:
+        ok = np.isfinite(np.asarray(ys, dtype=np.float64))
+        if ok.all(): return [(0, len(ok))] if len(ok) else []
+        d = np.diff(np.r_[0, ok.view(np.int8), 0])
+        return list(zip(np.flatnonzero(d == 1).tolist(), np.flatnonzero(d == -1).tolist()))
+    out = []; i = None
+    for k, v in enumerate(ys):
+        if v == v:
+            if i is None: i = k
+        elif i is not None: out.append((i, k)); i = None
+    if i is not None: out.append((i, len(ys)))
+    return out
+
+
+# ---------- Time-series store nhiều độ phân giải (raw + 1 s / 1 min / 1 h) ----------
+STATUS_FIELDS = ("gas", "distance", "temperature", "humidity", "led", "fan", "servo", "alarm")
+RAW_CAP = 65536
+TIERS = ((1, 6 * 3600), (60, 14 * 1440), (3600, 366 * 24))   # (giây/bucket, số bucket giữ lại)
+
+
+class _Columns:
+    """Fixed-capacity ring of float64 columns sharing one write index (column "t" is time)."""
+    __slots__ = ("cap", "count", "cols")
+
+    def __init__(self, cap:int, names):
+        self.cap = cap; self.count = 0
+        self.cols = {n: array("d", (0.0,)) * cap for n in ("t",) + tuple(names)}   # nhân mảng: không qua bytes tạm
+
+    def __len__(self):
+        return min(self.count, self.cap)
+
+    def nbytes(self) -> int:
+        return sum(c.itemsize * len(c) for c in self.cols.values())
+
+    def _phys(self, i:int) -> int:
+        return (self.count - len(self) + i) % self.cap
+
+    def append(self, names, t:float, values):
+        i = self.count % self.cap; cols = self.cols
+        cols["t"][i] = t
+        for n, v in zip(names, values): cols[n][i] = v
+        self.count += 1
+
+    def first_t(self):
+        return self.cols["t"][self._phys(0)] if self.count else None
+
+    def bisect(self, t:float) -> int:
+        """Logical index of the first row with time >= t (binary search, O(log n))."""
+        tc = self.cols["t"]; lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tc[self._phys(mid)] < t: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def slice(self, name:str, i:int, j:int) -> array:
+        col = self.cols[name]
+        if i >= j: return array("d")
+        a, b = self._phys(i), self._phys(j - 1) + 1
+        return col[a:b] if a < b else col[a:] + col[:b]
+
+
+class _Tier:
+    """Buckets of `width` seconds with min/max/sum/n per field; closed buckets roll up into `parent`.
+
+    A gap (add_gap) is written as a marker row (n = 0 everywhere) right after
+    the bucket open at that time, when it closes, and passed on to `parent`.
+    """
+    __slots__ = ("width", "rows", "names", "parent", "start", "acc", "gap")
+
+    def __init__(self, width:int, cap:int, fields, parent=None):
+        self.width = width; self.parent = parent
+        self.names = tuple(f"{f}.{k}" for f in fields for k in ("min", "max", "sum", "n"))
+        self.rows = _Columns(cap, self.names)
+        self.start = None; self.acc = None; self.gap = None
+
+    def add(self, t:float, agg:list):
+        """agg = [min, max, sum, n] * len(fields) (sample đơn: [v, v, v, 1])."""
+        b = t - t % self.width
+        if self.start is None or b > self.start:
+            if self.start is not None: self._close()
+            self.start = b; self.acc = list(agg); return
+        acc = self.acc
+        for k in range(0, len(acc), 4):
+            n = agg[k + 3]
+            if not n: continue
+            if acc[k + 3]:
+                if agg[k] < acc[k]: acc[k] = agg[k]
+                if agg[k + 1] > acc[k + 1]: acc[k + 1] = agg[k + 1]
+                acc[k + 2] += agg[k + 2]; acc[k + 3] += n
+            else:
+                acc[k:k + 4] = agg[k:k + 4]
+
+    def add_gap(self, t:float):
+        if self.start is None: return          # chưa có bucket nào: không có gì để ngắt
+        self.gap = t if self.gap is None else min(self.gap, t)
+
+    def _close(self):
+        self.rows.append(self.names, self.start, self.acc)
+        if self.parent is not None: self.parent.add(self.start, self.acc)
+        if self.gap is not None:
+            t = max(self.gap, self.start); self.gap = None
+            self.rows.append(self.names, t, (_NAN, _NAN, 0.0, 0) * (len(self.names) // 4))
+            if self.parent is not None: self.parent.add_gap(t)
+
+
+class TimeSeriesStore:
+    """Bounded in-process history of every status field.
+
+    A raw ring keeps the latest samples; 1 s / 1 min / 1 h tiers keep
+    min/max/mean and are maintained incrementally (each closed bucket rolls up
+    into the next tier), so memory is fixed at construction and a range query
+    picks one tier and binary-searches it instead of scanning raw samples.
+    """
+
+    def __init__(self, fields=STATUS_FIELDS, raw_cap:int=RAW_CAP, tiers=TIERS):
+        self.fields = tuple(fields)
+        self.raw = _Columns(raw_cap, self.fields)
+        self.tiers = []; parent = None
+        for width, cap in reversed(tiers):
+            parent = _Tier(width, cap, self.fields, parent); self.tiers.insert(0, parent)
+
+    def nbytes(self) -> int:
+        return self.raw.nbytes() + sum(t.rows.nbytes() for t in self.tiers)
+
+    def append(self, st:dict, t:float|None=None):
+        if t is None: t = time.time()
+        vals = []; agg = []
+        for f in self.fields:
+            v = st.get(f)
+            try: v = float(v) if v is not None else _NAN
+            except (TypeError, ValueError): v = _NAN
+            vals.append(v)
+            agg += (v, v, v, 1) if v == v else (_NAN, _NAN, 0.0, 0)
+        self.raw.append(self.fields, t, vals)
+        if self.tiers: self.tiers[0].add(t, agg)
+
+    def add_gap(self, t:float|None=None):
+        """Marker (mọi field = NaN) ở raw và ở mọi tier để đồ thị không nối qua lúc mất kết nối."""
+        if t is None: t = time.time()
+        self.raw.append(self.fields, t, [_NAN] * len(self.fields))
+        for tier in self.tiers: tier.add_gap(t)      # tier cha nhận marker khi bucket con đóng
+
+    def raw_columns(self, fields=None, t0:float=-float("inf"), t1:float=float("inf")) -> dict:
+        """Raw rows in [t0, t1], oldest first: {"t": array, field: array, ...} (copies)."""
+        raw = self.raw; i, j = raw.bisect(t0), raw.bisect(t1 + 1e-9)
+        return {n: raw.slice(n, i, j) for n in ("t",) + tuple(fields or self.fields)}
+
+    def pick(self, t0:float, t1:float, max_points:int):
+        """Finest level covering [t0, t1] with <= max_points rows: None = raw, else a _Tier."""
+        raw = self.raw
+        if raw.count and (raw.count <= raw.cap or raw.first_t() <= t0):
+            if raw.bisect(t1 + 1e-9) - raw.bisect(t0) <= max_points: return None
+        for tier in self.tiers:
+            rows = tier.rows
+            covers = rows.count <= rows.cap or rows.first_t() <= t0
+            if covers and (t1 - t0) / tier.width <= max_points: return tier
+        return self.tiers[-1] if self.tiers else None
+
+    def query(self, field:str, t0:float, t1:float, max_points:int=2000, level=...) -> dict:
+        """Rows of `field` in [t0, t1]: {"t", "min", "max", "mean", "width"} (arrays of float).
+
+        `level`: None = raw, a bucket width in seconds (ValueError if no tier has it), or ... to pick automatically.
+        Tier results include the bucket still being filled.
+        """
+        if level is ...: tier = self.pick(t0, t1, max_points)
+        elif level is None: tier = None
+        else:
+            tier = next((t for t in self.tiers if t.width == level), None)
+            if tier is None: raise ValueError(f"no tier of width {level}")
+        if tier is None:
+            rows = self.raw; i, j = rows.bisect(t0), rows.bisect(t1 + 1e-9)
+            v = rows.slice(field, i, j)
+            return {"t": rows.slice("t", i, j), "min": v, "max": v, "mean": v, "width": 0}
+        rows = tier.rows; i, j = rows.bisect(t0), rows.bisect(t1 + 1e-9)
+        t = rows.slice("t", i, j); mn = rows.slice(f"{field}.min", i, j); mx = rows.slice(f"{field}.max", i, j)
+        sm = rows.slice(f"{field}.sum", i, j); n = rows.slice(f"{field}.n", i, j)
+        if tier.start is not None and t0 <= tier.start <= t1:
+            k = self.fields.index(field) * 4; acc = tier.acc
+            t.append(tier.start); mn.append(acc[k]); mx.append(acc[k + 1]); sm.append(acc[k + 2]); n.append(acc[k + 3])
+        mean = array("d", (s / c if c else _NAN for s, c in zip(sm, n)))
+        return {"t": t, "min": mn, "max": mx, "mean": mean, "width": tier.width}
+
+    def envelope(self, field:str, t0:float, t1:float, max_points:int=2000):
+        """min/max interleaved for plotting, plus the bucket width used.
+
+        Gaps and empty buckets stay as one NaN pair (pen break, see runs());
+        consecutive ones are merged, leading / trailing ones dropped.
+        """
+        q = self.query(field, t0, t1, max_points)
+        ys = array("d"); brk = False
+        for a, b in zip(q["min"], q["max"]):
+            if a == a:
+                if brk and ys: ys.append(_NAN); ys.append(_NAN)
+                ys.append(a); ys.append(b); brk = False
+            else:
+                brk = True
+        return (np.frombuffer(ys, dtype=np.float64) if np is not None else ys), q["width"]
@@ -0,0 +1,315 @@
+# ---------- Giả lập firmware iot.ino trên pty (không cần Arduino, không phụ thuộc Qt) ----------
+"""Python port of iot/iot.ino's command set and sendStatus auto logic, served on a pty.
+
+    python sim.py --profile leak+spike --rate 10 --proto json --garbage 0.01
+    python sim.py --profile cycle --rate line --proto bin --link /tmp/ttyIOT
+    python sim.py --acquisition blocking            # firmware cũ: đọc cảm biến trong sendStatus
+
+Prints the slave device (or creates --link as a symlink); type it as the port in
+the dashboard, or pass it to daemon.py --port. Commands: STATUS, STREAM <hz>,
+PROTO BIN|JSON, AUTO 0|1, LED/FAN/SERVO <v> (manual mode only), THRLO/THRHI <v>;
+ALARM <x> is accepted and ignored, exactly like the firmware.
+
+Gas profiles combine with "+": steady, noise, leak, spike, warmup, cycle.
+--rate <hz> fixes the status period (STREAM still parsed but does not change
+it, like a build with a fixed period); "line" sends as fast as --baud allows,
+--baud 0 removes UART pacing. --garbage <p> corrupts that fraction of frames
+(random bytes, truncated frame, flipped byte, debug text).
+
+--acquisition models how long the MCU is busy reading sensors, during which
+it reads no commands: "sched" (current firmware) reads DHT11 for
+SIM_DHT_READ_S every SIM_DHT_PERIOD_S from its own task, postponed while a
+command is waiting, and statuses use cached values; "blocking" (before the
+cooperative tasks) runs pulseIn (echo time, or the 25 ms timeout) plus the
+DHT read (when the library's 2 s cache expired) inside every sendStatus and
+ends it with Serial.flush(). Only timing is modeled: the gas profile is
+the value the firmware reports (already averaged in "sched") and
+temperature / humidity are drawn per status either way.
+"""
+import argparse, math, os, random, select, sys, threading, time, tty
+from framing import StatusSample, encode_bin_frame
+
+SIM_BASE_GAS = 300
+SIM_NOISE = 3.0            # σ nhiễu ADC (units)
+GARBAGE_KINDS = ("noise", "truncate", "flip", "text")
+ACQUISITION = ("sched", "blocking")
+SIM_DHT_READ_S = 0.023     # DHT11: start 18 ms + 40 bit ~5 ms, ngắt bị tắt
+SIM_DHT_PERIOD_S = 2.0     # dhtTask / cache 2 s của thư viện DHT
+SIM_ECHO_TIMEOUT_S = 0.025 # pulseIn(ECHO, HIGH, 25000)
+
+
+# ---------- Gas profiles: base + tổng các delta(t) + nhiễu ----------
+def _leak(t, rnd, start=10.0, slope=2.0, top=520.0, end=None):
+    if t < start: return 0.0
+    d = min(top, (t - start) * slope)
+    if end is not None and t > end: d = max(0.0, d - (t - end) * slope)
+    return d
+
+def _spike(t, rnd, p=0.01, size=300.0):
+    return size if rnd.random() < p else 0.0
+
+def _warmup(t, rnd, start=400.0, tau=15.0):
+    return start * math.exp(-t / tau)
+
+def _cycle(t, rnd, period=60.0, amp=300.0):
+    ph = (t % period) / period
+    return amp * (1.0 - abs(2.0 * ph - 1.0)) - 50.0
+
+def _noise(t, rnd, sigma=15.0):
+    return rnd.gauss(0.0, sigma)
+
+PROFILES = {"steady": lambda t, rnd: 0.0, "noise": _noise, "leak": _leak, "spike": _spike,
+            "warmup": _warmup, "cycle": _cycle}
+
+
+def gas_profile(spec:str="steady", base:float=SIM_BASE_GAS, noise:float=SIM_NOISE, seed:int=1):
+    """"leak+spike" → f(t) = ADC 0..1023 ở giây t kể từ boot."""
+    parts = [PROFILES[p.strip()] for p in spec.split("+") if p.strip()]
+    rnd = random.Random(seed)
+    def f(t:float) -> int:
+        v = base + sum(p(t, rnd) for p in parts) + (rnd.gauss(0.0, noise) if noise else 0.0)
+        return max(0, min(1023, int(round(v))))
+    return f
+
+
+class Firmware:
+    """State machine of iot.ino: handle_command() / send_status() return the bytes the board would write."""
+
+    def __init__(self, gas=None, distance=None, temperature:float=27.5, humidity:float=61.0, dht_fail:float=0.0,
+                 seed:int=1, acquisition:str="sched"):
+        self.gas = gas or gas_profile(seed=seed)
+        self.distance = distance or (lambda t: 120)          # > 50 cm: cửa không mở theo siêu âm
+        self.temperature = temperature; self.humidity = humidity; self.dht_fail = dht_fail
+        self.rnd = random.Random(seed + 1)
+        self.thr_lo = 380; self.thr_hi = 450; self.auto = True
+        self.led = 0; self.fan = 0; self.servo = 0; self.alarm = 0
+        self.period = 1.0; self.last_status = -math.inf; self.seq = 0; self.proto_bin = False
+        self.fixed_period = None      # != None: chu kỳ cố định, STREAM không đổi được
+        self.t0 = time.monotonic()
+        if acquisition not in ACQUISITION: raise ValueError(f"acquisition must be one of {ACQUISITION}")
+        self.acquisition = acquisition
+        self.busy = 0.0               # giây MCU bận đọc cảm biến, BoardSim "ngủ" trước khi ghi / đọc lệnh tiếp
+        self._dht_at = -math.inf
+
+    def _read(self, now:float):
+        t = now - self.t0
+        fail = self.dht_fail and self.rnd.random() < self.dht_fail
+        temp = None if fail else round(self.temperature + self.rnd.gauss(0.0, 0.1), 2)
+        humi = None if fail else round(self.humidity + self.rnd.gauss(0.0, 0.3), 2)
+        dist = int(self.distance(t))
+        if self.acquisition == "blocking":
+            echo = dist * 58e-6
+            self.busy += echo if 0 < echo < SIM_ECHO_TIMEOUT_S else SIM_ECHO_TIMEOUT_S
+            if now - self._dht_at >= SIM_DHT_PERIOD_S: self._dht_at = now; self.busy += SIM_DHT_READ_S
+        return self.gas(t), dist, temp, humi
+
+    def dht_due(self, now:float) -> bool:
+        return self.acquisition == "sched" and now - self._dht_at >= SIM_DHT_PERIOD_S
+
+    def tasks(self, now:float, pending:bool=False):
+        """gasTask/usTask/dhtTask của loop(): chỉ dhtTask chặn (busy), và bị hoãn khi có lệnh đang chờ.
+
+        Chỉ mô phỏng thời gian: giá trị nhiệt độ / độ ẩm vẫn sinh mỗi status như trước.
+        """
+        if not pending and self.dht_due(now): self._dht_at = now; self.busy += SIM_DHT_READ_S
+
+    def current_period(self) -> float:
+        return self.period if self.fixed_period is None else self.fixed_period
+
+    def send_status(self, now:float, force:bool=False) -> bytes:
+        if not force and now - self.last_status < self.current_period(): return b""
+        self.last_status = now
+        gas, dist, temp, humi = self._read(now)
+        over_hi = gas >= self.thr_hi; below_lo = gas <= self.thr_lo
+        if self.auto:
+            self.alarm = 1 if over_hi else 0
+            if over_hi: self.fan = 1; self.led = 1; self.servo = 90
+            elif below_lo: self.fan = 0; self.led = 0; self.servo = 0
+            else: self.fan = 1; self.led = 1
+            if not over_hi and dist > 0: self.servo = 90 if dist <= 50 else 0
+        self.seq = (self.seq + 1) & 0xFFFF
+        s = StatusSample(self.seq, gas, dist, temp, humi, self.thr_lo, self.thr_hi,
+                         "AUTO" if self.auto else "MANUAL", self.led, self.fan, self.servo, self.alarm)
+        if self.proto_bin: return encode_bin_frame(s)
+        f = lambda v: "null" if v is None else f"{v:.2f}"          # Serial.print(float): 2 chữ số
+        return (f'{{"gas":{gas},"distance":{dist},"temperature":{f(temp)},"humidity":{f(humi)},'
+                f'"threshold_low":{self.thr_lo},"threshold_high":{self.thr_hi},"mode":"{s.mode}",'
+                f'"led":{self.led},"fan":{self.fan},"servo":{self.servo},"alarm":{self.alarm},"seq":{self.seq}}}\r\n'
+                ).encode()
+
+    def handle_command(self, cmd:str, now:float) -> bytes:
+        cmd = cmd.strip().upper()
+        arg = None
+        if " " in cmd:
+            try: arg = int(cmd.split(" ", 1)[1].strip().split()[0] or 0)
+            except (ValueError, IndexError): arg = 0             # String.toInt(): rác → 0
+        if cmd == "STATUS": return self.send_status(now, True)
+        if cmd.startswith("STREAM"):
+            if arg is not None:
+                v = max(0, min(100, arg)); self.period = 1.0 / v if v > 0 else 1.0
+            return self.send_status(now, True)
+        if cmd.startswith("PROTO"):
+            if cmd.endswith("BIN"): self.proto_bin = True
+            elif cmd.endswith("JSON"): self.proto_bin = False
+            return self.send_status(now, True)
+        if cmd.startswith("AUTO"):
+            if arg is None: return b""
+            self.auto = arg > 0; return self.send_status(now, True)
+        for verb, attr in (("LED", "led"), ("FAN", "fan"), ("SERVO", "servo")):
+            if cmd.startswith(verb):
+                if self.auto or arg is None: return b""
+                setattr(self, attr, max(0, min(180, arg)) if verb == "SERVO" else (0 if arg <= 0 else 1))
+                return self.send_status(now, True)
+        if cmd.startswith("THRHI"):
+            if arg is not None: self.thr_hi = max(0, min(1023, arg))
+            return b""
+        if cmd.startswith("THRLO"):
+            if arg is not None: self.thr_lo = max(0, min(1023, arg))
+            return b""
+        return b""                                               # ALARM / không rõ: firmware bỏ qua
+
+
+class BoardSim:
+    """Firmware on a pty pair, served by one thread.
+
+    `rate` > 0 fixes the status period (inf = line rate); `baud` paces writes
+    like the UART (0 = unpaced); `garbage` is the fraction of frames replaced by
+    a corrupted variant. `on_emit(seq, t)` is called with perf_counter() right
+    before each status is written (bench latency).
+    """
+
+    def __init__(self, profile:str="steady", rate:float=0.0, proto:str="json", baud:int=115200,
+                 garbage:float=0.0, seed:int=1, dht_fail:float=0.0, on_emit=None, acquisition:str="sched", **fw_kw):
+        self.fw = Firmware(gas_profile(profile, seed=seed), dht_fail=dht_fail, seed=seed, acquisition=acquisition,
+                           **fw_kw)
+        self.fw.proto_bin = proto.lower() == "bin"
+        if rate > 0: self.fw.fixed_period = 0.0 if rate == math.inf else 1.0 / rate
+        self.rate = rate; self.baud = baud; self.garbage = garbage; self.on_emit = on_emit
+        self.rnd = random.Random(seed + 2)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)            # không echo / không đổi CRLF trước khi host mở cổng
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.frames = 0; self.bytes = 0; self.commands = 0; self.overflows = 0; self.stalled = 0.0
+        self.injected = {k: 0 for k in GARBAGE_KINDS}
+        self._run = False; self._thread = None; self._line_free = 0.0; self._wake_r, self._wake_w = os.pipe()
+
+    def start(self):
+        self._run = True
+        self._thread = threading.Thread(target=self._loop, name="board-sim", daemon=True); self._thread.start()
+        return self
+
+    def stop(self):
+        self._run = False
+        try: os.write(self._wake_w, b"\0")
+        except OSError: pass
+        if self._thread: self._thread.join(1.0); self._thread = None
+        for fd in (self.master, self.slave, self._wake_r, self._wake_w):
+            try: os.close(fd)
+            except OSError: pass
+
+    def _stall(self):
+        """MCU bận đọc cảm biến: không đọc lệnh, không ghi gì trong lúc đó."""
+        s, self.fw.busy = self.fw.busy, 0.0
+        if s > 0: self.stalled += s; time.sleep(s)
+
+    def _write(self, data:bytes, seq=None):
+        self._stall()
+        if not data: return
+        if self.baud:
+            # UART: 10 bit/byte; chờ tới khi đường truyền rảnh
+            now = time.monotonic(); start = max(now, self._line_free)
+            self._line_free = start + len(data) * 10.0 / self.baud
+            if start > now: time.sleep(start - now)
+        if seq is not None and self.on_emit: self.on_emit(seq, time.perf_counter())
+        while True:
+            try:
+                self.bytes += os.write(self.master, data)
+                if self.baud and self.fw.acquisition == "blocking":      # Serial.flush(): chờ truyền xong
+                    time.sleep(max(0.0, self._line_free - time.monotonic()))
+                return
+            except BlockingIOError:
+                # baud=0: chạy theo tốc độ host đọc; có pacing UART: không ai đọc → mất như UART thật
+                if self.baud or not self._run: self.overflows += 1; return
+                select.select([], [self.master], [], 0.1)
+
+    def _corrupt(self, frame:bytes) -> bytes:
+        kind = self.rnd.choice(GARBAGE_KINDS); self.injected[kind] += 1
+        if kind == "noise": return bytes(self.rnd.randrange(256) for _ in range(self.rnd.randint(1, 32))) + frame
+        if kind == "truncate": return frame[:self.rnd.randint(1, len(frame) - 1)]
+        if kind == "flip":
+            b = bytearray(frame); i = self.rnd.randrange(1, len(b) - 2); b[i] ^= 1 << self.rnd.randrange(8)
+            return bytes(b)
+        return b"DHT read failed\r\n" + frame
+
+    def _status(self, now:float, force:bool=False):
+        frame = self.fw.send_status(now, force)
+        if not frame: return
+        if self.garbage and self.rnd.random() < self.garbage: frame = self._corrupt(frame)
+        self._write(frame, self.fw.seq); self.frames += 1
+
+    def _loop(self):
+        buf = b""
+        while self._run:
+            now = time.monotonic()
+            timeout = max(0.0, self.fw.last_status + self.fw.current_period() - now)
+            try: r, _, _ = select.select([self.master, self._wake_r], [], [], timeout)
+            except (OSError, ValueError): break
+            busy = False
+            if self.master in r:
+                try: data = os.read(self.master, 4096)
+                except BlockingIOError: data = b""
+                except OSError: break
+                buf += data; busy = bool(data)
+                *lines, buf = buf.replace(b"\r", b"\n").split(b"\n")
+                for line in lines:
+                    line = bytes(c for c in line if c >= 32).decode("ascii", "replace")
+                    if not line: continue
+                    self.commands += 1
+                    out = self.fw.handle_command(line, time.monotonic())
+                    if out: self._write(out, self.fw.seq); self.frames += 1
+            if not self._run: break
+            now = time.monotonic()
+            if self.fw.dht_due(now):
+                try: pending = bool(select.select([self.master], [], [], 0)[0])      # Serial.available()
+                except (OSError, ValueError): break
+                self.fw.tasks(now, pending); self._stall()
+            # loop() của firmware: có byte đến thì bỏ qua sendStatus(false) vòng này
+            if not busy: self._status(time.monotonic())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="iot.ino simulator on a pty")
+    ap.add_argument("--profile", default="steady", help="+ joined: " + ", ".join(PROFILES))
+    ap.add_argument("--rate", default="0", help='status Hz (0 = firmware: 1 Hz / STREAM), "line" = max for --baud')
+    ap.add_argument("--proto", choices=("json", "bin"), default="json")
+    ap.add_argument("--baud", type=int, default=115200, help="UART pacing, 0 = none")
+    ap.add_argument("--garbage", type=float, default=0.0, help="fraction of frames corrupted")
+    ap.add_argument("--dht-fail", type=float, default=0.0, help="fraction of DHT reads returning NaN")
+    ap.add_argument("--acquisition", choices=ACQUISITION, default="sched", help="sensor read timing model")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--link", help="create this symlink to the pty slave")
+    ap.add_argument("--seconds", type=float, default=0.0, help="stop after this long (0 = until Ctrl+C)")
+    a = ap.parse_args(argv)
+    rate = math.inf if a.rate == "line" else float(a.rate)
+    sim = BoardSim(a.profile, rate, a.proto, a.baud, a.garbage, a.seed, a.dht_fail, acquisition=a.acquisition).start()
+    port = sim.port
+    if a.link:
+        if os.path.islink(a.link): os.unlink(a.link)
+        os.symlink(sim.port, a.link); port = a.link
+    print(port, flush=True)
+    try:
+        t_end = time.monotonic() + a.seconds if a.seconds else math.inf
+        while time.monotonic() < t_end: time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+        if a.link and os.path.islink(a.link): os.unlink(a.link)
+        print(f"{sim.frames} frames, {sim.bytes} bytes, {sim.commands} commands, injected {sim.injected}, "
+              f"sensor stall {sim.stalled:.2f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+# ---------- Telemetry log: append-only, phân đoạn, nén, đọc lại bằng mmap ----------
+"""Persistent log of every status frame and every command sent.
+
+Records are fixed 32-byte structs. The active segment (``seg-<ms>.log``) is
+plain records appended by a writer thread (buffered, fsync batched). When it
+rotates it is rewritten as ``seg-<ms>.logz``: zlib blocks of BLOCK_RECORDS
+records, each with a small header (time range, sizes). Readers mmap both
+kinds; for .logz only the block headers are walked on open and a block is
+inflated only when a query touches it.
+
+    python telemetry.py export --dir ~/.local/share/iot-dashboard/telemetry --from 2024-05-01 --csv out.csv
+    python telemetry.py export --dir ~/.local/share/iot-dashboard/telemetry --columns out_dir
+    python telemetry.py stats --dir ~/.local/share/iot-dashboard/telemetry
+
+The default directory is per user (see data_dir); IOT_LOG_DIR overrides it,
+"" turns logging off. One writer per directory: start() takes an exclusive
+lock (fcntl.flock on .writer.lock), so a second instance cannot recompress
+the live segment of the first one. Old .logz segments are pruned beyond
+IOT_LOG_RETENTION_DAYS or IOT_LOG_MAX_MB in total.
+"""
+import argparse, atexit, csv, json, math, mmap, os, struct, sys, threading, time, zlib
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:               # Windows: không khoá, một instance mỗi thư mục là trách nhiệm người dùng
+    fcntl = None
+
+
+def data_dir(app:str="iot-dashboard") -> str:
+    """Thư mục dữ liệu theo user: $XDG_DATA_HOME / ~/.local/share, %LOCALAPPDATA%, ~/Library/Application Support."""
+    if sys.platform == "win32":
+        base = os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Application Support")
+    else:
+        base = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, app)
+
+
+LOG_DIR = os.getenv("IOT_LOG_DIR", os.path.join(data_dir(), "telemetry"))
+LOG_RETENTION_DAYS = float(os.getenv("IOT_LOG_RETENTION_DAYS", "30"))   # .logz cũ hơn bị xoá (0 = không giới hạn)
+LOG_MAX_BYTES = int(float(os.getenv("IOT_LOG_MAX_MB", "1024")) * (1 << 20))   # tổng .logz tối đa (0 = không giới hạn)
+LOCK_NAME = ".writer.lock"
+SEGMENT_BYTES = 4 << 20          # xoay segment khi đạt 4 MB (131072 record)...
+SEGMENT_SECONDS = 3600           # ...hoặc sau 1 giờ
+FLUSH_S = 0.5                    # write() buffer xuống file
+FSYNC_S = 5.0                    # fsync theo lô
+BLOCK_RECORDS = 2048             # record / block nén trong .logz
+PROGRESS_RECORDS = 8192          # export_csv: gọi on_progress sau mỗi ngần này record
+
+KIND_STATUS, KIND_COMMAND = 1, 2
+# t | kind | seq | gas | dist | temp | humi | thrLo | thrHi | led fan servo alarm
+STATUS_REC = struct.Struct("<dBxHHhffHHBBBB")
+COMMAND_REC = struct.Struct("<dB23s")
+REC_SIZE = STATUS_REC.size
+assert COMMAND_REC.size == REC_SIZE == 32
+BLOCK_HDR = struct.Struct("<4sIIddI")        # magic, raw_len, comp_len, t_first, t_last, n
+BLOCK_MAGIC = b"BLK1"
+STATUS_COLUMNS = ("t", "seq", "gas", "distance", "temperature", "humidity",
+                  "threshold_low", "threshold_high", "led", "fan", "servo", "alarm")
+_COL_TYPES = ("f8", "u2", "u2", "i2", "f4", "f4", "u2", "u2", "u1", "u1", "u1", "u1")
+_NAN = float("nan")
+
+
+def _i(v, default=0):
+    try: return int(v) if v is not None else default
+    except (TypeError, ValueError): return default
+
+
+def _f(v):
+    try: return float(v) if v is not None else _NAN
+    except (TypeError, ValueError): return _NAN
+
+
+def pack_status(st:dict, t:float) -> bytes:
+    return STATUS_REC.pack(t, KIND_STATUS, _i(st.get("seq")) & 0xFFFF, _i(st.get("gas")) & 0xFFFF,
+                           max(-32768, min(32767, _i(st.get("distance"), -1))),
+                           _f(st.get("temperature")), _f(st.get("humidity")),
+                           _i(st.get("threshold_low")) & 0xFFFF, _i(st.get("threshold_high")) & 0xFFFF,
+                           _i(st.get("led")) & 0xFF, _i(st.get("fan")) & 0xFF,
+                           _i(st.get("servo")) & 0xFF, _i(st.get("alarm")) & 0xFF)
+
+
+def pack_command(cmd:str, t:float) -> bytes:
+    return COMMAND_REC.pack(t, KIND_COMMAND, cmd.encode("utf-8", "replace")[:23])
+
+
+def unpack(buf, off:int=0):
+    """-> (kind, t, dict) for one record."""
+    kind = buf[off + 8]
+    if kind == KIND_COMMAND:
+        t, _, raw = COMMAND_REC.unpack_from(buf, off)
+        return kind, t, {"t": t, "cmd": raw.rstrip(b"\0").decode("utf-8", "replace")}
+    row = STATUS_REC.unpack_from(buf, off)
+    d = dict(zip(STATUS_COLUMNS, row[:1] + row[2:]))
+    for k in ("temperature", "humidity"):
+        if math.isnan(d[k]): d[k] = None
+    return kind, row[0], d
+
+
+# ---------- Writer ----------
+class LogLocked(OSError):
+    """Another TelemetryLog is already writing to this directory."""
+
+
+class TelemetryLog:
+    """Non-blocking appender: append_*() only packs into a buffer; a thread does the I/O."""
+
+    def __init__(self, directory:str=LOG_DIR, segment_bytes:int=SEGMENT_BYTES,
+                 segment_seconds:float=SEGMENT_SECONDS, flush_s:float=FLUSH_S, fsync_s:float=FSYNC_S,
+                 retention_days:float=LOG_RETENTION_DAYS, max_bytes:int=LOG_MAX_BYTES):
+        self.dir = directory; self.retention_days = retention_days; self.max_bytes = max_bytes
+        self._lockf = None; self.pruned = 0
+        # bội số của REC_SIZE: segment chỉ chứa record nguyên vẹn và luôn đầy đúng tới hạn mức
+        self.segment_bytes = max(REC_SIZE, segment_bytes - segment_bytes % REC_SIZE); self.segment_seconds = segment_seconds
+        self.flush_s = flush_s; self.fsync_s = fsync_s
+        self._buf = bytearray(); self._lock = threading.Lock()
+        self._wake = threading.Event(); self._run = False; self._thread = None
+        self._f = None; self._path = None; self._opened = 0.0; self._size = 0
+        self.records = 0; self.bytes_written = 0; self.fsyncs = 0; self.segments = 0
+
+    # API (gọi từ GUI / ingest thread); chưa start() (hoặc đã close) thì bỏ qua, không tích buffer
+    def append_status(self, st:dict, t:float|None=None):
+        if not self._run: return
+        rec = pack_status(st, time.time() if t is None else t)
+        with self._lock: self._buf += rec
+    def append_command(self, cmd:str, t:float|None=None):
+        if not self._run: return
+        rec = pack_command(cmd, time.time() if t is None else t)
+        with self._lock: self._buf += rec
+
+    def start(self):
+        """Khoá thư mục (LogLocked nếu đã có writer khác), nén segment sót lại, dọn segment cũ, chạy thread."""
+        if self._thread: return self
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock_dir()
+        self._recover(); self.prune()
+        self._run = True
+        self._thread = threading.Thread(target=self._loop, name="telemetry-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)      # thoát bình thường: không mất phần buffer cuối
+        return self
+    def close(self):
+        self._run = False; self._wake.set()
+        if self._thread: self._thread.join(5); self._thread = None
+        if self._lockf: self._lockf.close(); self._lockf = None     # đóng fd = nhả flock
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+    def flush(self):
+        """Ghi đồng bộ phần buffer còn lại (dùng khi không chạy thread, vd. bench)."""
+        self._write_pending(); self._fsync()
+
+    # thread
+    def _loop(self):
+        last_sync = time.monotonic()
+        try:
+            while self._run:
+                self._wake.wait(self.flush_s); self._wake.clear()
+                self._write_pending()
+                if time.monotonic() - last_sync >= self.fsync_s:
+                    self._fsync(); last_sync = time.monotonic()
+        finally:
+            self._write_pending(); self._fsync()
+            if self._f: self._f.close(); self._f = None
+
+    def _write_pending(self):
+        with self._lock:
+            if not self._buf: return
+            data = bytes(self._buf); del self._buf[:]
+        pos = 0
+        while pos < len(data):
+            if self._f is None or self._size + REC_SIZE > self.segment_bytes or \
+               time.time() - self._opened >= self.segment_seconds:
+                self._rotate()
+            n = min(len(data) - pos, self.segment_bytes - self._size)
+            n -= n % REC_SIZE
+            self._f.write(data[pos:pos + n])
+            pos += n; self._size += n; self.bytes_written += n; self.records += n // REC_SIZE
+
+    def _fsync(self):
+        if self._f is None: return
+        self._f.flush(); os.fsync(self._f.fileno()); self.fsyncs += 1
+
+    def _rotate(self):
+        old = self._path
+        if self._f is not None:
+            self._fsync(); self._f.close()
+        self._opened = time.time()
+        self._path = os.path.join(self.dir, f"seg-{int(self._opened * 1000):013d}.log")
+        while os.path.exists(self._path) or os.path.exists(self._path + "z"):
+            self._opened += 0.001
+            self._path = os.path.join(self.dir, f"seg-{int(self._opened * 1000):013d}.log")
+        self._f = open(self._path, "ab", buffering=0); self._size = 0; self.segments += 1
+        if old: compress_segment(old); self.prune()
+
+    def _lock_dir(self):
+        if fcntl is None: return
+        f = open(os.path.join(self.dir, LOCK_NAME), "a+")
+        try: fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close(); raise LogLocked(f"telemetry log {self.dir} is in use by another process") from None
+        f.seek(0); f.truncate(); f.write(f"{os.getpid()}\n"); f.flush()
+        self._lockf = f
+
+    def _recover(self):
+        """Nén các .log còn sót từ lần chạy trước (crash) — bỏ record cuối bị cắt dở.
+
+        Chỉ gọi khi đang giữ khoá thư mục: không writer nào khác còn ghi vào các .log này.
+        """
+        for name in sorted(os.listdir(self.dir)):
+            if name.startswith("seg-") and name.endswith(".log"):
+                compress_segment(os.path.join(self.dir, name))
+
+    def prune(self):
+        """Xoá .logz cũ nhất khi quá retention_days hoặc tổng quá max_bytes (segment đang ghi không bị đụng)."""
+        segs = []
+        for name in sorted(os.listdir(self.dir)):
+            if not (name.startswith("seg-") and name.endswith(".logz")): continue
+            p = os.path.join(self.dir, name)
+            try: segs.append((p, int(name[4:-5]) / 1000.0, os.path.getsize(p)))
+            except (ValueError, OSError): pass
+        total = sum(n for _, _, n in segs)
+        cutoff = time.time() - self.retention_days * 86400 if self.retention_days > 0 else -math.inf
+        for p, t, n in segs:           # tên = thời điểm mở segment: cũ nhất trước
+            if t >= cutoff and (self.max_bytes <= 0 or total <= self.max_bytes): break
+            try: os.remove(p)
+            except OSError: continue
+            total -= n; self.pruned += 1
+
+
+def compress_segment(path:str, block_records:int=BLOCK_RECORDS) -> str:
+    """Rewrite a raw .log segment as block-compressed .logz (atomic rename), return the new path."""
+    out = path + "z"; tmp = out + ".tmp"
+    with open(path, "rb") as f: raw = f.read()
+    raw = raw[:len(raw) - len(raw) % REC_SIZE]
+    with open(tmp, "wb") as f:
+        step = block_records * REC_SIZE
+        for i in range(0, len(raw), step):
+            blk = raw[i:i + step]; z = zlib.compress(blk, 6)
+            t0 = struct.unpack_from("<d", blk, 0)[0]; t1 = struct.unpack_from("<d", blk, len(blk) - REC_SIZE)[0]
+            f.write(BLOCK_HDR.pack(BLOCK_MAGIC, len(blk), len(z), t0, t1, len(blk) // REC_SIZE)); f.write(z)
+        f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, out); os.remove(path)
+    return out
+
+
+# ---------- Reader (mmap) ----------
+class _Segment:
+    def __init__(self, path:str):
+        self.path = path; self._f = open(path, "rb")
+        size = os.fstat(self._f.fileno()).st_size
+        self.mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.compressed = path.endswith(".logz")
+        self.blocks = []          # (t_first, t_last, offset, comp_len, n)
+        if self.compressed:
+            off = 0
+            while off + BLOCK_HDR.size <= size:
+                magic, raw_len, comp_len, t0, t1, n = BLOCK_HDR.unpack_from(self.mm, off)
+                if magic != BLOCK_MAGIC: break
+                self.blocks.append((t0, t1, off + BLOCK_HDR.size, comp_len, n))
+                off += BLOCK_HDR.size + comp_len
+            self.n = sum(b[4] for b in self.blocks)
+            self.t_first = self.blocks[0][0] if self.blocks else None
+            self.t_last = self.blocks[-1][1] if self.blocks else None
+        else:
+            self.n = size // REC_SIZE
+            self.t_first = self._t(0) if self.n else None
+            self.t_last = self._t(self.n - 1) if self.n else None
+
+    def _t(self, i): return struct.unpack_from("<d", self.mm, i * REC_SIZE)[0]
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap): self.mm.close()
+        self._f.close()
+
+    def chunks(self, t0:float, t1:float):
+        """Yield (buffer, first_index, end_index) of record ranges overlapping [t0, t1]."""
+        if not self.compressed:
+            lo, hi = 0, self.n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._t(mid) < t0: lo = mid + 1
+                else: hi = mid
+            hi_ = lo
+            while hi_ < self.n and self._t(hi_) <= t1: hi_ += 1
+            if hi_ > lo: yield self.mm, lo, hi_
+            return
+        for bt0, bt1, off, clen, n in self.blocks:
+            if bt1 < t0 or bt0 > t1: continue
+            yield zlib.decompress(self.mm[off:off + clen]), 0, n
+
+
+class LogReader:
+    """Opens every segment in `directory` via mmap; only headers are read up front."""
+
+    def __init__(self, directory:str=LOG_DIR):
+        self.dir = directory
+        names = sorted(n for n in os.listdir(directory)
+                       if n.startswith("seg-") and (n.endswith(".log") or n.endswith(".logz"))) \
+            if os.path.isdir(directory) else []
+        self.segments = [_Segment(os.path.join(directory, n)) for n in names]
+        self.segments = [s for s in self.segments if s.n]
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+    def close(self):
+        for s in self.segments: s.close()
+
+    def span(self):
+        if not self.segments: return None, None
+        return self.segments[0].t_first, self.segments[-1].t_last
+
+    def records(self, t0:float=-math.inf, t1:float=math.inf, kinds=(KIND_STATUS, KIND_COMMAND)):
+        """Iterate (kind, t, dict) in time order within [t0, t1]."""
+        for seg in self.segments:
+            if seg.t_last < t0 or seg.t_first > t1: continue
+            for buf, i, j in seg.chunks(t0, t1):
+                for k in range(i, j):
+                    off = k * REC_SIZE
+                    if buf[off + 8] not in kinds: continue
+                    kind, t, d = unpack(buf, off)
+                    if t0 <= t <= t1: yield kind, t, d
+
+    def status_columns(self, t0:float=-math.inf, t1:float=math.inf) -> dict:
+        """Status records as {column: array} (numpy if installed, else array.array)."""
+        from array import array
+        cols = {c: array("d") for c in STATUS_COLUMNS}
+        for _, _, d in self.records(t0, t1, (KIND_STATUS,)):
+            for c in STATUS_COLUMNS:
+                v = d[c]; cols[c].append(_NAN if v is None else v)
+        try:
+            import numpy as np
+            return {c: np.frombuffer(a, dtype=np.float64) for c, a in cols.items()}
+        except ImportError:
+            return cols
+
+    def export_csv(self, path:str, t0:float=-math.inf, t1:float=math.inf, on_progress=None) -> int:
+        """on_progress(done, total): mỗi PROGRESS_RECORDS record (total = record của các segment trong khoảng)."""
+        n = 0
+        total = sum(s.n for s in self.segments if not (s.t_last < t0 or s.t_first > t1))
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f); w.writerow(("time", "kind") + STATUS_COLUMNS[1:] + ("cmd",))
+            for kind, t, d in self.records(t0, t1):
+                ts = datetime.fromtimestamp(t).isoformat(timespec="milliseconds")
+                if kind == KIND_STATUS:
+                    w.writerow((ts, "status") + tuple("" if d[c] is None else d[c] for c in STATUS_COLUMNS[1:]) + ("",))
+                else:
+                    w.writerow((ts, "command") + ("",) * (len(STATUS_COLUMNS) - 1) + (d["cmd"],))
+                n += 1
+                if on_progress and not n % PROGRESS_RECORDS: on_progress(n, total)
+        if on_progress: on_progress(total, total)
+        return n
+
+    def export_columns(self, out_dir:str, t0:float=-math.inf, t1:float=math.inf) -> int:
+        """Columnar export: one little-endian binary file per column + schema.json."""
+        os.makedirs(out_dir, exist_ok=True)
+        files = {c: open(os.path.join(out_dir, f"{c}.{ty}"), "wb") for c, ty in zip(STATUS_COLUMNS, _COL_TYPES)}
+        packers = {c: struct.Struct("<" + {"f8": "d", "f4": "f", "u2": "H", "i2": "h", "u1": "B"}[ty])
+                   for c, ty in zip(STATUS_COLUMNS, _COL_TYPES)}
+        n = 0
+        try:
+            for _, _, d in self.records(t0, t1, (KIND_STATUS,)):
+                for c in STATUS_COLUMNS:
+                    v = d[c]; files[c].write(packers[c].pack(_NAN if v is None else v))
+                n += 1
+        finally:
+            for f in files.values(): f.close()
+        with open(os.path.join(out_dir, "schema.json"), "w", encoding="utf-8") as f:
+            json.dump({"rows": n, "columns": [{"name": c, "dtype": "<" + ty, "file": f"{c}.{ty}"}
+                                              for c, ty in zip(STATUS_COLUMNS, _COL_TYPES)]}, f, indent=2)
+        return n
+
+
+def _parse_time(s:str|None, default:float) -> float:
+    if not s: return default
+    try: return float(s)
+    except ValueError: return datetime.fromisoformat(s).timestamp()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="IoT telemetry log tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="export a time range to CSV and/or columnar files")
+    st = sub.add_parser("stats", help="segments, records and time span")
+    for p in (ex, st): p.add_argument("--dir", default=LOG_DIR)
+    ex.add_argument("--from", dest="t0", help="ISO time or unix seconds")
+    ex.add_argument("--to", dest="t1", help="ISO time or unix seconds")
+    ex.add_argument("--csv"); ex.add_argument("--columns", help="output directory")
+    a = ap.parse_args(argv)
+    with LogReader(a.dir) as r:
+        if a.cmd == "stats":
+            t0, t1 = r.span()
+            for s in r.segments:
+                print(f"{os.path.basename(s.path):28s} {s.n:9d} records {os.path.getsize(s.path):11d} B")
+            if t0 is not None:
+                print(f"{sum(s.n for s in r.segments)} records, {datetime.fromtimestamp(t0)} → {datetime.fromtimestamp(t1)}")
+            return 0
+        t0, t1 = _parse_time(a.t0, -math.inf), _parse_time(a.t1, math.inf)
+        if not (a.csv or a.columns): ap.error("export needs --csv and/or --columns")
+        if a.csv: print(f"{r.export_csv(a.csv, t0, t1)} records → {a.csv}")
+        if a.columns: print(f"{r.export_columns(a.columns, t0, t1)} status rows → {a.columns}/")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# Các module nằm phẳng ở gốc repo (chạy bằng `python Iot.py`): cho pytest import được từ tests/.
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, "tests", "data")
+if ROOT not in sys.path: sys.path.insert(0, ROOT)
+os.environ.setdefault("IOT_LOG_DIR", "")        # không module nào được ghi vào thư mục log của user khi chạy test
@@ -0,0 +1,21 @@
+"""daemon.TelemetryApi payloads: strict JSON (no NaN / Infinity) for every status pushed to clients."""
+import json, math
+from daemon import TelemetryApi, _dumps
+from framing import StatusSample
+
+
+def test_dumps_turns_non_finite_into_null():
+    assert json.loads(_dumps({"a": math.nan, "b": [math.inf, 1.0], "c": {"d": -math.inf}, "e": 2})) == \
+        {"a": None, "b": [None, 1.0], "c": {"d": None}, "e": 2}
+    assert _dumps({"gas": 300}) == b'{"gas":300}'
+
+
+def test_publish_queues_strict_json():
+    api = TelemetryApi(hub=None)                       # chưa start(): publish chỉ xếp hàng
+    st = StatusSample.from_dict({"gas": 300, "seq": 1})
+    st.gas_f = math.nan; st.gas_rate = math.inf; st.gas_pred = 301.5; st.warmup = 1
+    api.publish("/dev/ttyUSB0", st, t=12.0)
+    dev, payload = api._pending[0]
+    assert b"NaN" not in payload and b"Infinity" not in payload
+    msg = json.loads(payload)
+    assert dev == "/dev/ttyUSB0" and msg["gas_f"] is None and msg["gas_rate"] is None and msg["gas_pred"] == 301.5
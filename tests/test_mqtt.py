@@ -0,0 +1,116 @@
+"""MqttBridge against mqtt.MiniBroker on localhost: QoS 1, DUP resend, offline queue, commands."""
+import json, socket, time
+import pytest
+from mqtt import MiniBroker, MqttBridge, PUBLISH, parse_publish
+
+
+def wait(cond, timeout:float=5.0) -> bool:
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        if cond(): return True
+        time.sleep(0.005)
+    return False
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+
+class Recorder(MiniBroker):
+    """Ghi lại mọi PUBLISH (topic, payload, qos, dup); `hold` = topic nhận nhưng không PUBACK."""
+    def __init__(self, port:int=0, hold=()):
+        super().__init__(port=port); self.log = []; self.hold = set(hold)
+
+    def _packet(self, s, kind, flags, body):
+        if kind == PUBLISH:
+            topic, payload, qos, pid, _ = parse_publish(flags, body)
+            self.log.append((topic, payload, qos, bool(flags & 0x08)))
+            if topic in self.hold: return
+        super()._packet(s, kind, flags, body)
+
+    def got(self, topic:str) -> list:
+        return [p for t, p, q, d in self.log if t == topic]
+
+
+@pytest.fixture
+def started():
+    objs = []
+    def add(o):
+        objs.append(o); return o.start()
+    yield add
+    for o in reversed(objs): o.stop(0) if isinstance(o, MqttBridge) else o.stop()
+
+
+def bridge(port, **kw):
+    kw.setdefault("subscribe", []); kw.setdefault("linger_s", 0.0); kw.setdefault("reconnect", (0.05, 0.2))
+    return MqttBridge("127.0.0.1", port, prefix="t", **kw)
+
+
+def test_qos1_delivery_and_puback(started):
+    br = started(Recorder()); b = started(bridge(br.port))
+    assert wait(lambda: b.connected)
+    for i in range(20): b.publish("t/dev/status", f"{i}".encode(), 1)
+    assert wait(lambda: b.acked == 20)
+    assert br.got("t/dev/status") == [f"{i}".encode() for i in range(20)]
+    assert all(q == 1 and not d for t, p, q, d in br.log)
+    assert b.depth == 0 and b.stats()["inflight"] == 0
+
+
+def test_unacked_qos1_resent_with_dup_after_broker_drop(started):
+    port = free_port()
+    br = Recorder(port, hold={"t/dev/tx"}).start(); b = started(bridge(port))
+    assert wait(lambda: b.connected)
+    b.publish_command("dev", "FAN 1")
+    assert wait(lambda: br.got("t/dev/tx") == [b"FAN 1"])
+    assert b.stats()["inflight"] == 1                          # broker nhận nhưng chưa PUBACK
+    br.stop(); assert wait(lambda: not b.connected)
+    br2 = started(Recorder(port))
+    assert wait(lambda: b.acked == 1 and b.stats()["inflight"] == 0)
+    (topic, payload, qos, dup), = [r for r in br2.log if r[0] == "t/dev/tx"]
+    assert (payload, qos, dup) == (b"FAN 1", 1, True)
+    assert b.connects == 2
+
+
+def test_offline_queue_flushed_in_order_after_reconnect(started):
+    port = free_port()
+    br = MiniBroker(port=port).start(); b = started(bridge(port))
+    assert wait(lambda: b.connected)
+    br.stop(); assert wait(lambda: not b.connected)
+    for i in range(100): assert b.publish("t/dev/status", f"{i}".encode(), i % 2)
+    assert b.stats()["queued"] == 100 and b.dropped == 0
+    br2 = started(Recorder(port))
+    assert wait(lambda: len(br2.got("t/dev/status")) == 100)
+    assert br2.got("t/dev/status") == [f"{i}".encode() for i in range(100)]
+
+
+def test_bounded_queue_drops_oldest(started):
+    port = free_port()                                         # chưa có broker: mọi message nằm trong queue
+    b = started(bridge(port, queue=5))
+    accepted = [b.publish("t/dev/status", f"{i}".encode(), 1) for i in range(8)]
+    assert accepted == [True] * 5 + [False] * 3
+    assert b.dropped == 3 and b.stats()["queued"] == 5
+    br = started(Recorder(port))
+    assert wait(lambda: len(br.got("t/dev/status")) == 5)
+    assert br.got("t/dev/status") == [b"3", b"4", b"5", b"6", b"7"]
+
+
+def test_subscribed_command_reaches_on_command(started):
+    cmds = []
+    br = started(MiniBroker())
+    b = started(bridge(br.port, subscribe=None, on_command=lambda dev, line: cmds.append((dev, line))))
+    assert wait(lambda: any(s.subs for s in list(br.sessions.values())))
+    pub = started(bridge(br.port))
+    assert wait(lambda: pub.connected)
+    pub.publish("t/_dev_ttyUSB0/cmd", b"FAN 1\n\nSERVO 90\n", 1)
+    pub.publish("t/other/status", b"{}", 0)                    # không phải cmd: không tới on_command
+    assert wait(lambda: len(cmds) == 2)
+    assert cmds == [("_dev_ttyUSB0", "FAN 1"), ("_dev_ttyUSB0", "SERVO 90")]
+    assert b.received == 1
+
+
+def test_non_finite_values_become_json_null(started):
+    br = started(Recorder()); b = started(bridge(br.port))
+    b.publish("t/dev/status", {"gas": 300, "gas_f": float("nan"), "gas_rate": float("inf"), "x": [1.5, float("-inf")]})
+    assert wait(lambda: br.got("t/dev/status"))
+    assert json.loads(br.got("t/dev/status")[0]) == {"gas": 300, "gas_f": None, "gas_rate": None, "x": [1.5, None]}
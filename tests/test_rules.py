@@ -0,0 +1,46 @@
+"""RulesEngine on a recorded trace: tests/data/rules_trace.jsonl (rules.py trace format).
+
+Frames every 0.5 s; the "cmd" lines are the commands the engine must emit with
+THR LOW 400, hysteresis 20, debounce 1 s, min hold 5 s on raw gas:
+  t+2.5  one 420 sample            → nothing (debounce)
+  t+5.0  410 held                  → ON at t+6.0
+  t+7.0  390 (inside hysteresis)   → stays on
+  t+8.0  350 held                  → OFF at t+11.0 (debounce ok at 9.0, min hold until 11.0)
+  t+12.5 405 held                  → ON at t+16.0 (min hold after the OFF)
+  t+17.0 385 (inside hysteresis)   → stays on
+"""
+import os
+from conftest import DATA
+from rules import RulesEngine, Rule, compare, default_rules, replay, _load_trace
+
+ON = ("FAN 1", "SERVO 90", "LED 1"); OFF = ("FAN 0", "SERVO 0", "LED 0")
+
+
+def engine(**kw):
+    kw = dict(dict(hysteresis=20, debounce_s=1.0, min_hold_s=5.0), **kw)
+    return RulesEngine(r for r in default_rules(400, alarm_cmds=ON, safe_cmds=OFF, **kw) if r.name == "gas_low")
+
+
+def test_trace_replay_matches_expected_commands():
+    samples, expected = _load_trace(os.path.join(DATA, "rules_trace.jsonl"))
+    decided = replay(engine(), samples, thresholds_from_frames=True)
+    assert decided == expected
+    res = compare(decided, expected, tolerance=0.0)
+    assert res["matched"] == len(expected) == 9 and not res["missing"] and not res["unexpected"]
+
+
+def test_each_guard_is_needed():
+    samples, expected = _load_trace(os.path.join(DATA, "rules_trace.jsonl"))
+    on_times = lambda out: sorted({t - 1000 for t, c in out if c == "FAN 1"})
+    assert on_times(replay(engine(debounce_s=0.0), samples)) == [2.5, 13.0]     # spike 420 lọt qua, rồi giữ tới 8.0
+    off_times = lambda out: [t - 1000 for t, c in out if c == "FAN 0"]
+    assert off_times(replay(engine(min_hold_s=0.0), samples)) == [9.0]                  # chỉ debounce
+    assert off_times(replay(engine(min_hold_s=0.0, hysteresis=0.0), samples)) == [8.0, 18.0]  # 390, 385 đã tắt
+
+
+def test_emit_initial_and_reset():
+    e = RulesEngine([Rule("door", "distance", 50, ("SERVO 90",), ("SERVO 0",), above=False, emit_initial=True)])
+    assert e.evaluate({"distance": 120}, 0.0) == ["SERVO 0"]
+    assert e.evaluate({"distance": 30}, 0.1) == ["SERVO 90"] and e.active("door")
+    assert e.evaluate({"distance": None}, 0.2) == [] and e.evaluate({"distance": float("nan")}, 0.3) == []
+    e.reset(); assert e.evaluate({"distance": 30}, 1.0) == ["SERVO 90"]
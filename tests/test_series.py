@@ -0,0 +1,50 @@
+"""series.TimeSeriesStore tiers / envelope and the gap markers the graph relies on."""
+import math
+import pytest
+from series import TimeSeriesStore, HistoryRing, minmax_decimate, runs
+
+
+def store_with_gap():
+    s = TimeSeriesStore()
+    for i in range(200): s.append({"gas": 300 + i % 7}, t=1000 + i * 0.5)
+    s.add_gap(1100.2)                                  # mất kết nối 100 s
+    for i in range(200): s.append({"gas": 400}, t=1200 + i * 0.5)
+    return s
+
+
+def test_gap_is_a_pen_break_at_every_level():
+    s = store_with_gap()
+    for points in (10_000, 500, 20):                   # raw, 1 s, 1 min
+        ys, width = s.envelope("gas", 900, 1400, points)
+        assert len(runs(ys)) == 2, width
+        (i, j), (k, _) = runs(ys)
+        assert max(ys[i:j]) <= 306 and min(ys[k:]) == 400
+
+
+def test_gap_markers_keep_tier_rows_ordered():
+    s = store_with_gap()
+    for tier in s.tiers[:2]:
+        rows = tier.rows; t = list(rows.slice("t", 0, len(rows)))
+        assert t == sorted(t)
+        assert sum(1 for n in rows.slice("gas.n", 0, len(rows)) if n == 0) == 1
+
+
+def test_envelope_merges_consecutive_breaks():
+    s = TimeSeriesStore()
+    s.append({"gas": 1}, t=0.0); s.add_gap(0.5); s.add_gap(0.6); s.append({"gas": 2}, t=1.0)
+    ys, _ = s.envelope("gas", 0, 2, 10_000)
+    assert [v if v == v else None for v in ys] == [1, 1, None, None, 2, 2]
+
+
+def test_live_ring_and_decimation_keep_nan():
+    h = HistoryRing(8)
+    h.extend([1, 2, math.nan, 3, 4, 5, 6, 7])
+    xs, ys = minmax_decimate(h.window(), 2)            # cột có NaN thành NaN
+    assert runs(ys) == [(2, 4)]
+    assert runs(h.window()) == [(0, 2), (3, 8)]
+
+
+def test_query_unknown_level_is_a_value_error():
+    s = store_with_gap()
+    assert s.query("gas", 900, 1400, level=60)["width"] == 60
+    with pytest.raises(ValueError, match="no tier of width 5"): s.query("gas", 900, 1400, level=5)
@@ -0,0 +1,72 @@
+"""Command → ack latency of sim.Firmware, "sched" vs "blocking" acquisition, in virtual time.
+
+Same model as sim.BoardSim without the pty and the sleeps: the board's
+loop() handles a waiting command first, otherwise runs the DHT task (sched)
+or the status due; fw.busy is the time spent in sensor reads before a write,
+the UART sends 10 bits/byte and "blocking" ends every status with
+Serial.flush(). The host is in MANUAL mode and toggles FAN at random gaps,
+like bench/bench_ack.py; the ack is the last byte of the status the command
+triggered.
+"""
+import math, random
+from collections import deque
+import pytest
+from sim import Firmware, SIM_DHT_PERIOD_S, SIM_DHT_READ_S
+
+RATE = 10.0; BAUD = 115200
+
+
+def ack_latencies(acquisition:str, commands:int=400, seed:int=1) -> list:
+    rnd = random.Random(seed)
+    fw = Firmware(seed=seed, acquisition=acquisition); fw.fixed_period = 1.0 / RATE
+    fw.handle_command("AUTO 0", 0.0); fw.busy = 0.0
+    t = 0.0; arrivals = deque()
+    for _ in range(commands): t += rnd.uniform(0.02, 0.2); arrivals.append(t)
+    line_free = 0.0; free = 0.0; fan = 0; lat = []
+
+    def write(data:bytes, t:float):
+        nonlocal line_free
+        t += fw.busy; fw.busy = 0.0                    # đọc cảm biến trước khi ghi
+        start = max(t, line_free); line_free = start + len(data) * 10.0 / BAUD
+        return (line_free if acquisition == "blocking" else start), line_free
+
+    while arrivals:
+        t_dht = fw._dht_at + SIM_DHT_PERIOD_S if acquisition == "sched" else math.inf
+        t = max(free, min(arrivals[0], fw.last_status + fw.current_period(), t_dht))
+        if arrivals[0] <= t:
+            t_cmd = arrivals.popleft(); fan ^= 1
+            out = fw.handle_command(f"FAN {fan}", t)
+            assert out, "MANUAL mode: FAN must answer with a status"
+            free, done = write(out, t); lat.append(done - t_cmd)
+        elif fw.dht_due(t):
+            fw.tasks(t); free = t + fw.busy; fw.busy = 0.0
+        else:
+            free, _ = write(fw.send_status(t, True), t)          # đã tới hạn (tránh so sánh float)
+    return lat
+
+
+def frame_s() -> float:
+    fw = Firmware(); return len(fw.send_status(0.0, True)) * 10.0 / BAUD
+
+
+def p99(xs):
+    xs = sorted(xs); return xs[int(0.99 * (len(xs) - 1))]
+
+
+def test_sched_ack_latency_is_bounded():
+    lat = ack_latencies("sched")
+    # tệ nhất: lệnh tới ngay khi DHT bắt đầu đọc (hoặc một status vừa lên dây), rồi ack của chính nó
+    assert max(lat) <= max(SIM_DHT_READ_S, frame_s()) + frame_s() + 1e-9
+    assert sorted(lat)[len(lat) // 2] <= 1.5 * frame_s()
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_blocking_acquisition_is_worse(seed):
+    sched, blocking = ack_latencies("sched", seed=seed), ack_latencies("blocking", seed=seed)
+    assert min(blocking) > min(sched)                  # pulseIn trong mỗi sendStatus, kể cả status trả lời lệnh
+    assert p99(blocking) > p99(sched) and max(blocking) > max(sched)
+
+
+def test_auto_mode_does_not_ack_actuator_commands():
+    fw = Firmware()
+    assert fw.handle_command("FAN 1", 0.0) == b"" and fw.handle_command("STATUS", 0.0)
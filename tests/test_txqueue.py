@@ -0,0 +1,44 @@
+"""txqueue.CommandWriter: coalescing and which commands wait for a status ack."""
+import time
+from txqueue import CommandWriter
+
+
+class Port:
+    def __init__(self): self.lines = []; self.t = []
+    def write(self, data): self.lines.append(data.decode().strip()); self.t.append(time.perf_counter())
+
+
+def drain(tx, port, n, timeout=2.0):
+    t_end = time.monotonic() + timeout
+    while len(port.lines) < n and time.monotonic() < t_end: time.sleep(0.002)
+
+
+def test_actuator_commands_do_not_wait_for_ack_in_auto():
+    port = Port(); tx = CommandWriter(port, 0.0, wait_ack=True, ack_timeout=0.3).start()
+    tx.ack("AUTO")
+    t0 = time.perf_counter(); tx.send("FAN 1"); tx.send("LED 1"); tx.send("SERVO 90")
+    drain(tx, port, 3); tx.stop()
+    assert port.lines == ["FAN 1", "LED 1", "SERVO 90"]
+    assert port.t[-1] - t0 < 0.2 and tx.ack_timeouts == 0
+
+
+def test_actuator_commands_wait_for_ack_in_manual():
+    port = Port(); tx = CommandWriter(port, 0.0, wait_ack=True, ack_timeout=0.3).start()
+    tx.ack("MANUAL"); tx.send("FAN 1"); tx.send("LED 1")
+    drain(tx, port, 2); tx.stop()
+    assert port.t[1] - port.t[0] >= 0.25 and tx.ack_timeouts >= 1     # không ai ack FAN 1
+
+
+def test_unknown_mode_and_always_acked_verbs():
+    port = Port(); tx = CommandWriter(port, 0.0, wait_ack=True, ack_timeout=0.2).start()
+    tx.send("FAN 1"); tx.send("STATUS"); tx.send("THRLO 380")
+    drain(tx, port, 3); tx.stop()
+    assert port.t[1] - port.t[0] < 0.15              # chưa có status: coi như AUTO
+    assert port.t[2] - port.t[1] >= 0.15 and tx.ack_timeouts == 1
+
+
+def test_coalesce_keeps_slot_and_latest_value():
+    port = Port(); tx = CommandWriter(port, 0.05)
+    for c in ("FAN 1", "LED 1", "FAN 0", "RAW", "RAW"): tx.send(c)
+    tx.start(); drain(tx, port, 4); tx.stop()
+    assert port.lines == ["FAN 0", "LED 1", "RAW", "RAW"] and tx.superseded == 1
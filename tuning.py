@@ -0,0 +1,328 @@
+# ---------- What-if replay + tự chọn ngưỡng THR LOW/HIGH trên lịch sử đã ghi (không phụ thuộc Qt) ----------
+"""Replay recorded gas history against a whole grid of (THR LOW, THR HIGH) pairs.
+
+For every candidate pair the same auto logic as live runs over the history:
+
+    host     rules.default_rules gas_low on gas_pred (dsp.process_batch) or raw
+             gas: THR LOW with hysteresis / debounce / min hold → alarm commands
+    board    sendStatus() of iot.ino in AUTO: alarm while gas >= THR HIGH,
+             fan (and LED) while gas > THR LOW
+
+and reports, per pair:
+
+    alarms      alarm episodes the dashboard shows (host rule active or board alarm, merged)
+    host / fw   the two parts separately (rule activations, board alarm episodes)
+    fan_duty    fraction of recorded time the fan runs (gaps > GAP_S not counted)
+    missed      incidents never alarmed; ttd_med / ttd_max: time from incident start to
+                the first alarm (negative = gas_pred warned before gas got there)
+
+Incidents are the reference: runs of raw gas >= `event` lasting `event_min_s`
+(runs closer than `event_merge_s` are one incident); they do not depend on
+the candidates. Every quantity that depends on one threshold only is
+computed once per distinct value (numpy, O(samples) each), pairs only
+combine the resulting interval lists, so a sweep costs about
+(#lo + #hi) passes over the data, not #lo × #hi.
+
+best() picks the pair with no missed incident and ttd_med <= max_ttd_s with
+the fewest alarms, then the lowest fan duty.
+
+    python tuning.py --dir telemetry --from 2024-05-01 --lo 300:450:5 --hi 400:600:10
+    python tuning.py --dir telemetry --raw --hysteresis 10 --top 20
+"""
+import argparse, math, statistics, sys
+from rules import Rule, RulesEngine, RULE_HYSTERESIS, RULE_DEBOUNCE_S, RULE_MIN_HOLD_S
+from series import np
+
+TUNE_LO = (300, 450, 5)          # start, stop (gồm cả stop), bước
+TUNE_HI = (400, 600, 10)
+TUNE_EVENT = 450.0               # gas raw >= ngần này ...
+TUNE_EVENT_MIN_S = 5.0           # ... liên tục ngần này giây = một sự cố thật
+TUNE_EVENT_MERGE_S = 30.0
+TUNE_MAX_TTD_S = 10.0            # best(): chậm hơn ngần này coi như không đạt
+GAP_S = 60.0                     # như workers.GAP_S: khoảng trống dài hơn = mất kết nối, không tính thời gian
+METRICS = ("alarms", "host", "fw", "fan_duty", "missed", "ttd_med", "ttd_max")
+
+
+def grid(spec) -> list:
+    """"300:450:5" / (300, 450, 5) → [300, 305, ..., 450]; "380,400" → [380, 400]."""
+    if isinstance(spec, str):
+        if ":" not in spec: return [float(x) for x in spec.split(",") if x.strip()]
+        spec = tuple(float(x) for x in spec.split(":"))
+    a, b, step = spec
+    return [a + k * step for k in range(int(math.floor((b - a) / step + 1e-9)) + 1)]
+
+
+# ---------- Khoảng bật của một ngưỡng (numpy) ----------
+def _next_true(b):
+    """out[i] = index nhỏ nhất j >= i có b[j], len(b) nếu không có."""
+    n = len(b); idx = np.where(b, np.arange(n), n)
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+
+def _held(b, t):
+    """Số giây b đã đúng liên tục tính đến sample i (0 ở sample đầu của mỗi đoạn, âm khi b sai)."""
+    n = len(b); start = b & ~np.r_[False, b[:-1]]
+    rs = np.maximum.accumulate(np.where(start, np.arange(n), 0))
+    return np.where(b, t - t[rs], -1.0)
+
+
+def switch_points(v, t, thr:float, hysteresis:float=0.0, debounce_s:float=0.0, min_hold_s:float=0.0):
+    """Rule(thr, hysteresis, debounce, min hold) of rules.py over v (no NaN) → (on indices, off indices).
+
+    Inactive → active on v >= thr, back on v < thr - hysteresis, each after
+    the condition held `debounce_s` and `min_hold_s` after the last change,
+    exactly like RulesEngine.evaluate (bench/bench_tuning.py checks).
+    """
+    hi = v >= thr; lo = v < thr - hysteresis
+    if debounce_s <= 0 and min_hold_s <= 0:
+        # không debounce/hold: trạng thái chỉ đổi ở sample "hi" đầu sau một "lo" (và ngược lại), dải giữa giữ nguyên
+        idx = np.flatnonzero(hi | lo); c = hi[idx]
+        edge = c != np.r_[False, c[:-1]]
+        return idx[edge & c], idx[edge & ~c]
+    ready = []
+    for b in (hi, lo):
+        r = b if debounce_s <= 0 else _held(b, t) >= debounce_s
+        ready.append(_next_true(r))
+    n = len(v); k = 0; active = False; t_change = None; on = []; off = []
+    while k < n:
+        i0 = k if t_change is None or min_hold_s <= 0 else max(k, int(np.searchsorted(t, t_change + min_hold_s)))
+        if i0 >= n: break
+        i = int(ready[active][i0])
+        if i >= n: break
+        (off if active else on).append(i); active = not active; t_change = t[i]; k = i + 1
+    return np.asarray(on, dtype=np.int64), np.asarray(off, dtype=np.int64)
+
+
+def _intervals(t, on, off):
+    """Index bật/tắt → (start, end) theo thời gian; còn bật ở cuối thì end = sample cuối."""
+    s = t[on]; e = t[off] if len(off) == len(on) else np.r_[t[off], t[-1]]
+    return s, e
+
+
+def _overlaps(a_s, a_e, b_s, b_e) -> int:
+    """Số cặp (a, b) giao nhau; a, b là các khoảng rời nhau đã sắp xếp."""
+    if not len(a_s) or not len(b_s): return 0
+    return int((np.searchsorted(a_s, b_e, side="right") - np.searchsorted(a_e, b_s, side="left")).clip(0).sum())
+
+
+def _detect(s, e, ev_s, ev_e):
+    """Với mỗi sự cố: thời điểm alarm bật (khoảng chứa lúc bắt đầu, hoặc khoảng đầu tiên bắt đầu trong sự cố) − lúc bắt đầu."""
+    out = np.full(len(ev_s), np.inf)
+    if not len(s): return out
+    k = np.searchsorted(s, ev_s, side="right") - 1
+    kc = k.clip(0); inside = (k >= 0) & (e[kc] >= ev_s)
+    out[inside] = s[kc[inside]] - ev_s[inside]
+    k2 = (k + 1).clip(0, len(s) - 1); nxt = ~inside & (k + 1 < len(s)) & (s[k2] <= ev_e)
+    out[nxt] = s[k2[nxt]] - ev_s[nxt]
+    return out
+
+
+def incidents(t, gas, event:float=TUNE_EVENT, min_s:float=TUNE_EVENT_MIN_S, merge_s:float=TUNE_EVENT_MERGE_S):
+    """Đoạn gas >= event dài >= min_s (gộp các đoạn cách nhau < merge_s) → (start, end)."""
+    on, off = switch_points(gas, t, event)
+    s, e = _intervals(t, on, off)
+    if len(s) > 1:
+        keep = np.r_[True, s[1:] - e[:-1] >= merge_s]
+        s = s[keep]; e = np.maximum.reduceat(e, np.flatnonzero(keep))
+    long = e - s >= min_s
+    return s[long], e[long]
+
+
+def _duty(gas, dt, levels):
+    """Phần thời gian gas > level (quạt của firmware) cho mọi level một lượt: sort + cumsum."""
+    order = np.argsort(gas[:-1], kind="stable"); g = gas[:-1][order]; w = np.cumsum(dt[order])
+    total = w[-1] if len(w) else 0.0
+    k = np.searchsorted(g, levels, side="right")
+    below = np.where(k > 0, w[(k - 1).clip(0)] if len(w) else 0.0, 0.0)
+    return (total - below) / total if total > 0 else np.zeros(len(levels))
+
+
+# ---------- Sweep ----------
+def sweep(t, gas, lo, hi, seq=None, field:str="gas_pred", hysteresis:float=RULE_HYSTERESIS,
+          debounce_s:float=RULE_DEBOUNCE_S, min_hold_s:float=RULE_MIN_HOLD_S, event:float=TUNE_EVENT,
+          event_min_s:float=TUNE_EVENT_MIN_S, event_merge_s:float=TUNE_EVENT_MERGE_S, dsp=None,
+          on_progress=None) -> dict:
+    """All candidate pairs at once → {"lo", "hi", metric: (len(lo), len(hi)) array (NaN where lo >= hi), ...}.
+
+    `t`/`gas`/`seq` are the recorded status columns (NaN = missing); field
+    "gas_pred" runs dsp.process_batch first (like the reader thread), "gas"
+    compares the raw reading (IOT_DSP=0).
+    """
+    if np is None: return sweep_py(t, gas, lo, hi, seq, field, hysteresis, debounce_s, min_hold_s, event,
+                                   event_min_s, event_merge_s, dsp, on_progress)
+    tick = on_progress or (lambda f: None)
+    t = np.asarray(t, dtype=np.float64); gas = np.asarray(gas, dtype=np.float64)
+    ok = ~np.isnan(t) & ~np.isnan(gas); t = t[ok]; gas = gas[ok]
+    lo = np.asarray(lo, dtype=np.float64); hi = np.asarray(hi, dtype=np.float64)
+    res = {"lo": lo, "hi": hi, "samples": len(t), "span_s": float(t[-1] - t[0]) if len(t) else 0.0}
+    if len(t) < 2:
+        nan = np.full((len(lo), len(hi)), np.nan)
+        return dict(res, incidents=0, **{m: nan.copy() for m in METRICS})
+    if field == "gas_pred":
+        from dsp import process_batch
+        v = process_batch(gas, t, None if seq is None else np.asarray(seq)[ok], dsp)["gas_pred"]
+    else:
+        v = gas
+    vok = ~np.isnan(v); v, tv = v[vok], t[vok]          # RulesEngine bỏ qua sample không có giá trị
+    ev_s, ev_e = incidents(t, gas, event, event_min_s, event_merge_s)
+    tick(0.05)
+    dt = np.diff(t); dt = np.where(dt <= GAP_S, dt, 0.0)
+    fan = _duty(gas, dt, lo)
+    host = []; fw = []; steps = len(lo) + len(hi)
+    for k, x in enumerate(lo):
+        s, e = _intervals(tv, *switch_points(v, tv, x, hysteresis, debounce_s, min_hold_s)) if len(v) else \
+            (np.empty(0), np.empty(0))
+        host.append((s, e, _detect(s, e, ev_s, ev_e))); tick(0.05 + 0.9 * (k + 1) / steps)
+    for k, x in enumerate(hi):
+        s, e = _intervals(t, *switch_points(gas, t, x))
+        fw.append((s, e, _detect(s, e, ev_s, ev_e))); tick(0.05 + 0.9 * (len(lo) + k + 1) / steps)
+    shape = (len(lo), len(hi)); out = {m: np.full(shape, np.nan) for m in METRICS}
+    for i in range(len(lo)):
+        hs, he, hd = host[i]
+        for j in range(len(hi)):
+            if lo[i] >= hi[j]: continue
+            fs, fe, fd = fw[j]
+            out["host"][i, j] = len(hs); out["fw"][i, j] = len(fs)
+            # khoảng của mỗi bên rời nhau → đồ thị giao là rừng: số đợt gộp = đỉnh − cạnh
+            out["alarms"][i, j] = len(hs) + len(fs) - _overlaps(hs, he, fs, fe)
+            out["fan_duty"][i, j] = fan[i]
+            d = np.minimum(hd, fd); hit = d[np.isfinite(d)]
+            out["missed"][i, j] = len(d) - len(hit)
+            if len(hit): out["ttd_med"][i, j] = float(np.median(hit)); out["ttd_max"][i, j] = float(hit.max())
+    tick(1.0)
+    return dict(res, incidents=len(ev_s), **out)
+
+
+def _spans_py(rows) -> list:
+    """[(t, on)] → [(start, end)]: bật ở sample đầu có on, tắt ở sample đầu không còn on; còn bật → sample cuối."""
+    out = []; start = None
+    for t, f in rows:
+        if f and start is None: start = t
+        elif not f and start is not None: out.append((start, t)); start = None
+    if start is not None: out.append((start, rows[-1][0]))
+    return out
+
+
+def sweep_py(t, gas, lo, hi, seq=None, field:str="gas_pred", hysteresis:float=RULE_HYSTERESIS,
+             debounce_s:float=RULE_DEBOUNCE_S, min_hold_s:float=RULE_MIN_HOLD_S, event:float=TUNE_EVENT,
+             event_min_s:float=TUNE_EVENT_MIN_S, event_merge_s:float=TUNE_EVENT_MERGE_S, dsp=None,
+             on_progress=None) -> dict:
+    """Reference: RulesEngine + the firmware branch sample by sample for every pair (slow; no numpy needed)."""
+    seq = [None] * len(t) if seq is None else list(seq)
+    rows = [(a, b, q) for a, b, q in zip(t, gas, seq) if a == a and b == b]
+    if field == "gas_pred":
+        from dsp import GasDsp
+        d = GasDsp() if dsp is None else dsp; d.reset()
+        pred = [d.process({"gas": b, "seq": None if q is None else int(q)}, a)["gas_pred"] for a, b, q in rows]
+    else:
+        pred = [b for _, b, _ in rows]
+    ev = []
+    for s, e in _spans_py([(a, b >= event) for a, b, _ in rows]):
+        if ev and s - ev[-1][1] < event_merge_s: ev[-1] = (ev[-1][0], e)
+        else: ev.append((s, e))
+    ev = [(s, e) for s, e in ev if e - s >= event_min_s]
+    steps = [(a[0], b[0] - a[0], a[1]) for a, b in zip(rows, rows[1:]) if b[0] - a[0] <= GAP_S]
+    total = sum(dt for _, dt, _ in steps)
+    out = {m: [[math.nan] * len(hi) for _ in lo] for m in METRICS}
+    for i, x in enumerate(lo):
+        eng = RulesEngine([Rule("gas_low", "v", x, ("ON",), ("OFF",), hysteresis=hysteresis,
+                                debounce_s=debounce_s, min_hold_s=min_hold_s)])
+        state = False; flags = []
+        for (a, _, _), p in zip(rows, pred):
+            if p is None or p != p: continue
+            for c in eng.evaluate({"v": p}, a): state = c == "ON"
+            flags.append((a, state))
+        hs = _spans_py(flags) if flags else []
+        fan = sum(dt for _, dt, g in steps if g > x)
+        for j, y in enumerate(hi):
+            if x >= y: continue
+            fs = _spans_py([(a, b >= y) for a, b, _ in rows])
+            links = sum(1 for a in hs for b in fs if a[0] <= b[1] and b[0] <= a[1])
+            det = []
+            for s, e in ev:
+                cand = [a for a, b in hs + fs if a <= s <= b] or [a for a, _ in hs + fs if s < a <= e]
+                if cand: det.append(min(cand) - s)
+            out["host"][i][j] = len(hs); out["fw"][i][j] = len(fs); out["alarms"][i][j] = len(hs) + len(fs) - links
+            out["fan_duty"][i][j] = fan / total if total else 0.0
+            out["missed"][i][j] = len(ev) - len(det)
+            if det: out["ttd_med"][i][j] = statistics.median(det); out["ttd_max"][i][j] = max(det)
+        if on_progress: on_progress((i + 1) / len(lo))
+    return dict({"lo": list(lo), "hi": list(hi), "samples": len(rows), "incidents": len(ev),
+                 "span_s": rows[-1][0] - rows[0][0] if rows else 0.0}, **out)
+
+
+def best(res:dict, max_ttd_s:float=TUNE_MAX_TTD_S):
+    """(lo, hi) without missed incidents, ttd_med <= max_ttd_s, fewest alarms then lowest fan duty; None if none."""
+    cand = []
+    for i, x in enumerate(res["lo"]):
+        for j, y in enumerate(res["hi"]):
+            a = res["alarms"][i][j]; ttd = res["ttd_med"][i][j]
+            if a != a or res["missed"][i][j] > 0: continue
+            if res["incidents"] and not ttd <= max_ttd_s: continue
+            cand.append((a, res["fan_duty"][i][j], ttd if ttd == ttd else 0.0, x, y))
+    return tuple(float(x) for x in min(cand)[3:]) if cand else None
+
+
+def at(res:dict, lo:float, hi:float) -> dict|None:
+    """Các chỉ số của cặp (lo, hi) trong lưới (None nếu không có)."""
+    try: i = list(res["lo"]).index(lo); j = list(res["hi"]).index(hi)
+    except ValueError: return None
+    return {m: float(res[m][i][j]) for m in METRICS}
+
+
+def table(res:dict, top:int=10, current=None, max_ttd_s:float=TUNE_MAX_TTD_S) -> list:
+    """Dòng text: `top` cặp theo thứ tự của best() + cặp hiện tại."""
+    rows = []
+    for i, x in enumerate(res["lo"]):
+        for j, y in enumerate(res["hi"]):
+            if res["alarms"][i][j] == res["alarms"][i][j]:
+                ttd = res["ttd_med"][i][j]
+                bad = res["missed"][i][j] > 0 or (res["incidents"] and not ttd <= max_ttd_s)
+                rows.append((bad, res["alarms"][i][j], res["fan_duty"][i][j], x, y))
+    rows.sort()
+    fmt = lambda x, y, tag="": "{:>5g}/{:<5g} alarms {:5.0f} (host {:4.0f}, fw {:4.0f})  fan {:5.1%}  " \
+        "missed {:3.0f}  ttd med {:6.1f} max {:6.1f} s{}".format(x, y, *(at(res, x, y)[m] for m in
+                                                                       ("alarms", "host", "fw", "fan_duty", "missed",
+                                                                        "ttd_med", "ttd_max")), tag)
+    out = [fmt(x, y) for _, _, _, x, y in rows[:top]]
+    if current is not None and at(res, *current) is not None: out.append(fmt(*current, "  ← current"))
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="What-if replay of THR LOW/HIGH pairs over a telemetry log")
+    ap.add_argument("--dir", required=True, help="telemetry log directory")
+    ap.add_argument("--from", dest="t0"); ap.add_argument("--to", dest="t1")
+    ap.add_argument("--lo", default=":".join(f"{x:g}" for x in TUNE_LO), help="THR LOW grid start:stop:step or a,b,c")
+    ap.add_argument("--hi", default=":".join(f"{x:g}" for x in TUNE_HI))
+    ap.add_argument("--hysteresis", type=float, default=RULE_HYSTERESIS)
+    ap.add_argument("--debounce", type=float, default=RULE_DEBOUNCE_S)
+    ap.add_argument("--min-hold", type=float, default=RULE_MIN_HOLD_S)
+    ap.add_argument("--raw", action="store_true", help="host rule on raw gas (IOT_DSP=0)")
+    ap.add_argument("--event", type=float, default=TUNE_EVENT, help="incident: raw gas >= this ...")
+    ap.add_argument("--event-min", type=float, default=TUNE_EVENT_MIN_S, help="... for at least this many seconds")
+    ap.add_argument("--max-ttd", type=float, default=TUNE_MAX_TTD_S)
+    ap.add_argument("--current", default="380,450", help="pair to compare with")
+    ap.add_argument("--top", type=int, default=10)
+    a = ap.parse_args(argv)
+    import time
+    from workers import load_log, InlineContext
+    from telemetry import _parse_time
+    t_start = time.perf_counter()
+    cols = load_log(InlineContext(), a.dir, ("gas", "seq"), _parse_time(a.t0, -math.inf), _parse_time(a.t1, math.inf))
+    t_load = time.perf_counter()
+    res = sweep(cols["t"], cols["gas"], grid(a.lo), grid(a.hi), cols["seq"], "gas" if a.raw else "gas_pred",
+                a.hysteresis, a.debounce, a.min_hold, a.event, a.event_min)
+    el = time.perf_counter() - t_load
+    print(f"{res['samples']} samples over {res['span_s'] / 86400:.1f} days, {res['incidents']} incidents "
+          f"(gas >= {a.event:g} for {a.event_min:g} s); {len(res['lo'])} × {len(res['hi'])} pairs in {el:.2f} s "
+          f"(+ {t_load - t_start:.2f} s load)")
+    cur = tuple(float(x) for x in a.current.split(","))
+    for line in table(res, a.top, cur, a.max_ttd): print("  " + line)
+    b = best(res, a.max_ttd)
+    print(f"best: THR LOW {b[0]:g}, THR HIGH {b[1]:g}" if b else "best: no pair detects every incident in time")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# ---------- Hàng đợi gửi lệnh: thread riêng, gộp lệnh, giới hạn tốc độ ----------
+import threading, time
+from collections import OrderedDict, deque
+
+CMD_MIN_INTERVAL_S = 0.015      # khoảng cách tối thiểu giữa 2 lệnh (Arduino đọc + xử lý từng dòng)
+ACK_TIMEOUT_S = 0.25
+# lệnh kiểu "đặt giá trị": lệnh mới thay lệnh cũ còn trong hàng đợi
+COALESCE = frozenset(("LED", "FAN", "SERVO", "ALARM", "THRLO", "THRHI", "STREAM", "PROTO", "AUTO", "STATUS"))
+# firmware trả lời bằng sendStatus(true) → dùng status frame kế tiếp làm ack
+ACKED = frozenset(("STATUS", "AUTO", "STREAM", "PROTO"))
+# chỉ được trả lời ở MANUAL (ở AUTO firmware bỏ qua lệnh, không gửi gì): chờ ack khi status cuối báo MANUAL
+MANUAL_ACKED = frozenset(("LED", "FAN", "SERVO"))
+
+
+def coalesce_key(cmd:str):
+    """Verb dùng làm khóa gộp (lệnh mới thay lệnh cũ cùng khóa), None nếu lệnh không gộp được."""
+    verb = cmd.split(None, 1)[0].upper() if cmd.strip() else ""
+    return verb if verb in COALESCE else None
+
+
+class CommandWriter:
+    """Writes commands to the port from its own thread so the GUI never blocks on ser.write.
+
+    send() is non-blocking: a command whose verb is in COALESCE replaces the
+    still-queued command with the same verb (in place, so it keeps its slot).
+    Writes are spaced by `min_interval`; with `wait_ack` the thread waits for
+    ack() (next status frame) after commands in ACKED, and after MANUAL_ACKED
+    ones when the last ack(mode) reported "MANUAL", up to `ack_timeout`.
+    Callbacks run on the writer thread. send(cmd, t_origin) with the
+    perf_counter time of the frame that caused the command also records
+    frame→write latency in `reaction`.
+    """
+
+    def __init__(self, ser, min_interval:float=CMD_MIN_INTERVAL_S, wait_ack:bool=False,
+                 ack_timeout:float=ACK_TIMEOUT_S, on_sent=None, on_error=None, history:int=512):
+        self.ser = ser; self.min_interval = min_interval
+        self.wait_ack = wait_ack; self.ack_timeout = ack_timeout
+        self.on_sent = on_sent; self.on_error = on_error
+        self._pending = OrderedDict(); self._cv = threading.Condition()
+        self._ack = threading.Event(); self._run = False; self._thread = None; self._uniq = 0
+        self.mode = None                         # mode của status cuối (ack), None = chưa biết → coi như AUTO
+        self.sent = 0; self.superseded = 0; self.errors = 0; self.ack_timeouts = 0; self.max_depth = 0
+        self.latency = deque(maxlen=history)     # enqueue → write xong (s)
+        self.write_time = deque(maxlen=history)  # thời gian ser.write (s)
+        self.reaction = deque(maxlen=history)    # frame nhận → lệnh ghi xong (lệnh của rules engine)
+
+    def start(self):
+        self._run = True
+        self._thread = threading.Thread(target=self._loop, name="serial-tx", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, drain:float=0.2):
+        """Dừng thread; chờ tối đa `drain` giây cho hàng đợi được gửi hết."""
+        end = time.monotonic() + drain
+        while self._pending and time.monotonic() < end and self._thread and self._thread.is_alive():
+            time.sleep(0.005)
+        with self._cv:
+            self._run = False; self._cv.notify()
+        self._ack.set()
+        if self._thread: self._thread.join(1.0); self._thread = None
+
+    def send(self, cmd:str, t_origin:float|None=None):
+        key = coalesce_key(cmd)
+        with self._cv:
+            if key is not None:
+                if key in self._pending: self.superseded += 1
+            else:
+                self._uniq += 1; key = self._uniq
+            self._pending[key] = (cmd, time.perf_counter(), t_origin)   # key cũ giữ nguyên vị trí
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cv.notify()
+
+    def ack(self, mode:str|None=None):
+        """Status frame vừa tới; `mode` (AUTO/MANUAL) quyết định LED/FAN/SERVO có được trả lời không."""
+        if mode is not None: self.mode = mode
+        self._ack.set()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        def pct(d, q):
+            s = sorted(d)
+            return s[min(len(s) - 1, int(q * len(s)))] * 1e3 if s else 0.0
+        return {"depth": self.depth, "max_depth": self.max_depth, "sent": self.sent,
+                "superseded": self.superseded, "errors": self.errors, "ack_timeouts": self.ack_timeouts,
+                "latency_p50_ms": pct(self.latency, .5), "latency_p99_ms": pct(self.latency, .99),
+                "write_p99_ms": pct(self.write_time, .99),
+                "reaction_p50_ms": pct(self.reaction, .5), "reaction_p99_ms": pct(self.reaction, .99)}
+
+    def _loop(self):
+        last = 0.0
+        while True:
+            with self._cv:
+                while self._run and not self._pending: self._cv.wait()
+                if not self._run: return
+                key, (cmd, t_enq, t_origin) = self._pending.popitem(last=False)
+            wait = last + self.min_interval - time.perf_counter()
+            if wait > 0: time.sleep(wait)
+            verb = key if isinstance(key, str) else ""
+            self._ack.clear()
+            t0 = time.perf_counter()
+            try:
+                self.ser.write((cmd + "\n").encode("utf-8"))
+            except Exception as e:
+                self.errors += 1
+                if self.on_error: self.on_error(f"Send error: {e} ({cmd})")
+                continue
+            last = time.perf_counter()
+            self.sent += 1; self.write_time.append(last - t0); self.latency.append(last - t_enq)
+            if t_origin is not None: self.reaction.append(last - t_origin)
+            if self.on_sent: self.on_sent(cmd)
+            acked = verb in ACKED or (verb in MANUAL_ACKED and self.mode == "MANUAL")
+            if self.wait_ack and acked and not self._ack.wait(self.ack_timeout):
+                self.ack_timeouts += 1
@@ -0,0 +1,415 @@
+# ---------- Process pool cho việc nặng: tổng hợp lịch sử, export (không phụ thuộc Qt) ----------
+"""Analytics jobs off the GUI process.
+
+JobPool runs job functions of this module in a concurrent.futures process
+pool (forkserver on Linux, so workers never inherit the Qt process, spawn
+elsewhere; nice'd so the dashboard keeps the CPU on a small host). Progress
+and cancellation go through one shared-memory block of float64 slots
+([progress, cancel] per job), so neither side blocks or pickles anything
+for them: the job writes progress and polls its cancel flag via JobContext,
+the GUI polls progress on a timer. Results come back through the future's
+done callback (on the executor's thread, see Iot.JobRunner for the Qt
+side).
+
+Large inputs travel as SharedArrays (float64 columns in one SharedMemory
+block, pickled as name + layout) or as a telemetry log directory that the
+worker reads itself. A job must return copies, not views into its inputs.
+
+    python workers.py aggregate --dir telemetry --field gas --points 1000
+    python workers.py export --dir telemetry --csv out.csv
+    python workers.py tune --dir telemetry --lo 300:450:5 --hi 400:600:10
+"""
+import argparse, math, os, signal, sys, threading, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:     # numpy tùy chọn: job chạy vòng lặp Python (chậm hơn, nhưng vẫn ngoài GUI process)
+    np = None
+
+WORKERS = int(os.getenv("IOT_WORKERS", "0"))        # 0 = số CPU - 1 (ít nhất 1)
+WORKER_NICE = int(os.getenv("IOT_WORKER_NICE", "10"))
+MAX_JOBS = 64                   # số slot progress/cancel trong block điều khiển
+LOAD_SHARE = 0.8                # phần progress dành cho đọc log (còn lại: tổng hợp)
+GAP_S = 60.0                    # khoảng giữa 2 sample dài hơn → coi là mất kết nối khi cộng thời gian vượt ngưỡng
+
+
+class Cancelled(Exception):
+    """Job bị huỷ giữa chừng (JobPool.cancel)."""
+
+
+# ---------- Shared columns ----------
+class SharedArrays:
+    """Equal-length float64 columns in one SharedMemory block.
+
+    The creator owns the block (close() + unlink(), or use it as a context
+    manager); pickling carries only the block name and layout, the receiving
+    process maps the same pages.
+    """
+
+    def __init__(self, columns:dict):
+        names = tuple(columns); n = len(columns[names[0]]) if names else 0
+        self.names = names; self.n = n; self.owner = True
+        self.shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * n * len(names)))
+        for k, name in enumerate(names):
+            col = columns[name]
+            if len(col) != n: raise ValueError(f"column {name!r}: {len(col)} rows, expected {n}")
+            if np is not None: self[name][:] = col
+            else:
+                from array import array
+                self.shm.buf.cast("d")[k * n:(k + 1) * n] = col if isinstance(col, array) else array("d", col)
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "names": self.names, "n": self.n}
+
+    def __setstate__(self, state):
+        self.names = state["names"]; self.n = state["n"]; self.owner = False
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __getitem__(self, name:str):
+        """View (không copy): numpy array, hoặc memoryview 'd' khi không có numpy."""
+        k = self.names.index(name)
+        if np is not None: return np.ndarray((self.n,), np.float64, buffer=self.shm.buf, offset=8 * k * self.n)
+        return self.shm.buf.cast("d")[k * self.n:(k + 1) * self.n]
+
+    def close(self):
+        try: self.shm.close()
+        except BufferError: pass     # còn view đang dùng: mapping được giải phóng khi view hết tham chiếu
+
+    def unlink(self):
+        if self.owner: self.shm.unlink()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close(); self.unlink()
+
+
+# ---------- Worker side ----------
+_ctl = {}          # tên block điều khiển → SharedMemory (mỗi worker attach một lần)
+
+
+class JobContext:
+    """Handed to every job: progress(frac) and check() (raises Cancelled); tick() = both."""
+    __slots__ = ("_slots", "_i")
+
+    def __init__(self, ctl_name:str, slot:int):
+        shm = _ctl.get(ctl_name)
+        if shm is None: shm = _ctl[ctl_name] = shared_memory.SharedMemory(name=ctl_name)
+        self._slots = shm.buf.cast("d"); self._i = 2 * slot
+
+    def progress(self, frac:float):
+        self._slots[self._i] = min(1.0, max(0.0, frac))
+
+    def check(self):
+        if self._slots[self._i + 1]: raise Cancelled()
+
+    def tick(self, frac:float):
+        self._slots[self._i] = min(1.0, max(0.0, frac))
+        if self._slots[self._i + 1]: raise Cancelled()
+
+
+class InlineContext:
+    """Context khi gọi job trực tiếp trong process hiện tại (bench, test tay): không progress, không huỷ."""
+    def progress(self, frac): pass
+    def check(self): pass
+    def tick(self, frac): pass
+
+
+def _init_worker(nice:int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)      # Ctrl+C trong terminal: chỉ process chính xử lý
+    if nice and hasattr(os, "nice"):
+        try: os.nice(nice)
+        except OSError: pass
+
+
+def _run(ctl_name:str, slot:int, fn, args, kw):
+    ctx = JobContext(ctl_name, slot); ctx.check()
+    try: return fn(ctx, *args, **kw)
+    finally:
+        for a in args:
+            if isinstance(a, SharedArrays): a.close()
+
+
+# ---------- Pool (GUI process) ----------
+class JobPool:
+    """Process pool + progress/cancel slots; on_done(job_id, result, error) runs on the executor's thread.
+
+    error is None on success, a Cancelled instance if the job was cancelled,
+    else the exception the job raised (BrokenProcessPool if a worker died).
+    Workers start on the first submit(). Until the first worker process
+    exists (forkserver boot ~0.1 s) jobs are handed to the executor by a
+    short-lived thread, so submit() never waits for a process to start.
+    """
+
+    def __init__(self, workers:int=WORKERS, on_done=None, nice:int=WORKER_NICE):
+        self.workers = workers if workers > 0 else max(1, (os.cpu_count() or 2) - 1)
+        self.on_done = on_done; self.nice = nice
+        self.ex = None; self.ctl = None; self._slots = None; self._retired = []
+        self.jobs = {}            # job_id → (future | None khi chưa giao cho executor, slot)
+        self._free = list(range(MAX_JOBS - 1, -1, -1)); self._next = 1
+        self._lock = threading.Lock(); self._ready = False; self._backlog = []
+        self.submitted = 0; self.completed = 0; self.failed = 0; self.cancelled = 0
+
+    def _start(self):
+        if self.ctl is None:
+            self.ctl = shared_memory.SharedMemory(create=True, size=16 * MAX_JOBS)
+            self._slots = self.ctl.buf.cast("d")
+        if "forkserver" in mp.get_all_start_methods():
+            # không preload: server nạp __main__ (Iot.py + Qt) thì submit() đầu chặn GUI ~0.25 s; worker tự import
+            ctx = mp.get_context("forkserver"); ctx.set_forkserver_preload([])
+        else:
+            ctx = mp.get_context("spawn")
+        self.ex = ProcessPoolExecutor(self.workers, mp_context=ctx, initializer=_init_worker, initargs=(self.nice,))
+        self._ready = False
+
+    def submit(self, fn, *args, **kw) -> int:
+        """fn(ctx, *args, **kw) phải là hàm top-level của một module import được (pickle theo tên)."""
+        if not self._free: raise RuntimeError(f"more than {MAX_JOBS} jobs in flight")
+        with self._lock:
+            if self.ex is None or getattr(self.ex, "_broken", False): self._start()
+            slot = self._free.pop(); jid = self._next; self._next += 1
+            self._slots[2 * slot] = 0.0; self._slots[2 * slot + 1] = 0.0
+            self.jobs[jid] = (None, slot); self.submitted += 1
+            job = (jid, slot, fn, args, kw)
+            if not self._ready:
+                self._backlog.append(job)
+                if len(self._backlog) == 1: threading.Thread(target=self._drain, name="job-pool-start", daemon=True).start()
+                return jid
+        self._dispatch(*job)
+        return jid
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._backlog: self._ready = True; return
+                job = self._backlog.pop(0)
+            self._dispatch(*job)
+
+    def _dispatch(self, jid, slot, fn, args, kw):
+        try: fut = self.ex.submit(_run, self.ctl.name, slot, fn, args, kw)
+        except Exception as e:       # executor đã shutdown / hỏng
+            from concurrent.futures import Future
+            fut = Future(); fut.set_exception(e)
+        if jid in self.jobs: self.jobs[jid] = (fut, slot)
+        fut.add_done_callback(lambda f, jid=jid: self._done(jid, f))
+
+    def _done(self, jid:int, fut):
+        _, slot = self.jobs.pop(jid, (None, None))
+        if fut.cancelled(): result, error = None, Cancelled()
+        else:
+            error = fut.exception(); result = None if error is not None else fut.result()
+        if slot is not None:
+            if self._slots[2 * slot + 1] and error is None: error = Cancelled()   # huỷ đúng lúc job vừa xong
+            self._free.append(slot)
+        if error is None: self.completed += 1
+        elif isinstance(error, Cancelled): self.cancelled += 1
+        else: self.failed += 1
+        if self.on_done: self.on_done(jid, result, error)
+
+    def cancel(self, jid:int) -> bool:
+        """Huỷ job: chưa chạy thì bỏ khỏi hàng đợi, đang chạy thì job thấy cờ ở lần tick() kế."""
+        job = self.jobs.get(jid)
+        if job is None: return False
+        fut, slot = job
+        self._slots[2 * slot + 1] = 1.0
+        if fut is not None: fut.cancel()
+        return True
+
+    def progress(self, jid:int) -> float|None:
+        job = self.jobs.get(jid)
+        return None if job is None else self._slots[2 * job[1]]
+
+    def running(self) -> list:
+        return list(self.jobs)
+
+    def shutdown(self, wait:bool=False):
+        for jid in list(self.jobs): self.cancel(jid)
+        if self.ex is not None: self.ex.shutdown(wait=wait, cancel_futures=True); self.ex = None
+        if self.ctl is not None:
+            # bỏ tên ngay; mapping giữ lại vì callback của job đang huỷ còn đọc slot
+            self.ctl.unlink(); self._retired.append(self.ctl); self.ctl = None
+
+
+# ---------- Jobs ----------
+def _rec_dtype():
+    from telemetry import STATUS_COLUMNS, REC_SIZE
+    # cùng layout với telemetry.STATUS_REC "<dBxHHhffHHBBBB"
+    formats = ("<f8", "<u2", "<u2", "<i2", "<f4", "<f4", "<u2", "<u2", "u1", "u1", "u1", "u1")
+    offsets = (0, 10, 12, 14, 16, 20, 24, 26, 28, 29, 30, 31)
+    return np.dtype({"names": ("kind",) + STATUS_COLUMNS, "formats": ("u1",) + formats,
+                     "offsets": (8,) + offsets, "itemsize": REC_SIZE})
+
+
+def load_log(ctx, log_dir:str, fields=("gas",), t0:float=-math.inf, t1:float=math.inf, share:float=1.0) -> dict:
+    """Status columns ("t" + fields) of a telemetry log in [t0, t1], read block by block (float64 arrays)."""
+    from telemetry import LogReader, KIND_STATUS, STATUS_COLUMNS
+    names = ("t",) + tuple(f for f in fields if f != "t")
+    with LogReader(log_dir) as r:
+        segs = [s for s in r.segments if not (s.t_last < t0 or s.t_first > t1)]
+        total = sum(s.n for s in segs) or 1; done = 0
+        if np is None:
+            out = {c: [] for c in names}
+            for kind, t, d in r.records(t0, t1, (KIND_STATUS,)):
+                for c in names: v = d[c]; out[c].append(math.nan if v is None else float(v))
+                done += 1
+                if not done & 0xFFF: ctx.tick(share * done / total)
+            return out
+        dt = _rec_dtype(); parts = {c: [] for c in names}
+        for seg in segs:
+            for buf, i, j in seg.chunks(t0, t1):
+                _take(buf, i, j, dt, names, t0, t1, KIND_STATUS, parts)
+                done += j - i; ctx.tick(share * done / total)
+    return {c: np.concatenate(p) if p else np.empty(0) for c, p in parts.items()}
+
+
+def _take(buf, i:int, j:int, dt, names, t0, t1, kind, parts):
+    # hàm riêng: view vào mmap hết tham chiếu khi return, LogReader.close() mới đóng được mmap
+    rec = np.frombuffer(buf, dtype=dt, count=j - i, offset=i * dt.itemsize)
+    keep = (rec["kind"] == kind) & (rec["t"] >= t0) & (rec["t"] <= t1)
+    for c in names: parts[c].append(rec[c][keep].astype(np.float64))
+
+
+def aggregate(ctx, src, field:str="gas", t0:float=-math.inf, t1:float=math.inf, max_points:int=1000,
+              threshold:float|None=None, width:float|None=None) -> dict:
+    """Bucketed min/max/mean of `field` plus whole-range stats.
+
+    src: SharedArrays with "t" and `field`, or a telemetry log directory.
+    Bucket width defaults to the span / max_points (at least 1 s). Result:
+    {"t", "min", "max", "mean", "n"} per bucket, "width", and "count", "min_v",
+    "max_v", "mean_v", "p50", "p95", "p99", "above_s" (seconds with
+    field >= threshold, gaps longer than GAP_S not counted), "t_first", "t_last".
+    """
+    if isinstance(src, str):
+        cols = load_log(ctx, src, (field,), t0, t1, LOAD_SHARE); share = LOAD_SHARE
+        t, v = cols["t"], cols[field]
+    else:
+        t, v = src["t"], src[field]; share = 0.0
+        if np is not None and (t0 > -math.inf or t1 < math.inf):
+            i, j = np.searchsorted(t, t0), np.searchsorted(t, t1, side="right"); t, v = t[i:j], v[i:j]
+    ctx.tick(share)
+    if np is None: return _aggregate_py(ctx, list(t), list(v), max_points, threshold, width)
+    t = np.asarray(t, dtype=np.float64); v = np.asarray(v, dtype=np.float64)
+    ok = ~np.isnan(v) & ~np.isnan(t); t, v = t[ok], v[ok]
+    res = {"count": int(len(v)), "width": 0.0, "t_first": None, "t_last": None}
+    if not len(v):
+        e = np.empty(0); return dict(res, t=e, min=e, max=e, mean=e, n=e)
+    t_first, t_last = float(t[0]), float(t[-1])
+    if width is None: width = max(1.0, math.ceil((t_last - t_first) / max(1, max_points)))
+    b = np.floor(t / width)
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    ends = np.r_[starts[1:], len(v)]
+    mn = np.empty(len(starts)); mx = np.empty(len(starts)); sm = np.empty(len(starts))
+    step = 1 << 16
+    for k in range(0, len(starts), step):      # theo lô: progress + huỷ được giữa chừng
+        s = starts[k:k + step]; e = int(ends[min(k + step, len(starts)) - 1])
+        seg = v[int(s[0]):e]; rel = s - s[0]
+        mn[k:k + step] = np.minimum.reduceat(seg, rel); mx[k:k + step] = np.maximum.reduceat(seg, rel)
+        sm[k:k + step] = np.add.reduceat(seg, rel)
+        ctx.tick(share + (1 - share) * 0.7 * (k + step) / len(starts))
+    n = (ends - starts).astype(np.float64)
+    p50, p95, p99 = (float(x) for x in np.percentile(v, (50, 95, 99)))
+    above = 0.0
+    if threshold is not None and len(t) > 1:
+        d = np.diff(t); above = float(d[(v[:-1] >= threshold) & (d <= GAP_S)].sum())
+    ctx.tick(1.0)
+    return dict(res, t=b[starts] * width, min=mn, max=mx, mean=sm / n, n=n, width=float(width),
+                min_v=float(v.min()), max_v=float(v.max()), mean_v=float(v.mean()),
+                p50=p50, p95=p95, p99=p99, above_s=above, t_first=t_first, t_last=t_last)
+
+
+def _aggregate_py(ctx, t, v, max_points, threshold, width) -> dict:
+    rows = [(a, b) for a, b in zip(t, v) if a == a and b == b]
+    res = {"count": len(rows), "width": 0.0, "t_first": None, "t_last": None,
+           "t": [], "min": [], "max": [], "mean": [], "n": []}
+    if not rows: return res
+    t_first, t_last = rows[0][0], rows[-1][0]
+    if width is None: width = max(1.0, math.ceil((t_last - t_first) / max(1, max_points)))
+    cur = None
+    for k, (a, x) in enumerate(rows):
+        b = math.floor(a / width)
+        if b != cur:
+            cur = b; res["t"].append(b * width); res["min"].append(x); res["max"].append(x)
+            res["mean"].append(0.0); res["n"].append(0)
+        if x < res["min"][-1]: res["min"][-1] = x
+        if x > res["max"][-1]: res["max"][-1] = x
+        res["mean"][-1] += x; res["n"][-1] += 1
+        if not k & 0xFFFF: ctx.check()
+    res["mean"] = [s / c for s, c in zip(res["mean"], res["n"])]
+    vs = sorted(x for _, x in rows); q = lambda p: vs[min(len(vs) - 1, int(p * len(vs)))]
+    above = sum(b[0] - a[0] for a, b in zip(rows, rows[1:]) if threshold is not None and a[1] >= threshold
+                and b[0] - a[0] <= GAP_S)
+    return dict(res, width=float(width), min_v=vs[0], max_v=vs[-1], mean_v=sum(vs) / len(vs),
+                p50=q(.5), p95=q(.95), p99=q(.99), above_s=above, t_first=t_first, t_last=t_last)
+
+
+def tune(ctx, src, lo, hi, t0:float=-math.inf, t1:float=math.inf, **kw) -> dict:
+    """tuning.sweep over the status history: telemetry log directory or SharedArrays with "t", "gas" (+ "seq")."""
+    from tuning import sweep
+    if isinstance(src, str):
+        cols = load_log(ctx, src, ("gas", "seq"), t0, t1, LOAD_SHARE); share = LOAD_SHARE
+    else:
+        cols = {c: src[c] for c in ("t", "gas", "seq") if c in src}; share = 0.0
+    ctx.tick(share)
+    return sweep(cols["t"], cols["gas"], lo, hi, cols.get("seq"),
+                 on_progress=lambda f: ctx.tick(share + (1 - share) * f), **kw)
+
+
+def export_csv(ctx, log_dir:str, path:str, t0:float=-math.inf, t1:float=math.inf) -> int:
+    """telemetry.LogReader.export_csv with progress; a cancelled export removes the partial file."""
+    from telemetry import LogReader
+    with LogReader(log_dir) as r:
+        try: return r.export_csv(path, t0, t1, on_progress=lambda done, total: ctx.tick(done / total if total else 1.0))
+        except Cancelled:
+            try: os.remove(path)
+            except OSError: pass
+            raise
+
+
+def main(argv=None):
+    from telemetry import LOG_DIR
+    ap = argparse.ArgumentParser(description="run an analytics job in a worker process")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ag = sub.add_parser("aggregate"); ex = sub.add_parser("export"); tu = sub.add_parser("tune")
+    for p in (ag, ex, tu): p.add_argument("--dir", default=LOG_DIR)
+    ag.add_argument("--field", default="gas"); ag.add_argument("--points", type=int, default=1000)
+    ag.add_argument("--threshold", type=float)
+    ex.add_argument("--csv", required=True)
+    tu.add_argument("--lo", default="300:450:5"); tu.add_argument("--hi", default="400:600:10")
+    a = ap.parse_args(argv)
+    done = []
+    pool = JobPool(1, on_done=lambda jid, res, err: done.append((res, err)))
+    t = time.perf_counter()
+    if a.cmd == "aggregate": jid = pool.submit(aggregate, a.dir, a.field, max_points=a.points, threshold=a.threshold)
+    elif a.cmd == "tune":
+        from tuning import grid
+        jid = pool.submit(tune, a.dir, grid(a.lo), grid(a.hi))
+    else: jid = pool.submit(export_csv, a.dir, a.csv)
+    while not done:
+        time.sleep(0.1); p = pool.progress(jid)
+        if p is not None: print(f"\r{p * 100:5.1f}%", end="", file=sys.stderr)
+    print(file=sys.stderr); pool.shutdown(wait=True)
+    res, err = done[0]
+    if err is not None: print(f"failed: {err!r}", file=sys.stderr); return 1
+    if a.cmd == "export": print(f"{res} records → {a.csv} ({time.perf_counter() - t:.2f} s)"); return 0
+    if a.cmd == "tune":
+        from tuning import table, best
+        print(f"{res['samples']} samples, {res['incidents']} incidents, {len(res['lo'])} × {len(res['hi'])} pairs "
+              f"({time.perf_counter() - t:.2f} s)")
+        for line in table(res, 10): print("  " + line)
+        print(f"best: {best(res)}"); return 0
+    print(f"{res['count']} samples in {len(res['t'])} buckets of {res['width']:g} s ({time.perf_counter() - t:.2f} s)")
+    if res["count"]:
+        print(f"min {res['min_v']:g}  mean {res['mean_v']:.1f}  max {res['max_v']:g}  "
+              f"p50 {res['p50']:g}  p95 {res['p95']:g}  p99 {res['p99']:g}  above {res['above_s']:.0f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())